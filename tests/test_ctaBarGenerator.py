@@ -0,0 +1,99 @@
+# encoding: UTF-8
+
+"""CtaBarGenerator的测试：回放收盘前后的tick和定时器"""
+
+import unittest
+from datetime import datetime, timedelta
+
+from vnpy.trader.app.ctaStrategy.ctaBase import CtaTickData
+from vnpy.trader.app.ctaStrategy.ctaBarGenerator import CtaBarGenerator
+
+
+#----------------------------------------------------------------------
+def makeTick(dt, lastPrice, volume):
+    """创建螺纹钢的tick"""
+    tick = CtaTickData()
+    tick.symbol = 'rb1901'
+    tick.exchange = 'SHFE'
+    tick.vtSymbol = 'rb1901'
+    tick.datetime = dt
+    tick.date = dt.strftime('%Y%m%d')
+    tick.time = dt.strftime('%H:%M:%S.%f')
+    tick.tradingDay = tick.date
+    tick.lastPrice = lastPrice
+    tick.volume = volume
+    return tick
+
+
+########################################################################
+class SessionCloseTest(unittest.TestCase):
+    """收盘tick在定时器检查之后到达"""
+
+    #----------------------------------------------------------------------
+    def setUp(self):
+        self.barList = []
+        self.generator = CtaBarGenerator(lambda bar, interval: self.barList.append((interval, bar)),
+                                         ['1m', '5m'])
+
+    #----------------------------------------------------------------------
+    def replay(self, start, end, closeTime, closePrice):
+        """
+        start到end之间每秒一个tick（收盘时段之外）并调用updateTime（与DrEngine相同），
+        收盘tick在closeTime到达
+        """
+        volume = 100
+        price = 3500
+        dt = start
+        while dt <= end:
+            if dt == closeTime:
+                volume += 10
+                self.generator.updateTick(makeTick(dt, closePrice, volume))
+            elif not self.generator.isEndTick(dt) and dt.minute != closeTime.minute:
+                volume += 1
+                price += 1
+                self.generator.updateTick(makeTick(dt, price, volume))
+            self.generator.updateTime(dt + timedelta(milliseconds=500))
+            dt += timedelta(seconds=1)
+
+    #----------------------------------------------------------------------
+    def testMorningBreak(self):
+        """10:15休市：收盘tick计入10:14的K线，不生成10:15的K线"""
+        self.replay(datetime(2018, 7, 2, 10, 14, 0), datetime(2018, 7, 2, 10, 15, 30),
+                    datetime(2018, 7, 2, 10, 15, 4), 3600)
+
+        minuteBars = [bar for interval, bar in self.barList if interval == '1m']
+        self.assertEqual(len(minuteBars), 1)
+        bar = minuteBars[0]
+        self.assertEqual(bar.datetime, datetime(2018, 7, 2, 10, 14))
+        self.assertEqual(bar.close, 3600)
+        self.assertEqual(bar.high, 3600)
+        self.assertEqual(bar.volume, 59 + 10)
+
+        # 5分钟线10:10-10:15同样在休市后结束，包含收盘tick
+        fiveMinuteBars = [bar for interval, bar in self.barList if interval == '5m']
+        self.assertEqual(len(fiveMinuteBars), 1)
+        self.assertEqual(fiveMinuteBars[0].close, 3600)
+
+    #----------------------------------------------------------------------
+    def testDayClose(self):
+        """15:00收盘：收盘tick计入14:59的K线"""
+        self.replay(datetime(2018, 7, 2, 14, 59, 0), datetime(2018, 7, 2, 15, 1, 0),
+                    datetime(2018, 7, 2, 15, 0, 5), 3700)
+
+        minuteBars = [bar for interval, bar in self.barList if interval == '1m']
+        self.assertEqual([bar.datetime for bar in minuteBars], [datetime(2018, 7, 2, 14, 59)])
+        self.assertEqual(minuteBars[0].close, 3700)
+
+    #----------------------------------------------------------------------
+    def testLateTimer(self):
+        """收盘时段过后，没有收到收盘tick的K线由定时器结束"""
+        self.replay(datetime(2018, 7, 2, 10, 14, 0), datetime(2018, 7, 2, 10, 15, 30),
+                    datetime(2018, 7, 2, 10, 14, 59), 3600)
+
+        minuteBars = [bar for interval, bar in self.barList if interval == '1m']
+        self.assertEqual(len(minuteBars), 1)
+        self.assertEqual(minuteBars[0].datetime, datetime(2018, 7, 2, 10, 14))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+# encoding: UTF-8
+
+"""tick总线的测试：写入进程写tick，另一个进程读取，检查内容、延迟和丢失数量"""
+
+import os
+import time
+import unittest
+import multiprocessing
+from datetime import datetime
+
+from vnpy.trader.vtEvent import EVENT_TICK
+from vnpy.trader.vtObject import VtTickData
+from vnpy.trader.vtTickBus import TickBusWriter, TickBusReader
+
+CAPACITY = 16
+
+
+#----------------------------------------------------------------------
+def makeTick(lastPrice, volume):
+    """创建螺纹钢的tick，datetime为写入时间"""
+    tick = VtTickData()
+    tick.gatewayName = 'CTP'
+    tick.symbol = 'rb1901'
+    tick.exchange = 'SHFE'
+    tick.vtSymbol = 'rb1901.SHFE'
+    tick.datetime = datetime.now()
+    tick.date = '2018-07-01'
+    tick.time = '09:00:00.500'
+    tick.lastPrice = lastPrice
+    tick.volume = volume
+    tick.openInterest = 1000
+    return tick
+
+
+########################################################################
+class FakeEventEngine(object):
+    """只记录事件的事件引擎"""
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self.eventList = []
+
+    #----------------------------------------------------------------------
+    def put(self, event):
+        self.eventList.append((event, datetime.now()))
+
+
+#----------------------------------------------------------------------
+def runReader(busName, conn):
+    """读取进程：按命令连接总线、读取tick，把结果发回测试进程"""
+    engine = FakeEventEngine()
+    reader = TickBusReader(engine, busName)
+
+    while True:
+        cmd = conn.recv()
+        if cmd == 'attach':
+            reader.checkDirectory()
+            conn.send([r[0] for r in reader.readerList])
+        elif cmd == 'poll':
+            reader.poll()
+            tickList = []
+            for event, receiveTime in engine.eventList:
+                tick = event.dict_['data']
+                lag = (receiveTime - tick.datetime).total_seconds()
+                tickList.append((event.type_, tick.vtSymbol, tick.gatewayName, tick.lastPrice,
+                                 tick.volume, tick.openInterest, tick.date, tick.time, lag))
+            engine.eventList = []
+            conn.send((tickList, dict(reader.lostDict), [r[2] for r in reader.readerList]))
+        else:
+            reader.stop()
+            conn.send(None)
+            return
+
+
+########################################################################
+@unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), u'需要fork启动子进程')
+class TickBusRoundTripTest(unittest.TestCase):
+    """写入进程和读取进程之间的往返"""
+
+    #----------------------------------------------------------------------
+    def setUp(self):
+        busName = 'vnpyTickTest%d' % os.getpid()
+        self.writer = TickBusWriter(busName, capacity=CAPACITY, maxSymbols=8)
+
+        # 合约缓冲区在第一个tick写入时创建，读取方只接收连接之后写入的tick
+        self.writer.writeTick(makeTick(3999.0, 0))
+
+        ctx = multiprocessing.get_context('fork')
+        self.conn, childConn = ctx.Pipe()
+        self.process = ctx.Process(target=runReader, args=(busName, childConn))
+        self.process.daemon = True
+        self.process.start()
+
+        self.assertEqual(self.request('attach'), ['rb1901.SHFE'])
+
+    #----------------------------------------------------------------------
+    def tearDown(self):
+        self.request('stop')
+        self.process.join(5)
+        self.writer.close()
+
+    #----------------------------------------------------------------------
+    def request(self, cmd):
+        """向读取进程发送命令并等待结果"""
+        self.conn.send(cmd)
+        self.assertTrue(self.conn.poll(10), u'读取进程无响应')
+        return self.conn.recv()
+
+    #----------------------------------------------------------------------
+    def writeTicks(self, count, startPrice):
+        """写入count个tick，返回写入的价格列表"""
+        priceList = [startPrice + i for i in range(count)]
+        for i, price in enumerate(priceList):
+            self.writer.writeTick(makeTick(price, 100 + i))
+        return priceList
+
+    #----------------------------------------------------------------------
+    def testRoundTrip(self):
+        """读取的tick与写入的一致，没有丢失"""
+        priceList = self.writeTicks(10, 4000.0)
+        writeTime = time.time()
+        tickList, lostDict, readCountList = self.request('poll')
+        pollSeconds = time.time() - writeTime
+
+        # 每个tick推送通用事件和合约事件
+        self.assertEqual(len(tickList), 20)
+        generalList = [t for t in tickList if t[0] == EVENT_TICK]
+        self.assertEqual([t[3] for t in generalList], priceList)
+        self.assertEqual(sorted(set(t[0] for t in tickList)), [EVENT_TICK, EVENT_TICK + 'rb1901.SHFE'])
+
+        vtSymbol, gatewayName, lastPrice, volume, openInterest, date, time_, lag = generalList[0][1:]
+        self.assertEqual((vtSymbol, gatewayName), ('rb1901.SHFE', 'CTP'))
+        self.assertEqual(volume, 100)
+        self.assertIsInstance(volume, int)
+        self.assertEqual(openInterest, 1000)
+        self.assertEqual((date, time_), ('2018-07-01', '09:00:00.500'))
+
+        # 读取位置追上写入位置，从写入到推入事件引擎的延迟不超过一次轮询的往返时间
+        self.assertEqual(lostDict, {})
+        self.assertEqual(readCountList, [self.writer.bufferDict['rb1901.SHFE'].writeCount])
+        for t in generalList:
+            self.assertGreaterEqual(t[-1], 0)
+            self.assertLess(t[-1], pollSeconds + 1)
+
+        # 没有新数据时不重复推送
+        self.assertEqual(self.request('poll')[0], [])
+
+    #----------------------------------------------------------------------
+    def testSlowReader(self):
+        """读取落后超过缓冲区容量时，丢弃被覆盖的tick并计入丢失数量"""
+        self.writeTicks(10, 4000.0)
+        self.request('poll')
+
+        priceList = self.writeTicks(CAPACITY + 5, 5000.0)
+        tickList, lostDict, readCountList = self.request('poll')
+
+        # 写入方可能正在覆盖最早的一条，只读取最近的CAPACITY-1条
+        generalList = [t for t in tickList if t[0] == EVENT_TICK]
+        self.assertEqual([t[3] for t in generalList], priceList[-(CAPACITY-1):])
+        self.assertEqual(lostDict, {'rb1901.SHFE': 6})
+        self.assertEqual(readCountList, [self.writer.bufferDict['rb1901.SHFE'].writeCount])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,6 +19,8 @@ import traceback
 from vnpy.api.binance.exceptions import BinanceAPIException, BinanceRequestException, BinanceWithdrawException
 from vnpy.api.binance.websockets import BinanceSocketManager
 from vnpy.api.binance.client import Client
+from vnpy.api.rest.vnhttp import httpPool
+from vnpy.api.rest.vnrest import RestScheduler, PRIORITY_TRADE, PRIORITY_QUERY, LIMIT_ALL
 import urllib, requests
 import urllib.parse
 
@@ -32,6 +34,23 @@ FUNCTIONCODE_SELL_ORDER_BINANCE = 'sell'
 FUNCTIONCODE_CANCEL_ORDER_BINANCE = 'cancel_order'
 FUNCTIONCODE_GET_EXCHANGE_INFO = "get_exchange_info"
 
+# 请求的端点、优先级和权重 {方法: (端点, 优先级, 权重)}，权重见币安REST接口文档
+BINANCE_REQUEST_DICT = {
+    FUNCTIONCODE_BUY_ORDER_BINANCE: ('order', PRIORITY_TRADE, 1),
+    FUNCTIONCODE_SELL_ORDER_BINANCE: ('order', PRIORITY_TRADE, 1),
+    FUNCTIONCODE_CANCEL_ORDER_BINANCE: ('cancel', PRIORITY_TRADE, 1),
+    FUNCTIONCODE_GET_ACCOUNT_BINANCE: ('account', PRIORITY_QUERY, 5),
+    FUNCTIONCODE_GET_OPEN_ORDERS: ('openOrders', PRIORITY_QUERY, 1),        # 不指定合约时为40
+    FUNCTIONCODE_GET_ALL_ORDERS: ('allOrders', PRIORITY_QUERY, 5),
+    FUNCTIONCODE_GET_EXCHANGE_INFO: ('exchangeInfo', PRIORITY_QUERY, 1),
+}
+
+# 限流 {端点: (每秒令牌数, 令牌桶容量)}：权重每分钟1200（每秒20），委托每秒10个
+BINANCE_LIMIT_DICT = {
+    LIMIT_ALL: (20, 100),
+    'order': (10, 10),
+}
+
 # 印射关系
 binance_exchanges_dict = {
     "bcc" : "bch",
@@ -78,9 +97,8 @@ class BinanceSpotApi(object):
         self.bm = None          # sockets 管理器
 
         self.reqID = 0              # 请求编号
-        # self.reqQueue = Queue()     # 请求队列
-        self.reqQueue = []          # 请求的队列
-        self.reqThread = Thread(target=self.processQueue)   # 请求处理线程
+        self.scheduler = RestScheduler('Binance', workers=4, limitDict=BINANCE_LIMIT_DICT,
+                                       onError=self.onSchedulerError)    # 请求调度器
 
         self.active = False      # API工作状态
 
@@ -104,38 +122,17 @@ class BinanceSpotApi(object):
         self.bm.start()
 
         self.active = True
-        self.reqThread.start()
+        self.scheduler.start()
 
     #----------------------------------------------------------------------
-    def processQueue(self):
-        """处理请求队列中的请求"""
-        while self.active:
-
-            if len(self.reqQueue) == 0:
-                sleep(0.1)
-                continue
-
-            (Type , req) = self.reqQueue[0]
-
-            if req is None:
-                self.reqQueue.pop(0)
-                continue
+    def onSchedulerError(self, ex, tb):
+        """请求调度器中的异常"""
+        self.writeError(u'processRequest exception:{},{}'.format(str(ex), tb))
 
-            callback = req.get('callback', None)
-            reqID = req.get('reqID', None)
-
-            try:
-                data = self.processRequest(req)
-                # 请求成功
-                if data != None :
-                    if self.DEBUG:
-                        self.writeLog(callback.__name__)
-                    callback(data, req, reqID)
-            except Exception as ex:
-                self.writeError(u'processQueue exception:{},{}'.format(str(ex), traceback.format_exc()))
-
-            self.reqQueue.pop(0)
-            sleep(0.1)
+    #----------------------------------------------------------------------
+    def getReqMetrics(self):
+        """请求调度统计（队列长度、各端点耗时）"""
+        return self.scheduler.getMetrics()
 
     #----------------------------------------------------------------------
     def processRequest(self, req):
@@ -260,8 +257,7 @@ class BinanceSpotApi(object):
         if self.bm != None:
             self.bm.close()
         
-        if self.reqThread.isAlive():
-            self.reqThread.join()    
+        self.scheduler.stop()
 
     #-----------------------------------------------------------------------
     def sendTradingRequest(self, method , callback , kwargs = None,optional=None):
@@ -275,17 +271,17 @@ class BinanceSpotApi(object):
         req['kwargs'] = kwargs
         req['reqID'] = self.reqID
 
+        endpoint, priority, weight = BINANCE_REQUEST_DICT.get(method, (method, PRIORITY_QUERY, 1))
+        if method == FUNCTIONCODE_GET_OPEN_ORDERS and not (kwargs or {}).get('symbol'):
+            weight = 40
+
         # 如果方法是查询委托订单和查询账号信息，则需要检查是否重复
+        key = None
         if method in [FUNCTIONCODE_GET_OPEN_ORDERS , FUNCTIONCODE_GET_ACCOUNT_BINANCE ]:
-            flag = False
-            for use_method ,r in self.reqQueue:
-                if use_method == method:
-                    flag = True
-                    break
-            if False == flag:
-                self.reqQueue.append( (method , req))
-        else:
-            self.reqQueue.append( (method , req))
+            key = method
+
+        self.scheduler.submit(self.processRequest, (req,), endpoint=endpoint, priority=priority,
+                              weight=weight, key=key)
 
         # 返回请求编号
         return self.reqID
@@ -384,7 +380,7 @@ class BinanceSpotApi(object):
             headers.update(add_to_headers)
         postdata = urllib.parse.urlencode(params)
         try:
-            response = requests.get(url, postdata, headers=headers, timeout=5 )
+            response = httpPool.get(url, postdata, headers=headers, timeout=5 )
             if response.status_code == 200:
                 return response.json()
             else:
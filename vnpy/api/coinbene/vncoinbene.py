@@ -2,12 +2,13 @@
 import sys
 import time
 import hashlib
-import requests
 import json
 from queue import Queue, Empty
 from multiprocessing.dummy import Pool
 from threading import Thread
 
+from vnpy.api.rest.vnhttp import httpPool
+
 #  此处为APIID SECRET
 apiid = ' '
 secret = ' '
@@ -40,7 +41,6 @@ class coinbeneRestApi(object):
         self.reqid = 0
         self.queue = Queue()
         self.pool = None
-        self.sessionDict = {}  # 会话对象字典
 
         self.header = {
             'Content-Type': 'application/x-www-form-urlencoded',
@@ -85,13 +85,10 @@ class coinbeneRestApi(object):
 
     def processReq(self, req, i):
         """处理请求"""
-        method, callback, params, postdict, reqid = req
-
-        # 使用长连接的session，比短连接的耗时缩短80%
-        session = self.sessionDict[i]
-        resp = session.request(method, url, headers=header, params=params, data=postdict)
+        method, path, callback, params, postdict, reqid = req
 
-        # resp = requests.request(method, url, headers=header, params=params, data=postdict)
+        # 使用共享连接池的长连接，比短连接的耗时缩短80%
+        resp = httpPool.request(method, REST_HOST + path, headers=self.header, params=params, data=postdict)
 
         code = resp.status_code
         d = resp.json()
@@ -105,8 +102,6 @@ class coinbeneRestApi(object):
 
     def run(self, i):
         """连续运行"""
-        self.sessionDict[i] = requests.Session()
-
         while self.active:
             try:
                 req = self.queue.get(timeout=1)
@@ -156,12 +151,10 @@ class coinbeneRestApi(object):
         return self.http_request(url,data=dic,i=i)
 
     def http_request(self, url, data,i=0):
-        session = self.sessionDict[i]
         if data == None:
-            reponse = session.request(method, url, headers=header_dict, params=params, data=postdict)
-            reponse = requests.get(url,headers=header_dict)
+            reponse = httpPool.get(url,headers=header_dict)
         else:
-            reponse = requests.post(url,data=json.dumps(data),headers=header_dict)
+            reponse = httpPool.post(url,data=json.dumps(data),headers=header_dict)
         try:
             if reponse.status_code == 200:
                 return json.loads(reponse.text)
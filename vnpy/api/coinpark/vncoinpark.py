@@ -13,6 +13,8 @@ import base64
 import json
 from collections import OrderedDict
 
+from vnpy.api.rest.vnhttp import httpPool
+
 class vncoinpark():
 
     def __init__(self,base_url = 'https://api.coinpark.cc/v1'):
@@ -26,7 +28,7 @@ class vncoinpark():
         """request public url"""
         r_url = self.base_url + api_url
         try:
-            r = requests.request(method, r_url, params=payload)
+            r = httpPool.request(method, r_url, params=payload)
             r.raise_for_status()
             if r.status_code == 200:
                 j = r.json()
@@ -53,7 +55,7 @@ class vncoinpark():
         sign = self.getSign(s_cmds,self.secret)
 
         try:
-            r = requests.post(r_url, data={'cmds':s_cmds, 'apikey':self.key,'sign':sign})
+            r = httpPool.post(r_url, data={'cmds':s_cmds, 'apikey':self.key,'sign':sign})
             r.raise_for_status()
             if r.status_code == 200:
                 j = r.json()
@@ -13,6 +13,8 @@ import base64
 import json
 from collections import OrderedDict
 
+from vnpy.api.rest.vnhttp import httpPool
+
 class Fcoin():
 
     def __init__(self,base_url = 'https://api.fcoin.com/v2/'):
@@ -27,7 +29,7 @@ class Fcoin():
         """request public url"""
         r_url = self.base_url + api_url
         try:
-            r = requests.request(method, r_url, params=payload)
+            r = httpPool.request(method, r_url, params=payload)
             r.raise_for_status()
             if r.status_code == 200:
                 return True, r.json()
@@ -73,7 +75,7 @@ class Fcoin():
         }
 
         try:
-            r = requests.request(method, full_url, headers = headers, json=payload)
+            r = httpPool.request(method, full_url, headers = headers, json=payload)
             r.raise_for_status()
             if r.status_code == 200:
                 return True, r.json()
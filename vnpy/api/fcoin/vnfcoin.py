@@ -25,6 +25,8 @@ import random
 import traceback
 
 from vnpy.trader.vtFunction import systemSymbolToVnSymbol , VnSymbolToSystemSymbol
+from vnpy.api.rest.vnhttp import httpPool
+from vnpy.api.rest.vnrest import RestScheduler, PRIORITY_TRADE, PRIORITY_QUERY, LIMIT_ALL
 
 FCOIN_MARKET_URL = "api.fcoin.com/v2"
 FCOIN_TRADE_URL = "api.fcoin.com/v2"
@@ -37,6 +39,14 @@ FUNCTIONCODE_POST_SEND_ORDERS_FCOIN = "send_order"
 FUNCTIONCODE_POST_CANCEL_ORDERS_FCOIN = "cancel_order"
 FUNCTIONCODE_GET_ORDER_INFO_FCOIN = "order_info"
 FUNCTIONCODE_GET_ORDER_LIST_FCOIN = "order_list"
+
+# 委托、撤单优先于查询
+FCOIN_TRADE_METHODS = [FUNCTIONCODE_POST_SEND_ORDERS_FCOIN, FUNCTIONCODE_POST_CANCEL_ORDERS_FCOIN]
+
+# 限流 {端点: (每秒令牌数, 令牌桶容量)}：每个用户每10秒100个请求
+FCOIN_LIMIT_DICT = {
+    LIMIT_ALL: (10, 20),
+}
 '''
 交易接口
 '''
@@ -49,9 +59,8 @@ class Fcoin_TradeApi(object):
         
         self.active = False         # API工作状态   
         self.reqID = 0              # 请求编号
-        #self.reqQueue = Queue()    # 请求队列
-        self.reqQueue = []          # 请求的队列
-        self.reqThread = Thread(target=self.processQueue)   # 请求处理线程      
+        self.scheduler = RestScheduler('Fcoin', workers=4, limitDict=FCOIN_LIMIT_DICT,
+                                       onError=self.onSchedulerError)    # 请求调度器
 
         self.account_id = None
 
@@ -80,38 +89,22 @@ class Fcoin_TradeApi(object):
         return None
 
     #----------------------------------------------------------------------
-    def processQueue(self):
-        """处理请求队列中的请求"""
-        while self.active:
+    def executeRequest(self, req):
+        """在请求调度器的线程中执行请求，成功时调用回调函数"""
+        data = self.processRequest(req)
+        # 请求成功
+        if data != None :
+            req['callback'](data, req, req['reqID'])
 
-            if len(self.reqQueue) == 0:
-                sleep(0.1)
-                continue
-
-            (Type , req) = self.reqQueue[0]
-            callback = req['callback']
-            reqID = req['reqID']
-            try:
-                data = self.processRequest(req)
-                # 请求成功
-                if data != None :
-                    # print "11 " ,callback , data, req, reqID
-                    callback(data, req, reqID)
-                    # print "22"
-            except Exception as ex:
-                print('{} processQueue Exception:{} {}'.format(datetime.now(), str(ex),traceback.format_exc()), file=sys.stderr)
-            self.reqQueue.pop(0)
-            sleep(0.1)
-
-    #----------------------------------------------------------------------
-    def is_same_req(self, req1 , req2):
-        flag = False
-        try:
-            if req1["url"] == req2["url"]:
-                return True
-        except Exception as ex:
-            print(u'Error in is_same_req , req1:{} , req2:{},exception:{}'.format(req1 , req2,str(ex)),file=sys.stderr)
-        return flag
+    #----------------------------------------------------------------------
+    def onSchedulerError(self, ex, tb):
+        """请求调度器中的异常"""
+        print('{} executeRequest Exception:{} {}'.format(datetime.now(), str(ex), tb), file=sys.stderr)
+
+    #----------------------------------------------------------------------
+    def getReqMetrics(self):
+        """请求调度统计（队列长度、各端点耗时）"""
+        return self.scheduler.getMetrics()
 
     #各种请求,获取数据方式
     # ----------------------------------------------------------------------
@@ -120,7 +113,7 @@ class Fcoin_TradeApi(object):
         r_url = "https://" + url + resource
         postdata = urlparse.urlencode(params)
         try:
-            r = requests.get(r_url, postdata )
+            r = httpPool.get(r_url, postdata )
             r.raise_for_status()
         except Exception as ex:
             print("httpGet failed, detail is:%s" %ex)
@@ -177,7 +170,7 @@ class Fcoin_TradeApi(object):
 
         r = None
         try:
-            r = requests.request(method, full_url, headers = headers, json=kwargs)
+            r = httpPool.request(method, full_url, headers = headers, json=kwargs)
             r.raise_for_status()
         except Exception as ex:
             print(u'signed_request exception:{},{}'.format(str(ex), traceback.format_exc()), file=sys.stderr)
@@ -217,25 +210,15 @@ class Fcoin_TradeApi(object):
         req['reqID'] = self.reqID
 
         try:
+            # 查询余额、委托列表的请求不重复，撤单、查询委托的请求同一url不重复
+            key = None
             if method in [FUNCTIONCODE_GET_GET_BALANCE_FCOIN,FUNCTIONCODE_GET_ORDER_LIST_FCOIN ]:
-                flag = False
-                for use_method ,r in self.reqQueue:
-                    if use_method == method:
-                        flag = True
-                        break
-                if False == flag:
-                    self.reqQueue.append( (method , req))
+                key = method
             elif method in [ FUNCTIONCODE_POST_CANCEL_ORDERS_FCOIN,FUNCTIONCODE_GET_ORDER_INFO_FCOIN ]:
-                flag = False
-                for use_method ,r in self.reqQueue:
-                    if use_method == method:
-                        if self.is_same_req( r , req) == True:
-                            flag = True
-                            break
-                if False == flag:
-                    self.reqQueue.append( (method , req))
-            else:
-                self.reqQueue.append((method, req))
+                key = (method, resource)
+
+            priority = PRIORITY_TRADE if method in FCOIN_TRADE_METHODS else PRIORITY_QUERY
+            self.scheduler.submit(self.executeRequest, (req,), endpoint=method, priority=priority, key=key)
         except Exception as ex:
             print(u'sendRequest exception:{},{}'.format(str(ex), traceback.format_exc()), file=sys.stderr)
         
@@ -253,15 +236,13 @@ class Fcoin_TradeApi(object):
         self.secretKey = secretKey
         
         self.active = True
-        self.reqThread.start()
+        self.scheduler.start()
     
     # ----------------------------------------------------------------------
     def exit(self):
         """退出"""
         self.active = False
-        
-        if self.reqThread.isAlive():
-            self.reqThread.join()  
+        self.scheduler.stop()
 
     '''
     获得所有交易对
@@ -435,7 +416,7 @@ class Fcoin_DataApi(object):
         r_url = "https://" + url + resource
         postdata = urlparse.urlencode(params)
         try:
-            r = requests.get(r_url, postdata )
+            r = httpPool.get(r_url, postdata )
             r.raise_for_status()
         except Exception as ex:
             print(u'http_get_request exception:{}'.format(str(ex),traceback.format_exc()),file=sys.stderr)
@@ -12,9 +12,9 @@ import hmac
 import hashlib
 import json
 import gzip, binascii, os
-import http.client as httplib
 import traceback
 
+from vnpy.api.rest.vnhttp import httpPool
 from vnpy.trader.vtFunction import systemSymbolToVnSymbol , VnSymbolToSystemSymbol
 
 import json
@@ -187,11 +187,8 @@ class Gate_TradeApi(object):
 
     #----------------------------------------------------------------------
     def httpGet(self, url, resource, params=''):
-        conn = httplib.HTTPSConnection(url, timeout=10)
-        conn.request("GET", resource + '/' + params)
-        response = conn.getresponse()
-        data = response.read().decode('utf-8')
-        return json.loads(data)
+        response = httpPool.get('https://' + url + resource + '/' + params, timeout=10)
+        return response.json()
 
     #----------------------------------------------------------------------
     def httpPost(self, url, resource, params ):
@@ -203,15 +200,10 @@ class Gate_TradeApi(object):
             "SIGN":self.getSign(params, self.secretKey)
         }
 
-        conn = httplib.HTTPSConnection(url, timeout=10 )
         tempParams = urllib.parse.urlencode(params) if params else ''
 
-        conn.request("POST", resource, tempParams, headers)
-        response = conn.getresponse()
-        data = response.read().decode('utf-8')
-
-        conn.close()
-        return json.loads(data)
+        response = httpPool.post('https://' + url + resource, tempParams, headers=headers, timeout=10)
+        return response.json()
 
     #----------------------------------------------------------------------
     def get_symbols(self):
@@ -357,12 +349,9 @@ class Gate_DataApi(object):
 
     # ----------------------------------------------------------------------
     def http_get_request(self, url, resource ,params  ):
-        conn = httplib.HTTPSConnection(url, timeout=10)
-        conn.request("GET", resource + '/' + params)
         try:
-            response = conn.getresponse()
-            data = response.read().decode('utf-8')
-            return json.loads(data)
+            response = httpPool.get('https://' + url + resource + '/' + params, timeout=10)
+            return response.json()
         except Exception as e:
             print("httpGet failed, detail is:%s" %e)
             return {"status":"fail","msg":e}
@@ -12,10 +12,10 @@ import gzip, binascii, os
 
 import urllib , requests
 
-import websocket    
 import time
 
 from vnpy.trader.vtFunction import systemSymbolToVnSymbol , VnSymbolToSystemSymbol
+from vnpy.api.ws.vnws import wsTransport
 
 import json
 
@@ -32,25 +32,41 @@ class Gate_WSDataApi(object):
         self.apiKey = ''        # 用户名
         self.secretKey = ''     # 密码
         
-        self.ws = None          # websocket应用对象
-        self.thread = None      # 工作线程
+        self.ws = None          # wsTransport中的连接
 
         self.subscribeStrList = set([])
     #----------------------------------------------------------------------
     def reconnect(self):
         """重新连接"""
         # 首先关闭之前的连接
-        #self.close()
+        self.close()
         
         # 再执行重连任务
-        self.ws = websocket.WebSocketApp(self.host, 
-                                         on_message=self.onMessage,
-                                         on_error=self.onError,
-                                         on_close=self.onClose,
-                                         on_open=self.onOpen)        
-    
-        self.thread = Thread(target=self.ws.run_forever , args = (None , None , 60, 30))
-        self.thread.start()
+        self.createConnection()
+
+    #----------------------------------------------------------------------
+    def createConnection(self):
+        """在wsTransport中创建连接，断线后自动重连，并重新发送订阅请求"""
+        self.ws = wsTransport.connect(self.host,
+                                      on_message=self.onMessage,
+                                      on_error=self.onError,
+                                      on_close=self.onClose,
+                                      on_open=self.onWsOpen,
+                                      pingInterval=60,
+                                      name='GateWSDataApi')
+
+    #----------------------------------------------------------------------
+    def onWsOpen(self, ws):
+        """连接成功，连接可能在wsTransport.connect返回前就已建立"""
+        self.ws = ws
+        self.onOpen(ws)
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """关闭连接"""
+        if self.ws:
+            self.ws.close()
+            self.ws = None
     
     #----------------------------------------------------------------------
     def connect_Subpot(self, apiKey , secretKey , trace = False):
@@ -59,19 +75,7 @@ class Gate_WSDataApi(object):
         self.secretKey = secretKey
         self.trace = trace
 
-        websocket.enableTrace(trace)
-
-        self.ws = websocket.WebSocketApp(self.host, 
-                                             on_message=self.onMessage,
-                                             on_error=self.onError,
-                                             on_close=self.onClose,
-                                             on_open=self.onOpen)        
-            
-        self.thread = Thread(target = self.ws.run_forever , args = (None , None , 60, 30))
-        # self.thread_heart = Thread(target = self.run_forever_heart)
-
-        self.thread.start()
-        # self.thread_heart.start()
+        self.createConnection()
 
     #----------------------------------------------------------------------
     def onMessage(self, ws, evt):
@@ -118,7 +122,11 @@ class Gate_WSDataApi(object):
             "method": method,
             "params": json_params
         }
-        self.ws.send( json.dumps(send_json))
+        if method.endswith('.subscribe'):
+            # 订阅请求登记在连接中，重连后重新发送
+            self.ws.subscribe((method, json.dumps(json_params)), json.dumps(send_json))
+        else:
+            self.ws.send( json.dumps(send_json))
 
     '''
     vngate_nwe.onMessage:{"error": null, "result": {"period": 86400, "open": "18.1604", "close": "17.03"
@@ -18,7 +18,9 @@ from multiprocessing.dummy import Pool
 from time import sleep
 
 
-from websocket import create_connection, _exceptions
+from vnpy.api.rest.vnhttp import httpPool
+from vnpy.api.rest.vnretry import RetryPolicy, RetryQueue
+from vnpy.api.ws.vnws import wsTransport, INFLATE_ZLIB
 
 
 # 常量定义
@@ -81,6 +83,11 @@ class TradeApi(object):
         self.queue = Queue()        # 请求队列
         self.pool = None            # 线程池
 
+        self.retryPolicy = RetryPolicy()                    # 失败请求的重试策略
+        self.retryQueue = RetryQueue(self.queue.put)        # 等待重试的请求
+        self.retryCount = 0         # 重试次数
+        self.deadCount = 0          # 放弃重试的请求数
+
         self.DEBUG = False
 
     # ----------------------------------------------------------------------
@@ -109,13 +116,16 @@ class TradeApi(object):
 
         # 异步模式
         if self.mode == self.ASYNC_MODE:
+            httpPool.setPoolSize(self.hostname, n)      # 每个工作线程一个连接
             self.pool = Pool(n)
             self.pool.map_async(self.run, range(n))
+            self.retryQueue.start()
         
     # ----------------------------------------------------------------------
     def close(self):
         """停止"""
         self.active = False
+        self.retryQueue.stop()
         self.pool.close()
         self.pool.join()
         
@@ -127,7 +137,7 @@ class TradeApi(object):
         if self.DEBUG:
             print('httpGet:{} {}'.format(url, params))
         try:
-            response = requests.get(url, postdata, headers=headers, timeout=TIMEOUT)
+            response = httpPool.get(url, postdata, headers=headers, timeout=TIMEOUT)
             if response.status_code == 200:
                 return True, response.json()
             else:
@@ -142,7 +152,7 @@ class TradeApi(object):
         postdata = json.dumps(params)
         
         try:
-            response = requests.post(url, postdata, headers=headers, timeout=TIMEOUT)
+            response = httpPool.post(url, postdata, headers=headers, timeout=TIMEOUT)
             if response.status_code == 200:
                 return True, response.json()
             else:
@@ -168,6 +178,7 @@ class TradeApi(object):
         """API GET"""
         method = 'GET'
         
+        params.pop('Signature', None)       # 重试时去掉上次的签名
         params.update(self.generateSignParams())
         params['Signature'] = createSign(params, method, self.hostname, path, self.secretKey)
         
@@ -189,12 +200,15 @@ class TradeApi(object):
         return self.httpPost(url, params)
     
     # ----------------------------------------------------------------------
-    def addReq(self, path, params, func, callback):
-        """添加请求"""       
+    def addReq(self, path, params, func, callback, idempotent=True):
+        """
+        添加请求
+        idempotent: 请求可以重复提交（查询、撤单），失败后可以重试；委托重复提交可能重复下单，不重试
+        """       
         # 异步模式
         if self.mode == self.ASYNC_MODE:
             self.reqid += 1
-            req = (path, params, func, callback, self.reqid)
+            req = (path, params, func, callback, self.reqid, idempotent, 1)
             self.queue.put(req)
             return self.reqid
         # 同步模式
@@ -204,7 +218,7 @@ class TradeApi(object):
     # ----------------------------------------------------------------------
     def processReq(self, req):
         """处理请求"""
-        path, params, func, callback, reqid = req
+        path, params, func, callback, reqid, idempotent, attempt = req
         result, data = func(path, params)
         
         if result:
@@ -215,9 +229,30 @@ class TradeApi(object):
                 self.onError(msg, reqid)
         else:
             self.onError(data, reqid)
-            
-            # 失败的请求重新放回队列，等待下次处理
-            self.queue.put(req)
+            self.retryReq(req, data)
+
+    # ----------------------------------------------------------------------
+    def retryReq(self, req, msg):
+        """失败的请求按重试策略延迟后放回队列，不能重试的交给onDeadLetter"""
+        path, params, func, callback, reqid, idempotent, attempt = req
+
+        if self.active and self.retryPolicy.canRetry(attempt, idempotent):
+            delay = self.retryPolicy.getDelay(attempt)
+            if self.retryQueue.add((path, params, func, callback, reqid, idempotent, attempt + 1), delay):
+                self.retryCount += 1
+                return
+            msg = u'等待重试的请求过多：%s' %msg
+
+        self.deadCount += 1
+        self.onDeadLetter(req, msg)
+
+    # ----------------------------------------------------------------------
+    def getReqMetrics(self):
+        """请求统计：队列中的请求数、等待重试的请求数、重试次数、放弃重试的请求数"""
+        return {'queued': self.queue.qsize(),
+                'retrying': self.retryQueue.size(),
+                'retryCount': self.retryCount,
+                'deadCount': self.deadCount}
     
     # ----------------------------------------------------------------------
     def run(self, n):
@@ -395,7 +430,7 @@ class TradeApi(object):
         func = self.apiPost
         callback = self.onPlaceOrder
 
-        return self.addReq(path, params, func, callback)           
+        return self.addReq(path, params, func, callback, idempotent=False)           
     
     #----------------------------------------------------------------------
     def cancelOrder(self, orderid):
@@ -427,6 +462,11 @@ class TradeApi(object):
     def onError(self, msg, reqid):
         """错误回调"""
         print('onError:{},{}'.format(msg, reqid),file=sys.stderr)
+
+    #----------------------------------------------------------------------
+    def onDeadLetter(self, req, msg):
+        """放弃重试的请求回调，req为(path, params, func, callback, reqid, idempotent, attempt)"""
+        print('onDeadLetter:{},{},{}'.format(req[0], req[4], msg),file=sys.stderr)
         
     #----------------------------------------------------------------------
     def onGetSymbols(self, data, reqid):
@@ -500,12 +540,11 @@ class DataApi(object):
     #----------------------------------------------------------------------
     def __init__(self):
         """Constructor"""
-        self.ws = None
+        self.ws = None              # wsTransport中的连接
         self.url = ''
         
         self.reqid = 0
         self.active = False
-        self.thread = None # Thread(target=self.run)
         
         self.subDict = {}
         
@@ -516,52 +555,31 @@ class DataApi(object):
         self.DEBUG = False
         
     #----------------------------------------------------------------------
-    def run(self):
-        """执行连接"""
-        while self.active:
-            try:
-                stream = self.ws.recv()
-                result = zlib.decompress(stream, 47).decode('utf-8')
-                data = json.loads(result)
-                self.onData(data)
-            except zlib.error:
-                self.onError(u'数据解压出错：%s' %stream)
-            except:
-                self.onError('行情服务器连接断开')
-                result = self.reconnect()
-                if not result:
-                    self.onError(u'等待3秒后再次重连')
-                    sleep(3)
-                else:
-                    self.onError(u'行情服务器重连成功')
-                    self.resubscribe()
-
-    #----------------------------------------------------------------------
-    def reconnect(self):
-        """重连"""
-        try:
-            if self.DEBUG:
-                print('DataApi:reconnect:{}'.format(self.url))
-            if not self.proxyHost:
-                self.ws = create_connection(self.url)
-            else:
-                self.ws = create_connection(self.url, 
-                                            http_proxy_host=self.proxyHost, 
-                                            http_proxy_port=self.proxyPort)
-            return True
-        except:
-            msg = traceback.format_exc()
-            self.onError(u'行情服务器重连失败：%s' %msg)            
-            return False
-        
+    def onOpen(self, ws):
+        """连接成功，订阅请求由wsTransport重新发送"""
+        self.ws = ws        # 连接可能在wsTransport.connect返回前就已建立
+        if ws.connectCount > 1:
+            self.onError(u'行情服务器重连成功')
+
     #----------------------------------------------------------------------
-    def resubscribe(self):
-        """重新订阅"""
-        d = self.subDict
-        self.subDict = {}
-        for topic in d.keys():
-            self.subTopic(topic)
-        
+    def onClose(self, ws):
+        """连接断开，wsTransport自动重连"""
+        if self.active:
+            self.onError(u'行情服务器连接断开')
+
+    #----------------------------------------------------------------------
+    def onWsError(self, ws, ex):
+        """连接出错"""
+        if isinstance(ex, zlib.error):
+            self.onError(u'数据解压出错：%s' %ex)
+        else:
+            self.onError(u'行情服务器连接失败：%s' %ex)
+
+    #----------------------------------------------------------------------
+    def onWsMessage(self, ws, data):
+        """收到已解压、解析的数据"""
+        self.onData(data)
+
     #----------------------------------------------------------------------
     def connect(self, url, proxyHost='', proxyPort=0):
         """连接"""
@@ -570,21 +588,21 @@ class DataApi(object):
         self.proxyPort = proxyPort
         
         try:
-            if not self.proxyHost:
-                self.ws = create_connection(self.url)
-            else:
-                self.ws = create_connection(self.url, 
-                                            http_proxy_host=self.proxyHost, 
-                                            http_proxy_port=self.proxyPort)
-            
+            proxy = 'http://%s:%s' %(self.proxyHost, self.proxyPort) if self.proxyHost else None
             self.active = True
-
-            if self.thread is None:
-                self.thread = Thread(target=self.run)
-            self.thread.start()
-            
+            self.ws = wsTransport.connect(self.url,
+                                          on_open=self.onOpen,
+                                          on_message=self.onWsMessage,
+                                          on_error=self.onWsError,
+                                          on_close=self.onClose,
+                                          inflate=INFLATE_ZLIB,
+                                          decodeJson=True,
+                                          timeout=30,
+                                          proxy=proxy,
+                                          name='HuobiDataApi')
             return True
         except:
+            self.active = False
             msg = traceback.format_exc()
             self.onError(u'行情服务器连接失败：%s' %msg)
             return False 
@@ -594,8 +612,6 @@ class DataApi(object):
         """停止"""
         if self.active:
             self.active = False
-            if self.thread is not None:
-                self.thread.join()
             self.ws.close()
         
     #----------------------------------------------------------------------
@@ -614,7 +630,7 @@ class DataApi(object):
     
     #----------------------------------------------------------------------
     def subTopic(self, topic):
-        """订阅主题"""
+        """订阅主题，断线重连后由wsTransport重新订阅"""
         if topic in self.subDict:
             return
         
@@ -623,7 +639,9 @@ class DataApi(object):
             'sub': topic,
             'id': str(self.reqid)
         }
-        self.sendReq(req)
+        if self.DEBUG:
+            print('DataApi.subTopic:{}'.format(req))
+        self.ws.subscribe(topic, json.dumps(req))
         
         self.subDict[topic] = str(self.reqid)
     
@@ -636,7 +654,7 @@ class DataApi(object):
             'unsub': topic,
             'id': self.subDict[topic]
         }
-        self.sendReq(req)
+        self.ws.unsubscribe(topic, json.dumps(req))
         
         del self.subDict[topic]
     
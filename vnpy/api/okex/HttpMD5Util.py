@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 #用于进行http请求，以及MD5加密，生成签名的工具类
 
-import http.client
 import urllib
 import json
 import hashlib
@@ -13,6 +12,8 @@ if six.PY2:
 elif six.PY3:
     from urllib.parse import urlencode
 
+from vnpy.api.rest.vnhttp import httpPool
+
 def buildMySign(params,secretKey):
     sign = ''
     for key in sorted(params.keys()):
@@ -21,24 +22,17 @@ def buildMySign(params,secretKey):
     return  hashlib.md5(data.encode("utf8")).hexdigest().upper()
 
 def httpGet(url,resource,params=''):
-    conn = http.client.HTTPSConnection(url, timeout=10)
-    conn.request("GET",resource + '?' + params)
-    response = conn.getresponse()
-    data = response.read().decode('utf-8')
-    return json.loads(data)
+    response = httpPool.get('https://' + url + resource + '?' + params, timeout=10)
+    return response.json()
 
 def httpPost(url,resource,params):
      headers = {
             "Content-type" : "application/x-www-form-urlencoded",
      }
-     conn = http.client.HTTPSConnection(url, timeout=10)
      temp_params = urlencode(params)
-     conn.request("POST", resource, temp_params, headers)
-     response = conn.getresponse()
-     data = response.read().decode('utf-8')
+     response = httpPool.post('https://' + url + resource, temp_params, headers=headers, timeout=10)
      params.clear()
-     conn.close()
-     return data
+     return response.text
 
 
         
@@ -6,13 +6,14 @@ import json
 from time import sleep
 from threading import Thread
 import traceback
-import websocket
 import requests
 import sys
 import ssl
 from datetime import datetime
 # API文档 https://github.com/okcoin-okex/OKEx.com-api-docs
 
+from vnpy.api.rest.vnhttp import httpPool
+from vnpy.api.ws.vnws import wsTransport, INFLATE_DEFLATE, WsConnectionClosedException
 from vnpy.api.okex.okexData import SPOT_TRADE_SIZE_DICT,SPOT_REST_ERROR_DICT, FUTURES_ERROR_DICT
 
 # OKEX网站
@@ -71,8 +72,26 @@ class OkexApi(object):
         self.apiKey = ''        # 用户名
         self.secretKey = ''     # 密码
   
-        self.ws = None          # websocket应用对象  现货对象
-        self.thread = None      # 初始化线程
+        self.ws = None          # wsTransport中的连接  现货对象
+
+    #----------------------------------------------------------------------
+    def createConnection(self):
+        """在wsTransport中创建连接，断线后自动重连并再次调用onOpen"""
+        self.ws = wsTransport.connect(self.host,
+                                      on_message=self.onMessage,
+                                      on_error=self.onError,
+                                      on_close=self.onClose,
+                                      on_open=self.onWsOpen,
+                                      inflate=INFLATE_DEFLATE,
+                                      heartbeat=(25, {'event': 'ping'}),
+                                      timeout=60,
+                                      name='OkexSpotApi')
+
+    #----------------------------------------------------------------------
+    def onWsOpen(self, ws):
+        """连接成功，连接可能在wsTransport.connect返回前就已建立"""
+        self.ws = ws
+        self.onOpen(ws)
 
     #----------------------------------------------------------------------
     def reconnect(self):
@@ -81,15 +100,7 @@ class OkexApi(object):
         self.close()
         try:
             # 再执行重连任务
-            self.ws = websocket.WebSocketApp(self.host,
-                                             on_message=self.onMessage,
-                                             on_error=self.onError,
-                                             on_close=self.onClose,
-                                             on_open=self.onOpen)
-
-            kwargs = {'sslopt': {'cert_reqs': ssl.CERT_NONE}}
-            self.thread = Thread(target=self.ws.run_forever, kwargs=kwargs)
-            self.thread.start()
+            self.createConnection()
         except Exception as ex:
             print(u'{} OkexApi reconnect exception :{},{}'.format(datetime.now(), str(ex), traceback.format_exc()),
                   file=sys.stderr)
@@ -108,19 +119,9 @@ class OkexApi(object):
         self.apiKey = apiKey
         self.secretKey = secretKey
         try:
-            # 是否开启日志
-            websocket.enableTrace(trace)
-
             # 创建websocket，绑定本地回调函数 onMessage/onError/onClose/onOpen
-            self.ws = websocket.WebSocketApp(self.host,
-                                                 on_message=self.onMessage,
-                                                 on_error=self.onError,
-                                                 on_close=self.onClose,
-                                                 on_open=self.onOpen)
-
-            kwargs = {'sslopt': {'cert_reqs': ssl.CERT_NONE}}
-            self.thread = Thread(target=self.ws.run_forever, kwargs=kwargs)
-            self.thread.start()
+            self.close()
+            self.createConnection()
         except Exception as ex:
             print(u'{} OkexApi connect exception :{},{}'.format(datetime.now(), str(ex), traceback.format_exc()),
                   file=sys.stderr)
@@ -143,10 +144,10 @@ class OkexApi(object):
         :return:
         """
 
-        if self.thread and self.thread.isAlive():
+        if self.ws:
             print(u'vnokex.close')
             self.ws.close()
-            self.thread.join()
+            self.ws = None
 
     #----------------------------------------------------------------------
     def onMessage(self, *args):
@@ -195,7 +196,9 @@ class OkexApi(object):
 
     # ----------------------------------------------------------------------
     def inflate(self,data):
-        """解压数据流"""
+        """解压数据流，wsTransport推送的数据已解压，直接返回"""
+        if isinstance(data, str):
+            return data
         decompress = zlib.decompressobj(
             -zlib.MAX_WBITS  # see above
         )
@@ -239,7 +242,7 @@ class OkexApi(object):
         # 若触发异常则重连
         try:
             self.ws.send(j)
-        except websocket.WebSocketConnectionClosedException as ex:
+        except WsConnectionClosedException as ex:
             print(u'vnokex.sendTradingRequest Exception:{}'.format(str(ex)),file=sys.stderr)
 
     #----------------------------------------------------------------------
@@ -254,7 +257,7 @@ class OkexApi(object):
         # 若触发异常则重连
         try:
             self.ws.send(j)
-        except websocket.WebSocketConnectionClosedException as ex:
+        except WsConnectionClosedException as ex:
             print(u'vnokex.sendDataRequest Exception:{},{}'.format(str(ex),traceback.format_exc()), file=sys.stderr)
         except Exception as ex:
             print(u'vnokex.sendDataRequest Exception:{},{}'.format(str(ex),traceback.format_exc()), file=sys.stderr)
@@ -270,7 +273,7 @@ class OkexApi(object):
             #print(u'vnokex.sendHeartBeat')
             j = json.dumps(d)
             self.ws.send(j)
-        except websocket.WebSocketConnectionClosedException as ex:
+        except WsConnectionClosedException as ex:
             print(u'vnokex.sendHeartBeat Exception:{}'.format(str(ex)), file=sys.stderr)
 
     #----------------------------------------------------------------------
@@ -296,7 +299,7 @@ class OkexApi(object):
         try:
             self.ws.send(j)
             return True
-        except websocket.WebSocketConnectionClosedException as ex:
+        except WsConnectionClosedException as ex:
             print(u'vnokex.login exception:{},{}'.format(str(ex), traceback.format_exc()), file=sys.stderr)
             return False
 
@@ -443,7 +446,7 @@ class WsFuturesApi(object):
         self.apiKey = ''  # 用户名
         self.secretKey = ''  # 密码
 
-        self.ws = None  # websocket应用对象  期货对象
+        self.ws = None  # wsTransport中的连接  期货对象
         self.active = False  # 还存活
 
         self.use_lever_rate = 10
@@ -457,16 +460,17 @@ class WsFuturesApi(object):
         self.secretKey = secretKey
         self.trace = trace
         try:
-            websocket.enableTrace(trace)
-
-            self.ws = websocket.WebSocketApp(self.host,
-                                             on_message=self.onMessage,
-                                             on_error=self.onError,
-                                             on_close=self.onClose,
-                                             on_open=self.onOpen)
-            kwargs = {'sslopt': {'cert_reqs': ssl.CERT_NONE}}
-            self.thread = Thread(target=self.ws.run_forever, kwargs=kwargs)
-            self.thread.start()
+            # 断线后wsTransport自动重连并再次调用onOpen
+            self.close()
+            self.ws = wsTransport.connect(self.host,
+                                          on_message=self.onMessage,
+                                          on_error=self.onError,
+                                          on_close=self.onClose,
+                                          on_open=self.onWsOpen,
+                                          inflate=INFLATE_DEFLATE,
+                                          heartbeat=(25, {'event': 'ping'}),
+                                          timeout=60,
+                                          name='OkexFuturesApi')
         except Exception as ex:
             print(u'{} wsFuturesApi connect exception :{},{}'.format(datetime.now(), str(ex),traceback.format_exc()), file=sys.stderr)
 
@@ -481,7 +485,7 @@ class WsFuturesApi(object):
         #postdata = urllib.urlencode(params)
         try:
             # response = requests.get(url, postdata, headers=headers, timeout=TIMEOUT)
-            response = requests.get(url, headers=headers, timeout=TIMEOUT)
+            response = httpPool.get(url, headers=headers, timeout=TIMEOUT)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -516,19 +520,27 @@ class WsFuturesApi(object):
             print(u'vnokex.futuresApi.sendHeartBeat')
             j = json.dumps(d)
             self.ws.send(j)
-        except websocket.WebSocketConnectionClosedException as ex:
+        except WsConnectionClosedException as ex:
             print(u'vnokex.futuresApi.sendHeartBeat Exception:{}'.format(str(ex)), file=sys.stderr)
 
+    # ----------------------------------------------------------------------
+    def onWsOpen(self, ws):
+        """连接成功，连接可能在wsTransport.connect返回前就已建立"""
+        self.ws = ws
+        self.onOpen(ws)
+
     # ----------------------------------------------------------------------
     def close(self):
         """关闭接口"""
-        if self.thread and self.thread.isAlive():
+        if self.ws:
             self.ws.close()
-            self.thread.join()
+            self.ws = None
 
     # ----------------------------------------------------------------------
     def inflate(self, data):
-        """解压数据流"""
+        """解压数据流，wsTransport推送的数据已解压，直接返回"""
+        if isinstance(data, str):
+            return data
         decompress = zlib.decompressobj(
             -zlib.MAX_WBITS  # see above
         )
@@ -633,7 +645,7 @@ class WsFuturesApi(object):
         # 若触发异常则重连
         try:
             self.ws.send(j)
-        except websocket.WebSocketConnectionClosedException as ex:
+        except WsConnectionClosedException as ex:
             print(u'OkexContractApi.sendTradingRequest exception:{},{}'.format(str(ex),traceback.format_exc()), file=sys.stderr)
         except Exception as ex:
             print(u'OkexContractApi.sendTradingRequest exception:{},{}'.format(str(ex), traceback.format_exc()), file=sys.stderr)
@@ -660,7 +672,7 @@ class WsFuturesApi(object):
         # 若触发异常则重连
         try:
             self.ws.send(j)
-        except websocket.WebSocketConnectionClosedException as ex:
+        except WsConnectionClosedException as ex:
             print(u'OkexContractApi.login exception:{},{}'.format(str(ex), traceback.format_exc()), file=sys.stderr)
         except Exception as ex:
             print(u'OkexContractApi.login exception:{},{}'.format(str(ex), traceback.format_exc()), file=sys.stderr)
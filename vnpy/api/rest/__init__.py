@@ -0,0 +1,5 @@
+# encoding: UTF-8
+
+from vnpy.api.rest.vnrest import RestScheduler, TokenBucket, LatencyHistogram, PRIORITY_TRADE, PRIORITY_QUERY, LIMIT_ALL
+from vnpy.api.rest.vnhttp import HttpSessionPool, httpPool
+from vnpy.api.rest.vnretry import RetryPolicy, RetryQueue
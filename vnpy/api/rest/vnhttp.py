@@ -0,0 +1,113 @@
+# encoding: UTF-8
+
+"""
+各交易所REST接口共享的HTTP连接池
+
+原来各接口直接调用requests.get/post，每次请求都新建TCP+TLS连接。
+HttpSessionPool为每个主机保存一个requests.Session，连接保持（keep-alive）并复用，
+每个主机的连接池大小可以单独设置，并按主机统计请求耗时。
+
+用法与requests相同：httpPool.get(url, params, headers=...)、httpPool.post(url, data, ...)。
+requests不支持HTTP/2，这里只使用HTTP/1.1的连接复用。
+"""
+
+from threading import Lock
+from time import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from vnpy.api.rest.vnrest import LatencyHistogram
+
+
+########################################################################
+class HttpSessionPool(object):
+    """按主机复用连接的HTTP会话池"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, poolSize=10, poolSizeDict=None):
+        """
+        poolSize: 每个主机缺省的最大连接数
+        poolSizeDict: 单独设置的主机最大连接数 {主机: 连接数}，主机如'api.huobi.pro'
+        """
+        self.poolSize = poolSize
+        self.poolSizeDict = dict(poolSizeDict or {})
+
+        self.lock = Lock()
+        self.sessionDict = {}           # 主机: Session
+        self.histDict = {}              # 主机: LatencyHistogram
+
+    #----------------------------------------------------------------------
+    def setPoolSize(self, host, poolSize):
+        """设置主机的最大连接数，已建立的会话重新创建"""
+        with self.lock:
+            self.poolSizeDict[host] = poolSize
+            session = self.sessionDict.pop(host, None)
+        if session:
+            session.close()
+
+    #----------------------------------------------------------------------
+    def getSession(self, host):
+        """主机对应的会话，没有时创建"""
+        session = self.sessionDict.get(host)
+        if session is None:
+            with self.lock:
+                session = self.sessionDict.get(host)
+                if session is None:
+                    poolSize = self.poolSizeDict.get(host, self.poolSize)
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=poolSize)
+                    session = requests.Session()
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self.sessionDict[host] = session
+        return session
+
+    #----------------------------------------------------------------------
+    def request(self, method, url, **kwargs):
+        """发送请求，参数与requests.request相同"""
+        host = urlsplit(url).netloc
+        session = self.getSession(host)
+
+        start = time()
+        error = True
+        try:
+            response = session.request(method, url, **kwargs)
+            error = response.status_code >= 400
+            return response
+        finally:
+            latency = time() - start
+            with self.lock:
+                hist = self.histDict.get(host)
+                if hist is None:
+                    hist = self.histDict[host] = LatencyHistogram()
+                hist.add(latency, error)
+
+    #----------------------------------------------------------------------
+    def get(self, url, params=None, **kwargs):
+        """GET请求，参数与requests.get相同"""
+        return self.request('GET', url, params=params, **kwargs)
+
+    #----------------------------------------------------------------------
+    def post(self, url, data=None, json=None, **kwargs):
+        """POST请求，参数与requests.post相同"""
+        return self.request('POST', url, data=data, json=json, **kwargs)
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """关闭全部会话"""
+        with self.lock:
+            sessionList = list(self.sessionDict.values())
+            self.sessionDict.clear()
+        for session in sessionList:
+            session.close()
+
+    #----------------------------------------------------------------------
+    def getMetrics(self):
+        """各主机的请求耗时统计（次数、出错次数、平均、最大、p50、p99、直方图）"""
+        with self.lock:
+            return {host: hist.getMetrics() for host, hist in self.histDict.items()}
+
+
+# 全局共享的连接池
+httpPool = HttpSessionPool()
@@ -0,0 +1,286 @@
+# encoding: UTF-8
+
+"""
+各交易所REST接口共享的请求调度器
+
+原来各接口的processQueue从列表中逐个取出请求，每个请求之后sleep(0.1)，
+每个交易所每秒最多约10个请求，委托排在余额查询之后也要等待。RestScheduler：
+    优先级：委托、撤单（PRIORITY_TRADE）排在查询（PRIORITY_QUERY）之前
+    限流：每个端点可以有自己的令牌桶，另有全局令牌桶（'*'），请求按权重消耗令牌，
+          令牌不足的请求留在队列中，不阻塞其他端点的请求
+    并发：请求在线程池中执行，最多同时执行workers个
+    统计：每个端点的耗时直方图，getMetrics返回
+"""
+
+import traceback
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from threading import Thread, Condition, Lock
+from time import time
+
+# 优先级，数值小的先执行
+PRIORITY_TRADE = 0      # 委托、撤单
+PRIORITY_QUERY = 1      # 查询
+
+# 全局令牌桶的端点名，所有请求都消耗该令牌桶
+LIMIT_ALL = '*'
+
+# 耗时直方图的区间上限（秒）
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+########################################################################
+class TokenBucket(object):
+    """令牌桶，每秒补充rate个令牌，最多保存capacity个"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.lastTime = time()
+
+    #----------------------------------------------------------------------
+    def refill(self, now):
+        """补充令牌"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.lastTime) * self.rate)
+        self.lastTime = now
+
+    #----------------------------------------------------------------------
+    def waitTime(self, weight, now):
+        """令牌足够时返回0，否则返回还需等待的秒数"""
+        self.refill(now)
+        weight = min(weight, self.capacity)     # 权重超过容量的请求在令牌满时执行
+        if self.tokens >= weight:
+            return 0
+        return (weight - self.tokens) / self.rate
+
+    #----------------------------------------------------------------------
+    def consume(self, weight):
+        """消耗令牌"""
+        self.tokens -= min(weight, self.capacity)
+
+
+########################################################################
+class LatencyHistogram(object):
+    """单个端点的请求耗时直方图"""
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)     # 最后一个区间为超过10秒
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errorCount = 0
+
+    #----------------------------------------------------------------------
+    def add(self, seconds, error=False):
+        """记录一次请求"""
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if error:
+            self.errorCount += 1
+
+    #----------------------------------------------------------------------
+    def percentile(self, p):
+        """估算百分位数，返回所在区间的上限"""
+        if not self.count:
+            return 0
+        target = self.count * p
+        n = 0
+        for i, c in enumerate(self.counts):
+            n += c
+            if n >= target:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+    #----------------------------------------------------------------------
+    def getMetrics(self):
+        """统计结果"""
+        buckets = {'<={0}'.format(b): c for b, c in zip(LATENCY_BUCKETS, self.counts)}
+        buckets['>{0}'.format(LATENCY_BUCKETS[-1])] = self.counts[-1]
+        return {'count': self.count,
+                'error': self.errorCount,
+                'mean': self.total / self.count if self.count else 0,
+                'max': self.max,
+                'p50': self.percentile(0.5),
+                'p99': self.percentile(0.99),
+                'buckets': buckets}
+
+
+########################################################################
+class RestScheduler(object):
+    """REST请求调度器"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, name='', workers=4, limitDict=None, onError=None):
+        """
+        name: 调度器名称（线程名）
+        workers: 最多同时执行的请求数
+        limitDict: 限流设置 {端点: (每秒令牌数, 令牌桶容量)}，端点LIMIT_ALL为全局限流
+        onError: 请求函数抛出异常时调用onError(异常, traceback字符串)，为空时打印
+        """
+        self.name = name
+        self.workers = workers
+        self.onError = onError
+
+        self.bucketDict = {}            # 端点: TokenBucket
+        for endpoint, limit in (limitDict or {}).items():
+            self.setLimit(endpoint, *limit)
+
+        self.queueDict = {PRIORITY_TRADE: deque(), PRIORITY_QUERY: deque()}    # 优先级: 等待执行的请求
+        self.keySet = set()             # 等待或正在执行的请求的去重键值
+        self.running = 0                # 正在执行的请求数
+        self.seq = count()
+
+        self.histDict = {}              # 端点: LatencyHistogram
+        self.metricsLock = Lock()
+
+        self.condition = Condition()
+        self.executor = None
+        self.active = False
+        self.thread = None
+
+    #----------------------------------------------------------------------
+    def setLimit(self, endpoint, rate, capacity=None):
+        """设置端点的限流，每秒rate个令牌，令牌桶容量capacity"""
+        self.bucketDict[endpoint] = TokenBucket(rate, capacity)
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动调度线程"""
+        if self.active:
+            return
+        self.active = True
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.thread = Thread(target=self.run, name='RestScheduler{0}'.format(self.name))
+        self.thread.daemon = True
+        self.thread.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止，丢弃尚未执行的请求，等待正在执行的请求完成"""
+        if not self.active:
+            return
+        with self.condition:
+            self.active = False
+            for queue in self.queueDict.values():
+                queue.clear()
+            self.keySet.clear()
+            self.condition.notify_all()
+        self.thread.join()
+        self.executor.shutdown(wait=True)
+
+    #----------------------------------------------------------------------
+    def submit(self, func, args=(), endpoint='', priority=PRIORITY_QUERY, weight=1, key=None):
+        """
+        提交请求，在线程池中执行func(*args)
+        endpoint: 端点名，用于限流和耗时统计
+        weight: 消耗的令牌数（如币安各接口的权重）
+        key: 去重键值，同一键值的请求正在等待或执行时，不再提交，返回False
+        """
+        with self.condition:
+            if key is not None:
+                if key in self.keySet:
+                    return False
+                self.keySet.add(key)
+
+            queue = self.queueDict.setdefault(priority, deque())
+            queue.append((next(self.seq), func, args, endpoint, weight, key))
+            self.condition.notify()
+        return True
+
+    #----------------------------------------------------------------------
+    def run(self):
+        """调度线程运行函数"""
+        with self.condition:
+            while self.active:
+                timeout = None
+                if self.running < self.workers:
+                    item, timeout = self.popReady()
+                    if item:
+                        self.running += 1
+                        self.executor.submit(self.execute, item)
+                        continue
+                self.condition.wait(timeout)
+
+    #----------------------------------------------------------------------
+    def popReady(self):
+        """
+        按优先级取出第一个令牌足够的请求，返回(请求, None)
+        都不够时返回(None, 最短等待秒数)，没有请求时返回(None, None)
+        """
+        now = time()
+        minWait = None
+        globalBucket = self.bucketDict.get(LIMIT_ALL)
+
+        for priority in sorted(self.queueDict):
+            queue = self.queueDict[priority]
+            checked = set()     # 同一端点只检查最早的请求，保持端点内的顺序
+            for i, item in enumerate(queue):
+                endpoint, weight = item[3], item[4]
+                if endpoint in checked:
+                    continue
+                checked.add(endpoint)
+
+                bucket = self.bucketDict.get(endpoint)
+                wait = max(bucket.waitTime(weight, now) if bucket else 0,
+                           globalBucket.waitTime(weight, now) if globalBucket else 0)
+                if wait == 0:
+                    if bucket:
+                        bucket.consume(weight)
+                    if globalBucket:
+                        globalBucket.consume(weight)
+                    del queue[i]
+                    return item, None
+
+                minWait = wait if minWait is None else min(minWait, wait)
+
+        return None, minWait
+
+    #----------------------------------------------------------------------
+    def execute(self, item):
+        """在线程池中执行请求"""
+        seq, func, args, endpoint, weight, key = item
+        error = False
+        start = time()
+        try:
+            func(*args)
+        except Exception as ex:
+            error = True
+            if self.onError:
+                self.onError(ex, traceback.format_exc())
+            else:
+                traceback.print_exc()
+        finally:
+            latency = time() - start
+            with self.metricsLock:
+                hist = self.histDict.get(endpoint)
+                if hist is None:
+                    hist = self.histDict[endpoint] = LatencyHistogram()
+                hist.add(latency, error)
+
+            with self.condition:
+                self.running -= 1
+                self.keySet.discard(key)
+                self.condition.notify()
+
+    #----------------------------------------------------------------------
+    def getMetrics(self):
+        """
+        调度统计
+        queued：各优先级等待执行的请求数，running：正在执行的请求数
+        latency：各端点的耗时统计（次数、出错次数、平均、最大、p50、p99、直方图）
+        """
+        with self.condition:
+            queued = {priority: len(queue) for priority, queue in self.queueDict.items()}
+            running = self.running
+        with self.metricsLock:
+            latency = {endpoint: hist.getMetrics() for endpoint, hist in self.histDict.items()}
+        return {'queued': queued,
+                'running': running,
+                'latency': latency}
@@ -0,0 +1,116 @@
+# encoding: UTF-8
+
+"""
+REST请求的重试策略
+
+原来失败的请求直接放回请求队列，交易所故障时队列中堆满重试请求，新的委托排不上，同时不停请求交易所。
+    RetryPolicy：最多重试maxAttempts次，等待时间按指数增加（baseDelay * 2^(n-1)，最多maxDelay秒），
+                 并加上随机抖动，避免多个请求同时重试；不能重复提交的请求（如委托）不重试
+    RetryQueue：等待重试的请求，到期后由重试线程放回请求队列，最多保存maxSize个
+不再重试的请求交给死信回调（dead-letter），由接口决定如何处理（如查询委托确认状态）。
+"""
+
+import heapq
+import random
+from itertools import count
+from threading import Thread, Condition
+from time import time
+
+
+########################################################################
+class RetryPolicy(object):
+    """有限次数、指数退避加随机抖动的重试策略"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, maxAttempts=3, baseDelay=0.5, maxDelay=30, jitter=0.5):
+        """
+        maxAttempts: 最多执行的次数（含第一次）
+        baseDelay: 第一次重试前等待的秒数
+        maxDelay: 等待秒数的上限
+        jitter: 随机抖动比例，实际等待时间在[delay*(1-jitter), delay]之间
+        """
+        self.maxAttempts = maxAttempts
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.jitter = jitter
+
+    #----------------------------------------------------------------------
+    def canRetry(self, attempt, idempotent=True):
+        """第attempt次执行失败后，是否可以重试"""
+        return idempotent and attempt < self.maxAttempts
+
+    #----------------------------------------------------------------------
+    def getDelay(self, attempt):
+        """第attempt次执行失败后，重试前等待的秒数"""
+        delay = min(self.maxDelay, self.baseDelay * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+
+########################################################################
+class RetryQueue(object):
+    """等待重试的请求"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, putFunc, maxSize=1000):
+        """
+        putFunc: 请求到期后调用putFunc(请求)放回请求队列
+        maxSize: 最多等待重试的请求数，超出时add返回False
+        """
+        self.putFunc = putFunc
+        self.maxSize = maxSize
+
+        self.heap = []                  # (到期时间, 序号, 请求)
+        self.seq = count()
+        self.condition = Condition()
+
+        self.active = False
+        self.thread = None
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动重试线程"""
+        if self.active:
+            return
+        self.active = True
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止，丢弃等待重试的请求"""
+        if not self.active:
+            return
+        with self.condition:
+            self.active = False
+            self.heap = []
+            self.condition.notify()
+        self.thread.join()
+
+    #----------------------------------------------------------------------
+    def add(self, req, delay):
+        """请求在delay秒后重试，等待的请求过多时返回False"""
+        with self.condition:
+            if len(self.heap) >= self.maxSize:
+                return False
+            heapq.heappush(self.heap, (time() + delay, next(self.seq), req))
+            self.condition.notify()
+        return True
+
+    #----------------------------------------------------------------------
+    def size(self):
+        """等待重试的请求数"""
+        return len(self.heap)
+
+    #----------------------------------------------------------------------
+    def run(self):
+        """重试线程运行函数"""
+        while True:
+            with self.condition:
+                while self.active and (not self.heap or self.heap[0][0] > time()):
+                    self.condition.wait(self.heap[0][0] - time() if self.heap else None)
+                if not self.active:
+                    return
+                req = heapq.heappop(self.heap)[2]
+
+            self.putFunc(req)
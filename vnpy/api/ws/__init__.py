@@ -0,0 +1,4 @@
+# encoding: UTF-8
+
+from vnpy.api.ws.vnws import WsTransport, WsConnection, wsTransport, INFLATE_NONE, INFLATE_ZLIB, INFLATE_DEFLATE, \
+    WsConnectionClosedException
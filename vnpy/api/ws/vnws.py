@@ -0,0 +1,366 @@
+# encoding: UTF-8
+
+"""
+各交易所websocket接口共享的asyncio传输层
+
+原来每个接口各自运行阻塞的websocket线程（websocket-client、twisted），重连、心跳的逻辑各写一遍。
+WsTransport在一个线程中运行asyncio事件循环，全部websocket连接（WsConnection）都在该循环中收发：
+    解压：INFLATE_ZLIB（zlib/gzip，如火币）、INFLATE_DEFLATE（原始deflate，如OKEX）
+    心跳：协议层的ping（pingInterval），以及按固定间隔发送的应用层心跳消息（heartbeat）
+    超时：超过timeout秒没有收到任何消息，视为连接断开
+    重连：连接断开后按指数退避（加随机抖动）重连，重连后先调用on_open，再重新发送subscribe登记的订阅请求
+回调函数与websocket-client的WebSocketApp相同：on_open(ws)、on_message(ws, msg)、on_error(ws, ex)、on_close(ws)，
+ws为WsConnection，可以send、close。回调在事件循环线程中执行，不能长时间阻塞。
+"""
+
+import asyncio
+import json
+import random
+import sys
+import traceback
+import zlib
+from threading import Thread, Lock, get_ident
+from time import time
+
+import websockets
+
+# 解压方式
+INFLATE_NONE = 'none'           # 不解压
+INFLATE_ZLIB = 'zlib'           # zlib或gzip格式
+INFLATE_DEFLATE = 'deflate'     # 原始deflate格式（无头部）
+
+
+########################################################################
+class WsConnectionClosedException(Exception):
+    """连接未建立或已断开时发送消息"""
+    pass
+
+
+########################################################################
+class WsConnection(object):
+    """单个websocket连接"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, transport, url, on_open=None, on_message=None, on_error=None, on_close=None,
+                 inflate=INFLATE_NONE, decodeJson=False, heartbeat=None, pingInterval=20, timeout=None,
+                 autoReconnect=True, proxy=None, name=''):
+        """
+        url: 服务器地址
+        inflate: 二进制消息的解压方式，解压后的消息为字符串
+        decodeJson: 是否把消息解析为json对象后再传给on_message
+        heartbeat: 应用层心跳 (间隔秒数, 消息)，消息可以是字符串、字典或返回消息的函数
+        pingInterval: 协议层ping的间隔秒数，None为不发送
+        timeout: 超过该秒数没有收到消息时重连，None为不检查
+        autoReconnect: 断开后是否自动重连
+        proxy: http代理，如'http://127.0.0.1:1080'
+        """
+        self.transport = transport
+        self.url = url
+        self.on_open = on_open
+        self.on_message = on_message
+        self.on_error = on_error
+        self.on_close = on_close
+        self.inflate = inflate
+        self.decodeJson = decodeJson
+        self.heartbeat = heartbeat
+        self.pingInterval = pingInterval
+        self.timeout = timeout
+        self.autoReconnect = autoReconnect
+        self.proxy = proxy
+        self.name = name or url
+
+        self.subDict = {}               # 订阅键值: 订阅请求，重连后重新发送
+        self.ws = None                  # 已连接时为websockets的连接对象
+        self.sendQueue = None           # 待发送的消息
+        self.task = None                # 事件循环中的运行任务
+        self.active = False
+
+        # 统计
+        self.connectCount = 0
+        self.messageCount = 0
+        self.lastMessageTime = 0
+
+    #----------------------------------------------------------------------
+    @property
+    def connected(self):
+        """是否已连接"""
+        return self.ws is not None
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """在事件循环中开始连接"""
+        self.active = True
+        future = asyncio.run_coroutine_threadsafe(self.createTask(), self.transport.loop)
+        future.result()
+
+    #----------------------------------------------------------------------
+    async def createTask(self):
+        """在事件循环中创建运行任务"""
+        self.sendQueue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """关闭连接，不再重连"""
+        self.active = False
+        self.transport.remove(self)
+        if self.task is None:
+            return
+
+        loop = self.transport.loop
+        if self.transport.inLoop():
+            loop.create_task(self.cancelTask())
+        else:
+            future = asyncio.run_coroutine_threadsafe(self.cancelTask(), loop)
+            try:
+                future.result(timeout=5)
+            except Exception:
+                pass
+
+    #----------------------------------------------------------------------
+    async def cancelTask(self):
+        """正常关闭连接，再取消运行任务，等待其结束"""
+        ws = self.ws
+        if ws is not None:
+            try:
+                await ws.close()
+            except Exception:
+                pass
+        self.task.cancel()
+        try:
+            await self.task
+        except BaseException:
+            pass
+
+    #----------------------------------------------------------------------
+    def send(self, data):
+        """
+        发送消息（任何线程均可调用），data为字符串、字节或字典（转为json）
+        未连接时抛出WsConnectionClosedException
+        """
+        if self.ws is None:
+            raise WsConnectionClosedException(u'{0}未连接'.format(self.name))
+        if not isinstance(data, (str, bytes)):
+            data = json.dumps(data)
+        self.transport.loop.call_soon_threadsafe(self.sendQueue.put_nowait, data)
+
+    #----------------------------------------------------------------------
+    def subscribe(self, key, req):
+        """登记订阅请求，已连接时立即发送，重连后自动重新发送"""
+        self.subDict[key] = req
+        if self.ws is not None:
+            self.send(req)
+
+    #----------------------------------------------------------------------
+    def unsubscribe(self, key, req=None):
+        """取消登记的订阅，req为取消订阅的请求（可以为空）"""
+        self.subDict.pop(key, None)
+        if req is not None and self.ws is not None:
+            self.send(req)
+
+    #----------------------------------------------------------------------
+    def callback(self, func, *args):
+        """执行回调函数，异常不影响事件循环"""
+        if func is None:
+            return
+        try:
+            func(self, *args)
+        except Exception:
+            print(u'WsConnection {0} callback exception:{1}'.format(self.name, traceback.format_exc()),
+                  file=sys.stderr)
+
+    #----------------------------------------------------------------------
+    def decode(self, msg):
+        """解压、解析收到的消息"""
+        if isinstance(msg, bytes):
+            if self.inflate == INFLATE_ZLIB:
+                msg = zlib.decompress(msg, 47)
+            elif self.inflate == INFLATE_DEFLATE:
+                msg = zlib.decompress(msg, -zlib.MAX_WBITS)
+            msg = msg.decode('utf-8')
+        if self.decodeJson:
+            return json.loads(msg)
+        return msg
+
+    #----------------------------------------------------------------------
+    async def run(self):
+        """连接、收取消息，断开后重连"""
+        transport = self.transport
+        delay = transport.minDelay
+        kwargs = {'ping_interval': self.pingInterval, 'max_size': None}
+        if self.proxy:
+            kwargs['proxy'] = self.proxy        # websockets 15及以上版本才支持proxy参数
+
+        while self.active:
+            wasConnected = False
+            try:
+                async with websockets.connect(self.url, **kwargs) as ws:
+                    self.ws = ws
+                    wasConnected = True
+                    delay = transport.minDelay
+                    self.connectCount += 1
+                    self.lastMessageTime = time()
+
+                    while not self.sendQueue.empty():     # 丢弃断开前未发出的消息
+                        self.sendQueue.get_nowait()
+
+                    self.callback(self.on_open)
+                    for req in list(self.subDict.values()):
+                        self.send(req)
+
+                    await self.receive(ws)
+
+            except asyncio.CancelledError:
+                self.ws = None
+                if wasConnected:
+                    self.callback(self.on_close)
+                raise
+            except websockets.ConnectionClosed:
+                pass
+            except Exception as ex:
+                if self.active:
+                    self.callback(self.on_error, ex)
+
+            self.ws = None
+            if wasConnected:
+                self.callback(self.on_close)
+
+            if not (self.active and self.autoReconnect):
+                break
+
+            # 指数退避，加随机抖动
+            await asyncio.sleep(delay * (0.5 + random.random() / 2))
+            delay = min(delay * 2, transport.maxDelay)
+
+        self.active = False
+        transport.remove(self)
+
+    #----------------------------------------------------------------------
+    async def receive(self, ws):
+        """收取消息，同时运行发送和心跳任务，连接断开或超时时返回"""
+        loop = asyncio.get_running_loop()
+        taskList = [loop.create_task(self.sendLoop(ws))]
+        if self.heartbeat:
+            taskList.append(loop.create_task(self.heartbeatLoop()))
+
+        try:
+            while True:
+                if self.timeout:
+                    try:
+                        msg = await asyncio.wait_for(ws.recv(), self.timeout)
+                    except asyncio.TimeoutError:
+                        raise TimeoutError(u'{0}秒没有收到数据'.format(self.timeout))
+                else:
+                    msg = await ws.recv()
+
+                self.messageCount += 1
+                self.lastMessageTime = time()
+
+                try:
+                    msg = self.decode(msg)
+                except (zlib.error, UnicodeDecodeError, ValueError) as ex:
+                    self.callback(self.on_error, ex)
+                    continue
+                self.callback(self.on_message, msg)
+        finally:
+            for task in taskList:
+                task.cancel()
+
+    #----------------------------------------------------------------------
+    async def sendLoop(self, ws):
+        """按顺序发送队列中的消息"""
+        while True:
+            data = await self.sendQueue.get()
+            await ws.send(data)
+
+    #----------------------------------------------------------------------
+    async def heartbeatLoop(self):
+        """按固定间隔发送应用层心跳"""
+        interval, payload = self.heartbeat
+        while True:
+            await asyncio.sleep(interval)
+            if self.ws is not None:
+                self.send(payload() if callable(payload) else payload)
+
+
+########################################################################
+class WsTransport(object):
+    """在一个asyncio事件循环中运行全部websocket连接"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, minDelay=1, maxDelay=60):
+        """
+        minDelay: 断开后第一次重连前等待的秒数
+        maxDelay: 重连等待秒数的上限
+        """
+        self.minDelay = minDelay
+        self.maxDelay = maxDelay
+
+        self.lock = Lock()
+        self.loop = None
+        self.thread = None
+        self.connList = []
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动事件循环线程"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            self.thread = Thread(target=self.loop.run_forever, name='WsTransport')
+            self.thread.daemon = True
+            self.thread.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """关闭全部连接，停止事件循环"""
+        for conn in list(self.connList):
+            conn.close()
+
+        with self.lock:
+            if self.thread is None:
+                return
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.loop = None
+            self.thread = None
+
+    #----------------------------------------------------------------------
+    def inLoop(self):
+        """当前是否在事件循环线程中"""
+        return self.thread is not None and self.thread.ident == get_ident()
+
+    #----------------------------------------------------------------------
+    def connect(self, url, **kwargs):
+        """创建连接并开始连接，参数见WsConnection，返回WsConnection"""
+        self.start()
+        conn = WsConnection(self, url, **kwargs)
+        with self.lock:
+            self.connList.append(conn)
+        conn.start()
+        return conn
+
+    #----------------------------------------------------------------------
+    def remove(self, conn):
+        """移除已关闭的连接"""
+        with self.lock:
+            if conn in self.connList:
+                self.connList.remove(conn)
+
+    #----------------------------------------------------------------------
+    def getMetrics(self):
+        """各连接的状态：是否已连接、连接次数、收到的消息数、距上次收到消息的秒数"""
+        now = time()
+        with self.lock:
+            connList = list(self.connList)
+        return {conn.name: {'connected': conn.connected,
+                            'connectCount': conn.connectCount,
+                            'messageCount': conn.messageCount,
+                            'idle': now - conn.lastMessageTime if conn.lastMessageTime else None}
+                for conn in connList}
+
+
+# 全局共享的传输层
+wsTransport = WsTransport()
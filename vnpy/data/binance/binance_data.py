@@ -10,6 +10,7 @@ from vnpy.trader.app.ctaStrategy.ctaBase import CtaBarData
 from vnpy.api.binance.client import Client
 from vnpy.trader.vtFunction import getJsonPath
 from vnpy.trader.vtGlobal import globalSetting
+from vnpy.trader.vtHistoryCache import historyCache
 import json
 
 PERIOD_MAPPING = {}
@@ -83,7 +84,8 @@ class BinanceData(object):
 
         bars = []
         try:
-            bars = self.client.get_klines(symbol=binance_symbol, interval=binance_period)
+            bars = historyCache.get(('binance', binance_symbol, binance_period),
+                                    lambda: self.client.get_klines(symbol=binance_symbol, interval=binance_period))
             bar_len = len(bars)
             for i, bar in enumerate(bars):
                 add_bar = CtaBarData()
@@ -185,7 +187,8 @@ class BinanceData(object):
                         self.writeError(u'下载数据{} {} 异常:{},{}'.format(binance_symbol,binance_period,str(ex),traceback.format_exc()))
                         break
             else:
-                bars = self.client.get_klines(symbol=binance_symbol, interval=binance_period)
+                bars = historyCache.get(('binance', binance_symbol, binance_period),
+                                    lambda: self.client.get_klines(symbol=binance_symbol, interval=binance_period))
 
             for i, bar in enumerate(bars):
                 add_bar = {}
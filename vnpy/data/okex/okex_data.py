@@ -7,6 +7,7 @@ import requests
 import execjs
 import traceback
 from vnpy.trader.app.ctaStrategy.ctaBase import CtaBarData, CtaTickData
+from vnpy.trader.vtHistoryCache import historyCache
 
 period_list = ['1min','3min','5min','15min','30min','1day','1week','1hour','2hour','4hour','6hour','12hour']
 symbol_list = ['ltc_btc','eth_btc','etc_btc','bch_btc','btc_usdt','eth_usdt','ltc_usdt','etc_usdt','bch_usdt',
@@ -57,7 +58,7 @@ class OkexData(object):
 
         content = None
         try:
-            content = self.session.get(url).content.decode('gbk')
+            content = historyCache.get(('okex', url), lambda: self.session.get(url).content).decode('gbk')
         except Exception as ex:
             self.strategy.writeCtaError('exception in get:{},{},{}'.format(url,str(ex), traceback.format_exc()))
             return False,ret_bars
@@ -126,7 +127,7 @@ class OkexData(object):
 
         content = None
         try:
-            content = self.session.get(url).content.decode('gbk')
+            content = historyCache.get(('okex', url), lambda: self.session.get(url).content).decode('gbk')
         except Exception as ex:
             self.writeError('exception in get:{},{},{}'.format(url,str(ex), traceback.format_exc()))
             return ret_bars
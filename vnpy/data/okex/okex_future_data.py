@@ -7,6 +7,7 @@ import requests
 import execjs
 import traceback
 from vnpy.trader.app.ctaStrategy.ctaBase import CtaBarData, CtaTickData
+from vnpy.trader.vtHistoryCache import historyCache
 
 period_list = ['1min','3min','5min','15min','30min','1day','1week','1hour','2hour','4hour','6hour','12hour']
 symbol_list = ['btc_usd','eth_usd','etc_usd','bch_usd','xrp_usd','eos_usd','btg_usd']
@@ -50,7 +51,7 @@ class OkexFutureData(object):
         bars = []
         content = None
         try:
-            content = self.session.get(url).content.decode('gbk')
+            content = historyCache.get(('okex', url), lambda: self.session.get(url).content).decode('gbk')
             bars = execjs.eval(content)
         except Exception as ex:
             self.strategy.writeCtaError('exception in get:{},{},{}'.format(url,str(ex), traceback.format_exc()))
@@ -1,3 +1,3 @@
 # encoding: UTF-8
 
-from .eventEngine import EventEngine, EventEngine2, Event
\ No newline at end of file
+from .eventEngine import EventEngine, EventEngine2, BatchEventEngine, ShardedEventEngine, Event
\ No newline at end of file
@@ -2,8 +2,8 @@
 
 # 系统模块
 from queue import Queue, Empty
-from threading import Thread
-from time import sleep
+from threading import Thread, Lock
+from time import sleep, perf_counter
 from collections import defaultdict
 
 # 第三方模块
@@ -319,6 +319,504 @@ class EventEngine2(object):
             self.__generalHandlers.remove(handler)
 
 
+########################################################################
+class BatchEventEngine(object):
+    """
+    批量处理的事件驱动引擎（计时器使用python线程）
+
+    与EventEngine2的区别：
+    1、处理线程每次从队列中取出一批事件（最多batchSize个）后再逐个处理，减少阻塞读取的次数
+    2、每种事件类型对应的处理函数（含通用处理函数）预先合并为元组，仅在注册/注销时重建
+    3、提供队列深度、各事件类型的处理耗时、各处理函数的耗时统计，通过getStatistics获取
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, batchSize=100, profile=True):
+        """
+        初始化事件引擎
+        batchSize：每批最多处理的事件数量
+        profile：是否统计事件类型和处理函数的耗时
+        """
+        # 事件队列
+        self.__queue = Queue()
+
+        # 事件引擎开关
+        self.__active = False
+
+        # 事件处理线程
+        self.__thread = Thread(target = self.__run)
+
+        # 计时器，用于触发计时器事件
+        self.__timer = Thread(target = self.__runTimer)
+        self.__timerActive = False                      # 计时器工作状态
+        self.__timerSleep = 1                           # 计时器触发间隔（默认1秒）
+
+        # 事件类型 -> 处理函数列表
+        self.__handlers = defaultdict(list)
+
+        # 通用处理函数列表（所有事件均调用）
+        self.__generalHandlers = []
+
+        # 分发表：事件类型 -> 处理函数元组（已合并通用处理函数），注册/注销时整体替换
+        self.__dispatchTable = {}
+        self.__generalTuple = ()
+        self.__lock = Lock()
+
+        self.batchSize = max(1, batchSize)
+        self.profile = profile
+
+        # 统计数据
+        self.__batchCount = 0                           # 已处理批次
+        self.__eventCount = 0                           # 已处理事件数
+        self.__maxQueueSize = 0                         # 观察到的最大队列深度
+        self.__maxBatchSize = 0                         # 最大批次大小
+        self.__typeStats = defaultdict(lambda: [0, 0.0, 0.0])       # 事件类型 -> [次数，总耗时，最大耗时]
+        self.__handlerStats = defaultdict(lambda: [0, 0.0, 0.0])    # 处理函数 -> [次数，总耗时，最大耗时]
+
+    #----------------------------------------------------------------------
+    def __run(self):
+        """引擎运行"""
+        get = self.__queue.get
+        getNowait = self.__queue.get_nowait
+        qsize = self.__queue.qsize
+
+        while self.__active == True:
+            try:
+                event = get(block = True, timeout = 1)  # 获取事件的阻塞时间设为1秒
+            except Empty:
+                continue
+
+            # 记录队列深度（含已取出的事件）
+            depth = qsize() + 1
+            if depth > self.__maxQueueSize:
+                self.__maxQueueSize = depth
+
+            # 非阻塞地取出队列中已有的事件，组成一批
+            batch = [event]
+            try:
+                for _ in range(self.batchSize - 1):
+                    batch.append(getNowait())
+            except Empty:
+                pass
+
+            self.__processBatch(batch)
+
+    #----------------------------------------------------------------------
+    def __processBatch(self, batch):
+        """处理一批事件"""
+        self.__batchCount += 1
+        self.__eventCount += len(batch)
+        if len(batch) > self.__maxBatchSize:
+            self.__maxBatchSize = len(batch)
+
+        if self.profile:
+            for event in batch:
+                self.__processProfiled(event)
+            return
+
+        for event in batch:
+            # 每个事件读取一次分发表，保证注册/注销后立即生效
+            for handler in self.__dispatchTable.get(event.type_, self.__generalTuple):
+                handler(event)
+
+    #----------------------------------------------------------------------
+    def __processProfiled(self, event):
+        """处理事件，并统计耗时"""
+        handlers = self.__dispatchTable.get(event.type_, self.__generalTuple)
+        handlerStats = self.__handlerStats
+
+        eventStart = perf_counter()
+        for handler in handlers:
+            start = perf_counter()
+            handler(event)
+            cost = perf_counter() - start
+
+            s = handlerStats[handler]
+            s[0] += 1
+            s[1] += cost
+            if cost > s[2]:
+                s[2] = cost
+        cost = perf_counter() - eventStart
+
+        s = self.__typeStats[event.type_]
+        s[0] += 1
+        s[1] += cost
+        if cost > s[2]:
+            s[2] = cost
+
+    #----------------------------------------------------------------------
+    def __rebuildDispatchTable(self):
+        """重建分发表（在注册/注销时调用）"""
+        general = tuple(self.__generalHandlers)
+        table = {type_: tuple(handlerList) + general
+                 for type_, handlerList in self.__handlers.items()}
+
+        # 整体替换引用，处理线程无需加锁即可读取
+        self.__generalTuple = general
+        self.__dispatchTable = table
+
+    #----------------------------------------------------------------------
+    def __runTimer(self):
+        """运行在计时器线程中的循环函数"""
+        while self.__timerActive:
+            # 创建计时器事件
+            event = Event(type_=EVENT_TIMER)
+
+            # 向队列中存入计时器事件
+            self.put(event)
+
+            # 等待
+            sleep(self.__timerSleep)
+
+    #----------------------------------------------------------------------
+    def start(self, timer=True):
+        """
+        引擎启动
+        timer：是否要启动计时器
+        """
+        # 将引擎设为启动
+        self.__active = True
+
+        # 启动事件处理线程
+        self.__thread.start()
+
+        # 启动计时器，计时器事件间隔默认设定为1秒
+        if timer:
+            self.__timerActive = True
+            self.__timer.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止引擎"""
+        # 将引擎设为停止
+        self.__active = False
+
+        # 停止计时器
+        if self.__timerActive:
+            self.__timerActive = False
+            self.__timer.join()
+
+        # 等待事件处理线程退出
+        self.__thread.join()
+
+    #----------------------------------------------------------------------
+    def register(self, type_, handler):
+        """注册事件处理函数监听"""
+        with self.__lock:
+            handlerList = self.__handlers[type_]
+
+            # 若要注册的处理器不在该事件的处理器列表中，则注册该事件
+            if handler not in handlerList:
+                handlerList.append(handler)
+                self.__rebuildDispatchTable()
+
+    #----------------------------------------------------------------------
+    def unregister(self, type_, handler):
+        """注销事件处理函数监听"""
+        with self.__lock:
+            handlerList = self.__handlers.get(type_)
+            if handlerList is None:
+                return
+
+            # 如果该函数存在于列表中，则移除
+            if handler in handlerList:
+                handlerList.remove(handler)
+
+            # 如果函数列表为空，则从引擎中移除该事件类型
+            if not handlerList:
+                del self.__handlers[type_]
+
+            self.__rebuildDispatchTable()
+
+    #----------------------------------------------------------------------
+    def put(self, event):
+        """向事件队列中存入事件"""
+        self.__queue.put(event)
+
+    #----------------------------------------------------------------------
+    def registerGeneralHandler(self, handler):
+        """注册通用事件处理函数监听"""
+        with self.__lock:
+            if handler not in self.__generalHandlers:
+                self.__generalHandlers.append(handler)
+                self.__rebuildDispatchTable()
+
+    #----------------------------------------------------------------------
+    def unregisterGeneralHandler(self, handler):
+        """注销通用事件处理函数监听"""
+        with self.__lock:
+            if handler in self.__generalHandlers:
+                self.__generalHandlers.remove(handler)
+                self.__rebuildDispatchTable()
+
+    #----------------------------------------------------------------------
+    def getQueueSize(self):
+        """当前队列深度"""
+        return self.__queue.qsize()
+
+    #----------------------------------------------------------------------
+    def getStatistics(self):
+        """
+        获取运行统计
+        耗时单位为毫秒；handlers按总耗时从大到小排列，便于定位阻塞行情的处理函数
+        """
+        typeStats = {}
+        for type_, (count, total, maxCost) in list(self.__typeStats.items()):
+            typeStats[type_] = {'count': count,
+                                'avg_ms': total * 1000 / count if count else 0,
+                                'max_ms': maxCost * 1000,
+                                'total_ms': total * 1000}
+
+        handlerStats = []
+        for handler, (count, total, maxCost) in list(self.__handlerStats.items()):
+            handlerStats.append({'handler': getattr(handler, '__qualname__', repr(handler)),
+                                 'count': count,
+                                 'avg_ms': total * 1000 / count if count else 0,
+                                 'max_ms': maxCost * 1000,
+                                 'total_ms': total * 1000})
+        handlerStats.sort(key=lambda d: d['total_ms'], reverse=True)
+
+        return {'queue_size': self.__queue.qsize(),
+                'max_queue_size': self.__maxQueueSize,
+                'batch_count': self.__batchCount,
+                'event_count': self.__eventCount,
+                'max_batch_size': self.__maxBatchSize,
+                'types': typeStats,
+                'handlers': handlerStats}
+
+    #----------------------------------------------------------------------
+    def resetStatistics(self):
+        """清空运行统计"""
+        self.__batchCount = 0
+        self.__eventCount = 0
+        self.__maxQueueSize = 0
+        self.__maxBatchSize = 0
+        self.__typeStats.clear()
+        self.__handlerStats.clear()
+
+
+########################################################################
+class ShardedEventEngine(object):
+    """
+    多通道（分片）事件驱动引擎（计时器使用python线程）
+
+    事件按键值分配到不同的工作线程（通道）中处理：
+    1、优先通道：事件类型以priorityPrefixes开头的事件（默认为委托、成交回报），
+       不会排在大量行情事件之后
+    2、行情通道：共lanes个，按keyFunc(event)的哈希值分配，同一键值（默认为vtSymbol，
+       账户类事件为gatewayName）的事件固定在同一通道，保证顺序
+    3、通用通道：无法取得键值的事件（计时器、日志、合约等）
+
+    注意：同一处理函数可能在不同通道线程中被并发调用，处理函数内部对共享数据的
+    修改需要自行保证线程安全。同一键值的事件在同一通道内按投递顺序处理。
+    """
+
+    # 默认进入优先通道的事件类型前缀（对应vtEvent中的EVENT_ORDER、EVENT_TRADE）
+    DEFAULT_PRIORITY_PREFIXES = ('eOrder.', 'eTrade.')
+
+    #----------------------------------------------------------------------
+    def __init__(self, lanes=4, priorityPrefixes=DEFAULT_PRIORITY_PREFIXES, keyFunc=None):
+        """
+        初始化事件引擎
+        lanes：行情通道数量
+        priorityPrefixes：进入优先通道的事件类型前缀
+        keyFunc：从事件中提取分片键值的函数，返回None时进入通用通道
+        """
+        self.laneCount = max(1, lanes)
+        self.priorityPrefixes = tuple(priorityPrefixes)
+        self.keyFunc = keyFunc or getEventKey
+
+        # 事件引擎开关
+        self.__active = False
+
+        # 通道队列及处理线程：[通用通道, 优先通道, 行情通道1..N]
+        self.__queues = [Queue() for _ in range(self.laneCount + 2)]
+        self.__threads = [Thread(target=self.__run, args=(i,), name='EventLane-%d' % i)
+                          for i in range(len(self.__queues))]
+        self.__processed = [0] * len(self.__queues)
+
+        # 计时器，用于触发计时器事件
+        self.__timer = Thread(target = self.__runTimer)
+        self.__timerActive = False                      # 计时器工作状态
+        self.__timerSleep = 1                           # 计时器触发间隔（默认1秒）
+
+        # 事件类型 -> 处理函数列表
+        self.__handlers = defaultdict(list)
+
+        # 通用处理函数列表（所有事件均调用）
+        self.__generalHandlers = []
+
+        # 分发表：事件类型 -> 处理函数元组（已合并通用处理函数），注册/注销时整体替换
+        self.__dispatchTable = {}
+        self.__generalTuple = ()
+        self.__lock = Lock()
+
+        # 事件类型是否进入优先通道的缓存
+        self.__priorityCache = {}
+
+    #----------------------------------------------------------------------
+    def __run(self, lane):
+        """通道线程运行"""
+        queue = self.__queues[lane]
+        processed = self.__processed
+
+        while self.__active == True:
+            try:
+                event = queue.get(block = True, timeout = 1)  # 获取事件的阻塞时间设为1秒
+            except Empty:
+                continue
+
+            for handler in self.__dispatchTable.get(event.type_, self.__generalTuple):
+                handler(event)
+            processed[lane] += 1
+
+    #----------------------------------------------------------------------
+    def __rebuildDispatchTable(self):
+        """重建分发表（在注册/注销时调用）"""
+        general = tuple(self.__generalHandlers)
+        table = {type_: tuple(handlerList) + general
+                 for type_, handlerList in self.__handlers.items()}
+
+        self.__generalTuple = general
+        self.__dispatchTable = table
+
+    #----------------------------------------------------------------------
+    def __runTimer(self):
+        """运行在计时器线程中的循环函数"""
+        while self.__timerActive:
+            # 创建计时器事件
+            event = Event(type_=EVENT_TIMER)
+
+            # 向队列中存入计时器事件
+            self.put(event)
+
+            # 等待
+            sleep(self.__timerSleep)
+
+    #----------------------------------------------------------------------
+    def getLane(self, event):
+        """计算事件所属的通道序号"""
+        type_ = event.type_
+
+        isPriority = self.__priorityCache.get(type_)
+        if isPriority is None:
+            isPriority = type_.startswith(self.priorityPrefixes) if isinstance(type_, str) else False
+            self.__priorityCache[type_] = isPriority
+        if isPriority:
+            return 1
+
+        key = self.keyFunc(event)
+        if key is None:
+            return 0
+        return 2 + hash(key) % self.laneCount
+
+    #----------------------------------------------------------------------
+    def start(self, timer=True):
+        """
+        引擎启动
+        timer：是否要启动计时器
+        """
+        # 将引擎设为启动
+        self.__active = True
+
+        # 启动各通道处理线程
+        for thread in self.__threads:
+            thread.start()
+
+        # 启动计时器，计时器事件间隔默认设定为1秒
+        if timer:
+            self.__timerActive = True
+            self.__timer.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止引擎"""
+        # 将引擎设为停止
+        self.__active = False
+
+        # 停止计时器
+        if self.__timerActive:
+            self.__timerActive = False
+            self.__timer.join()
+
+        # 等待各通道处理线程退出
+        for thread in self.__threads:
+            thread.join()
+
+    #----------------------------------------------------------------------
+    def register(self, type_, handler):
+        """注册事件处理函数监听"""
+        with self.__lock:
+            handlerList = self.__handlers[type_]
+
+            # 若要注册的处理器不在该事件的处理器列表中，则注册该事件
+            if handler not in handlerList:
+                handlerList.append(handler)
+                self.__rebuildDispatchTable()
+
+    #----------------------------------------------------------------------
+    def unregister(self, type_, handler):
+        """注销事件处理函数监听"""
+        with self.__lock:
+            handlerList = self.__handlers.get(type_)
+            if handlerList is None:
+                return
+
+            # 如果该函数存在于列表中，则移除
+            if handler in handlerList:
+                handlerList.remove(handler)
+
+            # 如果函数列表为空，则从引擎中移除该事件类型
+            if not handlerList:
+                del self.__handlers[type_]
+
+            self.__rebuildDispatchTable()
+
+    #----------------------------------------------------------------------
+    def put(self, event):
+        """向事件所属通道的队列中存入事件"""
+        self.__queues[self.getLane(event)].put(event)
+
+    #----------------------------------------------------------------------
+    def registerGeneralHandler(self, handler):
+        """注册通用事件处理函数监听"""
+        with self.__lock:
+            if handler not in self.__generalHandlers:
+                self.__generalHandlers.append(handler)
+                self.__rebuildDispatchTable()
+
+    #----------------------------------------------------------------------
+    def unregisterGeneralHandler(self, handler):
+        """注销通用事件处理函数监听"""
+        with self.__lock:
+            if handler in self.__generalHandlers:
+                self.__generalHandlers.remove(handler)
+                self.__rebuildDispatchTable()
+
+    #----------------------------------------------------------------------
+    def getStatistics(self):
+        """获取各通道的队列深度和已处理事件数"""
+        names = ['general', 'priority'] + ['lane%d' % i for i in range(1, self.laneCount + 1)]
+        return {name: {'queue_size': queue.qsize(), 'processed': processed}
+                for name, queue, processed in zip(names, self.__queues, self.__processed)}
+
+
+#----------------------------------------------------------------------
+def getEventKey(event):
+    """
+    默认的分片键值：事件数据的vtSymbol，没有则使用gatewayName（账户类事件），
+    均没有时返回None
+    """
+    data = event.dict_.get('data')
+    if data is None:
+        return None
+
+    key = getattr(data, 'vtSymbol', None)
+    if key:
+        return key
+    return getattr(data, 'gatewayName', None) or None
+
+
 ########################################################################
 class Event:
     """事件对象"""
@@ -1,3 +1,4 @@
 # encoding: UTF-8
 
-from .vnrpc import RpcServer, RpcClient, RemoteException
\ No newline at end of file
+from .vnrpc import RpcServer, RpcClient, RemoteException, RpcTimeout
+from .vnrpc import PUB_DROP_OLDEST, PUB_DROP_NEWEST, PUB_BLOCK
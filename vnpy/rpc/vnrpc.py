@@ -3,6 +3,10 @@
 import threading
 import traceback
 import signal
+import asyncio
+from collections import deque, OrderedDict
+from time import time, sleep
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import zmq
 from msgpack import packb, unpackb
@@ -16,6 +20,14 @@ pLoads = cPickle.loads
 # 实现Ctrl-c中断recv
 signal.signal(signal.SIGINT, signal.SIG_DFL)
 
+# 推送队列已满时的处理方式
+PUB_DROP_OLDEST = 'dropOldest'      # 丢弃队列中最早的数据
+PUB_DROP_NEWEST = 'dropNewest'      # 丢弃新推送的数据
+PUB_BLOCK = 'block'                 # 阻塞推送线程，直到队列有空位
+
+# 合并推送的消息标记：[主题, PUB_BATCH, 格式1, 数据1, 格式2, 数据2, ...]，格式为b''时表示使用序列化工具打包
+PUB_BATCH = b'#batch'
+
 
 ########################################################################
 class RpcObject(object):
@@ -106,11 +118,28 @@ class RpcObject(object):
 
 ########################################################################
 class RpcServer(RpcObject):
-    """RPC服务器"""
+    """
+    RPC服务器
+    使用ROUTER socket接收请求，由工作线程池并发执行调用，单个慢调用不会阻塞其他客户端。
+    同时兼容REQ客户端（一次一个请求）和RpcClient的DEALER客户端（带请求编号，可同时发出多个请求）。
+    注册的函数可能在多个线程中同时被调用，workerCount=1时按顺序执行。
+    
+    publish只把数据放入有界队列，由推送线程发出，推送方（通常是事件引擎线程）不会被zmq发送阻塞。
+    推送线程每次把队列中同一主题的多条数据合并为一条消息发出（同一主题内保持顺序）。
+    """
 
     #----------------------------------------------------------------------
-    def __init__(self, repAddress, pubAddress):
-        """Constructor"""
+    def __init__(self, repAddress, pubAddress, workerCount=4,
+                 pubQueueSize=100000, pubDropPolicy=PUB_DROP_OLDEST, pubHwm=1000,
+                 pubFlushInterval=0, pubBatchSize=1000):
+        """
+        Constructor
+        pubQueueSize: 推送队列的最大长度
+        pubDropPolicy: 队列已满时的处理方式，PUB_DROP_OLDEST/PUB_DROP_NEWEST/PUB_BLOCK
+        pubHwm: zmq PUB socket的发送高水位（每个订阅者），超过后zmq丢弃发给该订阅者的消息
+        pubFlushInterval: 推送线程每次发送前等待积累数据的秒数，0为有数据即发送
+        pubBatchSize: 每次最多从队列取出的数据条数
+        """
         super(RpcServer, self).__init__()
         
         # 保存功能函数的字典，key是函数名，value是函数对象
@@ -119,25 +148,62 @@ class RpcServer(RpcObject):
         # zmq端口相关
         self.__context = zmq.Context()
         
-        self.__socketREP = self.__context.socket(zmq.REP)   # 请求回应socket
-        self.__socketREP.bind(repAddress)
+        self.__socketROUTER = self.__context.socket(zmq.ROUTER)     # 请求回应socket
+        self.__socketROUTER.bind(repAddress)
         
         self.__socketPUB = self.__context.socket(zmq.PUB)   # 数据广播socket
+        self.__socketPUB.setsockopt(zmq.SNDHWM, pubHwm)
         self.__socketPUB.bind(pubAddress)
+
+        # 工作线程返回调用结果的内部socket，结果统一由服务器线程通过ROUTER发出
+        replyAddress = 'inproc://rpc_reply_{0}'.format(id(self))
+        self.__socketReplyPULL = self.__context.socket(zmq.PULL)
+        self.__socketReplyPULL.bind(replyAddress)
+        self.__socketReplyPUSH = self.__context.socket(zmq.PUSH)
+        self.__socketReplyPUSH.connect(replyAddress)
+        self.__replyLock = threading.Lock()
         
         # 工作线程相关
         self.__active = False                             # 服务器的工作状态
         self.__thread = threading.Thread(target=self.run) # 服务器的工作线程
+        self.__workerCount = workerCount                  # 执行调用的线程数量
+        self.__executor = None                            # 执行调用的线程池
+
+        # 推送相关，队列中的元素为(主题, 格式, 数据)
+        if pubDropPolicy not in (PUB_DROP_OLDEST, PUB_DROP_NEWEST, PUB_BLOCK):
+            raise ValueError(u'不支持的推送队列处理方式：{0}'.format(pubDropPolicy))
+        self.__pubQueue = deque()
+        self.__pubQueueSize = pubQueueSize
+        self.__pubDropPolicy = pubDropPolicy
+        self.__pubFlushInterval = pubFlushInterval
+        self.__pubBatchSize = pubBatchSize
+        self.__pubCondition = threading.Condition()
+        self.__pubActive = False
+        self.__pubThread = threading.Thread(target=self.runPublish)    # 推送线程
+
+        # 推送统计，key是主题
+        self.__queuedDict = {}          # 在队列中等待发送的数量
+        self.__droppedDict = {}         # 因队列已满被丢弃的数量
+        self.__sentCount = 0            # 已发出的数据条数
+        self.__messageCount = 0         # 已发出的消息数量（合并后）
 
     #----------------------------------------------------------------------
     def start(self):
         """启动服务器"""
         # 将服务器设为启动
         self.__active = True
+
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=self.__workerCount)
         
         # 启动工作线程
-        if not self.__thread.isAlive():
+        if not self.__thread.is_alive():
             self.__thread.start()
+
+        # 启动推送线程
+        self.__pubActive = True
+        if not self.__pubThread.is_alive():
+            self.__pubThread.start()
         
     #----------------------------------------------------------------------
     def stop(self):
@@ -146,39 +212,77 @@ class RpcServer(RpcObject):
         self.__active = False
         
         # 等待工作线程退出
-        if self.__thread.isAlive():
+        if self.__thread.is_alive():
             self.__thread.join()
+
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=True)
+            self.__executor = None
+
+        # 推送线程发完队列中的数据后退出
+        with self.__pubCondition:
+            self.__pubActive = False
+            self.__pubCondition.notify_all()
+        if self.__pubThread.is_alive():
+            self.__pubThread.join()
     
     #----------------------------------------------------------------------
     def run(self):
         """服务器运行函数"""
+        poller = zmq.Poller()
+        poller.register(self.__socketROUTER, zmq.POLLIN)
+        poller.register(self.__socketReplyPULL, zmq.POLLIN)
+
         while self.__active:
             # 使用poll来等待事件到达，等待1秒（1000毫秒）
-            if not self.__socketREP.poll(1000):
-                continue
-            
-            # 从请求响应socket收取请求数据
-            reqb = self.__socketREP.recv()
-            
-            # 序列化解包
-            req = self.unpack(reqb)
-            
-            # 获取函数名和参数
-            name, args, kwargs = req
-            
-            # 获取引擎中对应的函数对象，并执行调用，如果有异常则捕捉后返回
-            try:
-                func = self.__functions[name]
-                r = func(*args, **kwargs)
-                rep = [True, r]
-            except Exception as e:
-                rep = [False, traceback.format_exc()]
-            
-            # 序列化打包
+            events = dict(poller.poll(1000))
+
+            # 收到的请求交给线程池执行
+            if self.__socketROUTER in events:
+                frames = self.__socketROUTER.recv_multipart()
+                self.__executor.submit(self.__process, frames)
+
+            # 发出工作线程返回的调用结果
+            if self.__socketReplyPULL in events:
+                self.__socketROUTER.send_multipart(self.__socketReplyPULL.recv_multipart())
+
+    #----------------------------------------------------------------------
+    def __process(self, frames):
+        """
+        在工作线程中执行一个请求
+        REQ客户端的请求为：[路由信息..., 空帧, 请求数据]
+        DEALER客户端的请求为：[路由信息..., 空帧, 请求编号, 请求数据]
+        回应时原样带回请求数据之前的各帧
+        """
+        try:
+            i = frames.index(b'')
+        except ValueError:
+            # 不符合格式的消息，无法回应
+            return
+        if len(frames) - i - 1 not in (1, 2):
+            return
+        header = frames[:-1]
+        reqb = frames[-1]
+
+        # 获取引擎中对应的函数对象，并执行调用，如果有异常则捕捉后返回
+        try:
+            # 序列化解包，获取函数名和参数
+            name, args, kwargs = self.unpack(reqb)
+            func = self.__functions[name]
+            r = func(*args, **kwargs)
+            rep = [True, r]
+        except Exception as e:
+            rep = [False, traceback.format_exc()]
+
+        # 序列化打包
+        try:
             repb = self.pack(rep)
-            
-            # 通过请求响应socket返回调用结果
-            self.__socketREP.send(repb)
+        except Exception as e:
+            repb = self.pack([False, traceback.format_exc()])
+
+        # 交给服务器线程，通过ROUTER返回调用结果
+        with self.__replyLock:
+            self.__socketReplyPUSH.send_multipart(header + [repb])
         
     #----------------------------------------------------------------------
     def publish(self, topic, data):
@@ -187,12 +291,119 @@ class RpcServer(RpcObject):
         topic：主题内容
         data：具体的数据
         """
-        # 序列化数据
+        # 序列化数据，放入推送队列
         datab = self.pack(data)
-        if len(topic) >0 :
-            topic = topic.encode('utf-8')
-        # 通过广播socket发送数据
-        self.__socketPUB.send_multipart([topic, datab])
+        self.__putPublish(topic, b'', datab)
+
+    #----------------------------------------------------------------------
+    def publishRaw(self, topic, kind, datab):
+        """
+        广播推送已按其他格式打包的数据
+        kind：格式名称（bytes），客户端据此使用decodeFunc解包
+        datab：打包后的数据（bytes）
+        """
+        self.__putPublish(topic, kind, datab)
+
+    #----------------------------------------------------------------------
+    def __putPublish(self, topic, kind, datab):
+        """放入推送队列，队列已满时按pubDropPolicy处理"""
+        with self.__pubCondition:
+            queue = self.__pubQueue
+
+            if len(queue) >= self.__pubQueueSize:
+                if self.__pubDropPolicy == PUB_DROP_NEWEST:
+                    self.__countDropped(topic)
+                    return
+                elif self.__pubDropPolicy == PUB_DROP_OLDEST:
+                    oldTopic = queue.popleft()[0]
+                    self.__queuedDict[oldTopic] -= 1
+                    self.__countDropped(oldTopic)
+                else:
+                    # 推送线程未运行时无法等待，直接丢弃
+                    while len(queue) >= self.__pubQueueSize and self.__pubActive:
+                        self.__pubCondition.wait(1)
+                    if len(queue) >= self.__pubQueueSize:
+                        self.__countDropped(topic)
+                        return
+
+            queue.append((topic, kind, datab))
+            self.__queuedDict[topic] = self.__queuedDict.get(topic, 0) + 1
+            self.__pubCondition.notify_all()
+
+    #----------------------------------------------------------------------
+    def __countDropped(self, topic):
+        """记录丢弃的数据"""
+        self.__droppedDict[topic] = self.__droppedDict.get(topic, 0) + 1
+
+    #----------------------------------------------------------------------
+    def runPublish(self):
+        """推送线程运行函数"""
+        while True:
+            with self.__pubCondition:
+                while not self.__pubQueue and self.__pubActive:
+                    self.__pubCondition.wait(1)
+
+                # 停止后发完队列中的数据再退出
+                if not self.__pubQueue:
+                    return
+
+            # 等待一段时间，积累更多数据一起发送
+            if self.__pubFlushInterval > 0 and self.__pubActive:
+                sleep(self.__pubFlushInterval)
+
+            with self.__pubCondition:
+                queue = self.__pubQueue
+                n = min(len(queue), self.__pubBatchSize)
+                itemList = [queue.popleft() for i in range(n)]
+                for topic, kind, datab in itemList:
+                    self.__queuedDict[topic] -= 1
+                # 唤醒阻塞的推送方
+                self.__pubCondition.notify_all()
+
+            self.__sendBatch(itemList)
+
+    #----------------------------------------------------------------------
+    def __sendBatch(self, itemList):
+        """按主题合并后发出"""
+        topicDict = OrderedDict()
+        for topic, kind, datab in itemList:
+            topicDict.setdefault(topic, []).append((kind, datab))
+
+        for topic, dataList in topicDict.items():
+            topicb = topic.encode('utf-8') if len(topic) > 0 else b''
+
+            if len(dataList) == 1:
+                # 单条数据保持原来的消息格式
+                kind, datab = dataList[0]
+                if kind:
+                    frames = [topicb, kind, datab]
+                else:
+                    frames = [topicb, datab]
+            else:
+                frames = [topicb, PUB_BATCH]
+                for kind, datab in dataList:
+                    frames.append(kind)
+                    frames.append(datab)
+
+            # 通过广播socket发送数据，PUB socket在订阅者达到高水位时直接丢弃，不会阻塞
+            self.__socketPUB.send_multipart(frames)
+
+            self.__sentCount += len(dataList)
+            self.__messageCount += 1
+
+    #----------------------------------------------------------------------
+    def getPublishMetrics(self):
+        """
+        推送统计
+        queued：各主题在队列中等待发送的数量
+        dropped：各主题因队列已满被丢弃的数量（不含zmq在订阅者达到高水位时丢弃的消息）
+        """
+        with self.__pubCondition:
+            return {'queueLength': len(self.__pubQueue),
+                    'queued': {k: v for k, v in self.__queuedDict.items() if v},
+                    'dropped': dict(self.__droppedDict),
+                    'sentCount': self.__sentCount,
+                    'messageCount': self.__messageCount}
         
     #----------------------------------------------------------------------
     def register(self, func):
@@ -201,57 +412,100 @@ class RpcServer(RpcObject):
 
 ########################################################################
 class RpcClient(RpcObject):
-    """RPC客户端"""
+    """
+    RPC客户端
+    使用DEALER socket发送请求，每个请求带有请求编号，可同时发出多个请求，按编号匹配回应。
+    请求的收发由客户端的请求线程完成，可以在多个线程中同时调用。
+    client.func(*args, **kwargs)：同步调用，等待结果返回
+    client.callAsync(name, args, kwargs, timeout)：异步调用，返回concurrent.futures.Future
+    client.callAwaitable(name, args, kwargs, timeout)：在asyncio中使用，返回可await的对象
+    """
     
     #----------------------------------------------------------------------
-    def __init__(self, reqAddress, subAddress):
-        """Constructor"""
+    def __init__(self, reqAddress, subAddress, timeout=None):
+        """
+        Constructor
+        timeout: 同步调用的缺省超时秒数，None为不超时
+        """
         super(RpcClient, self).__init__()
         
         # zmq端口相关
         self.__reqAddress = reqAddress
         self.__subAddress = subAddress
+        self.timeout = timeout
+        self.decodeFunc = None      # 解包publishRaw推送数据的函数decodeFunc(kind, datab)，返回None时忽略
         
         self.__context = zmq.Context()
-        self.__socketREQ = self.__context.socket(zmq.REQ)   # 请求发出socket
+        self.__socketDEALER = self.__context.socket(zmq.DEALER)     # 请求发出socket
+        self.__socketDEALER.setsockopt(zmq.LINGER, 0)
         self.__socketSUB = self.__context.socket(zmq.SUB)   # 广播订阅socket        
 
+        # 调用线程把请求交给请求线程的内部socket
+        requestAddress = 'inproc://rpc_request_{0}'.format(id(self))
+        self.__socketRequestPULL = self.__context.socket(zmq.PULL)
+        self.__socketRequestPULL.bind(requestAddress)
+        self.__socketRequestPUSH = self.__context.socket(zmq.PUSH)
+        self.__socketRequestPUSH.connect(requestAddress)
+        self.__requestLock = threading.Lock()
+
+        # 等待回应的请求，key是请求编号，value是[函数名, Future, 超时时间]
+        self.__reqCount = 0
+        self.__pendingDict = {}
+        self.__pendingLock = threading.Lock()
+
         # 工作线程相关，用于处理服务器推送的数据
         self.__active = False                                   # 客户端的工作状态
         self.__thread = threading.Thread(target=self.run)       # 客户端的工作线程
+        self.__reqThread = threading.Thread(target=self.runRequest)     # 请求收发线程
         
     #----------------------------------------------------------------------
     def __getattr__(self, name):
         """实现远程调用功能"""
         # 执行远程调用任务
         def dorpc(*args, **kwargs):
-            # 生成请求
-            req = [name, args, kwargs]
-            
-            # 序列化打包请求
-            reqb = self.pack(req)
-            
-            # 发送请求并等待回应
-            self.__socketREQ.send(reqb)
-            repb = self.__socketREQ.recv()
-            
-            # 序列化解包回应
-            rep = self.unpack(repb)
-            
-            # 若正常则返回结果，调用失败则触发异常
-            if rep[0]:
-                return rep[1]
-            else:
-                raise RemoteException(rep[1])
+            # 发送请求并等待回应，调用失败则触发异常
+            return self.callAsync(name, args, kwargs).result()
         
         return dorpc
+
+    #----------------------------------------------------------------------
+    def callAsync(self, name, args=(), kwargs=None, timeout=None):
+        """
+        异步远程调用，返回concurrent.futures.Future
+        调用失败时Future的异常为RemoteException，超时为RpcTimeout
+        timeout: 超时秒数，None时使用客户端的缺省超时
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        # 生成请求，序列化打包
+        reqb = self.pack([name, args, kwargs or {}])
+
+        future = Future()
+        expireTime = time() + timeout if timeout else None
+
+        with self.__requestLock:
+            self.__reqCount += 1
+            reqID = str(self.__reqCount).encode('utf-8')
+            with self.__pendingLock:
+                self.__pendingDict[reqID] = [name, future, expireTime]
+
+            # 交给请求线程发送
+            self.__socketRequestPUSH.send_multipart([reqID, reqb])
+
+        return future
+
+    #----------------------------------------------------------------------
+    def callAwaitable(self, name, args=(), kwargs=None, timeout=None):
+        """在asyncio的事件循环中调用，返回可await的对象"""
+        return asyncio.wrap_future(self.callAsync(name, args, kwargs, timeout))
     
     #----------------------------------------------------------------------
     def start(self):
         """启动客户端"""
         # 连接端口
         print( 'conenct to req:{0}'.format(self.__reqAddress))
-        self.__socketREQ.connect(self.__reqAddress)
+        self.__socketDEALER.connect(self.__reqAddress)
         print( 'connect to sub:{0}'.format(self.__subAddress))
         self.__socketSUB.connect(self.__subAddress)
     
@@ -259,8 +513,10 @@ class RpcClient(RpcObject):
         self.__active = True
         
         # 启动工作线程
-        if not self.__thread.isAlive():
+        if not self.__thread.is_alive():
             self.__thread.start()
+        if not self.__reqThread.is_alive():
+            self.__reqThread.start()
     
     #----------------------------------------------------------------------
     def stop(self):
@@ -269,8 +525,77 @@ class RpcClient(RpcObject):
         self.__active = False
         
         # 等待工作线程退出
-        if self.__thread.isAlive():
+        if self.__thread.is_alive():
             self.__thread.join()
+        if self.__reqThread.is_alive():
+            self.__reqThread.join()
+
+        # 未完成的调用全部失败
+        with self.__pendingLock:
+            pendingList = list(self.__pendingDict.values())
+            self.__pendingDict.clear()
+        for name, future, expireTime in pendingList:
+            if not future.done():
+                future.set_exception(RemoteException(u'RPC客户端已停止，调用{0}未完成'.format(name)))
+
+    #----------------------------------------------------------------------
+    def runRequest(self):
+        """请求线程运行函数：发送请求，接收回应，检查超时"""
+        poller = zmq.Poller()
+        poller.register(self.__socketDEALER, zmq.POLLIN)
+        poller.register(self.__socketRequestPULL, zmq.POLLIN)
+
+        while self.__active:
+            events = dict(poller.poll(self.__getPollTimeout()))
+
+            # 发送调用线程提交的请求
+            if self.__socketRequestPULL in events:
+                reqID, reqb = self.__socketRequestPULL.recv_multipart()
+                self.__socketDEALER.send_multipart([b'', reqID, reqb])
+
+            # 按请求编号匹配回应
+            if self.__socketDEALER in events:
+                frames = self.__socketDEALER.recv_multipart()
+                with self.__pendingLock:
+                    pending = self.__pendingDict.pop(frames[-2], None)
+
+                if pending is not None and not pending[1].done():
+                    try:
+                        rep = self.unpack(frames[-1])
+                        if rep[0]:
+                            pending[1].set_result(rep[1])
+                        else:
+                            pending[1].set_exception(RemoteException(rep[1]))
+                    except Exception as e:
+                        pending[1].set_exception(e)
+
+            self.__checkTimeout()
+
+    #----------------------------------------------------------------------
+    def __getPollTimeout(self):
+        """距离最近一个调用超时的毫秒数，最长1秒"""
+        now = time()
+        timeout = 1000
+        with self.__pendingLock:
+            for name, future, expireTime in self.__pendingDict.values():
+                if expireTime is not None:
+                    timeout = min(timeout, max(int((expireTime - now) * 1000) + 1, 0))
+        return timeout
+
+    #----------------------------------------------------------------------
+    def __checkTimeout(self):
+        """超时的调用设置RpcTimeout异常"""
+        now = time()
+        expiredList = []
+        with self.__pendingLock:
+            for reqID, (name, future, expireTime) in list(self.__pendingDict.items()):
+                if expireTime is not None and expireTime <= now:
+                    del self.__pendingDict[reqID]
+                    expiredList.append((name, future))
+
+        for name, future in expiredList:
+            if not future.done():
+                future.set_exception(RpcTimeout(u'RPC调用{0}超时'.format(name)))
         
     #----------------------------------------------------------------------
     def run(self):
@@ -281,15 +606,36 @@ class RpcClient(RpcObject):
                 continue
             
             # 从订阅socket收取广播数据
-            topic, datab = self.__socketSUB.recv_multipart()
+            frames = self.__socketSUB.recv_multipart()
+            topic = frames[0]
             if len(topic)>0:
                 topic = topic.decode("utf-8")
 
+            if len(frames) == 2:
+                self.__processPublish(topic, b'', frames[1])
+            elif frames[1] == PUB_BATCH:
+                # 合并推送的多条数据
+                for i in range(2, len(frames) - 1, 2):
+                    self.__processPublish(topic, frames[i], frames[i+1])
+            else:
+                self.__processPublish(topic, frames[1], frames[2])
+
+    #----------------------------------------------------------------------
+    def __processPublish(self, topic, kind, datab):
+        """解包一条推送数据并调用回调函数"""
+        if kind:
+            # 按其他格式打包的数据
+            if self.decodeFunc is None:
+                return
+            data = self.decodeFunc(kind, datab)
+            if data is None:
+                return
+        else:
             # 序列化解包
             data = self.unpack(datab)
 
-            # 调用回调函数处理
-            self.callback(topic, data)
+        # 调用回调函数处理
+        self.callback(topic, data)
             
     #----------------------------------------------------------------------
     def callback(self, topic, data):
@@ -303,11 +649,9 @@ class RpcClient(RpcObject):
         
         可以使用topic=''来订阅所有的主题
         """
-        if len(topic)==0:
-            topic = ''
-        else:
+        if not isinstance(topic, bytes):
             topic = topic.encode('utf-8')
-        self.__socketSUB.setsockopt_string(zmq.SUBSCRIBE, topic)
+        self.__socketSUB.setsockopt(zmq.SUBSCRIBE, topic)
 
 
 ########################################################################
@@ -324,4 +668,8 @@ class RemoteException(Exception):
         """输出错误信息"""
         return self.__value
 
-    
\ No newline at end of file
+
+########################################################################
+class RpcTimeout(RemoteException):
+    """RPC调用超时"""
+    pass
@@ -343,7 +343,8 @@ class CmaEngine(object):
 
         # 1. 获取事件的Tick数据
         tick = event.dict_['data']
-        tick = copy.copy(tick)
+        # 转换为紧凑的CtaSlotTickData，缓存与推送给策略的是同一个对象，无需再次复制
+        tick = CtaSlotTickData.fromTick(tick)
         # 移除待订阅的合约清单
         if tick.vtSymbol in self.pendingSubcribeSymbols:
             self.writeCtaLog(u'已成功订阅{0}，从待订阅清单中移除'.format(tick.vtSymbol))
@@ -358,20 +359,15 @@ class CmaEngine(object):
         # 3.推送tick到对应的策略对象进行处理
         if tick.vtSymbol in self.tickStrategyDict:
 
-            # 4.将vtTickData数据转化为ctaTickData
-            ctaTick = CtaTickData()
-            d = ctaTick.__dict__
-            for key in d.keys():
-                d[key] = tick.__getattribute__(key)
-
-            if not ctaTick.datetime:
+            # 4.CtaSlotTickData已包含ctaTickData的全部字段，只需补充datetime
+            if not tick.datetime:
                 # 添加datetime字段
-                ctaTick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y-%m-%d %H:%M:%S.%f')
+                tick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y-%m-%d %H:%M:%S.%f')
 
             # 逐个推送到策略实例中
             l = self.tickStrategyDict[tick.vtSymbol]
             for strategy in l:
-                self.callStrategyFunc(strategy, strategy.onTick, ctaTick)
+                self.callStrategyFunc(strategy, strategy.onTick, tick)
 
     # ----------------------------------------------------------------------
     def processOrderEvent(self, event):
@@ -524,8 +520,10 @@ class CmaEngine(object):
 
     # ----------------------------------------------------------------------
     def insertData(self, dbName, collectionName, data):
-        """插入数据到数据库（这里的data可以是CtaTickData或者CtaBarData）"""
-        self.mainEngine.dbInsert(dbName, collectionName, data.__dict__)
+        """插入数据到数据库（这里的data可以是CtaTickData、CtaSlotTickData或者CtaBarData）"""
+        # CtaSlotTickData没有__dict__，使用toDict
+        d = data.toDict() if hasattr(data, 'toDict') else data.__dict__
+        self.mainEngine.dbInsert(dbName, collectionName, d)
 
     # ----------------------------------------------------------------------
     def loadBar(self, dbName, collectionName, days):
@@ -13,7 +13,10 @@ cta_engine_path = os.path.abspath(os.path.dirname(__file__))
 from datetime import datetime, timedelta
 from collections import OrderedDict
 from itertools import product
+from bisect import bisect_left, bisect_right
 import multiprocessing
+import tempfile
+import shutil
 import pymongo
 #import MySQLdb
 import json
@@ -35,6 +38,9 @@ from vnpy.trader.vtEvent import *
 from vnpy.trader.setup_logger import setup_logger
 from vnpy.trader.data_source import DataSource
 from vnpy.trader.app.ctaStrategy.ctaEngine import PositionBuffer
+from vnpy.trader.app.ctaStrategy.ctaColumnStore import CtaColumnStore, COLUMN_KIND_TICK, COLUMN_KIND_BAR
+from vnpy.trader.app.ctaStrategy.ctaOptimization import SEARCH_GRID, SEARCH_RANDOM, SEARCH_HALVING, SEARCH_GENETIC, \
+    SEARCH_COORDINATE, SEARCH_CLASS_DICT, FULL_WINDOW
 
 ########################################################################
 class BacktestingEngine(object):
@@ -56,6 +62,14 @@ class BacktestingEngine(object):
     REALTIME_MODE ='RealTime'       # 逐笔交易计算资金，供策略获取资金容量，计算开仓数量
     FINAL_MODE = 'Final'            # 最后才统计交易，不适合按照百分比等开仓数量计算
 
+    # 并行优化时，复制到子进程回测引擎的配置项
+    ENGINE_SETTING_KEYS = ['mode', 'startDate', 'initDays', 'endDate',
+                           'dataStartDate', 'dataEndDate', 'strategyStartDate',
+                           'slippage', 'rate', 'size', 'priceTick', 'minDiff', 'margin_rate',
+                           'dbName', 'symbol', 'strategy_name', 'is_7x24', 'barTimeInterval',
+                           'initCapital', 'percentLimit', 'calculateMode', 'usageCompounding',
+                           'fixCommission', 'useBreakoutMode']
+
     #----------------------------------------------------------------------
     def __init__(self, eventEngine = None):
         """Constructor"""
@@ -69,7 +83,7 @@ class BacktestingEngine(object):
         # 本地停止单字典
         # key为stopOrderID，value为stopOrder对象
         self.stopOrderDict = {}             # 停止单撤销后不会从本字典中删除
-        self.workingStopOrderDict = {}      # 停止单撤销后会从本字典中删除
+        self.workingStopOrderDict = WorkingOrderDict()      # 停止单撤销后会从本字典中删除
 
         # 引擎类型为回测
         self.engineType = ENGINETYPE_BACKTESTING
@@ -91,6 +105,7 @@ class BacktestingEngine(object):
 
         self.dbClient = None        # 数据库客户端
         self.dbCursor = None        # 数据库指针
+        self.columnStore = None     # 列式本地存储（CtaColumnStore），设置后优先从中读取回测数据
         
         self.historyData = []       # 历史数据的列表，回测用
         self.initData = []          # 初始化用的数据
@@ -105,7 +120,7 @@ class BacktestingEngine(object):
         self.strategyStartDate = None   # 策略启动日期（即前面的数据用于初始化），datetime对象
         
         self.limitOrderDict = OrderedDict()         # 限价单字典
-        self.workingLimitOrderDict = OrderedDict()  # 活动限价单字典，用于进行撮合用
+        self.workingLimitOrderDict = WorkingOrderDict()     # 活动限价单字典，按价格索引，用于进行撮合用
         self.limitOrderCount = 0                    # 限价单编号
 
         # 持仓缓存字典
@@ -230,6 +245,15 @@ class BacktestingEngine(object):
         self.dbName = dbName
         self.symbol = symbol
 
+    #----------------------------------------------------------------------
+    def setColumnStore(self, rootPath):
+        """
+        设置列式本地存储的目录
+        设置后，回测数据优先从列式存储中以内存映射方式读取；
+        从数据库/数据源加载的数据会写入列式存储，供下次回测使用
+        """
+        self.columnStore = CtaColumnStore(rootPath) if rootPath else None
+
     def setMarginRate(self, margin_rate):
 
         if margin_rate!= EMPTY_FLOAT:
@@ -283,6 +307,25 @@ class BacktestingEngine(object):
         :return: 
         """
         self.daily_report_name = report_file
+
+    #----------------------------------------------------------------------
+    def getEngineSetting(self):
+        """
+        导出回测引擎的完整配置（可pickle的字典），用于在其他进程中重建相同配置的回测引擎
+        列式存储只传递目录，由子进程自行以内存映射方式打开
+        """
+        setting = {key: getattr(self, key) for key in self.ENGINE_SETTING_KEYS if hasattr(self, key)}
+        setting['columnStorePath'] = self.columnStore.rootPath if self.columnStore is not None else ''
+        return setting
+
+    #----------------------------------------------------------------------
+    def loadEngineSetting(self, setting):
+        """载入getEngineSetting导出的配置"""
+        for key in self.ENGINE_SETTING_KEYS:
+            if key in setting:
+                setattr(self, key, setting[key])
+
+        self.setColumnStore(setting.get('columnStorePath', ''))
     #----------------------------------------------------------------------
     def connectMysql(self):
         """连接MysqlDB"""
@@ -410,13 +453,18 @@ class BacktestingEngine(object):
         for i in range(0, testdays):
             testday = self.dataStartDate + timedelta(days=i)
 
-            # 看本地缓存是否存在
-            cachefilename = u'{0}_{1}_{2}'.format(self.symbol, symbol, testday.strftime('%Y%m%d'))
-            rawTicks = self.__loadTicksFromLocalCache(cachefilename)
-
-            dt = None
+            # 优先从列式存储读取（按需生成tick对象）
+            tradingDay = testday.strftime('%Y%m%d')
+            fromColumnStore = self.columnStore is not None and \
+                              self.columnStore.hasPartition(COLUMN_KIND_TICK, symbol, tradingDay)
+            if fromColumnStore:
+                rawTicks = self.columnStore.iterRecords(COLUMN_KIND_TICK, symbol, tradingDay, dataClass)
+            else:
+                # 看本地缓存是否存在
+                cachefilename = u'{0}_{1}_{2}'.format(self.symbol, symbol, tradingDay)
+                rawTicks = self.__loadTicksFromLocalCache(cachefilename)
 
-            if len(rawTicks) < 1 and isOffline == False:
+            if not fromColumnStore and len(rawTicks) < 1 and isOffline == False:
 
                 testday_monrning = testday  # testday.replace(hour=0, minute=0, second=0, microsecond=0)
                 testday_midnight = testday + timedelta(
@@ -443,10 +491,16 @@ class BacktestingEngine(object):
                                     str(datetime.now() - process_time)))
 
                 # 保存本地cache文件
-                if count_ticks > 0:
+                if count_ticks > 0 and self.columnStore is None:
                     self.__saveTicksToLocalCache(cachefilename, rawTicks)
 
+            # 写入列式存储，下次直接内存映射读取
+            if self.columnStore is not None and not fromColumnStore and len(rawTicks) > 0:
+                self.columnStore.writeRecords(COLUMN_KIND_TICK, symbol, tradingDay, rawTicks)
+
+            count_ticks = 0
             for t in rawTicks:
+                count_ticks += 1
                 # 排除涨停/跌停的数据
                 if ((t.askPrice1 == float('1.79769E308') or t.askPrice1 == 0) and t.askVolume1 == 0) \
                         or ((t.bidPrice1 == float('1.79769E308') or t.bidPrice1 == 0) and t.bidVolume1 == 0):
@@ -460,7 +514,7 @@ class BacktestingEngine(object):
                 self.last_leg1_tick.vtSymbol = symbol
 
             # 记录每日净值
-            if len(rawTicks) > 1:
+            if count_ticks > 1:
                 self.savingDailyData(testday, self.capital, self.maxCapital, self.totalCommission)
 
     def __loadDataHistoryFromLocalCache(self, symbol, startDate, endDate):
@@ -1204,6 +1258,9 @@ class BacktestingEngine(object):
             return False
 
         else:
+            # tick转换为紧凑的CtaSlotTickData后写入，缩小cache文件
+            arbticks = [CtaSlotTickData.fromTick(t) if isinstance(t, CtaTickData) else t for t in arbticks]
+
             # 写入cache文件
             cache = open(cacheFile, mode='wb')
             cPickle.dump(arbticks, cache)
@@ -2081,12 +2138,20 @@ class BacktestingEngine(object):
         testdays = (self.dataEndDate - self.dataStartDate).days
 
         rawBars = []
-        # 看本地缓存是否存在
-        cachefilename = u'{0}_{1}_{2}'.format(self.symbol, self.dataStartDate.strftime('%Y%m%d'),
-                                              self.dataEndDate.strftime('%Y%m%d'))
-        rawBars = self.__loadTicksFromLocalCache(cachefilename)
+        startDay = self.dataStartDate.strftime('%Y%m%d')
+        endDay = self.dataEndDate.strftime('%Y%m%d')
+
+        # 优先从列式存储读取（按需生成bar对象）
+        fromColumnStore = self.columnStore is not None and \
+                          self.columnStore.hasRange(COLUMN_KIND_BAR, self.symbol, startDay, endDay)
+        if fromColumnStore:
+            rawBars = self.columnStore.iterRange(COLUMN_KIND_BAR, self.symbol, startDay, endDay, CtaBarData)
+        else:
+            # 看本地缓存是否存在
+            cachefilename = u'{0}_{1}_{2}'.format(self.symbol, startDay, endDay)
+            rawBars = self.__loadTicksFromLocalCache(cachefilename)
 
-        if len(rawBars) < 1:
+        if not fromColumnStore and len(rawBars) < 1:
             self.writeCtaLog(u'从数据库中读取数据')
 
             query_time = datetime.now()
@@ -2129,12 +2194,19 @@ class BacktestingEngine(object):
                                      count_bars, str(datetime.now() - query_time), str(datetime.now() - process_time)))
 
             # 保存本地cache文件
-            if count_bars > 0:
+            if count_bars > 0 and self.columnStore is None:
                 self.__saveTicksToLocalCache(cachefilename, rawBars)
 
-        if len(rawBars) < 1:
-            self.writeCtaLog(u'ERROR 拿不到指定日期的数据，结束')
-            return
+        if not fromColumnStore:
+            if len(rawBars) < 1:
+                self.writeCtaLog(u'ERROR 拿不到指定日期的数据，结束')
+                return
+
+            # 按交易日写入列式存储，并登记已加载的区间
+            if self.columnStore is not None:
+                self.columnStore.writeRecordsByDay(COLUMN_KIND_BAR, self.symbol, rawBars,
+                                                   lambda bar: bar.tradingDay.strftime('%Y%m%d'))
+                self.columnStore.addRange(COLUMN_KIND_BAR, self.symbol, startDay, endDay)
 
         self.output(u'开始回放数据')
         last_tradingDay = 0
@@ -2275,23 +2347,20 @@ class BacktestingEngine(object):
     def runHistoryDataFromMongo(self):
         """
         根据测试的每一天，从MongoDB载入历史数据，并推送Tick至回测函数
+        设置了列式存储时，已完整加载过的日期区间直接从列式存储内存映射回放，不再连接数据库
         :return: 
         """
-
-        host, port, log = loadMongoSetting()
-
-        self.dbClient = pymongo.MongoClient(host, port)
-        collection = self.dbClient[self.dbName][self.symbol]
-
         self.output(u'开始载入数据')
 
         # 首先根据回测模式，确认要使用的数据类
         if self.mode == self.BAR_MODE:
             dataClass = CtaBarData
             func = self.newBar
+            kind = COLUMN_KIND_BAR
         else:
             dataClass = CtaTickData
             func = self.newTick
+            kind = COLUMN_KIND_TICK
 
         # 载入回测数据
         if not self.dataEndDate:
@@ -2303,35 +2372,71 @@ class BacktestingEngine(object):
             self.writeCtaLog(u'回测时间不足')
             return
 
+        # 按自然日分区，与按交易日分区的数据区分开
+        kind = u'{}_{}'.format(kind, self.dbName)
+        startDay = self.dataStartDate.strftime('%Y%m%d')
+        endDay = (self.dataStartDate + timedelta(days=testdays - 1)).strftime('%Y%m%d')
+        fromColumnStore = self.columnStore is not None and \
+                          self.columnStore.hasRange(kind, self.symbol, startDay, endDay)
+
+        collection = None
+        if not fromColumnStore:
+            host, port, log = loadMongoSetting()
+
+            self.dbClient = pymongo.MongoClient(host, port)
+            collection = self.dbClient[self.dbName][self.symbol]
+
         # 循环每一天
         for i in range(0, testdays):
             testday = self.dataStartDate + timedelta(days=i)
             testday_monrning = testday  #testday.replace(hour=0, minute=0, second=0, microsecond=0)
             testday_midnight = testday + timedelta(days=1) #testday.replace(hour=23, minute=59, second=59, microsecond=999999)
+            tradingDay = testday.strftime('%Y%m%d')
 
             query_time = datetime.now()
-            # 载入初始化需要用的数据
-            flt = {'datetime': {'$gte': testday_monrning,
-                                '$lt': testday_midnight}}
+            if fromColumnStore:
+                # 区间内没有分区的日期，即没有数据
+                if self.columnStore.hasPartition(kind, self.symbol, tradingDay):
+                    initCursor = self.columnStore.iterRecords(kind, self.symbol, tradingDay, dataClass)
+                else:
+                    initCursor = []
+            else:
+                # 载入初始化需要用的数据
+                flt = {'datetime': {'$gte': testday_monrning,
+                                    '$lt': testday_midnight}}
 
-            initCursor = collection.find(flt).sort('datetime', pymongo.ASCENDING)
+                initCursor = collection.find(flt).sort('datetime', pymongo.ASCENDING)
 
             process_time = datetime.now()
             # 将数据从查询指针中读取出，并生成列表
             count_ticks = 0
+            records = []
 
             for d in initCursor:
-                data = dataClass()
-                data.__dict__ = d
+                if fromColumnStore:
+                    data = d
+                else:
+                    data = dataClass()
+                    data.__dict__ = d
+                    if self.columnStore is not None:
+                        records.append(data)
                 func(data)
                 count_ticks += 1
 
+            # 写入列式存储，下次（或并行优化的其他进程）直接内存映射读取
+            if records:
+                self.columnStore.writeRecords(kind, self.symbol, tradingDay, records)
+
             self.output(u'回测日期{0}，数据量：{1}，查询耗时:{2},回测耗时:{3}'
                         .format(testday.strftime('%Y-%m-%d'), count_ticks, str(datetime.now() - query_time),
                                 str(datetime.now() - process_time)))
             # 记录每日净值
             self.savingDailyData(testday, self.capital, self.maxCapital,self.totalCommission)
 
+        # 登记已完整加载的区间
+        if self.columnStore is not None and not fromColumnStore:
+            self.columnStore.addRange(kind, self.symbol, startDay, endDay)
+
     def __sendOnBarEvent(self, bar):
         """发送Bar的事件"""
         if self.eventEngine is not None:
@@ -2448,7 +2553,7 @@ class BacktestingEngine(object):
         # Symbol参数:指定合约的撤单；
         # OFFSET参数:指定Offset的撤单,缺省不填写时，为所有
         self.writeCtaLog(u'从所有订单中撤销{0}\{1}'.format(offset, symbol))
-        for vtOrderID in self.workingLimitOrderDict.keys():
+        for vtOrderID in list(self.workingLimitOrderDict.keys()):
             order = self.workingLimitOrderDict[vtOrderID]
 
             if offset == EMPTY_STRING:
@@ -2528,13 +2633,17 @@ class BacktestingEngine(object):
             vtSymbol = self.tick.vtSymbol
             symbol = self.tick.symbol
 
-        # 遍历限价单字典中的所有限价单
-        workingLimitOrderDictClone = copy.deepcopy(self.workingLimitOrderDict)
-        for orderID, order in list(workingLimitOrderDictClone.items()):
-            # 判断是否会成交
-            buyCross = order.direction == DIRECTION_LONG and order.price >= buyCrossPrice and (vtSymbol.lower() == order.vtSymbol.lower() or symbol.lower() == order.vtSymbol.lower())
-            sellCross = order.direction == DIRECTION_SHORT and order.price <= sellCrossPrice and (vtSymbol.lower() == order.vtSymbol.lower() or symbol.lower() == order.vtSymbol.lower())
-            
+        # 从价格索引中取出会成交的限价单（多单价格>=buyCrossPrice，空单价格<=sellCrossPrice），按委托顺序撮合
+        crossList = self.workingLimitOrderDict.getCrossOrders([vtSymbol.lower(), symbol.lower()],
+                                                              (buyCrossPrice, None), (None, sellCrossPrice))
+        for orderID, order in crossList:
+            # 撮合过程中，已在策略回调中撤销的委托不再成交
+            if orderID not in self.workingLimitOrderDict:
+                continue
+
+            buyCross = order.direction == DIRECTION_LONG
+            sellCross = not buyCross
+
             # 如果发生了成交
             if buyCross or sellCross:
                 # 推送成交数据
@@ -2582,7 +2691,6 @@ class BacktestingEngine(object):
                     posBuffer.vtSymbol = trade.vtSymbol
                     self.posBufferDict[trade.vtSymbol] = posBuffer
                 posBuffer.updateTradeData(trade)
-                self.writeCtaLog(u'DEBUG-- [ctaBacktesting] crossLimitOrder: TradeId:{},  posBuffer = {}'.format(tradeID, posBuffer.toStr()))
 
                 # 推送委托数据
                 order.tradedVolume = order.totalVolume
@@ -2617,13 +2725,17 @@ class BacktestingEngine(object):
             vtSymbol = self.tick.vtSymbol
             symbol = self.tick.symbol
 
-        # 遍历停止单字典中的所有停止单
-        workingStopOrderDictClone = copy.deepcopy(self.workingStopOrderDict)
-        for stopOrderID, so in workingStopOrderDictClone.items():
-            # 判断是否会成交
-            buyCross = so.direction == DIRECTION_LONG and so.price <= buyCrossPrice and (vtSymbol.lower() == so.vtSymbol.lower() or symbol.lower() == order.vtSymbol.lower())
-            sellCross = so.direction == DIRECTION_SHORT and so.price >= sellCrossPrice and (vtSymbol.lower() == so.vtSymbol.lower() or symbol.lower() == order.vtSymbol.lower())
-            
+        # 从价格索引中取出会触发的停止单（多单价格<=buyCrossPrice，空单价格>=sellCrossPrice），按委托顺序撮合
+        crossList = self.workingStopOrderDict.getCrossOrders([vtSymbol.lower(), symbol.lower()],
+                                                             (None, buyCrossPrice), (sellCrossPrice, None))
+        for stopOrderID, so in crossList:
+            # 撮合过程中，已在策略回调中撤销的停止单不再成交
+            if stopOrderID not in self.workingStopOrderDict:
+                continue
+
+            buyCross = so.direction == DIRECTION_LONG
+            sellCross = not buyCross
+
             # 如果发生了成交
             if buyCross or sellCross:
                 # 推送成交数据
@@ -2709,6 +2821,25 @@ class BacktestingEngine(object):
         """直接返回初始化数据列表中的Tick"""
         return self.initData
 
+    #----------------------------------------------------------------------
+    def iterBar(self, dbName, collectionName, startDate, endDate=None, projection=None, chunkSize=0):
+        """直接返回初始化数据列表中的Bar（作为一批）"""
+        yield self.initData
+
+    #----------------------------------------------------------------------
+    def iterTick(self, dbName, collectionName, startDate, endDate=None, projection=None, chunkSize=0):
+        """直接返回初始化数据列表中的Tick（作为一批）"""
+        yield self.initData
+
+    #----------------------------------------------------------------------
+    def loadBarToLineBar(self, dbName, collectionName, days, lineBarList, endDate=None,
+                         bar_is_completed=False, bar_freq=1):
+        """把初始化数据列表中的Bar推入lineBarList中各CtaLineBar的addBar"""
+        for bar in self.initData:
+            for lineBar in lineBarList:
+                lineBar.addBar(bar, bar_is_completed=bar_is_completed, bar_freq=bar_freq)
+        return len(self.initData)
+
     def get_data_path(self):
         """
         获取数据保存目录
@@ -4004,29 +4135,19 @@ class BacktestingEngine(object):
 
     #----------------------------------------------------------------------
     def runOptimization(self, strategyClass, optimizationSetting):
-        """优化参数"""
-        # 获取优化设置
-        settingList = optimizationSetting.generateSetting()
+        """优化参数（按优化设置的搜索模式和预算）"""
         targetName = optimizationSetting.optimizeTarget
 
         # 检查参数设置问题
-        if not settingList or not targetName:
+        if not optimizationSetting.paramDict or not targetName:
             self.output(u'优化设置有问题，请检查')
+            return []
 
-        # 遍历优化
-        resultList = []
-        for setting in settingList:
-            self.clearBacktestingResult()
-            self.output('-' * 30)
-            self.output('setting: %s' %str(setting))
-            self.initStrategy(strategyClass, setting)
-            self.runBacktesting()
-            d = self.calculateBacktestingResult()
-            try:
-                targetValue = d[targetName]
-            except KeyError:
-                targetValue = 0
-            resultList.append(([str(setting)], targetValue))
+        # 搜索优化
+        resultList = [([str(setting)], targetValue) for setting, targetValue in
+                      self.runOptimizationSearch(optimizationSetting,
+                                                 lambda taskList: self.__runOptimizationTasks(strategyClass, taskList,
+                                                                                              targetName))]
 
         # 显示结果
         resultList.sort(reverse=True, key=lambda result:result[1])
@@ -4037,6 +4158,94 @@ class BacktestingEngine(object):
 
         return resultList
 
+    #----------------------------------------------------------------------
+    def __runOptimizationTasks(self, strategyClass, taskList, targetName):
+        """在本引擎中依次回测各个任务，返回(setting, windowRate, targetValue)"""
+        dataEndDate, endDate = self.dataEndDate, self.endDate
+        for setting, windowRate in taskList:
+            self.clearBacktestingResult()
+            self.output('-' * 30)
+            self.output('setting: %s' %str(setting))
+            self.setDataWindow(windowRate)
+            try:
+                self.initStrategy(strategyClass, setting)
+                self.runBacktesting()
+                d = self.calculateBacktestingResult()
+                try:
+                    targetValue = d[targetName]
+                except KeyError:
+                    targetValue = 0
+            finally:
+                self.dataEndDate, self.endDate = dataEndDate, endDate
+            yield (setting, windowRate, targetValue)
+
+    #----------------------------------------------------------------------
+    def runOptimizationSearch(self, optimizationSetting, runFunc):
+        """
+        按优化设置的搜索算法逐批生成回测任务，交给runFunc回测，直到搜索结束或用完预算
+        runFunc(taskList)：回测[(setting, windowRate)]，按完成顺序返回(setting, windowRate, targetValue)
+        返回最长回测区间上的[(setting, targetValue)]，不含回测失败的参数
+        """
+        search = optimizationSetting.createSearch()
+        maxRuns = optimizationSetting.maxRuns
+        maxSeconds = optimizationSetting.maxSeconds
+
+        totalCount = search.getTotalCount()
+        if maxRuns:
+            totalCount = min(totalCount, maxRuns) if totalCount else maxRuns
+
+        windowDict = {}         # windowRate: [(setting, targetValue)]
+        runCount = 0
+        startTime = datetime.now()
+        timeout = False
+        while not timeout:
+            taskList = search.ask()
+            if maxRuns:
+                taskList = taskList[:maxRuns - runCount]
+            if not taskList:
+                break
+
+            batchList = []
+            for setting, windowRate, targetValue in runFunc(taskList):
+                runCount += 1
+                batchList.append((setting, windowRate, targetValue))
+                if targetValue is None:
+                    self.output(u'参数{}回测失败'.format(setting))
+                else:
+                    windowDict.setdefault(windowRate, []).append((setting, targetValue))
+
+                usedTime = datetime.now() - startTime
+                msg = u'优化进度:{}'.format(runCount)
+                if totalCount:
+                    leftTime = usedTime / runCount * max(totalCount - runCount, 0)
+                    msg += u'/{}，预计剩余:{}'.format(totalCount, leftTime)
+                if windowRate < FULL_WINDOW:
+                    msg += u'，区间比例:{:.2f}'.format(windowRate)
+                self.output(u'{}，已用时:{}，{}: {}'.format(msg, usedTime, setting, targetValue))
+
+                if maxSeconds and usedTime.total_seconds() >= maxSeconds:
+                    self.output(u'优化运行时间达到{}秒，停止优化'.format(maxSeconds))
+                    timeout = True
+                    break
+
+            search.tell(batchList)
+
+        if not windowDict:
+            return []
+        return windowDict[max(windowDict.keys())]
+
+    #----------------------------------------------------------------------
+    def setDataWindow(self, windowRate):
+        """按比例缩短策略运行的回测区间（初始化数据不变），用于参数优化时在短区间上初筛参数"""
+        if windowRate >= FULL_WINDOW:
+            return
+
+        dataEndDate = self.dataEndDate or datetime.now()
+        startDate = self.strategyStartDate or self.dataStartDate
+        days = max(1, int((dataEndDate - startDate).days * windowRate + 0.5))
+        self.dataEndDate = min(dataEndDate, startDate + timedelta(days=days))
+        self.endDate = self.dataEndDate.strftime('%Y%m%d')
+
     #----------------------------------------------------------------------
     def clearBacktestingResult(self):
         """清空之前回测的结果"""
@@ -4055,37 +4264,45 @@ class BacktestingEngine(object):
         self.tradeDict.clear()
 
     #----------------------------------------------------------------------
-    def runParallelOptimization(self, strategyClass, optimizationSetting):
-        """并行优化参数"""
-        # 获取优化设置
-        settingList = optimizationSetting.generateSetting()
+    def runParallelOptimization(self, strategyClass, optimizationSetting, runFuncName='runBacktesting', runArgs=(),
+                                processes=0, resumeFile=''):
+        """
+        并行优化参数（按优化设置的搜索模式和预算）
+        runFuncName: 回放数据的回测方法名，如runBacktesting、runBackTestingWithDataSource、runBackTestingWithMongoDBTicks
+        runArgs: 回测方法的参数
+        processes: 进程数，缺省为CPU核心数
+        resumeFile: 优化结果记录文件（每行一个json），每完成一次回测即追加写入；
+                    中断后重新运行时，文件中已完成的回测直接使用记录的结果
+
+        子进程使用getEngineSetting导出的完整引擎配置重建回测引擎。
+        历史数据只加载一次：第一组参数在本进程中以完整区间回测，同时把历史数据写入列式存储，
+        其余回测分发到进程池，各进程以内存映射方式回放同一份列式存储。
+        未设置列式存储时使用临时目录，优化结束后删除。
+        """
         targetName = optimizationSetting.optimizeTarget
 
         # 检查参数设置问题
-        if not settingList or not targetName:
+        if not optimizationSetting.paramDict or not targetName:
             self.output(u'优化设置有问题，请检查')
+            return []
 
-        # 多进程优化，启动一个对应CPU核心数量的进程池
-        pool = multiprocessing.Pool(multiprocessing.cpu_count())
-        l = []
-
-        for setting in settingList:
-            l.append(pool.apply_async(optimize, (strategyClass, setting,
-                                                 targetName, self.mode,
-                                                 self.startDate, self.initDays, self.endDate,
-                                                 self.slippage, self.rate, self.size,
-                                                 self.dbName, self.symbol)))
-        pool.close()
-        pool.join()
+        pool = OptimizationProcessPool(self, strategyClass, runFuncName, runArgs, targetName,
+                                       processes, resumeFile)
+        try:
+            resultList = [(str(setting), targetValue) for setting, targetValue in
+                          self.runOptimizationSearch(optimizationSetting, pool.runTasks)]
+        finally:
+            pool.close()
 
         # 显示结果
-        resultList = [res.get() for res in l]
         resultList.sort(reverse=True, key=lambda result:result[1])
         self.output('-' * 30)
         self.output(u'优化结果：')
         for result in resultList:
             self.output(u'%s: %s' %(result[0], result[1]))
 
+        return resultList
+
     #----------------------------------------------------------------------
     def roundToPriceTick(self, price, priceTick=None):
         """取整价格到合约最小价格变动"""
@@ -4134,6 +4351,111 @@ class BacktestingEngine(object):
         else:
             return dt.strftime('%Y-%m-%d')
 
+########################################################################
+class WorkingOrderDict(OrderedDict):
+    """
+    活动委托字典（限价单/停止单）
+    在OrderedDict的基础上，按 合约(小写)+方向 分组维护价格有序的索引，
+    撮合时只需二分查找出价格会成交的委托，不必遍历全部委托。
+    委托对象需要有vtSymbol、direction、price属性，加入字典后不应再修改这三个属性。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        super(WorkingOrderDict, self).__init__()
+        self.seq = 0                # 委托加入的顺序号
+        self.bookDict = {}          # (合约小写, 方向): [价格列表, (顺序号, key)列表]，按价格升序
+        self.entryDict = {}         # key: (合约小写, 方向, 价格, 顺序号)
+
+    #----------------------------------------------------------------------
+    def __setitem__(self, key, order):
+        """加入委托"""
+        seq = None
+        if key in self.entryDict:
+            # 替换已有委托，保持原来的顺序
+            seq = self.entryDict[key][3]
+            self.removeEntry(key)
+        super(WorkingOrderDict, self).__setitem__(key, order)
+
+        if seq is None:
+            self.seq += 1
+            seq = self.seq
+        bookKey = (order.vtSymbol.lower(), order.direction)
+        prices, entries = self.bookDict.setdefault(bookKey, ([], []))
+        i = bisect_right(prices, order.price)
+        prices.insert(i, order.price)
+        entries.insert(i, (seq, key))
+        self.entryDict[key] = (bookKey[0], bookKey[1], order.price, seq)
+
+    #----------------------------------------------------------------------
+    def __delitem__(self, key):
+        """删除委托"""
+        super(WorkingOrderDict, self).__delitem__(key)
+        self.removeEntry(key)
+
+    #----------------------------------------------------------------------
+    def pop(self, key, *args):
+        """删除并返回委托"""
+        if key not in self:
+            return super(WorkingOrderDict, self).pop(key, *args)
+        order = self[key]
+        del self[key]
+        return order
+
+    #----------------------------------------------------------------------
+    def popitem(self, last=True):
+        """删除并返回最后（或最早）加入的委托"""
+        key, order = super(WorkingOrderDict, self).popitem(last)
+        self.removeEntry(key)
+        return key, order
+
+    #----------------------------------------------------------------------
+    def update(self, *args, **kwargs):
+        """批量加入委托"""
+        for key, order in dict(*args, **kwargs).items():
+            self[key] = order
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空委托"""
+        super(WorkingOrderDict, self).clear()
+        self.bookDict.clear()
+        self.entryDict.clear()
+
+    #----------------------------------------------------------------------
+    def removeEntry(self, key):
+        """从价格索引中删除委托"""
+        symbolKey, direction, price, seq = self.entryDict.pop(key)
+        prices, entries = self.bookDict[(symbolKey, direction)]
+        i = bisect_left(prices, price)
+        while entries[i][1] != key:
+            i += 1
+        del prices[i]
+        del entries[i]
+
+    #----------------------------------------------------------------------
+    def getCrossOrders(self, symbolList, longRange, shortRange):
+        """
+        返回symbolList（小写）合约中，多单价格在longRange内、空单价格在shortRange内的委托[(key, order)]，
+        按委托加入的顺序排列。
+        range为(最低价, 最高价)，None表示该侧不限
+        """
+        crossList = []
+        for symbolKey in set(symbolList):
+            for direction, (lowPrice, highPrice) in ((DIRECTION_LONG, longRange), (DIRECTION_SHORT, shortRange)):
+                book = self.bookDict.get((symbolKey, direction))
+                if not book:
+                    continue
+                prices, entries = book
+                start = 0 if lowPrice is None else bisect_left(prices, lowPrice)
+                end = len(prices) if highPrice is None else bisect_right(prices, highPrice)
+                crossList.extend(entries[start:end])
+
+        crossList.sort()
+        return [(key, self[key]) for seq, key in crossList]
+
+
 ########################################################################
 class TradingResult(object):
     """每笔交易的结果"""
@@ -4171,6 +4493,11 @@ class OptimizationSetting(object):
 
         self.optimizeTarget = ''        # 优化目标字段
 
+        self.searchMode = SEARCH_GRID   # 参数搜索模式
+        self.searchSetting = {}         # 搜索算法的参数
+        self.maxRuns = 0                # 回测次数预算，0为不限
+        self.maxSeconds = 0             # 运行时间预算（秒），0为不限
+
     #----------------------------------------------------------------------
     def addParameter(self, name, start, end=None, step=None):
         """增加优化参数"""
@@ -4218,6 +4545,130 @@ class OptimizationSetting(object):
         """设置优化目标字段"""
         self.optimizeTarget = target
 
+    #----------------------------------------------------------------------
+    def setSearchMode(self, mode, **searchSetting):
+        """
+        设置参数搜索模式，searchSetting为对应搜索算法的参数，例如：
+        setSearchMode(SEARCH_RANDOM, sampleCount=200, seed=1)
+        setSearchMode(SEARCH_HALVING, sampleCount=300, minWindow=0.2, eta=3)
+        setSearchMode(SEARCH_GENETIC, populationSize=30, generations=20)
+        setSearchMode(SEARCH_COORDINATE, maxCycles=5, restarts=2)
+        """
+        if mode not in SEARCH_CLASS_DICT:
+            raise ValueError(u'不支持的参数搜索模式:{}'.format(mode))
+        self.searchMode = mode
+        self.searchSetting = searchSetting
+
+    #----------------------------------------------------------------------
+    def setBudget(self, maxRuns=0, maxSeconds=0):
+        """设置优化预算：最多回测次数、最长运行秒数，0为不限"""
+        self.maxRuns = maxRuns
+        self.maxSeconds = maxSeconds
+
+    #----------------------------------------------------------------------
+    def createSearch(self):
+        """创建参数搜索算法"""
+        return SEARCH_CLASS_DICT[self.searchMode](self.paramDict, **self.searchSetting)
+
+########################################################################
+class OptimizationProcessPool(object):
+    """
+    并行优化的进程池
+    第一次回测在本进程中以完整区间运行（同时把历史数据加载到列式存储），之后的回测分发到子进程；
+    回测结果追加写入记录文件，断点续跑时直接使用已记录的结果。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, engine, strategyClass, runFuncName, runArgs, targetName, processes=0, resumeFile=''):
+        """Constructor"""
+        self.engine = engine
+        self.processes = processes or multiprocessing.cpu_count()
+        self.pool = None
+
+        # 读取已完成的回测结果
+        self.finishedDict = {}      # 任务标识: targetValue
+        if resumeFile and os.path.isfile(resumeFile):
+            with open(resumeFile, 'r') as f:
+                for line in f:
+                    try:
+                        d = json.loads(line)
+                    except ValueError:
+                        # 中断时未写完的行
+                        continue
+                    self.finishedDict[getTaskKey(d['setting'], d.get('window', FULL_WINDOW))] = d['target']
+            engine.output(u'从{}读取已完成的回测结果{}个'.format(resumeFile, len(self.finishedDict)))
+        self.resultFile = open(resumeFile, 'a') if resumeFile else None
+
+        engineSetting = engine.getEngineSetting()
+        self.tempPath = ''
+        if not engineSetting['columnStorePath']:
+            self.tempPath = tempfile.mkdtemp(prefix='cta_optimize_')
+            engineSetting['columnStorePath'] = self.tempPath
+
+        self.processSetting = (strategyClass, engineSetting, runFuncName, runArgs, targetName)
+        initOptimizeProcess(*self.processSetting)
+
+    #----------------------------------------------------------------------
+    def runTasks(self, taskList):
+        """回测[(setting, windowRate)]，按完成顺序返回(setting, windowRate, targetValue)"""
+        pendingList = []
+        for setting, windowRate in taskList:
+            key = getTaskKey(setting, windowRate)
+            if key in self.finishedDict:
+                yield (setting, windowRate, self.finishedDict[key])
+            else:
+                pendingList.append((setting, windowRate))
+
+        # 在本进程中回测，直到一次完整区间的回测成功（完成历史数据的加载），
+        # 避免多个子进程同时从数据库加载并写入列式存储
+        while pendingList and self.pool is None:
+            setting, windowRate = pendingList[0]
+            result = self.saveResult(runOptimizeSetting((setting, FULL_WINDOW)))
+            if windowRate >= FULL_WINDOW or result[2] is None:
+                pendingList.pop(0)
+                yield (setting, windowRate, result[2])
+
+            if result[2] is not None:
+                self.pool = multiprocessing.Pool(self.processes, initializer=initOptimizeProcess,
+                                                 initargs=self.processSetting)
+
+        if pendingList:
+            for result in self.pool.imap_unordered(runOptimizeSetting, pendingList):
+                yield self.saveResult(result)
+
+    #----------------------------------------------------------------------
+    def saveResult(self, result):
+        """记录回测结果"""
+        setting, windowRate, targetValue = result
+        if targetValue is None:
+            return result
+
+        self.finishedDict[getTaskKey(setting, windowRate)] = targetValue
+        if self.resultFile:
+            d = {'setting': setting, 'target': targetValue}
+            if windowRate < FULL_WINDOW:
+                d['window'] = windowRate
+            self.resultFile.write(json.dumps(d, default=str) + '\n')
+            self.resultFile.flush()
+        return result
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """关闭进程池，删除临时目录"""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+        if self.resultFile:
+            self.resultFile.close()
+            self.resultFile = None
+
+        if self.tempPath:
+            shutil.rmtree(self.tempPath, ignore_errors=True)
+            self.tempPath = ''
+
+
 #----------------------------------------------------------------------
 def formatNumber(n):
     """格式化数字到字符串"""
@@ -4251,4 +4702,46 @@ def optimize(strategyClass, setting, targetName,
 
 
     
-    
\ No newline at end of file
+    
+
+
+# 并行优化进程中的回测设置：(strategyClass, engineSetting, runFuncName, runArgs, targetName)
+optimizeProcessSetting = None
+
+
+#----------------------------------------------------------------------
+def initOptimizeProcess(strategyClass, engineSetting, runFuncName, runArgs, targetName):
+    """进程池初始化，每个进程只接收一次策略类和引擎配置"""
+    global optimizeProcessSetting
+    optimizeProcessSetting = (strategyClass, engineSetting, runFuncName, runArgs, targetName)
+
+
+#----------------------------------------------------------------------
+def runOptimizeSetting(task):
+    """
+    在进程中回测一个任务(setting, windowRate)
+    返回(setting, windowRate, targetValue)，回测出错时targetValue为None
+    """
+    setting, windowRate = task
+    strategyClass, engineSetting, runFuncName, runArgs, targetName = optimizeProcessSetting
+    try:
+        engine = BacktestingEngine()
+        engine.loadEngineSetting(engineSetting)
+        engine.setDataWindow(windowRate)
+        engine.initStrategy(strategyClass, setting)
+        getattr(engine, runFuncName)(*runArgs)
+        d = engine.calculateBacktestingResult()
+        try:
+            targetValue = d[targetName]
+        except KeyError:
+            targetValue = 0
+    except Exception:
+        traceback.print_exc()
+        return (setting, windowRate, None)
+    return (setting, windowRate, targetValue)
+
+
+#----------------------------------------------------------------------
+def getTaskKey(setting, windowRate=FULL_WINDOW):
+    """回测任务的唯一标识，用于断点续跑时比对已完成的回测"""
+    return json.dumps([setting, windowRate], sort_keys=True, default=str)
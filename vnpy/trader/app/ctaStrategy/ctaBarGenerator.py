@@ -0,0 +1,265 @@
+# encoding: UTF-8
+
+"""
+多周期K线合成器
+
+由tick同时合成多个周期的K线（如1分钟、5分钟、15分钟、1小时、日线），K线的划分规则与CtaLineBar相同：
+    分钟线：按当日经过的分钟数（扣除10:15-10:30、11:30-13:30等休市时间）整除周期
+    小时线：2小时、4小时线在1/9/11/13/21/23点（4小时为1/9/13/21点）切换，其他按小时数整除周期
+    日线：按交易日切换（夜盘属于下一交易日）
+各时段收盘时的最后一个tick（如10:15、11:30、15:00）计入前一根K线。
+
+K线成交量为tick累计成交量（tick.volume）的差值；K线除了在下一周期的tick到达时结束，
+也可以由定时器调用updateTime，在当前周期过去closeDelay秒后结束，休市前的最后一根K线无需等待下一个tick。
+收盘后END_TICK_SECONDS秒内仍可能收到收盘tick，这段时间updateTime不结束K线，避免收盘tick生成多余的K线。
+"""
+
+from datetime import timedelta
+
+from vnpy.trader.app.ctaStrategy.ctaBase import (CtaBarData, MARKET_ZJ, NIGHT_MARKET_SQ2,
+                                                 NIGHT_MARKET_SQ3, NIGHT_MARKET_ZZ, NIGHT_MARKET_DL)
+from vnpy.trader.app.ctaStrategy.ctaLineBar import PERIOD_MINUTE, PERIOD_HOUR, PERIOD_DAY
+
+# 周期简写：(周期类型, 周期数)
+INTERVAL_DICT = {'m': PERIOD_MINUTE, 'h': PERIOD_HOUR, 'd': PERIOD_DAY}
+
+# 各时段收盘后，该秒数（含）之内的tick视为收盘tick
+END_TICK_SECONDS = 5
+
+
+#----------------------------------------------------------------------
+def parseInterval(interval):
+    """解析周期简写，如'5m'、'1h'、'1d'，返回(周期类型, 周期数)"""
+    period = INTERVAL_DICT.get(interval[-1:].lower())
+    if period is None or not interval[:-1].isdigit():
+        raise ValueError(u'不支持的K线周期：{0}'.format(interval))
+    return period, int(interval[:-1])
+
+
+#----------------------------------------------------------------------
+def getShortSymbol(symbol):
+    """合约的短代码，如rb1901 => RB"""
+    return ''.join([c for c in symbol if c.isalpha()]).upper()
+
+
+#----------------------------------------------------------------------
+def getTradingDay(dt):
+    """根据时间返回交易日（YYYYMMDD），规则与CtaLineBar.getTradingDate相同"""
+    if dt.hour >= 21:
+        if dt.isoweekday() == 5:
+            # 星期五=》星期一
+            return (dt + timedelta(days=3)).strftime('%Y%m%d')
+        # 第二天
+        return (dt + timedelta(days=1)).strftime('%Y%m%d')
+    elif dt.hour < 8 and dt.isoweekday() == 6:
+        # 星期六=>星期一
+        return (dt + timedelta(days=2)).strftime('%Y%m%d')
+    return dt.strftime('%Y%m%d')
+
+
+########################################################################
+class CtaBarGenerator(object):
+    """单个合约的多周期K线合成器"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, onBarFunc, intervalList=('1m',), shortSymbol='', is7x24=False,
+                 barClass=CtaBarData, closeDelay=3):
+        """
+        onBarFunc: K线结束时的回调函数onBarFunc(bar, interval)，interval为intervalList中的周期简写
+        intervalList: 需要合成的周期，如['1m', '5m', '15m', '1h', '1d']
+        shortSymbol: 合约短代码，用于判断休市时间，为空时由第一个tick的symbol得到
+        barClass: K线数据类，如CtaBarData、DrBarData
+        closeDelay: updateTime时，周期结束后等待最后一个tick的秒数
+        """
+        self.onBarFunc = onBarFunc
+        self.intervalList = list(intervalList)
+        self.periodList = [parseInterval(interval) for interval in self.intervalList]
+        self.shortSymbol = shortSymbol
+        self.is7x24 = is7x24
+        self.barClass = barClass
+        self.closeDelay = timedelta(seconds=closeDelay)
+
+        self.barList = [None] * len(self.intervalList)      # 各周期正在合成的K线
+        self.keyList = [None] * len(self.intervalList)      # 各周期正在合成的K线的划分键值
+
+        self.lastVolume = None          # 上一个tick的累计成交量
+        self.lastTradingDay = ''        # 上一个tick的交易日
+
+    #----------------------------------------------------------------------
+    def updateTick(self, tick):
+        """更新tick"""
+        dt = tick.datetime
+        if dt is None:
+            return
+
+        if not self.shortSymbol:
+            self.shortSymbol = getShortSymbol(tick.symbol)
+
+        # 交易日
+        tradingDay = getattr(tick, 'tradingDay', '') or ''
+        tradingDay = tradingDay.replace('-', '') or (dt.strftime('%Y%m%d') if self.is7x24 else getTradingDay(dt))
+
+        # 由累计成交量计算本tick的成交量，新交易日重新累计，第一个tick无法计算，视为0
+        if self.lastVolume is None:
+            volume = 0
+        elif tradingDay != self.lastTradingDay or tick.volume < self.lastVolume:
+            volume = tick.volume
+        else:
+            volume = tick.volume - self.lastVolume
+        self.lastVolume = tick.volume
+        self.lastTradingDay = tradingDay
+
+        # 各时段收盘的最后一个tick计入前一根K线
+        if self.isEndTick(dt):
+            keyTime = dt.replace(second=0, microsecond=0) - timedelta(microseconds=1)
+        else:
+            keyTime = dt
+
+        for i, (period, interval) in enumerate(self.periodList):
+            key = self.getBarKey(period, interval, keyTime, tradingDay)
+            bar = self.barList[i]
+
+            if bar is not None and key != self.keyList[i]:
+                self.closeBar(i)
+                bar = None
+
+            if bar is None:
+                self.barList[i] = self.newBar(tick, tradingDay, volume)
+                self.keyList[i] = key
+            else:
+                bar.high = max(bar.high, tick.lastPrice)
+                bar.low = min(bar.low, tick.lastPrice)
+                bar.close = tick.lastPrice
+                bar.volume += volume
+                if hasattr(bar, 'dayVolume'):
+                    bar.dayVolume = tick.volume
+                bar.openInterest = tick.openInterest
+
+    #----------------------------------------------------------------------
+    def updateTime(self, dt):
+        """定时检查，所在周期已过去closeDelay秒的K线结束"""
+        # 收盘tick可能还未到达，此时结束K线，收盘tick会生成一根多余的K线
+        if self.isEndTick(dt):
+            return
+
+        dt = dt - self.closeDelay
+        tradingDay = dt.strftime('%Y%m%d') if self.is7x24 else getTradingDay(dt)
+
+        for i, (period, interval) in enumerate(self.periodList):
+            bar = self.barList[i]
+            # 刚开始的K线（第一个tick晚于dt）尚未结束
+            if bar is None or bar.datetime > dt:
+                continue
+
+            if period == PERIOD_DAY and not self.is7x24:
+                # 日线在日盘收盘后结束，夜盘前的时间仍属于当前交易日
+                if 15 <= dt.hour < 21 and dt.strftime('%H%M') >= '1515':
+                    self.closeBar(i)
+                elif tradingDay != self.keyList[i][0]:
+                    self.closeBar(i)
+            elif self.getBarKey(period, interval, dt, tradingDay) != self.keyList[i]:
+                self.closeBar(i)
+
+    #----------------------------------------------------------------------
+    def closeBar(self, i):
+        """结束一根K线，推送回调"""
+        bar = self.barList[i]
+        self.barList[i] = None
+        self.keyList[i] = None
+        if bar is not None:
+            self.onBarFunc(bar, self.intervalList[i])
+
+    #----------------------------------------------------------------------
+    def closeAll(self):
+        """结束全部正在合成的K线（如停止记录时）"""
+        for i in range(len(self.barList)):
+            self.closeBar(i)
+
+    #----------------------------------------------------------------------
+    def newBar(self, tick, tradingDay, volume):
+        """由tick创建新的K线"""
+        bar = self.barClass()
+        bar.vtSymbol = tick.vtSymbol
+        bar.symbol = tick.symbol
+        bar.exchange = tick.exchange
+
+        bar.open = tick.lastPrice
+        bar.high = tick.lastPrice
+        bar.low = tick.lastPrice
+        bar.close = tick.lastPrice
+
+        # K线的日期时间（去除秒）设为第一个Tick的时间
+        bar.datetime = tick.datetime.replace(second=0, microsecond=0)
+        bar.date = bar.datetime.strftime('%Y%m%d')
+        bar.time = bar.datetime.strftime('%H:%M:%S')
+        if hasattr(bar, 'tradingDay'):
+            bar.tradingDay = tradingDay
+
+        bar.volume = volume
+        if hasattr(bar, 'dayVolume'):
+            bar.dayVolume = tick.volume
+        bar.openInterest = tick.openInterest
+        return bar
+
+    #----------------------------------------------------------------------
+    def getBarKey(self, period, interval, dt, tradingDay):
+        """K线的划分键值，键值不同即属于不同的K线"""
+        if period == PERIOD_DAY:
+            return (tradingDay, )
+
+        if period == PERIOD_HOUR:
+            hour = dt.hour
+            if not self.is7x24 and interval == 2:
+                # 1,9,11,13,21,23点开始新的K线
+                index = max([h for h in (1, 9, 11, 13, 21, 23) if h <= hour] or [-1])
+            elif not self.is7x24 and interval == 4:
+                index = max([h for h in (1, 9, 13, 21) if h <= hour] or [-1])
+            else:
+                index = hour // interval
+            return (tradingDay, index)
+
+        # 分钟线，扣除日盘中的休市时间
+        minutesPassed = dt.hour * 60 + dt.minute
+        if not self.is7x24:
+            hm = dt.hour * 100 + dt.minute
+            if self.shortSymbol in MARKET_ZJ:
+                if 1130 < hm < 1600:
+                    # 扣除11:30到13:00的中场休息的90分钟
+                    minutesPassed -= 90
+            else:
+                if 1015 < hm <= 1130:
+                    # 扣除10:15到10:30的中场休息的15分钟
+                    minutesPassed -= 15
+                elif 1130 < hm < 1600:
+                    # 扣除(10:15到10:30的中场休息的15分钟)&(11:30到13:30的中场休息的120分钟)
+                    minutesPassed -= 135
+        return (tradingDay, dt.date(), minutesPassed // interval)
+
+    #----------------------------------------------------------------------
+    def isEndTick(self, dt):
+        """是否为各时段收盘时的最后一个tick，规则与CtaLineBar.is_end_tick相同"""
+        if self.is7x24 or dt.second > END_TICK_SECONDS:
+            return False
+
+        hm = dt.hour * 100 + dt.minute
+
+        # 中金所，只有11：30 和15：15，才有最后一个tick
+        if self.shortSymbol in MARKET_ZJ:
+            return hm in (1130, 1500, 1515)
+
+        if hm in (1015, 1130, 1500, 230):
+            return True
+
+        # 夜盘1:00收盘
+        if self.shortSymbol in NIGHT_MARKET_SQ2 and hm == 100:
+            return True
+
+        # 夜盘23:00收盘
+        if self.shortSymbol in NIGHT_MARKET_SQ3 and hm == 2300:
+            return True
+
+        # 夜盘23:30收盘
+        if (self.shortSymbol in NIGHT_MARKET_ZZ or self.shortSymbol in NIGHT_MARKET_DL) and hm == 2330:
+            return True
+
+        return False
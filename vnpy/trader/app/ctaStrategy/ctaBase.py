@@ -171,4 +171,94 @@ class CtaTickData(object):
         self.askVolume2 = EMPTY_INT
         self.askVolume3 = EMPTY_INT
         self.askVolume4 = EMPTY_INT
-        self.askVolume5 = EMPTY_INT    
\ No newline at end of file
+        self.askVolume5 = EMPTY_INT    
+
+# 紧凑tick的字段（VtTickData与CtaTickData字段的并集，不含rawData），及其缺省值
+SLOT_TICK_DEFAULTS = (
+    ('gatewayName', EMPTY_STRING),
+    ('vtSymbol', EMPTY_STRING),
+    ('symbol', EMPTY_STRING),
+    ('exchange', EMPTY_STRING),
+    ('lastPrice', EMPTY_FLOAT),
+    ('lastVolume', EMPTY_FLOAT),
+    ('volume', EMPTY_INT),
+    ('preOpenInterest', EMPTY_INT),
+    ('openInterest', EMPTY_INT),
+    ('openPrice', EMPTY_FLOAT),
+    ('highPrice', EMPTY_FLOAT),
+    ('lowPrice', EMPTY_FLOAT),
+    ('preClosePrice', EMPTY_FLOAT),
+    ('upperLimit', EMPTY_FLOAT),
+    ('lowerLimit', EMPTY_FLOAT),
+    ('tradingDay', EMPTY_STRING),
+    ('date', EMPTY_STRING),
+    ('time', EMPTY_STRING),
+    ('datetime', None),
+    ('bidPrice1', EMPTY_FLOAT), ('bidPrice2', EMPTY_FLOAT), ('bidPrice3', EMPTY_FLOAT),
+    ('bidPrice4', EMPTY_FLOAT), ('bidPrice5', EMPTY_FLOAT),
+    ('askPrice1', EMPTY_FLOAT), ('askPrice2', EMPTY_FLOAT), ('askPrice3', EMPTY_FLOAT),
+    ('askPrice4', EMPTY_FLOAT), ('askPrice5', EMPTY_FLOAT),
+    ('bidVolume1', EMPTY_INT), ('bidVolume2', EMPTY_INT), ('bidVolume3', EMPTY_INT),
+    ('bidVolume4', EMPTY_INT), ('bidVolume5', EMPTY_INT),
+    ('askVolume1', EMPTY_INT), ('askVolume2', EMPTY_INT), ('askVolume3', EMPTY_INT),
+    ('askVolume4', EMPTY_INT), ('askVolume5', EMPTY_INT),
+)
+SLOT_TICK_FIELDS = tuple(name for name, _ in SLOT_TICK_DEFAULTS)
+
+
+########################################################################
+class CtaSlotTickData(object):
+    """
+    紧凑的Tick数据（__slots__，无实例__dict__）
+    字段为VtTickData与CtaTickData的并集，可同时作为两者使用：
+    CtaEngine收到VtTickData后只需转换一次，缓存与推送给策略的都是同一个对象。
+    pickle时只保存字段值的元组，缓存文件更小。
+    """
+    __slots__ = SLOT_TICK_FIELDS
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        for name, default in SLOT_TICK_DEFAULTS:
+            setattr(self, name, default)
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def fromTick(cls, tick):
+        """从VtTickData/CtaTickData/CtaSlotTickData创建，缺少的字段使用缺省值"""
+        newTick = cls.__new__(cls)
+        d = getattr(tick, '__dict__', None)
+        if d is not None:
+            for name, default in SLOT_TICK_DEFAULTS:
+                setattr(newTick, name, d.get(name, default))
+        else:
+            for name, default in SLOT_TICK_DEFAULTS:
+                setattr(newTick, name, getattr(tick, name, default))
+        return newTick
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def fromDict(cls, d):
+        """从字典（如数据库记录）创建，多余的字段被忽略"""
+        newTick = cls.__new__(cls)
+        for name, default in SLOT_TICK_DEFAULTS:
+            setattr(newTick, name, d.get(name, default))
+        return newTick
+
+    #----------------------------------------------------------------------
+    def toDict(self):
+        """转换为字典，用于数据库写入等原来使用__dict__的场合"""
+        return {name: getattr(self, name) for name in SLOT_TICK_FIELDS}
+
+    #----------------------------------------------------------------------
+    def __copy__(self):
+        return self.fromTick(self)
+
+    #----------------------------------------------------------------------
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in SLOT_TICK_FIELDS)
+
+    #----------------------------------------------------------------------
+    def __setstate__(self, state):
+        for name, value in zip(SLOT_TICK_FIELDS, state):
+            setattr(self, name, value)
@@ -0,0 +1,563 @@
+# encoding: UTF-8
+
+"""
+列式的tick/bar本地存储，用于回测快速加载历史数据
+
+目录结构：
+    rootPath/kind/vtSymbol/tradingDay/字段名.npy
+    rootPath/kind/vtSymbol/tradingDay/meta.json
+    rootPath/kind/vtSymbol/index.json
+kind为tick或bar（也可以是'bar_5m'等自定义名称）。
+
+每个字段保存为一个NumPy数组，读取时使用np.load(mmap_mode='r')内存映射，
+整个分区取值相同的字段（如vtSymbol、exchange）只保存在meta.json中。
+index.json记录各分区的数据量、起止时间，以及已完整加载过的日期区间。
+
+appendRecords写入的分区（如行情记录）使用追加格式：
+    rootPath/kind/vtSymbol/tradingDay/records.npy   定长记录数组，新数据追加到文件末尾
+records.npy的头部预留了空间，追加后原地更新记录数量；meta.json中的count为已确认写入的数量。
+读取接口相同，loadColumns返回的各列为records.npy中对应字段的视图。
+"""
+
+import os
+import json
+import shutil
+import struct
+from datetime import datetime, timedelta
+
+import numpy as np
+
+COLUMN_KIND_TICK = 'tick'
+COLUMN_KIND_BAR = 'bar'
+
+# 不保存的字段
+EXCLUDE_FIELDS = ('_id', 'rawData')
+
+# 字段类型
+FIELD_FLOAT = 'float'
+FIELD_INT = 'int'
+FIELD_BOOL = 'bool'
+FIELD_STR = 'str'
+FIELD_DATETIME = 'datetime'
+
+# 分区格式
+LAYOUT_COLUMNS = 'columns'      # 每个字段一个文件（writeRecords）
+LAYOUT_RECORDS = 'records'      # 定长记录，可追加（appendRecords）
+
+RECORDS_FILE = 'records.npy'
+MIN_STR_WIDTH = 16              # 追加格式中字符串字段的最小宽度
+
+
+########################################################################
+class CtaColumnStore(object):
+    """列式tick/bar存储"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, rootPath):
+        """Constructor"""
+        self.rootPath = os.path.abspath(rootPath)
+        if not os.path.isdir(self.rootPath):
+            os.makedirs(self.rootPath)
+
+        self.indexCache = {}        # (kind, vtSymbol): index字典
+
+    #----------------------------------------------------------------------
+    def getSymbolPath(self, kind, vtSymbol):
+        """合约目录"""
+        name = vtSymbol.replace(os.sep, '_').replace(':', '_')
+        return os.path.join(self.rootPath, kind, name)
+
+    #----------------------------------------------------------------------
+    def getPartitionPath(self, kind, vtSymbol, tradingDay):
+        """分区目录"""
+        return os.path.join(self.getSymbolPath(kind, vtSymbol), tradingDay)
+
+    #----------------------------------------------------------------------
+    def loadIndex(self, kind, vtSymbol):
+        """读取合约的分区索引"""
+        key = (kind, vtSymbol)
+        if key in self.indexCache:
+            return self.indexCache[key]
+
+        index = {'partitions': {}, 'ranges': []}
+        indexFile = os.path.join(self.getSymbolPath(kind, vtSymbol), 'index.json')
+        if os.path.isfile(indexFile):
+            with open(indexFile, 'r') as f:
+                index = json.load(f)
+
+        self.indexCache[key] = index
+        return index
+
+    #----------------------------------------------------------------------
+    def saveIndex(self, kind, vtSymbol):
+        """保存合约的分区索引"""
+        index = self.loadIndex(kind, vtSymbol)
+        symbolPath = self.getSymbolPath(kind, vtSymbol)
+        if not os.path.isdir(symbolPath):
+            os.makedirs(symbolPath)
+
+        indexFile = os.path.join(symbolPath, 'index.json')
+        tmpFile = indexFile + '.tmp'
+        with open(tmpFile, 'w') as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.replace(tmpFile, indexFile)
+
+    #----------------------------------------------------------------------
+    def hasPartition(self, kind, vtSymbol, tradingDay):
+        """是否存在某个交易日的分区"""
+        return tradingDay in self.loadIndex(kind, vtSymbol)['partitions']
+
+    #----------------------------------------------------------------------
+    def listPartitions(self, kind, vtSymbol, startDay=None, endDay=None):
+        """列出[startDay, endDay]内已有的交易日分区（升序）"""
+        days = sorted(self.loadIndex(kind, vtSymbol)['partitions'].keys())
+        return [d for d in days
+                if (startDay is None or d >= startDay) and (endDay is None or d <= endDay)]
+
+    #----------------------------------------------------------------------
+    def hasRange(self, kind, vtSymbol, startDay, endDay):
+        """[startDay, endDay]是否已被某次完整加载的区间覆盖"""
+        for s, e in self.loadIndex(kind, vtSymbol)['ranges']:
+            if s <= startDay and endDay <= e:
+                return True
+        return False
+
+    #----------------------------------------------------------------------
+    def addRange(self, kind, vtSymbol, startDay, endDay):
+        """登记已完整加载的区间（区间内没有数据的日期视为非交易日）"""
+        index = self.loadIndex(kind, vtSymbol)
+        ranges = sorted(index['ranges'] + [[startDay, endDay]])
+
+        # 合并重叠或相邻的区间
+        merged = []
+        for s, e in ranges:
+            if merged and s <= nextDay(merged[-1][1]):
+                merged[-1][1] = max(merged[-1][1], e)
+            else:
+                merged.append([s, e])
+        index['ranges'] = merged
+        self.saveIndex(kind, vtSymbol)
+
+    #----------------------------------------------------------------------
+    def writeRecords(self, kind, vtSymbol, tradingDay, records, updateIndex=True):
+        """
+        将一个交易日的tick/bar对象列表写入分区（覆盖已有分区）
+        records中的对象需要有datetime字段
+        """
+        if not records:
+            return 0
+
+        first = records[0]
+        d0 = first.toDict() if hasattr(first, 'toDict') else first.__dict__
+        names = [k for k in d0.keys() if k not in EXCLUDE_FIELDS]
+
+        # 逐字段收集数据
+        dicts = [r.toDict() if hasattr(r, 'toDict') else r.__dict__ for r in records]
+        columns = {name: [d.get(name) for d in dicts] for name in names}
+
+        fields = {}
+        constants = {}
+        arrays = {}
+        for name, values in columns.items():
+            fieldType = inferFieldType(values)
+            if fieldType is None:
+                continue
+
+            first = values[0]
+            if values.count(first) == len(values):
+                constants[name] = [fieldType, encodeValue(fieldType, first)]
+                continue
+
+            fields[name] = fieldType
+            arrays[name] = toArray(fieldType, values)
+
+        partitionPath = self.getPartitionPath(kind, vtSymbol, tradingDay)
+        tmpPath = partitionPath + '.tmp'
+        if os.path.isdir(tmpPath):
+            shutil.rmtree(tmpPath)
+        os.makedirs(tmpPath)
+
+        for name, array in arrays.items():
+            np.save(os.path.join(tmpPath, name + '.npy'), array)
+
+        datetimes = [r.datetime for r in records if r.datetime is not None]
+        meta = {'count': len(records),
+                'fields': fields,
+                'constants': constants,
+                'start': min(datetimes).strftime('%Y-%m-%d %H:%M:%S.%f') if datetimes else '',
+                'end': max(datetimes).strftime('%Y-%m-%d %H:%M:%S.%f') if datetimes else ''}
+        with open(os.path.join(tmpPath, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=1, sort_keys=True)
+
+        if os.path.isdir(partitionPath):
+            shutil.rmtree(partitionPath)
+        os.rename(tmpPath, partitionPath)
+
+        index = self.loadIndex(kind, vtSymbol)
+        index['partitions'][tradingDay] = {'count': meta['count'], 'start': meta['start'], 'end': meta['end']}
+        if updateIndex:
+            self.saveIndex(kind, vtSymbol)
+
+        return len(records)
+
+    #----------------------------------------------------------------------
+    def appendRecords(self, kind, vtSymbol, tradingDay, records, updateIndex=True):
+        """
+        把tick/bar对象（或数据字典）追加到一个交易日的分区，只写入新数据
+        分区中取值相同的字符串字段保存在meta.json中，之后出现不同取值或更长的字符串时，整个分区重写一次
+        """
+        if not records:
+            return 0
+
+        dicts = [toRecordDict(r) for r in records]
+        partitionPath = self.getPartitionPath(kind, vtSymbol, tradingDay)
+
+        meta = None
+        if self.hasPartition(kind, vtSymbol, tradingDay):
+            meta = self.loadMeta(kind, vtSymbol, tradingDay)
+            if meta.get('layout') != LAYOUT_RECORDS or not isCompatible(meta, dicts):
+                # 已有数据与新数据一起重写为追加格式
+                dicts = self.loadDicts(kind, vtSymbol, tradingDay) + dicts
+                meta = None
+
+        if meta is None:
+            meta = createRecordsMeta(dicts)
+            tmpPath = partitionPath + '.tmp'
+            if os.path.isdir(tmpPath):
+                shutil.rmtree(tmpPath)
+            os.makedirs(tmpPath)
+
+            dtype = getRecordsDtype(meta)
+            meta['headerSize'] = getNpyHeaderSize(dtype)
+            with open(os.path.join(tmpPath, RECORDS_FILE), 'wb') as f:
+                writeNpyHeader(f, dtype, 0, meta['headerSize'])
+            with open(os.path.join(tmpPath, 'meta.json'), 'w') as f:
+                json.dump(meta, f, indent=1, sort_keys=True)
+
+            if os.path.isdir(partitionPath):
+                shutil.rmtree(partitionPath)
+            os.rename(tmpPath, partitionPath)
+
+        dtype = getRecordsDtype(meta)
+        array = toRecordsArray(meta, dtype, dicts)
+
+        # 先追加数据、更新头部的记录数量，最后更新meta.json中的count
+        count = meta['count']
+        recordsFile = os.path.join(partitionPath, RECORDS_FILE)
+        with open(recordsFile, 'r+b') as f:
+            # 丢弃上次未确认的数据
+            f.truncate(meta['headerSize'] + count * dtype.itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(array.tobytes())
+            f.seek(0)
+            writeNpyHeader(f, dtype, count + len(array), meta['headerSize'])
+
+        datetimes = [d['datetime'] for d in dicts if isinstance(d.get('datetime'), datetime)]
+        if datetimes:
+            start = min(datetimes).strftime('%Y-%m-%d %H:%M:%S.%f')
+            end = max(datetimes).strftime('%Y-%m-%d %H:%M:%S.%f')
+            meta['start'] = min(meta['start'], start) if meta['start'] else start
+            meta['end'] = max(meta['end'], end)
+        meta['count'] = count + len(array)
+
+        metaFile = os.path.join(partitionPath, 'meta.json')
+        with open(metaFile + '.tmp', 'w') as f:
+            json.dump(meta, f, indent=1, sort_keys=True)
+        os.replace(metaFile + '.tmp', metaFile)
+
+        index = self.loadIndex(kind, vtSymbol)
+        index['partitions'][tradingDay] = {'count': meta['count'], 'start': meta['start'], 'end': meta['end']}
+        if updateIndex:
+            self.saveIndex(kind, vtSymbol)
+
+        return len(array)
+
+    #----------------------------------------------------------------------
+    def loadDicts(self, kind, vtSymbol, tradingDay):
+        """读取一个分区的全部数据，返回数据字典列表"""
+        columns, constants = self.loadColumns(kind, vtSymbol, tradingDay)
+        names = list(columns.keys())
+        values = [columns[name].tolist() for name in names]
+
+        dicts = []
+        for row in zip(*values):
+            d = dict(constants)
+            d.update(zip(names, row))
+            dicts.append(d)
+        return dicts
+
+    #----------------------------------------------------------------------
+    def writeRecordsByDay(self, kind, vtSymbol, records, dayFunc):
+        """按dayFunc(record)返回的交易日，将records分组写入多个分区"""
+        groups = {}
+        for r in records:
+            groups.setdefault(dayFunc(r), []).append(r)
+
+        for tradingDay, group in groups.items():
+            self.writeRecords(kind, vtSymbol, tradingDay, group, updateIndex=False)
+
+        if groups:
+            self.saveIndex(kind, vtSymbol)
+        return len(groups)
+
+    #----------------------------------------------------------------------
+    def loadMeta(self, kind, vtSymbol, tradingDay):
+        """读取分区的描述信息"""
+        metaFile = os.path.join(self.getPartitionPath(kind, vtSymbol, tradingDay), 'meta.json')
+        with open(metaFile, 'r') as f:
+            return json.load(f)
+
+    #----------------------------------------------------------------------
+    def loadColumns(self, kind, vtSymbol, tradingDay):
+        """
+        以内存映射方式读取分区的全部列
+        返回(columns, constants)：columns为 字段名:np.memmap，constants为 字段名:值
+        可直接用于向量化计算，无需生成tick/bar对象
+        """
+        partitionPath = self.getPartitionPath(kind, vtSymbol, tradingDay)
+        meta = self.loadMeta(kind, vtSymbol, tradingDay)
+
+        columns = {}
+        if meta.get('layout') == LAYOUT_RECORDS:
+            # 只读取已确认写入的记录
+            array = np.load(os.path.join(partitionPath, RECORDS_FILE), mmap_mode='r')[:meta['count']]
+            for name in meta['fields'].keys():
+                columns[name] = array[name]
+        else:
+            for name in meta['fields'].keys():
+                columns[name] = np.load(os.path.join(partitionPath, name + '.npy'), mmap_mode='r')
+
+        constants = {name: decodeValue(fieldType, value)
+                     for name, (fieldType, value) in meta['constants'].items()}
+        return columns, constants
+
+    #----------------------------------------------------------------------
+    def iterRecords(self, kind, vtSymbol, tradingDay, dataClass):
+        """逐条生成一个分区的tick/bar对象（dataClass实例），按需生成，不一次性加载全部对象"""
+        columns, constants = self.loadColumns(kind, vtSymbol, tradingDay)
+        meta = self.loadMeta(kind, vtSymbol, tradingDay)
+
+        names = list(columns.keys())
+        # 每列整体转换为python对象列表（tolist直接返回float/int/str/datetime），比逐个元素取值快得多
+        values = [columns[name].tolist() for name in names]
+
+        rows = zip(*values) if values else [()] * meta['count']
+
+        if hasattr(dataClass, 'fromDict'):
+            for row in rows:
+                d = dict(constants)
+                d.update(zip(names, row))
+                yield dataClass.fromDict(d)
+            return
+
+        # 缺省字段值只生成一次，之后每条记录复制字典，避免重复调用__init__
+        template = dataClass().__dict__
+        template.update(constants)
+        for row in rows:
+            d = template.copy()
+            d.update(zip(names, row))
+            data = dataClass.__new__(dataClass)
+            data.__dict__ = d
+            yield data
+
+    #----------------------------------------------------------------------
+    def iterRange(self, kind, vtSymbol, startDay, endDay, dataClass):
+        """逐条生成[startDay, endDay]内全部分区的tick/bar对象"""
+        for tradingDay in self.listPartitions(kind, vtSymbol, startDay, endDay):
+            for data in self.iterRecords(kind, vtSymbol, tradingDay, dataClass):
+                yield data
+
+
+#----------------------------------------------------------------------
+def inferFieldType(values):
+    """根据字段值推断保存类型，无法保存时返回None"""
+    fieldType = None
+    for v in values:
+        if v is None:
+            continue
+        if isinstance(v, bool):
+            t = FIELD_BOOL
+        elif isinstance(v, (int, np.integer)):
+            t = FIELD_INT
+        elif isinstance(v, (float, np.floating)):
+            t = FIELD_FLOAT
+        elif isinstance(v, datetime):
+            t = FIELD_DATETIME
+        elif isinstance(v, str):
+            t = FIELD_STR
+        else:
+            return None
+
+        if fieldType is None or fieldType == t:
+            fieldType = t
+        elif {fieldType, t} == {FIELD_INT, FIELD_FLOAT}:
+            fieldType = FIELD_FLOAT
+        else:
+            return None
+
+    # 含None的非时间字段无法还原，不保存
+    if fieldType != FIELD_DATETIME and any(v is None for v in values):
+        return None
+    return fieldType
+
+
+#----------------------------------------------------------------------
+def toArray(fieldType, values):
+    """字段值列表转换为NumPy数组"""
+    if fieldType == FIELD_FLOAT:
+        return np.array(values, dtype=np.float64)
+    if fieldType == FIELD_INT:
+        return np.array(values, dtype=np.int64)
+    if fieldType == FIELD_BOOL:
+        return np.array(values, dtype=np.bool_)
+    if fieldType == FIELD_DATETIME:
+        return np.array(['NaT' if v is None else v for v in values], dtype='datetime64[us]')
+    return np.array(values, dtype=np.str_)
+
+
+#----------------------------------------------------------------------
+def encodeValue(fieldType, value):
+    """常量字段值转换为json可保存的值"""
+    if fieldType == FIELD_DATETIME and value is not None:
+        return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+    if fieldType == FIELD_FLOAT:
+        return float(value)
+    if fieldType == FIELD_INT:
+        return int(value)
+    return value
+
+
+#----------------------------------------------------------------------
+def decodeValue(fieldType, value):
+    """还原常量字段值"""
+    if fieldType == FIELD_DATETIME and value is not None:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
+    return value
+
+
+#----------------------------------------------------------------------
+def nextDay(day):
+    """下一个自然日（YYYYMMDD）"""
+    return (datetime.strptime(day, '%Y%m%d') + timedelta(days=1)).strftime('%Y%m%d')
+
+
+#----------------------------------------------------------------------
+def toRecordDict(record):
+    """tick/bar对象或数据字典转换为不含排除字段的字典"""
+    if isinstance(record, dict):
+        d = record
+    elif hasattr(record, 'toDict'):
+        d = record.toDict()
+    else:
+        d = record.__dict__
+    return {k: v for k, v in d.items() if k not in EXCLUDE_FIELDS}
+
+
+#----------------------------------------------------------------------
+def getStrWidth(values):
+    """字符串字段的宽度，预留一倍空间"""
+    width = max([len(v) for v in values if v is not None] or [0])
+    return max(MIN_STR_WIDTH, width * 2)
+
+
+#----------------------------------------------------------------------
+def createRecordsMeta(dicts):
+    """根据数据确定追加格式分区的字段"""
+    fields = {}
+    constants = {}
+    strWidths = {}
+    for name in dicts[0].keys():
+        values = [d.get(name) for d in dicts]
+        fieldType = inferFieldType(values)
+        if fieldType is None:
+            continue
+
+        # 只有字符串字段作为常量保存，数值字段即使暂时不变也保存为列
+        if fieldType == FIELD_STR and values.count(values[0]) == len(values):
+            constants[name] = [fieldType, values[0]]
+            continue
+
+        fields[name] = fieldType
+        if fieldType == FIELD_STR:
+            strWidths[name] = getStrWidth(values)
+
+    return {'layout': LAYOUT_RECORDS,
+            'count': 0,
+            'fields': fields,
+            'strWidths': strWidths,
+            'constants': constants,
+            'start': '',
+            'end': ''}
+
+
+#----------------------------------------------------------------------
+def isCompatible(meta, dicts):
+    """新数据能否直接追加到已有分区"""
+    for name, (fieldType, value) in meta['constants'].items():
+        for d in dicts:
+            if d.get(name) != value:
+                return False
+
+    for name, fieldType in meta['fields'].items():
+        values = [d.get(name) for d in dicts]
+        if fieldType == FIELD_STR:
+            if any(v is not None and (not isinstance(v, str) or len(v) > meta['strWidths'][name])
+                   for v in values):
+                return False
+        elif fieldType == FIELD_INT:
+            if any(isinstance(v, (float, np.floating)) and v != int(v) for v in values):
+                return False
+    return True
+
+
+#----------------------------------------------------------------------
+def getRecordsDtype(meta):
+    """追加格式分区的记录类型"""
+    dtypeList = []
+    for name in sorted(meta['fields'].keys()):
+        fieldType = meta['fields'][name]
+        if fieldType == FIELD_FLOAT:
+            dtypeList.append((name, np.float64))
+        elif fieldType == FIELD_INT:
+            dtypeList.append((name, np.int64))
+        elif fieldType == FIELD_BOOL:
+            dtypeList.append((name, np.bool_))
+        elif fieldType == FIELD_DATETIME:
+            dtypeList.append((name, 'datetime64[us]'))
+        else:
+            dtypeList.append((name, 'U%d' % meta['strWidths'][name]))
+    return np.dtype(dtypeList)
+
+
+#----------------------------------------------------------------------
+def toRecordsArray(meta, dtype, dicts):
+    """数据字典列表转换为记录数组，缺失的数值为nan/0，字符串为空"""
+    array = np.zeros(len(dicts), dtype=dtype)
+    for name, fieldType in meta['fields'].items():
+        values = [d.get(name) for d in dicts]
+        if fieldType == FIELD_DATETIME:
+            array[name] = ['NaT' if v is None else v for v in values]
+        elif fieldType == FIELD_FLOAT:
+            array[name] = [np.nan if v is None else v for v in values]
+        elif fieldType == FIELD_STR:
+            array[name] = ['' if v is None else v for v in values]
+        else:
+            array[name] = [0 if v is None else v for v in values]
+    return array
+
+
+#----------------------------------------------------------------------
+def getNpyHeaderSize(dtype):
+    """npy文件头部的字节数，预留记录数量增长的空间，按64字节对齐"""
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(dtype), 10 ** 18)
+    return (10 + len(header) + 1 + 63) // 64 * 64
+
+
+#----------------------------------------------------------------------
+def writeNpyHeader(f, dtype, count, headerSize):
+    """在文件当前位置写入定长的npy头部（1.0版本格式）"""
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(dtype), count)
+    header = header.ljust(headerSize - 10 - 1) + '\n'
+    f.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1'))
@@ -25,7 +25,9 @@ import json
 import os
 import traceback
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from time import time
 import re
 import csv
 import copy
@@ -37,6 +39,8 @@ from vnpy.trader.vtGateway import VtSubscribeReq, VtOrderReq, VtCancelOrderReq,
 from vnpy.trader.app.ctaStrategy.ctaBase import *
 from vnpy.trader.setup_logger import setup_logger
 from vnpy.trader.vtFunction import todayDate, getJsonPath
+from vnpy.trader.vtGlobal import globalSetting
+from vnpy.trader.vtHistoryCache import historyCache
 from vnpy.trader.util_mail import sendmail
 # 加载 strategy目录下所有的策略
 from vnpy.trader.app.ctaStrategy.strategy import STRATEGY_CLASS
@@ -108,6 +112,12 @@ class CtaEngine(object):
         # 未能订阅的symbols
         self.pendingSubcribeSymbols = {}
 
+        # 启动时并行初始化策略的线程数（VT_setting.json中的ctaInitWorkers），为1时逐个初始化
+        self.initWorkers = globalSetting.get('ctaInitWorkers', 1)
+
+        # 策略初始化耗时，key为策略名称，value为秒数
+        self.initTimeDict = OrderedDict()
+
         # 注册事件监听
         self.registerEvent()
 
@@ -461,7 +471,8 @@ class CtaEngine(object):
 
         # 1. 获取事件的Tick数据
         tick = event.dict_['data']
-        tick = copy.copy(tick)
+        # 转换为紧凑的CtaSlotTickData，缓存与推送给策略的是同一个对象，无需再次复制
+        tick = CtaSlotTickData.fromTick(tick)
         # 移除待订阅的合约清单
         if tick.vtSymbol in self.pendingSubcribeSymbols:
             self.writeCtaLog(u'已成功订阅{0}，从待订阅清单中移除'.format(tick.vtSymbol))
@@ -476,22 +487,16 @@ class CtaEngine(object):
         # 3.推送tick到对应的策略对象进行处理
         if tick.vtSymbol in self.tickStrategyDict:
 
-            # 4.将vtTickData数据转化为ctaTickData
-            ctaTick = CtaTickData()
-            d = ctaTick.__dict__
-            for key in d.keys():
-                if key in tick.__dict__:
-                    d[key] = tick.__getattribute__(key)
-
-            if not ctaTick.datetime:
+            # 4.CtaSlotTickData已包含ctaTickData的全部字段，只需补充datetime
+            if not tick.datetime:
                 # 添加datetime字段
                 tickDate = tick.date.replace('-', '')
-                ctaTick.datetime = datetime.strptime(' '.join([tickDate, tick.time]), '%Y%m%d %H:%M:%S.%f')
+                tick.datetime = datetime.strptime(' '.join([tickDate, tick.time]), '%Y%m%d %H:%M:%S.%f')
 
             # 逐个推送到策略实例中
             l = self.tickStrategyDict[tick.vtSymbol]
             for strategy in l:
-                self.callStrategyFunc(strategy, strategy.onTick, ctaTick)
+                self.callStrategyFunc(strategy, strategy.onTick, tick)
 
     # ----------------------------------------------------------------------
     def processOrderEvent(self, event):
@@ -650,42 +655,82 @@ class CtaEngine(object):
 
     # ----------------------------------------------------------------------
     def insertData(self, dbName, collectionName, data):
-        """插入数据到数据库（这里的data可以是CtaTickData或者CtaBarData）"""
-        self.mainEngine.dbInsert(dbName, collectionName, data.__dict__)
+        """插入数据到数据库（这里的data可以是CtaTickData、CtaSlotTickData或者CtaBarData），异步写入，不阻塞事件线程"""
+        # CtaSlotTickData没有__dict__，使用toDict（DbService在放入队列时复制数据字典）
+        d = data.toDict() if hasattr(data, 'toDict') else data.__dict__
+        self.mainEngine.dbInsertAsync(dbName, collectionName, d)
 
     # ----------------------------------------------------------------------
-    def loadBar(self, dbName, collectionName, days):
-        """从数据库中读取Bar数据，startDate是datetime对象"""
-        startDate = self.today - timedelta(days)
+    def iterData(self, dataClass, dbName, collectionName, startDate, endDate=None, projection=None, chunkSize=0):
+        """
+        按时间顺序分批读取数据（生成器），每次返回一批dataClass对象的列表，内存占用只与chunkSize有关
+        startDate/endDate: 起止时间（datetime，不含endDate），endDate为None时不限
+        projection: 需要返回的字段列表，为None时为dataClass的全部字段
+        """
+        flt = {'datetime': {'$gte': startDate}}
+        if endDate:
+            flt['datetime']['$lt'] = endDate
+
+        fieldList = projection or list(dataClass().__dict__.keys())
+        projectionDict = dict.fromkeys(fieldList, True)
+        projectionDict['_id'] = False
+
+        for chunk in self.mainEngine.dbQueryChunks(dbName, collectionName, flt, sortKey='datetime',
+                                                   projection=projectionDict, chunkSize=chunkSize):
+            l = []
+            for d in chunk:
+                data = dataClass()
+                data.__dict__.update(d)
+                l.append(data)
+            yield l
 
-        d = {'datetime': {'$gte': startDate}}
-        barData = self.mainEngine.dbQuery(dbName, collectionName, d)
+    # ----------------------------------------------------------------------
+    def iterBar(self, dbName, collectionName, startDate, endDate=None, projection=None, chunkSize=0):
+        """按时间顺序分批读取Bar数据（生成器），参数见iterData"""
+        return self.iterData(CtaBarData, dbName, collectionName, startDate, endDate, projection, chunkSize)
 
-        l = []
-        for d in barData:
-            bar = CtaBarData()
-            bar.__dict__ = d
-            l.append(bar)
+    # ----------------------------------------------------------------------
+    def iterTick(self, dbName, collectionName, startDate, endDate=None, projection=None, chunkSize=0):
+        """按时间顺序分批读取Tick数据（生成器），参数见iterData"""
+        return self.iterData(CtaTickData, dbName, collectionName, startDate, endDate, projection, chunkSize)
 
+    # ----------------------------------------------------------------------
+    def loadBar(self, dbName, collectionName, days, endDate=None):
+        """从数据库中读取最近days天的Bar数据（按时间排序），endDate为截止时间（不含）"""
+        startDate = self.today - timedelta(days)
+
+        l = []
+        for chunk in self.iterBar(dbName, collectionName, startDate, endDate):
+            l.extend(chunk)
         return l
 
     # ----------------------------------------------------------------------
-
-    def loadTick(self, dbName, collectionName, days):
-        """从数据库中读取Tick数据，startDate是datetime对象"""
+    def loadTick(self, dbName, collectionName, days, endDate=None):
+        """从数据库中读取最近days天的Tick数据（按时间排序），endDate为截止时间（不含）"""
         startDate = self.today - timedelta(days)
 
-        d = {'datetime': {'$gte': startDate}}
-        tickData = self.mainEngine.dbQuery(dbName, collectionName, d)
-
         l = []
-        for d in tickData:
-            tick = CtaTickData()
-            tick.__dict__ = d
-            l.append(tick)
-
+        for chunk in self.iterTick(dbName, collectionName, startDate, endDate):
+            l.extend(chunk)
         return l
 
+    # ----------------------------------------------------------------------
+    def loadBarToLineBar(self, dbName, collectionName, days, lineBarList, endDate=None,
+                         bar_is_completed=False, bar_freq=1):
+        """
+        从数据库中分批读取最近days天的Bar数据，按时间顺序逐根推入lineBarList中各CtaLineBar的addBar，
+        不保留全部历史数据，返回推入的Bar数量
+        """
+        startDate = self.today - timedelta(days)
+
+        count = 0
+        for chunk in self.iterBar(dbName, collectionName, startDate, endDate):
+            for bar in chunk:
+                for lineBar in lineBarList:
+                    lineBar.addBar(bar, bar_is_completed=bar_is_completed, bar_freq=bar_freq)
+            count += len(chunk)
+        return count
+
         # ----------------------------------------------------------------------
 
     # 日志相关
@@ -874,11 +919,12 @@ class CtaEngine(object):
 
         return RUNING
 
-    def loadStrategy(self, setting, is_dispatch=False):
+    def loadStrategy(self, setting, is_dispatch=False, deferInit=False):
         """
         载入策略
         :param setting: 策略设置参数
         :param is_dispatch: 是否为调度
+        :param deferInit: 不执行auto_init/auto_start，由调用者（并行初始化）统一处理
         :return:
         """
         try:
@@ -985,6 +1031,9 @@ class CtaEngine(object):
             self.pendingSubcribeSymbols[symbol] = strategy
             self.subscribe(strategy=strategy, symbol=symbol)
 
+        if deferInit:
+            return True
+
         # 自动初始化
         if 'auto_init' in setting:
             if setting['auto_init'] == True:
@@ -1011,7 +1060,10 @@ class CtaEngine(object):
             strategy = self.strategyDict[name]
 
             if not strategy.inited or force == True:
+                startTime = time()
                 self.callStrategyFunc(strategy, strategy.onInit, force)
+                self.initTimeDict[name] = time() - startTime
+                self.writeCtaLog(u'策略{}初始化耗时{:.2f}秒'.format(name, self.initTimeDict[name]))
                 # strategy.onInit(force=force)
                 # strategy.inited = True
             else:
@@ -1019,6 +1071,36 @@ class CtaEngine(object):
         else:
             self.writeCtaError(u'策略实例不存在：%s' % name)
 
+    def initStrategies(self, nameList, workers=None):
+        """
+        并行初始化多个策略（线程池），各策略在自己的线程中下载/读取历史数据并回放，
+        相同合约、周期的下载由historyCache去重。完成后输出初始化耗时报告
+        """
+        workers = workers or self.initWorkers
+        startTime = time()
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futureDict = {executor.submit(self.initStrategy, name): name for name in nameList}
+            for future, name in futureDict.items():
+                try:
+                    future.result()
+                except Exception as ex:
+                    self.writeCtaCritical(u'初始化策略：{} 异常,{},{}'.format(name, str(ex), traceback.format_exc()))
+
+        self.writeInitReport(nameList, time() - startTime)
+
+    def writeInitReport(self, nameList, totalTime):
+        """输出策略初始化耗时报告（按耗时从长到短）"""
+        timeList = sorted([(self.initTimeDict.get(name, 0.0), name) for name in nameList], reverse=True)
+        metrics = historyCache.getMetrics()
+        self.writeCtaLog(u'{}个策略初始化完成，总耗时{:.2f}秒，线程数{}，历史数据下载{}次，共享{}次'
+                         .format(len(nameList), totalTime, self.initWorkers,
+                                 metrics['loadCount'], metrics['hitCount']))
+        for initTime, name in timeList:
+            strategy = self.strategyDict.get(name)
+            status = u'成功' if strategy is not None and strategy.inited else u'失败'
+            self.writeCtaLog(u'    {}: {:.2f}秒 {}'.format(name, initTime, status))
+
     def startStrategy(self, name):
         """启动策略"""
         # 1.判断策略名称是否存在字典中
@@ -1670,12 +1752,35 @@ class CtaEngine(object):
         try:
             with open(self.settingfilePath,'r',encoding='UTF-8') as f:
                 l = json.load(f)
-                for setting in l:
-                    try:
-                        self.loadStrategy(setting)
-                    except Exception as ex:
-                        self.writeCtaCritical(u'加载策略配置{}:异常{}，{}'.format(setting, str(ex), traceback.format_exc()))
-                        traceback.print_exc()
+
+            # 并行初始化时，先载入全部策略，再统一初始化、启动
+            deferInit = self.initWorkers > 1
+            loadedList = []
+            for setting in l:
+                try:
+                    if self.loadStrategy(setting, deferInit=deferInit):
+                        loadedList.append(setting)
+                except Exception as ex:
+                    self.writeCtaCritical(u'加载策略配置{}:异常{}，{}'.format(setting, str(ex), traceback.format_exc()))
+                    traceback.print_exc()
+
+            if deferInit:
+                initList = [setting['name'] for setting in loadedList if setting.get('auto_init') == True]
+                if initList:
+                    self.writeCtaLog(u'并行初始化{}个策略，线程数{}'.format(len(initList), self.initWorkers))
+                    self.initStrategies(initList)
+
+                for setting in loadedList:
+                    if setting.get('auto_start') == True:
+                        self.writeCtaLog(u'自动启动策略：{}'.format(setting['name']))
+                        try:
+                            self.startStrategy(name=setting['name'])
+                        except Exception as ex:
+                            self.writeCtaCritical(u'自动启动策略：{} 异常,{},{}'.format(setting['name'], str(ex),
+                                                                                     traceback.format_exc()))
+            elif self.initTimeDict:
+                self.writeInitReport(list(self.initTimeDict.keys()), sum(self.initTimeDict.values()))
+
             self.loadPosition()
         except Exception as ex:
             self.writeCtaCritical(u'加载策略配置异常:{},{}'.format(str(ex),traceback.format_exc()))
@@ -1855,8 +1960,8 @@ class CtaEngine(object):
                  'vtSymbol': strategy.vtSymbol,
                  'pos': strategy.pos}
 
-            self.mainEngine.dbUpdate(POSITION_DB_NAME, strategy.className,
-                                     d, flt, True)
+            self.mainEngine.dbUpdateAsync(POSITION_DB_NAME, strategy.className,
+                                          d, flt, True)
 
             content = '策略%s持仓保存成功' % strategy.name
             self.writeCtaLog(content)
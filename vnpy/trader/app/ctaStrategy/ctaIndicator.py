@@ -0,0 +1,402 @@
+# encoding: UTF-8
+
+"""
+CtaLineBar的增量指标计算层
+
+CtaBarArrays与lineBar同步保存OHLCV的NumPy数组，指标计算直接使用数组的连续视图，
+不再每根bar重建[x.close for x in lineBar[-n:]]列表和np.array：
+1、MA、Boll的均值/标准差、RSI 使用前缀和，O(1)计算任意窗口
+2、EMA、MACD 在固定窗口上是收盘价的线性函数，预先求出权重后用一次点积计算，
+   权重由talib在单位向量上求得，与直接调用talib的结果一致（仅浮点舍入误差）
+3、KDJ的最高/最低价在数组视图上求max/min，窗口中已完成bar的部分按bar缓存，bar内计算时每个tick只比较最后一个bar
+"""
+
+import math
+
+import numpy as np
+import talib as ta
+
+# 判断为0的阈值，与talib的TA_IS_ZERO一致
+TA_EPSILON = 0.00000001
+
+
+########################################################################
+class CtaBarArrays(object):
+    """
+    K线OHLCV的NumPy缓存
+    数组长度为2倍容量，写满后把最近的capacity个数据移到数组开头（均摊O(1)），
+    保证任意窗口都是连续内存的视图，可以直接传给talib。
+    """
+
+    FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+    #----------------------------------------------------------------------
+    def __init__(self, capacity=1024):
+        """Constructor"""
+        self.capacity = capacity
+        self.count = 0                  # 数组中有效数据的数量
+        self.dirty = 0                  # 前缀和需要从该位置开始重算（用到时才计算）
+        self.tailBar = None             # 最后一次同步的bar对象，用于识别lineBar中新增的bar
+
+        size = capacity * 2
+        self.data = np.zeros((len(self.FIELDS), size))
+        self.arrays = {field: self.data[i] for i, field in enumerate(self.FIELDS)}
+
+        # 收盘价的前缀和（减去基准价后计算，减少大数相减的精度损失），sumX[i]为前i个数据之和
+        self.ref = None
+        self.sumX = np.zeros(size + 1)
+        self.sumX2 = np.zeros(size + 1)
+        # 收盘价变化的上涨/下跌前缀和，用于RSI
+        self.sumGain = np.zeros(size + 1)
+        self.sumLoss = np.zeros(size + 1)
+
+        # 线性指标的权重缓存
+        self.weightsCache = {}
+        # 最高/最低价窗口中已完成bar部分的缓存，(n, skip): (count, high, low)
+        self.highLowCache = {}
+
+    #----------------------------------------------------------------------
+    def sync(self, lineBar):
+        """
+        与lineBar同步：追加新增的bar，并刷新上次同步时仍在更新中的最后一个bar
+        lineBar只在尾部追加、头部删除，通过对象标识找到上次同步的位置
+        """
+        if not lineBar:
+            return
+
+        n = len(lineBar)
+        pos = n - 1
+        while pos >= 0 and lineBar[pos] is not self.tailBar:
+            pos -= 1
+
+        if pos < 0 or self.count == 0:
+            # 首次同步或无法定位，全部重建
+            self.count = 0
+            self.dirty = 0
+            self.ref = None
+            self.highLowCache.clear()
+            for bar in lineBar[-self.capacity:]:
+                self.append(bar)
+        else:
+            # 刷新上次的最后一个bar，再追加新增的bar
+            self.update(self.count - 1, lineBar[pos])
+            for bar in lineBar[pos + 1:]:
+                self.append(bar)
+
+        self.tailBar = lineBar[-1]
+
+    #----------------------------------------------------------------------
+    def append(self, bar):
+        """追加一个bar"""
+        if self.count == len(self.arrays['close']):
+            self.compact()
+
+        i = self.count
+        self.count += 1
+        self.update(i, bar)
+
+    #----------------------------------------------------------------------
+    def update(self, i, bar):
+        """更新第i个位置的数据，并重新计算其后的前缀和"""
+        self.data[:, i] = (bar.open, bar.high, bar.low, bar.close, bar.volume)
+
+        if self.ref is None:
+            self.ref = bar.close
+
+        self.dirty = min(self.dirty, i)
+
+    #----------------------------------------------------------------------
+    def recountPrefix(self):
+        """从dirty位置开始重新计算前缀和（通常只有最后1、2个数据）"""
+        close = self.arrays['close']
+        start, self.dirty = self.dirty, self.count
+        for i in range(start, self.count):
+            x = close[i] - self.ref
+            self.sumX[i + 1] = self.sumX[i] + x
+            self.sumX2[i + 1] = self.sumX2[i] + x * x
+
+            diff = close[i] - close[i - 1] if i > 0 else 0.0
+            self.sumGain[i + 1] = self.sumGain[i] + (diff if diff > 0 else 0.0)
+            self.sumLoss[i + 1] = self.sumLoss[i] + (-diff if diff < 0 else 0.0)
+
+    #----------------------------------------------------------------------
+    def compact(self):
+        """保留最近capacity个数据，移到数组开头"""
+        start = self.count - self.capacity
+        self.data[:, :self.capacity] = self.data[:, start:self.count]
+        self.count = self.capacity
+        self.highLowCache.clear()
+
+        # 以新的第一个收盘价为基准重算前缀和（每capacity个bar一次，均摊O(1)）
+        # 第一个数据的涨跌会记为0，不影响任何需要n+1个收盘价的窗口
+        self.ref = self.arrays['close'][0]
+        self.dirty = 0
+
+    #----------------------------------------------------------------------
+    def view(self, field, n, skip=0):
+        """最近n个数据（不含最后skip个）的连续视图"""
+        end = self.count - skip
+        return self.arrays[field][end - n:end]
+
+    #----------------------------------------------------------------------
+    def last(self, field, skip=0):
+        """倒数第skip+1个数据"""
+        return float(self.arrays[field][self.count - skip - 1])
+
+    #----------------------------------------------------------------------
+    def highLow(self, n, skip=0):
+        """
+        最近n个bar（不含最后skip个）的最高价和最低价
+        只有最后一个bar会随tick变化，窗口中其余bar的最高/最低价按bar缓存，bar内每个tick只需比较一次
+        """
+        key = (n, skip)
+        cache = self.highLowCache.get(key)
+        if cache is None or cache[0] != self.count:
+            if n > 1:
+                cache = (self.count, float(self.view('high', n - 1, skip + 1).max()),
+                         float(self.view('low', n - 1, skip + 1).min()))
+            else:
+                cache = (self.count, float('-inf'), float('inf'))
+            self.highLowCache[key] = cache
+
+        return max(cache[1], self.last('high', skip)), min(cache[2], self.last('low', skip))
+
+    #----------------------------------------------------------------------
+    def windowSum(self, n, skip=0):
+        """收盘价窗口的和（减去基准价之后）"""
+        if self.dirty < self.count:
+            self.recountPrefix()
+        end = self.count - skip
+        return self.sumX[end] - self.sumX[end - n], self.sumX2[end] - self.sumX2[end - n]
+
+    #----------------------------------------------------------------------
+    def ma(self, n, skip=0, roundN=None):
+        """收盘价的简单移动平均，与talib.MA(close[-n:], n)[-1]一致"""
+        s, _ = self.windowSum(n, skip)
+        mean = s / n + self.ref
+        if nearRoundBoundary(mean, roundN):
+            # 前缀和与talib的累加顺序不同，在取整分界点附近按talib的顺序逐个累加，保证取整结果一致
+            mean = sum(self.view('close', n, skip).tolist()) / n
+        return mean
+
+    #----------------------------------------------------------------------
+    def meanStd(self, n, skip=0, ddof=0):
+        """收盘价窗口的均值和标准差（ddof=0为总体标准差，ddof=1与np.std(ddof=1)一致）"""
+        s, s2 = self.windowSum(n, skip)
+        mean = s / n
+        var = (s2 - s * mean) / (n - ddof)
+        if var < 0:
+            var = 0.0
+        return mean + self.ref, math.sqrt(var)
+
+    #----------------------------------------------------------------------
+    def bbands(self, n, rate, skip=0, roundN=None):
+        """
+        布林带(upper, middle, lower, std)，与talib.BBANDS(close[-n:], n, rate, rate, matype=0)一致
+        任一结果接近roundN位取整的分界点时，直接调用talib计算，保证取整结果一致
+        """
+        middle, std = self.meanStd(n, skip)
+        upper = middle + rate * std
+        lower = middle - rate * std
+
+        if nearRoundBoundary(upper, roundN) or nearRoundBoundary(middle, roundN) \
+                or nearRoundBoundary(lower, roundN):
+            u, m, l = ta.BBANDS(self.view('close', n, skip), timeperiod=n,
+                                nbdevup=rate, nbdevdn=rate, matype=0)
+            return u[-1], m[-1], l[-1], std
+
+        return np.float64(upper), np.float64(middle), np.float64(lower), std
+
+    #----------------------------------------------------------------------
+    def rsi(self, n, skip=0):
+        """最近n+1个收盘价（n个变化）计算的RSI，与talib.RSI(close[-n-1:], n)[-1]一致"""
+        if self.dirty < self.count:
+            self.recountPrefix()
+        end = self.count - skip
+        gain = self.sumGain[end] - self.sumGain[end - n]
+        loss = self.sumLoss[end] - self.sumLoss[end - n]
+        total = gain + loss
+        # talib对平均涨跌幅之和做判断
+        if -TA_EPSILON < total / n < TA_EPSILON:
+            return 0.0
+        return 100 * gain / total
+
+    #----------------------------------------------------------------------
+    def getWeights(self, key, func, n):
+        """
+        线性指标（EMA、MACD等）在长度为n的窗口上，最后一个输出值对各输入的权重
+        func(array)返回最后一个输出值（或其元组），在单位向量上求值得到权重
+        """
+        cacheKey = (key, n)
+        weights = self.weightsCache.get(cacheKey)
+        if weights is None:
+            eye = np.eye(n)
+            weights = np.array([func(eye[i]) for i in range(n)]).T
+            self.weightsCache[cacheKey] = weights
+        return weights
+
+    #----------------------------------------------------------------------
+    def ema(self, period, n, skip=0):
+        """收盘价最近n个数据计算的EMA最后一个值，与talib.EMA(close[-n:], period)[-1]一致"""
+        if n < period:
+            return float('nan')
+        weights = self.getWeights(('ema', period), lambda x: ta.EMA(x, period)[-1], n)
+        return float(np.dot(weights, self.view('close', n, skip)))
+
+    #----------------------------------------------------------------------
+    def macd(self, fast, slow, signal, n, skip=0):
+        """收盘价最近n个数据计算的MACD最后一组值(dif, dea, macd)，与talib.MACD一致"""
+        def func(x):
+            dif, dea, macd = ta.MACD(x, fastperiod=fast, slowperiod=slow, signalperiod=signal)
+            return dif[-1], dea[-1], macd[-1]
+
+        weights = self.getWeights(('macd', fast, slow, signal), func, n)
+        dif, dea, macd = np.dot(weights, self.view('close', n, skip))
+        return float(dif), float(dea), float(macd)
+
+
+#----------------------------------------------------------------------
+def nearRoundBoundary(value, roundN):
+    """value是否接近保留roundN位小数时四舍五入的分界点（roundN为None时不判断）"""
+    if roundN is None:
+        return False
+    scaled = value * 10 ** roundN
+    return abs(scaled - math.floor(scaled) - 0.5) < 0.000001
+
+
+########################################################################
+class CtaSeries(object):
+    """
+    指标序列：NumPy存储的环形缓存，兼容list的常用用法([-1]、[-2]、len、append、del [0]、遍历)
+    数据保存在一段连续的数组中，头部删除只移动起始位置(O(1))，尾部写满时整体移回数组开头(均摊O(1))，
+    切片返回NumPy视图，可直接传给talib。
+    maxLen>0时，append超过maxLen后自动淘汰最早的数据。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, maxLen=0, values=None):
+        """Constructor"""
+        self.maxLen = maxLen
+        self.data = np.zeros(max(2 * maxLen, 64))
+        self.start = 0                  # 第一个有效数据的位置
+        self.end = 0                    # 最后一个有效数据的下一个位置
+
+        if values is not None:
+            self.extend(values)
+
+    #----------------------------------------------------------------------
+    def setMaxLen(self, maxLen):
+        """设置最大长度（0为不限制），超出的最早数据被淘汰"""
+        self.maxLen = maxLen
+        if 0 < maxLen < len(self):
+            self.start = self.end - maxLen
+
+    #----------------------------------------------------------------------
+    def append(self, value):
+        """追加一个数据"""
+        if self.end == len(self.data):
+            self.compact()
+        self.data[self.end] = value
+        self.end += 1
+
+        if 0 < self.maxLen < self.end - self.start:
+            self.start += 1
+
+    #----------------------------------------------------------------------
+    def extend(self, values):
+        """追加多个数据"""
+        for value in values:
+            self.append(value)
+
+    #----------------------------------------------------------------------
+    def compact(self):
+        """有效数据移到数组开头，空间不足一半时扩容"""
+        n = self.end - self.start
+        size = len(self.data)
+        if n * 2 > size:
+            data = np.zeros(size * 2)
+            data[:n] = self.data[self.start:self.end]
+            self.data = data
+        else:
+            self.data[:n] = self.data[self.start:self.end]
+        self.start, self.end = 0, n
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空"""
+        self.start = self.end = 0
+
+    #----------------------------------------------------------------------
+    @property
+    def values(self):
+        """全部有效数据的视图"""
+        return self.data[self.start:self.end]
+
+    #----------------------------------------------------------------------
+    def tolist(self):
+        """转换为list"""
+        return self.values.tolist()
+
+    #----------------------------------------------------------------------
+    def __index(self, key):
+        """下标转换为数组位置"""
+        n = self.end - self.start
+        if key < 0:
+            key += n
+        if key < 0 or key >= n:
+            raise IndexError('CtaSeries index out of range')
+        return self.start + key
+
+    #----------------------------------------------------------------------
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.values[key]
+        return float(self.data[self.__index(key)])
+
+    #----------------------------------------------------------------------
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            self.values[key] = value
+        else:
+            self.data[self.__index(key)] = value
+
+    #----------------------------------------------------------------------
+    def __delitem__(self, key):
+        if not isinstance(key, slice) and self.__index(key) == self.start:
+            # 删除最早的数据
+            self.start += 1
+            return
+
+        values = np.delete(self.values, key)
+        self.clear()
+        self.extend(values)
+
+    #----------------------------------------------------------------------
+    def __len__(self):
+        return self.end - self.start
+
+    #----------------------------------------------------------------------
+    def __iter__(self):
+        return iter(self.tolist())
+
+    #----------------------------------------------------------------------
+    def __array__(self, dtype=None, copy=None):
+        values = self.values
+        return values.astype(dtype) if dtype is not None else values
+
+    #----------------------------------------------------------------------
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    #----------------------------------------------------------------------
+    def __repr__(self):
+        return repr(self.tolist())
+
+    #----------------------------------------------------------------------
+    def __getstate__(self):
+        """pickle时只保存有效数据"""
+        return {'maxLen': self.maxLen, 'values': self.tolist()}
+
+    #----------------------------------------------------------------------
+    def __setstate__(self, state):
+        self.__init__(state['maxLen'], state['values'])
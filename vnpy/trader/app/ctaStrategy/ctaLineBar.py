@@ -18,6 +18,7 @@ from vnpy.trader.app.ctaStrategy.ctaBase import *
 from vnpy.trader.vtConstant import *
 from vnpy.trader.vtConstant import DIRECTION_LONG, DIRECTION_SHORT
 from vnpy.trader.app.ctaStrategy.ctaPeriod import *
+from vnpy.trader.app.ctaStrategy.ctaIndicator import CtaBarArrays, CtaSeries
 
 DEBUGCTALOG = True
 
@@ -121,6 +122,9 @@ class CtaLineBar(object):
 
         self.is_7x24 = False
 
+        # 指标序列和lineBar的最大保存数量，0为不限制；需大于各指标计算所需的K线数量
+        self.maxHistory = 0
+
         # 当前的Tick
         self.curTick = None
         self.lastTick = None
@@ -131,6 +135,7 @@ class CtaLineBar(object):
         # K线保存数据
         self.bar = None  # K线数据对象
         self.lineBar = []  # K线缓存数据队列
+        self.barArrays = None  # 与lineBar同步的OHLCV数组，用于指标的增量计算
         self.barFirstTick = False  # K线的第一条Tick数据
 
         self.export_filename = None
@@ -150,6 +155,9 @@ class CtaLineBar(object):
                 exponent = decimal.Decimal(str(self.minDiff))
                 self.round_n = abs(exponent.as_tuple().exponent)
 
+            if self.maxHistory > 0:
+                self.setMaxHistory(self.maxHistory)
+
             ## 导入卡尔曼过滤器
             if self.inputKF:
                 try:
@@ -208,6 +216,7 @@ class CtaLineBar(object):
         self.paramList.append('inputSarAfStep')
         self.paramList.append('inputSarAfLimit')
         self.paramList.append('is_7x24')
+        self.paramList.append('maxHistory')
 
         self.paramList.append('minDiff')
         self.paramList.append('shortSymbol')
@@ -236,11 +245,32 @@ class CtaLineBar(object):
     def __setstate__(self, state):
         """Pickle load()"""
         self.__dict__.update(state)
+        self.upgradeState()
 
     def restore(self, state):
         """从Pickle中恢复数据"""
         for key in state.__dict__.keys():
             self.__dict__[key] = state.__dict__[key]
+        self.upgradeState()
+
+    # 指标序列（CtaSeries）的属性名称，第一次使用时由init_indicators得到
+    seriesNameList = None
+
+    def upgradeState(self):
+        """旧版本Pickle中的指标序列为list，转换为CtaSeries，并补充旧版本没有的属性"""
+        d = self.__dict__
+        d.setdefault('maxHistory', 0)
+        d.setdefault('barArrays', None)
+
+        if CtaLineBar.seriesNameList is None:
+            template = CtaLineBar.__new__(CtaLineBar)
+            template.init_indicators()
+            CtaLineBar.seriesNameList = [k for k, v in template.__dict__.items() if isinstance(v, CtaSeries)]
+
+        for name in CtaLineBar.seriesNameList:
+            value = d.get(name)
+            if isinstance(value, list):
+                d[name] = CtaSeries(d['maxHistory'], value)
 
     def init_indicators(self):
         """ 定义所有的指标数据"""
@@ -272,13 +302,13 @@ class CtaLineBar(object):
         self.preHigh = []  # K线的前inputPreLen的的最高
         self.preLow = []  # K线的前inputPreLen的的最低
 
-        self.lineMa1 = []  # K线的MA1均线，周期是InputMaLen1，不包含当前bar
-        self.lineMa2 = []  # K线的MA2均线，周期是InputMaLen2，不包含当前bar
-        self.lineMa3 = []  # K线的MA2均线，周期是InputMaLen2，不包含当前bar
+        self.lineMa1 = CtaSeries()  # K线的MA1均线，周期是InputMaLen1，不包含当前bar
+        self.lineMa2 = CtaSeries()  # K线的MA2均线，周期是InputMaLen2，不包含当前bar
+        self.lineMa3 = CtaSeries()  # K线的MA2均线，周期是InputMaLen2，不包含当前bar
 
-        self.lineEma1 = []  # K线的EMA1均线，周期是InputEmaLen1，不包含当前bar
-        self.lineEma2 = []  # K线的EMA2均线，周期是InputEmaLen2，不包含当前bar
-        self.lineEma3 = []  # K线的EMA3均线，周期是InputEmaLen3，不包含当前bar
+        self.lineEma1 = CtaSeries()  # K线的EMA1均线，周期是InputEmaLen1，不包含当前bar
+        self.lineEma2 = CtaSeries()  # K线的EMA2均线，周期是InputEmaLen2，不包含当前bar
+        self.lineEma3 = CtaSeries()  # K线的EMA3均线，周期是InputEmaLen3，不包含当前bar
 
         self.ma12_count = 0    # ma1 与 ma2 ,金叉/死叉后第几根bar
         self.ma13_count = 0    # ma1 与 ma3 ,金叉/死叉后第几根bar
@@ -289,14 +319,14 @@ class CtaLineBar(object):
         self.barPdi = EMPTY_FLOAT  # bar内的升动向指标，即做多的比率
         self.barMdi = EMPTY_FLOAT  # bar内的下降动向指标，即做空的比率
 
-        self.linePdi = []  # 升动向指标，即做多的比率
-        self.lineMdi = []  # 下降动向指标，即做空的比率
+        self.linePdi = CtaSeries()  # 升动向指标，即做多的比率
+        self.lineMdi = CtaSeries()  # 下降动向指标，即做空的比率
 
-        self.lineDx = []  # 趋向指标列表，最大长度为inputM*2
+        self.lineDx = CtaSeries()  # 趋向指标列表，最大长度为inputM*2
         self.barAdx = EMPTY_FLOAT  # Bar内计算的平均趋向指标
-        self.lineAdx = []  # 平均趋向指标
+        self.lineAdx = CtaSeries()  # 平均趋向指标
         self.barAdxr = EMPTY_FLOAT  # 趋向平均值，为当日ADX值与M日前的ADX值的均值
-        self.lineAdxr = []  # 平均趋向变化指标
+        self.lineAdxr = CtaSeries()  # 平均趋向变化指标
 
         # K线的基于DMI、ADX计算的结果
         self.barAdxTrend = EMPTY_FLOAT  # ADX值持续高于前一周期时，市场行情将维持原趋势
@@ -306,20 +336,20 @@ class CtaLineBar(object):
         self.sellFilterCond = False  # 空过滤器条件,做空趋势的判断，ADXR高于前一天，下降动向> inputMM
 
         # K线的ATR技术数据
-        self.lineAtr1 = []  # K线的ATR1,周期为inputAtr1Len
-        self.lineAtr2 = []  # K线的ATR2,周期为inputAtr2Len
-        self.lineAtr3 = []  # K线的ATR3,周期为inputAtr3Len
+        self.lineAtr1 = CtaSeries()  # K线的ATR1,周期为inputAtr1Len
+        self.lineAtr2 = CtaSeries()  # K线的ATR2,周期为inputAtr2Len
+        self.lineAtr3 = CtaSeries()  # K线的ATR3,周期为inputAtr3Len
 
         self.barAtr1 = EMPTY_FLOAT
         self.barAtr2 = EMPTY_FLOAT
         self.barAtr3 = EMPTY_FLOAT
 
         # K线的交易量平均
-        self.lineAvgVol = []  # K 线的交易量平均
+        self.lineAvgVol = CtaSeries()  # K 线的交易量平均
 
         # K线的RSI计算数据
-        self.lineRsi1 = []  # 记录K线对应的RSI数值，只保留inputRsi1Len*8
-        self.lineRsi2 = []  # 记录K线对应的RSI数值，只保留inputRsi2Len*8
+        self.lineRsi1 = CtaSeries()  # 记录K线对应的RSI数值，只保留inputRsi1Len*8
+        self.lineRsi2 = CtaSeries()  # 记录K线对应的RSI数值，只保留inputRsi2Len*8
 
         self.lowRsi = 30  # RSI的最低线
         self.highRsi = 70  # RSI的最高线
@@ -330,17 +360,17 @@ class CtaLineBar(object):
 
         # K线的CMI计算数据
         self.inputCmiLen = EMPTY_INT
-        self.lineCmi = []  # 记录K线对应的Cmi数值，只保留inputCmiLen*8
+        self.lineCmi = CtaSeries()  # 记录K线对应的Cmi数值，只保留inputCmiLen*8
 
         # K线的布林特计算数据
         self.inputBollLen = EMPTY_INT  # K线周期
         self.inputBollTBLen = EMPTY_INT  # K线周期
         self.inputBollStdRate = 1.5  # 两倍标准差
         self.lineBollClose = []  # 用于运算的close价格列表
-        self.lineUpperBand = []  # 上轨
-        self.lineMiddleBand = []  # 中线
-        self.lineLowerBand = []  # 下轨
-        self.lineBollStd = []  # 标准差
+        self.lineUpperBand = CtaSeries()  # 上轨
+        self.lineMiddleBand = CtaSeries()  # 中线
+        self.lineLowerBand = CtaSeries()  # 下轨
+        self.lineBollStd = CtaSeries()  # 标准差
 
         self.lastBollUpper = EMPTY_FLOAT  # 最后一根K的Boll上轨数值（与MinDiff取整）
         self.lastBollMiddle = EMPTY_FLOAT  # 最后一根K的Boll中轨数值（与MinDiff取整）
@@ -350,10 +380,10 @@ class CtaLineBar(object):
         self.inputBoll2TBLen = EMPTY_INT  # K线周期
         self.inputBoll2StdRate = 1.5  # 两倍标准差
         self.lineBoll2Close = []  # 用于运算的close价格列表
-        self.lineUpperBand2 = []  # 上轨
-        self.lineMiddleBand2 = []  # 中线
-        self.lineLowerBand2 = []  # 下轨
-        self.lineBoll2Std = []  # 标准差
+        self.lineUpperBand2 = CtaSeries()  # 上轨
+        self.lineMiddleBand2 = CtaSeries()  # 中线
+        self.lineLowerBand2 = CtaSeries()  # 下轨
+        self.lineBoll2Std = CtaSeries()  # 标准差
 
         self.lastBoll2Upper = EMPTY_FLOAT  # 最后一根K的Boll2上轨数值（与MinDiff取整）
         self.lastBoll2Middle = EMPTY_FLOAT  # 最后一根K的Boll2中轨数值（与MinDiff取整）
@@ -364,12 +394,12 @@ class CtaLineBar(object):
         self.inputKdjTBLen = EMPTY_INT  # KDJ指标的长度,缺省是9 ( for TB)
         self.inputKdjSlowLen = EMPTY_INT
         self.inputKdjSmoothLen = EMPTY_INT
-        self.lineK = []  # K为快速指标
-        self.lineD = []  # D为慢速指标
-        self.lineJ = []  #
+        self.lineK = CtaSeries()  # K为快速指标
+        self.lineD = CtaSeries()  # D为慢速指标
+        self.lineJ = CtaSeries()  #
         self.lineKdjTop = []  # 记录KDJ最高峰，只保留 inputKdjLen个
         self.lineKdjButtom = []  # 记录KDJ的最低谷，只保留 inputKdjLen个
-        self.lineKdjRSV = []  # RSV
+        self.lineKdjRSV = CtaSeries()  # RSV
         self.lastKdjTopButtom = {}  # 最近的一个波峰/波谷
         self.lastK = EMPTY_FLOAT  # bar内计算时，最后一个未关闭的bar的实时K值
         self.lastD = EMPTY_FLOAT  # bar内计算时，最后一个未关闭的bar的实时值
@@ -380,13 +410,13 @@ class CtaLineBar(object):
         self.inputMacdSlowPeriodLen = EMPTY_INT
         self.inputMacdSignalPeriodLen = EMPTY_INT
 
-        self.lineDif = []  # DIF = EMA12 - EMA26，即为talib-MACD返回值macd
-        self.lineDea = []  # DEA = （前一日DEA X 8/10 + 今日DIF X 2/10），即为talib-MACD返回值
-        self.lineMacd = []  # (dif-dea)*2，但是talib中MACD的计算是bar = (dif-dea)*1,国内一般是乘以2
+        self.lineDif = CtaSeries()  # DIF = EMA12 - EMA26，即为talib-MACD返回值macd
+        self.lineDea = CtaSeries()  # DEA = （前一日DEA X 8/10 + 今日DIF X 2/10），即为talib-MACD返回值
+        self.lineMacd = CtaSeries()  # (dif-dea)*2，但是talib中MACD的计算是bar = (dif-dea)*1,国内一般是乘以2
 
         # K 线的CCI计算数据
         self.inputCciLen = EMPTY_INT
-        self.lineCci = []
+        self.lineCci = CtaSeries()
 
         # 卡尔曼过滤器
         self.inputKF = False
@@ -419,17 +449,17 @@ class CtaLineBar(object):
         self.inputSkd = False
         self.inputSkdLen1 = 13  # 周期1
         self.inputSkdLen2 = 8  # 周期2
-        self.lineSkdRSI = []    # 参照的RSI
-        self.lineSkdSTO = []    # 根据RSI演算的STO
-        self.lineSK = []  # 快线
-        self.lineSD = []  # 慢线
+        self.lineSkdRSI = CtaSeries()    # 参照的RSI
+        self.lineSkdSTO = CtaSeries()    # 根据RSI演算的STO
+        self.lineSK = CtaSeries()  # 快线
+        self.lineSD = CtaSeries()  # 慢线
         self.lowSkd = 30
         self.highSkd = 70
         self.skd_count = 0 # 当前金叉/死叉后累加
 
         # 多空趋势线
         self.inputYb = False
-        self.lineYb = []
+        self.lineYb = CtaSeries()
         self.inputYbRef = 1
         self.inputYbLen = 10
         self.yb_count = 0  # 当前黄/蓝累加
@@ -462,6 +492,13 @@ class CtaLineBar(object):
         """Tick/Bar模式"""
         self.mode = mode
 
+    def setMaxHistory(self, maxHistory):
+        """设置指标序列和lineBar的最大保存数量，0为不限制"""
+        self.maxHistory = maxHistory
+        for value in self.__dict__.values():
+            if isinstance(value, CtaSeries):
+                value.setMaxLen(maxHistory)
+
     def onTick(self, tick):
         """行情更新
         :type tick: object
@@ -490,6 +527,8 @@ class CtaLineBar(object):
             self.curPeriod.onPrice(self.curTick.lastPrice)
 
         # 4.执行 bar内计算
+        if self.inputKdjLen > EMPTY_INT or self.inputKdjTBLen > EMPTY_INT:
+            self.__syncBarArrays()
         self.__recountKdj(countInBar=True)
         self.__recountKdj_TB(countInBar=True)
 
@@ -574,6 +613,11 @@ class CtaLineBar(object):
         bar.mid4 = round((2*bar.close + bar.high + bar.low)/4, self.round_n)
         bar.mid5 = round((2*bar.close + bar.open + bar.high + bar.low)/5, self.round_n)
 
+        # 限制lineBar的长度，超出1/4时批量删除最早的K线（均摊O(1)）
+        if self.maxHistory > 0 and len(self.lineBar) > self.maxHistory + self.maxHistory // 4:
+            del self.lineBar[:-self.maxHistory]
+
+        self.__syncBarArrays()
         self.__recountPreHighLow()
         self.__recountMa()
         self.__recountEma()
@@ -596,6 +640,23 @@ class CtaLineBar(object):
         # 回调上层调用者
         self.onBarFunc(bar)
 
+    def __syncBarArrays(self):
+        """同步lineBar到OHLCV数组（只追加新bar、刷新未完成的bar）"""
+        if self.barArrays is None:
+            # 容量需覆盖最长的指标计算窗口
+            maxLen = max([v for k, v in self.__dict__.items()
+                          if k.startswith('input') and k.endswith('Len') and isinstance(v, int)] + [0])
+            self.barArrays = CtaBarArrays(capacity=max(1024, maxLen * 4 + 64))
+        self.barArrays.sync(self.lineBar)
+
+    def __closeWindow(self, n, countInBar=False):
+        """
+        计算窗口的长度和末尾跳过的bar数量
+        TICK_MODE下(非bar内计算)不包含当前未完成的bar，窗口长度不超过lineBar的长度
+        """
+        skip = 1 if self.mode == self.TICK_MODE and not countInBar else 0
+        return min(n, len(self.lineBar) - skip), skip
+
     def export_to_csv(self,bar):
         if self.export_filename is None or len(self.export_fields) == 0:
             return
@@ -1139,12 +1200,7 @@ class CtaLineBar(object):
                 ma1Len = self.inputMa1Len
 
             # 3、获取前InputN周期(不包含当前周期）的K线
-            if self.mode == self.TICK_MODE:
-                listClose=[x.close for x in self.lineBar[-ma1Len - 1:-1]]
-            else:
-                listClose=[x.close for x in self.lineBar[-ma1Len:]]
-
-            barMa1 = ta.MA(np.array(listClose, dtype=float), ma1Len)[-1]
+            barMa1 = self.barArrays.ma(*self.__closeWindow(ma1Len), roundN=self.round_n)
             barMa1 = round(float(barMa1), self.round_n)
 
             if len(self.lineMa1) > self.inputMa1Len*8:
@@ -1159,12 +1215,7 @@ class CtaLineBar(object):
                 ma2Len = self.inputMa2Len
 
             # 3、获取前InputN周期(不包含当前周期）的K线
-            if self.mode == self.TICK_MODE:
-                listClose=[x.close for x in self.lineBar[-ma2Len - 1:-1]]
-            else:
-                listClose=[x.close for x in self.lineBar[-ma2Len:]]
-
-            barMa2 = ta.MA(np.array(listClose, dtype=float), ma2Len)[-1]
+            barMa2 = self.barArrays.ma(*self.__closeWindow(ma2Len), roundN=self.round_n)
             barMa2 = round(float(barMa2), self.round_n)
 
             if len(self.lineMa2) > self.inputMa2Len*8:
@@ -1179,12 +1230,7 @@ class CtaLineBar(object):
                 ma3Len = self.inputMa3Len
 
             # 3、获取前InputN周期(不包含当前周期）的K线
-            if self.mode == self.TICK_MODE:
-                listClose = [x.close for x in self.lineBar[-ma3Len - 1:-1]]
-            else:
-                listClose = [x.close for x in self.lineBar[-ma3Len:]]
-
-            barMa3 = ta.MA(np.array(listClose, dtype=float), ma3Len)[-1]
+            barMa3 = self.barArrays.ma(*self.__closeWindow(ma3Len), roundN=self.round_n)
             barMa3 = round(float(barMa3), self.round_n)
 
             if len(self.lineMa3) > self.inputMa3Len * 8:
@@ -1302,12 +1348,8 @@ class CtaLineBar(object):
                 ema1Len = self.inputEma1Len
 
             # 3、获取前InputN周期(不包含当前周期）的K线
-            if self.mode == self.TICK_MODE:
-                listClose=[x.close for x in self.lineBar[-ema1_data_len - 1:-1]]
-            else:
-                listClose=[x.close for x in self.lineBar[-ema1_data_len:]]
-
-            barEma1 = ta.EMA(np.array(listClose, dtype=float), ema1Len)[-1]
+            n, skip = self.__closeWindow(ema1_data_len)
+            barEma1 = self.barArrays.ema(ema1Len, n, skip)
 
             barEma1 = round(float(barEma1), self.round_n)
 
@@ -1323,12 +1365,8 @@ class CtaLineBar(object):
                 ema2Len = self.inputEma2Len
 
             # 3、获取前InputN周期(不包含当前周期）的自适应均线
-            if self.mode == self.TICK_MODE:
-                listClose=[x.close for x in self.lineBar[-ema2_data_len - 1:-1]]
-            else:
-                listClose=[x.close for x in self.lineBar[-ema2_data_len:]]
-
-            barEma2 = ta.EMA(np.array(listClose, dtype=float), ema2Len)[-1]
+            n, skip = self.__closeWindow(ema2_data_len)
+            barEma2 = self.barArrays.ema(ema2Len, n, skip)
 
             barEma2 = round(float(barEma2), self.round_n)
 
@@ -1344,12 +1382,8 @@ class CtaLineBar(object):
                 ema3Len = self.inputEma3Len
 
             # 3、获取前InputN周期(不包含当前周期）的自适应均线
-            if self.mode == self.TICK_MODE:
-                listClose = [x.close for x in self.lineBar[-ema3_data_len - 1:-1]]
-            else:
-                listClose = [x.close for x in self.lineBar[-ema3_data_len:]]
-
-            barEma3 = ta.EMA(np.array(listClose, dtype=float), ema3_data_len)[-1]
+            n, skip = self.__closeWindow(ema3_data_len)
+            barEma3 = self.barArrays.ema(ema3_data_len, n, skip)
 
             barEma3 = round(float(barEma3), self.round_n)
 
@@ -1637,12 +1671,7 @@ class CtaLineBar(object):
                              format(len(self.lineBar), self.inputVolLen+1))
             return
 
-        if self.mode == self.TICK_MODE:
-            listVol = [x.volume for x in self.lineBar[-self.inputVolLen-1: -1]]
-        else:
-            listVol = [x.volume for x in self.lineBar[-self.inputVolLen:]]
-
-        sumVol = ta.SUM(np.array(listVol, dtype=float), timeperiod=self.inputVolLen)[-1]
+        sumVol = self.barArrays.view('volume', *self.__closeWindow(self.inputVolLen)).sum()
 
         avgVol = round(sumVol/self.inputVolLen, 0)
 
@@ -1663,14 +1692,10 @@ class CtaLineBar(object):
 
         # 计算第1根RSI曲线
         # 3、inputRsi1Len(包含当前周期）的相对强弱
-        if self.mode == self.TICK_MODE:
-            listClose=[x.close for x in self.lineBar[-self.inputRsi1Len - 2:-1]]
-            idx = 2
-        else:
-            listClose=[x.close for x in self.lineBar[-self.inputRsi1Len-1:]]
-            idx = 1
+        n, skip = self.__closeWindow(self.inputRsi1Len)
+        idx = skip + 1
 
-        barRsi = ta.RSI(np.array(listClose, dtype=float), self.inputRsi1Len)[-1]
+        barRsi = self.barArrays.rsi(n, skip)
         barRsi = round(float(barRsi), self.round_n)
 
         l = len(self.lineRsi1)
@@ -1710,12 +1735,7 @@ class CtaLineBar(object):
             if len(self.lineBar) < self.inputRsi2Len+2:
                 return
 
-            if self.mode == self.TICK_MODE:
-                listClose=[x.close for x in self.lineBar[-self.inputRsi2Len - 2:-1]]
-            else:
-                listClose=[x.close for x in self.lineBar[-self.inputRsi2Len - 1:]]
-
-            barRsi = ta.RSI(np.array(listClose, dtype=float), self.inputRsi2Len)[-1]
+            barRsi = self.barArrays.rsi(*self.__closeWindow(self.inputRsi2Len))
             barRsi = round(float(barRsi), self.round_n)
 
             l = len(self.lineRsi2)
@@ -1785,14 +1805,8 @@ class CtaLineBar(object):
                     bollLen = self.inputBollLen
 
                 # 不包含当前最新的Bar
-                if self.mode == self.TICK_MODE:
-                    listClose=[x.close for x in self.lineBar[-bollLen - 1:-1]]
-                else:
-                    listClose=[x.close for x in self.lineBar[-bollLen :]]
-
-                upper, middle, lower = ta.BBANDS(np.array(listClose, dtype=float),
-                                                 timeperiod=bollLen, nbdevup=self.inputBollStdRate,
-                                                 nbdevdn=self.inputBollStdRate, matype=0)
+                n, skip = self.__closeWindow(bollLen)
+                upper, middle, lower, std = self.barArrays.bbands(n, self.inputBollStdRate, skip, self.round_n)
                 if len(self.lineUpperBand) > self.inputBollLen*8:
                     del self.lineUpperBand[0]
                 if len(self.lineMiddleBand) > self.inputBollLen*8:
@@ -1803,18 +1817,17 @@ class CtaLineBar(object):
                     del self.lineBollStd[0]
 
                 # 1标准差
-                std = (upper[-1] - lower[-1]) / (self.inputBollStdRate*2)
                 self.lineBollStd.append(std)
 
-                u = round(upper[-1], self.round_n)
+                u = round(upper, self.round_n)
                 self.lineUpperBand.append(u)                                # 上轨
                 self.lastBollUpper = u - u % self.minDiff                   # 上轨取整
 
-                m = round(middle[-1], self.round_n)
+                m = round(middle, self.round_n)
                 self.lineMiddleBand.append(m)                               # 中轨
                 self.lastBollMiddle = m - m % self.minDiff                  # 中轨取整
 
-                l = round(lower[-1], self.round_n)
+                l = round(lower, self.round_n)
                 self.lineLowerBand.append(l)                                # 下轨
                 self.lastBollLower = l - l % self.minDiff                   # 下轨取整
 
@@ -1830,14 +1843,8 @@ class CtaLineBar(object):
                     boll2Len = self.inputBoll2Len
 
                 # 不包含当前最新的Bar
-                if self.mode == self.TICK_MODE:
-                    listClose=[x.close for x in self.lineBar[-boll2Len - 1:-1]]
-                else:
-                    listClose=[x.close for x in self.lineBar[-boll2Len :]]
-
-                upper, middle, lower = ta.BBANDS(np.array(listClose, dtype=float),
-                                                 timeperiod=boll2Len, nbdevup=self.inputBoll2StdRate,
-                                                 nbdevdn=self.inputBoll2StdRate, matype=0)
+                n, skip = self.__closeWindow(boll2Len)
+                upper, middle, lower, std = self.barArrays.bbands(n, self.inputBoll2StdRate, skip, self.round_n)
                 if len(self.lineUpperBand2) > self.inputBoll2Len * 8:
                     del self.lineUpperBand2[0]
                 if len(self.lineMiddleBand2) > self.inputBoll2Len * 8:
@@ -1848,18 +1855,17 @@ class CtaLineBar(object):
                     del self.lineBoll2Std[0]
 
                 # 1标准差
-                std = (upper[-1] - lower[-1]) / (self.inputBoll2StdRate*2)
                 self.lineBoll2Std.append(std)
 
-                u = round(upper[-1], self.round_n)
+                u = round(upper, self.round_n)
                 self.lineUpperBand2.append(u)                                # 上轨
                 self.lastBoll2Upper = u - u % self.minDiff                   # 上轨取整
 
-                m = round(middle[-1], self.round_n)
+                m = round(middle, self.round_n)
                 self.lineMiddleBand2.append(m)                               # 中轨
                 self.lastBoll2Middle = m - m % self.minDiff                  # 中轨取整
 
-                l = round(lower[-1], self.round_n)
+                l = round(lower, self.round_n)
                 self.lineLowerBand2.append(l)                                # 下轨
                 self.lastBoll2Lower = l - l % self.minDiff                   # 下轨取整
 
@@ -1874,11 +1880,8 @@ class CtaLineBar(object):
                 else:
                     bollLen = self.inputBollTBLen
 
-                # 不包含当前最新的Bar
-                if self.mode == self.TICK_MODE:
-                    listClose=[x.close for x in self.lineBar[-bollLen - 1:-1]]
-                else:
-                    listClose=[x.close for x in self.lineBar[-bollLen :]]
+                # 不包含当前最新的Bar，样本标准差(与np.std(ddof=1)一致)
+                m, std = self.barArrays.meanStd(*self.__closeWindow(bollLen), ddof=1)
 
                 if len(self.lineUpperBand) > self.inputBollTBLen*8:
                     del self.lineUpperBand[0]
@@ -1890,10 +1893,8 @@ class CtaLineBar(object):
                     del self.lineBollStd[0]
 
                 # 1标准差
-                std = np.std(listClose, ddof=1)
                 self.lineBollStd.append(std)
 
-                m = np.mean(listClose)
                 self.lineMiddleBand.append(m)                               # 中轨
                 self.lastBollMiddle = m - m % self.minDiff                  # 中轨取整
 
@@ -1916,11 +1917,8 @@ class CtaLineBar(object):
                 else:
                     boll2Len = self.inputBoll2TBLen
 
-                # 不包含当前最新的Bar
-                if self.mode == self.TICK_MODE:
-                    listClose=[x.close for x in self.lineBar[-boll2Len - 1:-1]]
-                else:
-                    listClose=[x.close for x in self.lineBar[-boll2Len :]]
+                # 不包含当前最新的Bar，样本标准差(与np.std(ddof=1)一致)
+                m, std = self.barArrays.meanStd(*self.__closeWindow(boll2Len), ddof=1)
 
                 if len(self.lineUpperBand2) > self.inputBoll2TBLen*8:
                     del self.lineUpperBand2[0]
@@ -1932,10 +1930,8 @@ class CtaLineBar(object):
                     del self.lineBoll2Std[0]
 
                 # 1标准差
-                std = np.std(listClose, ddof=1)
                 self.lineBoll2Std.append(std)
 
-                m = np.mean(listClose)
                 self.lineMiddleBand2.append(m)                               # 中轨
                 self.lastBoll2Middle = m - m % self.minDiff                  # 中轨取整
 
@@ -1978,21 +1974,12 @@ class CtaLineBar(object):
         if self.inputKdjSmoothLen == EMPTY_INT:
             self.inputKdjSmoothLen = 3
 
-        inputKdjLen = min(self.inputKdjLen, len(self.lineBar))
-        # 数据是Tick模式，非bar内计算
-        if self.mode == self.TICK_MODE and not countInBar:
-            listClose =[x.close for x in self.lineBar[-self.inputKdjLen-1:-1]]
-            listHigh = [x.high for x in self.lineBar[-self.inputKdjLen - 1:-1]]
-            listLow = [x.low for x in self.lineBar[-self.inputKdjLen - 1:-1]]
-            idx = 2
-        else:
-            listClose =[x.close for x in self.lineBar[-self.inputKdjLen:]]
-            listHigh = [x.high for x in self.lineBar[-self.inputKdjLen :]]
-            listLow = [x.low for x in self.lineBar[-self.inputKdjLen :]]
-            idx = 1
+        # 数据是Tick模式，非bar内计算时，不包含当前未完成的bar
+        n, skip = self.__closeWindow(self.inputKdjLen, countInBar)
+        idx = skip + 1
 
-        hhv = max(listHigh)
-        llv = min(listLow)
+        hhv, llv = self.barArrays.highLow(n, skip)
+        lastClose = self.barArrays.last('close', skip)
 
         if len(self.lineK) > 0:
             lastK = self.lineK[-1]
@@ -2007,7 +1994,7 @@ class CtaLineBar(object):
         if hhv == llv:
             rsv = 50
         else:
-            rsv = (listClose[-1] - llv)/(hhv - llv) * 100
+            rsv = (lastClose - llv)/(hhv - llv) * 100
 
         self.lineKdjRSV.append(rsv)
 
@@ -2100,34 +2087,14 @@ class CtaLineBar(object):
         if self.inputKdjSmoothLen == EMPTY_INT:
             self.inputKdjSmoothLen = 3
 
-        if len(self.lineBar) < self.inputKdjTBLen + 1:
-            inputKdjTBLen = len(self.lineBar)
-            # 数据是Tick模式，非bar内计算
-            if self.mode == self.TICK_MODE and not countInBar:
-                listClose = [x.close for x in self.lineBar[0:-1]]
-                listHigh = [x.high for x in self.lineBar[0:-1]]
-                listLow = [x.low for x in self.lineBar[0:-1]]
-                idx = 2
-            else:
-                listClose = [x.close for x in self.lineBar]
-                listHigh = [x.high for x in self.lineBar]
-                listLow = [x.low for x in self.lineBar]
-                idx = 1
-        else:
-            # 数据是Tick模式，非bar内计算
-            if self.mode == self.TICK_MODE and not countInBar:
-                listClose = [x.close for x in self.lineBar[-self.inputKdjTBLen - 1:-1]]
-                listHigh = [x.high for x in self.lineBar[-self.inputKdjTBLen - 1:-1]]
-                listLow = [x.low for x in self.lineBar[-self.inputKdjTBLen - 1:-1]]
-                idx = 2
-            else:
-                listClose = [x.close for x in self.lineBar[-self.inputKdjTBLen:]]
-                listHigh = [x.high for x in self.lineBar[-self.inputKdjTBLen:]]
-                listLow = [x.low for x in self.lineBar[-self.inputKdjTBLen:]]
-                idx = 1
+        # 数据是Tick模式，非bar内计算时，不包含当前未完成的bar；数据不足时使用全部bar
+        n, skip = self.__closeWindow(self.inputKdjTBLen, countInBar)
+        if n <= 0:
+            return
+        idx = skip + 1
 
-        hhv = max(listHigh)
-        llv = min(listLow)
+        hhv, llv = self.barArrays.highLow(n, skip)
+        lastClose = self.barArrays.last('close', skip)
 
         if len(self.lineK) > 0:
             lastK = self.lineK[-1]
@@ -2142,7 +2109,7 @@ class CtaLineBar(object):
         if hhv == llv:
             rsv = 50
         else:
-            rsv = (listClose[-1] - llv) / (hhv - llv) * 100
+            rsv = (lastClose - llv) / (hhv - llv) * 100
 
         self.lineKdjRSV.append(rsv)
 
@@ -2230,12 +2197,12 @@ class CtaLineBar(object):
             return
 
         if self.mode == self.TICK_MODE:
-            listClose =[x.close for x in self.lineBar[-maxLen:-1]]
+            n, skip = maxLen - 1, 1
         else:
-            listClose =[x.close for x in self.lineBar[-maxLen-1:]]
+            n, skip = min(maxLen + 1, len(self.lineBar)), 0
 
-        dif, dea, macd = ta.MACD(np.array(listClose, dtype=float), fastperiod=self.inputMacdFastPeriodLen,
-                       slowperiod=self.inputMacdSlowPeriodLen, signalperiod=self.inputMacdSignalPeriodLen)
+        dif, dea, macd = self.barArrays.macd(self.inputMacdFastPeriodLen, self.inputMacdSlowPeriodLen,
+                                             self.inputMacdSignalPeriodLen, n, skip)
 
         #dif, dea, macd = ta.MACDEXT(np.array(listClose, dtype=float),
         #                            fastperiod=self.inputMacdFastPeriodLen, fastmatype=1,
@@ -2244,15 +2211,15 @@ class CtaLineBar(object):
 
         if len(self.lineDif) > maxLen:
             del self.lineDif[0]
-        self.lineDif.append(dif[-1])
+        self.lineDif.append(dif)
 
         if len(self.lineDea) > maxLen:
             del self.lineDea[0]
-        self.lineDea.append(dea[-1])
+        self.lineDea.append(dea)
 
         if len(self.lineMacd) > maxLen:
             del self.lineMacd[0]
-        self.lineMacd.append(macd[-1]*2)            # 国内一般是2倍
+        self.lineMacd.append(macd*2)            # 国内一般是2倍
 
     def __recountCci(self):
         """CCI计算
@@ -2848,7 +2815,7 @@ class CtaLineBar(object):
         if len(self.lineSkdRSI) < self.inputSkdLen2:
             return 0, 0
 
-        rsi_list = self.lineSkdRSI[1-self.inputSkdLen2:]
+        rsi_list = self.lineSkdRSI[1-self.inputSkdLen2:].tolist()
         rsi_list.append(last_rsi)
 
         rsi_HHV = max(rsi_list)
@@ -2863,12 +2830,12 @@ class CtaLineBar(object):
         if sto_len < 5:
             return self.lineSK[-1] if len(self.lineSK)>0 else 0,self.lineSD[-1] if len(self.lineSD) > 0 else 0
 
-        sto_list = self.lineSkdSTO[:]
+        sto_list = self.lineSkdSTO.tolist()
         sto_list.append(sto)
 
         sk = ta.EMA(np.array(sto_list, dtype=float), 5)[-1]
 
-        sk_list = self.lineSK[:]
+        sk_list = self.lineSK.tolist()
         sk_list.append(sk)
         if len(sk_list) < 5:
             return sk, self.lineSD[-1] if len(self.lineSD) > 0 else 0
@@ -3270,6 +3237,7 @@ class CtaMinuteBar(CtaLineBar):
         self.paramList.append('inputSarAfStep')
         self.paramList.append('inputSarAfLimit')
         self.paramList.append('is_7x24')
+        self.paramList.append('maxHistory')
 
         self.paramList.append('minDiff')
         self.paramList.append('shortSymbol')
@@ -3556,6 +3524,7 @@ class CtaHourBar(CtaLineBar):
         self.paramList.append('inputYbLen')
         self.paramList.append('inputYbRef')
         self.paramList.append('is_7x24')
+        self.paramList.append('maxHistory')
 
         self.paramList.append('minDiff')
         self.paramList.append('shortSymbol')
@@ -3841,6 +3810,7 @@ class CtaDayBar(CtaLineBar):
         self.paramList.append('inputYbLen')
         self.paramList.append('inputYbRef')
         self.paramList.append('is_7x24')
+        self.paramList.append('maxHistory')
 
         self.paramList.append('minDiff')
         self.paramList.append('shortSymbol')
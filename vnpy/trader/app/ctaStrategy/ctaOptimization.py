@@ -0,0 +1,419 @@
+# encoding: UTF-8
+
+"""
+回测参数优化的搜索算法
+
+搜索算法按批次给出需要回测的任务，回测引擎执行后把结果交回搜索算法：
+    taskList = search.ask()        # [(setting, windowRate)]，为空时搜索结束
+    search.tell(resultList)        # [(setting, windowRate, targetValue)]
+windowRate为回测区间占完整区间的比例（1.0为完整区间），逐步淘汰搜索用较短的区间初筛参数。
+targetValue越大越好，回测失败时为None。
+
+支持的搜索模式：
+    SEARCH_GRID         网格搜索，遍历全部参数组合
+    SEARCH_RANDOM       随机抽样
+    SEARCH_HALVING      逐步淘汰（successive halving），先在短区间上回测，逐轮保留较优的参数并延长区间
+    SEARCH_GENETIC      遗传算法
+    SEARCH_COORDINATE   坐标下降，每次只调整一个参数
+"""
+
+import math
+import random
+from itertools import product, islice
+
+SEARCH_GRID = 'grid'
+SEARCH_RANDOM = 'random'
+SEARCH_HALVING = 'halving'
+SEARCH_GENETIC = 'genetic'
+SEARCH_COORDINATE = 'coordinate'
+
+FULL_WINDOW = 1.0
+
+
+########################################################################
+class OptimizationSearch(object):
+    """参数搜索算法基类"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, paramDict, seed=None):
+        """Constructor"""
+        self.nameList = list(paramDict.keys())
+        self.valueList = [list(v) for v in paramDict.values()]
+        self.random = random.Random(seed)
+
+        self.resultDict = {}        # 参数下标元组: 完整区间的回测结果
+
+    #----------------------------------------------------------------------
+    def ask(self):
+        """返回下一批需要回测的任务[(setting, windowRate)]，为空表示搜索结束"""
+        raise NotImplementedError
+
+    #----------------------------------------------------------------------
+    def tell(self, resultList):
+        """接收一批回测结果[(setting, windowRate, targetValue)]"""
+        for setting, windowRate, targetValue in resultList:
+            if windowRate >= FULL_WINDOW:
+                self.resultDict[self.toIndex(setting)] = targetValue
+
+    #----------------------------------------------------------------------
+    def getTotalCount(self):
+        """预计的回测次数，无法预计时返回0"""
+        return 0
+
+    #----------------------------------------------------------------------
+    def getSpaceSize(self):
+        """参数组合的总数"""
+        size = 1
+        for values in self.valueList:
+            size *= len(values)
+        return size
+
+    #----------------------------------------------------------------------
+    def toSetting(self, index):
+        """参数下标元组转换为参数字典"""
+        return dict(zip(self.nameList, [values[i] for values, i in zip(self.valueList, index)]))
+
+    #----------------------------------------------------------------------
+    def toIndex(self, setting):
+        """参数字典转换为参数下标元组"""
+        return tuple(values.index(setting[name]) for name, values in zip(self.nameList, self.valueList))
+
+    #----------------------------------------------------------------------
+    def randomIndex(self):
+        """随机的参数下标元组"""
+        return tuple(self.random.randrange(len(values)) for values in self.valueList)
+
+    #----------------------------------------------------------------------
+    def sampleIndex(self, count, exclude=()):
+        """不重复地随机抽取count个参数下标元组，count不小于可选数量时返回全部"""
+        exclude = set(exclude)
+        available = self.getSpaceSize() - len(exclude)
+        if count >= available:
+            return [index for index in product(*[range(len(values)) for values in self.valueList])
+                    if index not in exclude]
+
+        indexList = []
+        while len(indexList) < count:
+            index = self.randomIndex()
+            if index not in exclude:
+                exclude.add(index)
+                indexList.append(index)
+        return indexList
+
+
+########################################################################
+class GridSearch(OptimizationSearch):
+    """网格搜索，遍历全部参数组合"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, paramDict, batchSize=1000, seed=None):
+        """
+        batchSize: 每批回测的数量，参数组合按批逐步生成，不一次性生成全部组合
+        """
+        super(GridSearch, self).__init__(paramDict, seed)
+        self.batchSize = batchSize
+        self.paramIter = product(*self.valueList)
+
+    #----------------------------------------------------------------------
+    def ask(self):
+        """给出下一批参数组合"""
+        return [(dict(zip(self.nameList, p)), FULL_WINDOW) for p in islice(self.paramIter, self.batchSize)]
+
+    #----------------------------------------------------------------------
+    def getTotalCount(self):
+        """预计的回测次数"""
+        return self.getSpaceSize()
+
+
+########################################################################
+class RandomSearch(OptimizationSearch):
+    """随机抽样搜索"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, paramDict, sampleCount=100, batchSize=32, seed=None):
+        """
+        sampleCount: 抽样数量，0为不限（直到遍历全部组合或用完预算）
+        batchSize: 每批回测的数量
+        """
+        super(RandomSearch, self).__init__(paramDict, seed)
+        self.sampleCount = min(sampleCount, self.getSpaceSize()) if sampleCount else self.getSpaceSize()
+        self.batchSize = batchSize
+        self.askedSet = set()
+
+    #----------------------------------------------------------------------
+    def ask(self):
+        """给出下一批未回测过的随机参数组合"""
+        count = min(self.batchSize, self.sampleCount - len(self.askedSet))
+        if count <= 0:
+            return []
+
+        indexList = self.sampleIndex(count, self.askedSet)
+        self.askedSet.update(indexList)
+        return [(self.toSetting(index), FULL_WINDOW) for index in indexList]
+
+    #----------------------------------------------------------------------
+    def getTotalCount(self):
+        """预计的回测次数"""
+        return self.sampleCount
+
+
+########################################################################
+class SuccessiveHalvingSearch(OptimizationSearch):
+    """
+    逐步淘汰搜索
+    第一轮在minWindow比例的短区间上回测候选参数，每轮保留前1/eta的参数，区间延长eta倍，
+    最后一轮在完整区间上回测剩余的参数。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, paramDict, sampleCount=0, minWindow=0.25, eta=3, seed=None):
+        """
+        sampleCount: 候选参数数量（随机抽取），0为全部参数组合
+        minWindow: 第一轮回测区间的比例
+        eta: 每轮淘汰的倍数
+        """
+        super(SuccessiveHalvingSearch, self).__init__(paramDict, seed)
+        if not 0 < minWindow <= FULL_WINDOW:
+            raise ValueError(u'minWindow必须在(0, 1]之间')
+        if eta < 2:
+            raise ValueError(u'eta必须不小于2')
+
+        self.eta = eta
+        self.candidateList = self.sampleIndex(sampleCount or self.getSpaceSize())
+
+        # 各轮的回测区间比例
+        rungCount = int(math.ceil(math.log(FULL_WINDOW / minWindow) / math.log(eta) - 1e-9)) + 1
+        self.windowList = [min(FULL_WINDOW, minWindow * eta ** i) for i in range(rungCount)]
+        self.windowList[-1] = FULL_WINDOW
+        self.rung = 0
+
+    #----------------------------------------------------------------------
+    def ask(self):
+        """给出当前一轮的全部候选参数"""
+        if self.rung >= len(self.windowList) or not self.candidateList:
+            return []
+
+        windowRate = self.windowList[self.rung]
+        return [(self.toSetting(index), windowRate) for index in self.candidateList]
+
+    #----------------------------------------------------------------------
+    def tell(self, resultList):
+        """保留本轮较优的参数，进入下一轮"""
+        super(SuccessiveHalvingSearch, self).tell(resultList)
+
+        scoreDict = {self.toIndex(setting): getScore(targetValue) for setting, windowRate, targetValue in resultList}
+        candidateList = sorted([index for index in self.candidateList if index in scoreDict],
+                               key=lambda index: scoreDict[index], reverse=True)
+
+        self.rung += 1
+        keepCount = int(math.ceil(len(candidateList) / float(self.eta)))
+        self.candidateList = candidateList[:keepCount]
+
+    #----------------------------------------------------------------------
+    def getTotalCount(self):
+        """预计的回测次数"""
+        count = 0
+        n = len(self.candidateList)
+        for i in range(self.rung, len(self.windowList)):
+            count += n
+            n = int(math.ceil(n / float(self.eta)))
+        return count
+
+
+########################################################################
+class GeneticSearch(OptimizationSearch):
+    """
+    遗传算法搜索
+    每一代保留最优的eliteCount个参数，其余由锦标赛选择的父代均匀交叉、变异产生，
+    变异为参数下标随机移动一格（或在取值列表中随机取值）。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, paramDict, populationSize=20, generations=10, mutationRate=0.2, eliteCount=2,
+                 tournamentSize=3, seed=None):
+        """Constructor"""
+        super(GeneticSearch, self).__init__(paramDict, seed)
+        self.populationSize = min(populationSize, self.getSpaceSize())
+        self.generations = generations
+        self.mutationRate = mutationRate
+        self.eliteCount = eliteCount
+        self.tournamentSize = tournamentSize
+
+        self.generation = 0
+        self.population = self.sampleIndex(self.populationSize)
+
+    #----------------------------------------------------------------------
+    def ask(self):
+        """给出当前一代中尚未回测过的个体"""
+        while self.generation < self.generations:
+            indexList = [index for index in self.population if index not in self.resultDict]
+            if indexList:
+                return [(self.toSetting(index), FULL_WINDOW) for index in indexList]
+
+            # 整代都已回测过（例如全部由已有个体组成），直接繁殖下一代
+            self.evolve()
+        return []
+
+    #----------------------------------------------------------------------
+    def tell(self, resultList):
+        """记录适应度，繁殖下一代"""
+        super(GeneticSearch, self).tell(resultList)
+        self.evolve()
+
+    #----------------------------------------------------------------------
+    def evolve(self):
+        """由当前一代产生下一代"""
+        self.generation += 1
+        ranked = sorted([index for index in set(self.population) if index in self.resultDict],
+                        key=lambda index: getScore(self.resultDict[index]), reverse=True)
+        if not ranked:
+            self.population = self.sampleIndex(self.populationSize)
+            return
+
+        population = ranked[:self.eliteCount]
+        for i in range(self.populationSize * 10):
+            if len(population) >= self.populationSize:
+                break
+            child = self.mutate(self.crossover(self.select(ranked), self.select(ranked)))
+            if child not in population:
+                population.append(child)
+        self.population = population
+
+    #----------------------------------------------------------------------
+    def select(self, ranked):
+        """锦标赛选择（ranked已按适应度降序排列）"""
+        return ranked[min(self.random.randrange(len(ranked)) for i in range(self.tournamentSize))]
+
+    #----------------------------------------------------------------------
+    def crossover(self, parent1, parent2):
+        """均匀交叉"""
+        return tuple(a if self.random.random() < 0.5 else b for a, b in zip(parent1, parent2))
+
+    #----------------------------------------------------------------------
+    def mutate(self, index):
+        """变异"""
+        index = list(index)
+        for i, values in enumerate(self.valueList):
+            if len(values) < 2 or self.random.random() >= self.mutationRate:
+                continue
+            if self.random.random() < 0.5:
+                index[i] = self.random.randrange(len(values))
+            else:
+                index[i] = min(max(index[i] + self.random.choice((-1, 1)), 0), len(values) - 1)
+        return tuple(index)
+
+    #----------------------------------------------------------------------
+    def getTotalCount(self):
+        """预计的回测次数"""
+        return min(self.populationSize * self.generations, self.getSpaceSize())
+
+
+########################################################################
+class CoordinateSearch(OptimizationSearch):
+    """
+    坐标下降搜索
+    从起始参数开始，每次只改变一个参数，回测该参数的全部取值，并移动到最优值；
+    依次轮换各个参数，一整轮没有改进时收敛，可从随机参数重新开始restarts次。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, paramDict, startSetting=None, maxCycles=10, restarts=0, seed=None):
+        """
+        startSetting: 起始参数字典，缺省为各参数取值列表的中间值
+        maxCycles: 每次搜索最多轮换的轮数
+        restarts: 收敛后从随机参数重新开始的次数
+        """
+        super(CoordinateSearch, self).__init__(paramDict, seed)
+        self.maxCycles = maxCycles
+        self.restarts = restarts
+
+        if startSetting:
+            self.current = self.toIndex(startSetting)
+        else:
+            self.current = tuple(len(values) // 2 for values in self.valueList)
+
+        self.dimension = 0          # 当前调整的参数
+        self.cycle = 0              # 当前轮数
+        self.improved = False       # 本轮是否有改进
+
+    #----------------------------------------------------------------------
+    def ask(self):
+        """给出当前参数的一条坐标线上尚未回测过的参数组合"""
+        while True:
+            if self.cycle >= self.maxCycles:
+                if not self.restart():
+                    return []
+                continue
+
+            indexList = self.getLine()
+            if indexList:
+                return [(self.toSetting(index), FULL_WINDOW) for index in indexList]
+
+            # 坐标线已全部回测，移动到最优值
+            self.move()
+
+    #----------------------------------------------------------------------
+    def getLine(self):
+        """当前参数坐标线上尚未回测过的参数组合"""
+        indexList = []
+        for i in range(len(self.valueList[self.dimension])):
+            index = self.current[:self.dimension] + (i,) + self.current[self.dimension + 1:]
+            if index not in self.resultDict:
+                indexList.append(index)
+        return indexList
+
+    #----------------------------------------------------------------------
+    def move(self):
+        """移动到当前坐标线上的最优值，并切换到下一个参数"""
+        best = self.current
+        for i in range(len(self.valueList[self.dimension])):
+            index = self.current[:self.dimension] + (i,) + self.current[self.dimension + 1:]
+            if index in self.resultDict and \
+                    getScore(self.resultDict[index]) > getScore(self.resultDict.get(best)):
+                best = index
+
+        if best != self.current:
+            self.current = best
+            self.improved = True
+
+        self.dimension += 1
+        if self.dimension >= len(self.valueList):
+            self.dimension = 0
+            self.cycle += 1
+            if not self.improved:
+                self.cycle = self.maxCycles
+            self.improved = False
+
+    #----------------------------------------------------------------------
+    def restart(self):
+        """从随机的未回测参数重新开始，没有重启次数或参数时返回False"""
+        if self.restarts <= 0:
+            return False
+
+        indexList = self.sampleIndex(1, self.resultDict.keys())
+        if not indexList:
+            return False
+
+        self.restarts -= 1
+        self.current = indexList[0]
+        self.dimension = 0
+        self.cycle = 0
+        self.improved = False
+        return True
+
+
+SEARCH_CLASS_DICT = {
+    SEARCH_GRID: GridSearch,
+    SEARCH_RANDOM: RandomSearch,
+    SEARCH_HALVING: SuccessiveHalvingSearch,
+    SEARCH_GENETIC: GeneticSearch,
+    SEARCH_COORDINATE: CoordinateSearch
+}
+
+
+#----------------------------------------------------------------------
+def getScore(targetValue):
+    """用于比较的回测结果，回测失败（None）视为最差"""
+    if targetValue is None:
+        return float('-inf')
+    return targetValue
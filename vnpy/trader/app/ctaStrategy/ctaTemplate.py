@@ -8,6 +8,7 @@ from datetime import datetime,timedelta
 import os,csv
 from .ctaBase import *
 from vnpy.trader.vtConstant import *
+from vnpy.trader.vtFunction import todayDate
 
 
 ########################################################################
@@ -239,6 +240,20 @@ class CtaTemplate(object):
         """读取bar数据"""
         return self.ctaEngine.loadBar(self.barDbName, self.vtSymbol, days)
 
+    #----------------------------------------------------------------------
+    def iterBar(self, days):
+        """按时间顺序逐根读取bar数据（生成器），数据从数据库分批读取，不一次性载入内存"""
+        startDate = todayDate() - timedelta(days)
+        for chunk in self.ctaEngine.iterBar(self.barDbName, self.vtSymbol, startDate):
+            for bar in chunk:
+                yield bar
+
+    #----------------------------------------------------------------------
+    def loadBarToLineBar(self, days, lineBarList, bar_is_completed=False, bar_freq=1):
+        """读取bar数据，直接推入lineBarList中各CtaLineBar的addBar，返回推入的bar数量"""
+        return self.ctaEngine.loadBarToLineBar(self.barDbName, self.vtSymbol, days, lineBarList,
+                                               bar_is_completed=bar_is_completed, bar_freq=bar_freq)
+
     def saveData(self):
         """保持bar数据"""
         pass
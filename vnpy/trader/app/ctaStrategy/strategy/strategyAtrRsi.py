@@ -99,8 +99,7 @@ class AtrRsiStrategy(CtaTemplate):
         self.rsiSell = 50 - self.rsiEntry
 
         # 载入历史数据，并采用回放计算的方式初始化策略数值
-        initData = self.loadBar(self.initDays)
-        for bar in initData:
+        for bar in self.iterBar(self.initDays):
             self.onBar(bar)
 
         self.putEvent()
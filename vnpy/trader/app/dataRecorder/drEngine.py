@@ -11,14 +11,34 @@ import os
 import copy
 from collections import OrderedDict
 from datetime import datetime, timedelta
-from queue import Queue
-from threading import Thread
 
 from vnpy.trader.vtEvent import *
 from vnpy.trader.vtGateway import VtSubscribeReq, VtLogData
-from vnpy.trader.vtFunction import todayDate,getJsonPath
+from vnpy.trader.vtFunction import todayDate,getJsonPath,getTempPath
+
+from vnpy.trader.app.ctaStrategy.ctaBarGenerator import CtaBarGenerator, parseInterval
 
 from .drBase import *
+from .drWriter import DrBulkWriter, DrFileWriter
+
+# 配置文件中可选的批量写入设置，对应DrBulkWriter的同名参数
+WRITER_SETTING_KEYS = ['bulkSize', 'flushInterval', 'maxBacklog', 'spillPath']
+
+# 记录方式（配置文件中的recordBackend）
+BACKEND_MONGO = 'mongo'         # 写入MongoDB
+BACKEND_FILE = 'file'           # 按自然日追加写入列式存储文件（columnStorePath），不需要数据库
+
+
+#----------------------------------------------------------------------
+def getBarDbName(interval):
+    """K线周期（如'1m'、'5m'、'1h'、'1d'）对应的数据库名"""
+    period, n = parseInterval(interval)
+    if interval.endswith('d'):
+        return DAILY_DB_NAME if n == 1 else 'VnTrader_{0}Day_Db'.format(n)
+    if interval.endswith('h'):
+        return 'VnTrader_{0}Hour_Db'.format(n)
+    return 'VnTrader_{0}Min_Db'.format(n)
+
 
 ########################################################################
 class DrEngine(object):
@@ -42,13 +62,14 @@ class DrEngine(object):
         # Tick对象字典
         self.tickDict = {}
         
-        # K线对象字典
+        # K线合成器字典，key为vtSymbol，value为CtaBarGenerator
         self.barDict = {}
+
+        # 需要合成的K线周期（配置文件中的barIntervals）
+        self.barIntervals = ['1m']
         
-        # 负责执行数据库插入的单独线程相关
-        self.active = False                     # 工作状态
-        self.queue = Queue()                    # 队列
-        self.thread = Thread(target=self.run)   # 线程
+        # 负责执行数据库批量插入的写入器（单独线程）
+        self.writer = None
 
         # 载入设置，订阅行情
         self.loadSetting()
@@ -63,6 +84,15 @@ class DrEngine(object):
             working = drSetting['working']
             if not working:
                 return
+
+            backend = drSetting.get('recordBackend', BACKEND_MONGO)
+            if backend == BACKEND_FILE:
+                columnStorePath = drSetting.get('columnStorePath') or getTempPath('drColumnStore')
+                self.writer = DrFileWriter(columnStorePath, TICK_DB_NAME, MINUTE_DB_NAME,
+                                           drSetting.get('flushInterval', 1.0))
+            else:
+                writerSetting = {key: drSetting[key] for key in WRITER_SETTING_KEYS if key in drSetting}
+                self.writer = DrBulkWriter(self.mainEngine, **writerSetting)
             
             if 'tick' in drSetting:
                 l = drSetting['tick']
@@ -91,6 +121,7 @@ class DrEngine(object):
                     
             if 'bar' in drSetting:
                 l = drSetting['bar']
+                self.barIntervals = drSetting.get('barIntervals', self.barIntervals)
                 
                 for setting in l:
                     symbol = setting[0]
@@ -109,8 +140,8 @@ class DrEngine(object):
                     
                     self.mainEngine.subscribe(req, setting[1])  
                     
-                    bar = DrBarData() 
-                    self.barDict[vtSymbol] = bar
+                    self.barDict[vtSymbol] = CtaBarGenerator(self.onBar, self.barIntervals,
+                                                             barClass=DrBarData)
                     
             if 'active' in drSetting:
                 d = drSetting['active']
@@ -145,81 +176,77 @@ class DrEngine(object):
             
             if vtSymbol in self.activeSymbolDict:
                 activeSymbol = self.activeSymbolDict[vtSymbol]
-                self.insertData(TICK_DB_NAME, activeSymbol, drTick)
+                self.insertData(TICK_DB_NAME, activeSymbol, drTick, True)
             
             # 发出日志
             self.writeDrLog(u'记录Tick数据%s，时间:%s, last:%s, bid:%s, ask:%s' 
                             %(drTick.vtSymbol, drTick.time, drTick.lastPrice, drTick.bidPrice1, drTick.askPrice1))
             
-        # 更新分钟线数据
+        # 更新K线数据
         if vtSymbol in self.barDict:
-            bar = self.barDict[vtSymbol]
-            
-            # 如果第一个TICK或者新的一分钟
-            if not bar.datetime or bar.datetime.minute != drTick.datetime.minute:    
-                if bar.vtSymbol:
-                    newBar = copy.copy(bar)
-                    self.insertData(MINUTE_DB_NAME, vtSymbol, newBar)
-                    
-                    if vtSymbol in self.activeSymbolDict:
-                        activeSymbol = self.activeSymbolDict[vtSymbol]
-                        self.insertData(MINUTE_DB_NAME, activeSymbol, newBar)                    
-                    
-                    self.writeDrLog(u'记录分钟线数据%s，时间:%s, O:%s, H:%s, L:%s, C:%s' 
-                                    %(bar.vtSymbol, bar.time, bar.open, bar.high, 
-                                      bar.low, bar.close))
-                         
-                bar.vtSymbol = drTick.vtSymbol
-                bar.symbol = drTick.symbol
-                bar.exchange = drTick.exchange
-                
-                bar.open = drTick.lastPrice
-                bar.high = drTick.lastPrice
-                bar.low = drTick.lastPrice
-                bar.close = drTick.lastPrice
-                
-                bar.date = drTick.date
-                bar.time = drTick.time
-                bar.datetime = drTick.datetime
-                bar.volume = drTick.volume
-                bar.openInterest = drTick.openInterest        
-            # 否则继续累加新的K线
-            else:                               
-                bar.high = max(bar.high, drTick.lastPrice)
-                bar.low = min(bar.low, drTick.lastPrice)
-                bar.close = drTick.lastPrice            
+            self.barDict[vtSymbol].updateTick(drTick)
+
+    #----------------------------------------------------------------------
+    def processTimerEvent(self, event):
+        """定时结束已过周期的K线，休市前的最后一根K线无需等待下一个tick"""
+        now = datetime.now()
+        for generator in self.barDict.values():
+            generator.updateTime(now)
+
+    #----------------------------------------------------------------------
+    def onBar(self, bar, interval):
+        """K线合成完成"""
+        vtSymbol = bar.vtSymbol
+        dbName = getBarDbName(interval)
+        self.insertData(dbName, vtSymbol, bar)
+
+        if vtSymbol in self.activeSymbolDict:
+            activeSymbol = self.activeSymbolDict[vtSymbol]
+            self.insertData(dbName, activeSymbol, bar, True)
+
+        self.writeDrLog(u'记录%sK线数据%s，时间:%s, O:%s, H:%s, L:%s, C:%s, V:%s'
+                        %(interval, vtSymbol, bar.time, bar.open, bar.high,
+                          bar.low, bar.close, bar.volume))
 
     #----------------------------------------------------------------------
     def registerEvent(self):
         """注册事件监听"""
         self.eventEngine.register(EVENT_TICK, self.procecssTickEvent)
+        self.eventEngine.register(EVENT_TIMER, self.processTimerEvent)
  
     #----------------------------------------------------------------------
-    def insertData(self, dbName, collectionName, data):
-        """插入数据到数据库（这里的data可以是CtaTickData或者CtaBarData）"""
-        self.queue.put((dbName, collectionName, data.__dict__))
+    def insertData(self, dbName, collectionName, data, copyData=False):
+        """
+        插入数据到数据库（这里的data可以是CtaTickData或者CtaBarData）
+        copyData: 同一数据写入多个集合时，除第一次外需要复制（写入时会添加_id字段）
+        """
+        d = data.__dict__
+        if copyData:
+            d = d.copy()
+            d.pop('_id', None)
+        self.writer.put(dbName, collectionName, d)
 
     #----------------------------------------------------------------------
-    def run(self):
-        """运行插入线程"""
-        while self.active:
-            try:
-                dbName, collectionName, d = self.queue.get(block=True, timeout=1)
-                self.mainEngine.dbInsert(dbName, collectionName, d)
-            except Empty:
-                pass
-    #----------------------------------------------------------------------
     def start(self):
         """启动"""
-        self.active = True
-        self.thread.start()
+        self.writer.start()
 
     #----------------------------------------------------------------------
     def stop(self):
         """退出"""
-        if self.active:
-            self.active = False
-            self.thread.join()
+        # 写入尚未结束的K线
+        for generator in self.barDict.values():
+            generator.closeAll()
+
+        if self.writer:
+            self.writer.stop()
+
+    #----------------------------------------------------------------------
+    def getWriterMetrics(self):
+        """写入统计，见DrBulkWriter.getMetrics"""
+        if self.writer:
+            return self.writer.getMetrics()
+        return {}
         
     #----------------------------------------------------------------------
     def writeDrLog(self, content):
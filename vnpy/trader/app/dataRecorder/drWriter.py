@@ -0,0 +1,443 @@
+# encoding: UTF-8
+
+'''
+行情记录的批量写入器
+
+数据先放入队列，由写入线程按(数据库, 集合)分组，数量达到bulkSize或距上次写入超过flushInterval秒时，
+使用insert_many批量写入MongoDB。
+
+数据库不可用时，未写入的数据保留在内存中（最多maxBacklog条），超出部分（最早的数据）写入spillPath目录下的文件，
+数据库恢复后先按顺序写入文件中的数据并删除文件，再写入内存中的数据。
+
+DrFileWriter不使用数据库，把数据按自然日追加写入CtaColumnStore的分区文件，
+分区名称与BacktestingEngine从列式存储读取数据时相同（kind为tick_数据库名/bar_数据库名，合约为集合名），
+回测时setColumnStore设为同一目录即可直接读取。
+'''
+
+import os
+import pickle
+import traceback
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from queue import Queue, Empty
+from threading import Thread, Lock
+from time import time
+
+from vnpy.trader.vtFunction import getTempPath
+from vnpy.trader.app.ctaStrategy.ctaColumnStore import CtaColumnStore, COLUMN_KIND_TICK, COLUMN_KIND_BAR, nextDay
+
+
+SPILL_FILE_PREFIX = 'drSpill_'
+SPILL_FILE_SUFFIX = '.pkl'
+
+
+########################################################################
+class DrBulkWriter(object):
+    """批量写入器"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, mainEngine, bulkSize=500, flushInterval=1.0, maxBacklog=100000, spillPath=''):
+        """
+        bulkSize: 队列中累计的数据条数达到该数量时写入
+        flushInterval: 距上次写入超过该秒数时写入
+        maxBacklog: 数据库不可用时内存中最多保留的数据条数
+        spillPath: 超出maxBacklog的数据写入的目录，为空时使用temp/drSpill
+        """
+        self.mainEngine = mainEngine
+        self.bulkSize = bulkSize
+        self.flushInterval = flushInterval
+        self.maxBacklog = maxBacklog
+        self.spillPath = spillPath
+
+        self.queue = Queue()            # (数据库, 集合, 数据字典, 放入时间)
+        self.bufferDict = OrderedDict() # (数据库, 集合): [(数据字典, 放入时间)]，等待写入
+        self.bufferCount = 0
+        self.backlog = deque()          # [(数据库, 集合, [(数据字典, 放入时间)])]，写入失败的数据
+        self.backlogCount = 0
+        self.lastFlushTime = time()
+
+        # 统计
+        self.metricsLock = Lock()
+        self.writtenCount = 0           # 已写入的数据条数
+        self.failedCount = 0            # 写入失败的次数
+        self.spilledCount = 0           # 当前在文件中的数据条数
+        self.lastLag = 0.0              # 最近一次写入的数据中，放入队列到写入完成的最长秒数
+        self.maxLag = 0.0               # 历史最长写入延迟秒数
+
+        self.active = False
+        self.thread = Thread(target=self.run)
+
+    #----------------------------------------------------------------------
+    def put(self, dbName, collectionName, d):
+        """放入一条待写入的数据"""
+        self.queue.put((dbName, collectionName, d, time()))
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动"""
+        self.active = True
+        self.spilledCount = sum(count for fileName, count in self.listSpillFiles())
+        self.thread.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止，写入剩余的数据，仍无法写入的数据保存到文件"""
+        if self.active:
+            self.active = False
+            self.thread.join()
+
+        self.drainQueue(0)
+        self.flush()
+        if self.backlog:
+            self.spill(list(self.backlog))
+            self.backlog.clear()
+            self.backlogCount = 0
+
+    #----------------------------------------------------------------------
+    def run(self):
+        """写入线程运行函数"""
+        while self.active:
+            timeout = max(self.lastFlushTime + self.flushInterval - time(), 0.01)
+            try:
+                dbName, collectionName, d, putTime = self.queue.get(block=True, timeout=timeout)
+                self.addBuffer(dbName, collectionName, d, putTime)
+                self.drainQueue()
+            except Empty:
+                pass
+
+            if self.bufferCount >= self.bulkSize or time() - self.lastFlushTime >= self.flushInterval:
+                self.flush()
+
+    #----------------------------------------------------------------------
+    def drainQueue(self, maxCount=None):
+        """把队列中已有的数据取出，放入待写入缓存，缓存达到maxCount条时停止（None为bulkSize，0为不限）"""
+        if maxCount is None:
+            maxCount = self.bulkSize
+        while not maxCount or self.bufferCount < maxCount:
+            try:
+                dbName, collectionName, d, putTime = self.queue.get_nowait()
+            except Empty:
+                return
+            self.addBuffer(dbName, collectionName, d, putTime)
+
+    #----------------------------------------------------------------------
+    def addBuffer(self, dbName, collectionName, d, putTime):
+        """放入待写入缓存"""
+        key = (dbName, collectionName)
+        if key not in self.bufferDict:
+            self.bufferDict[key] = []
+        self.bufferDict[key].append((d, putTime))
+        self.bufferCount += 1
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """写入缓存中的数据，之前写入失败的数据优先"""
+        self.lastFlushTime = time()
+
+        batchList = [(dbName, collectionName, docList)
+                     for (dbName, collectionName), docList in self.bufferDict.items()]
+        self.bufferDict = OrderedDict()
+        self.bufferCount = 0
+
+        # 先写入文件中的数据（最早的失败数据）
+        if self.spilledCount and not self.loadSpillFiles():
+            self.addBacklog(batchList)
+            return
+
+        # 再写入内存中的失败数据
+        while self.backlog:
+            dbName, collectionName, docList = self.backlog[0]
+            if not self.insertBatch(dbName, collectionName, docList):
+                self.addBacklog(batchList)
+                return
+            self.backlog.popleft()
+            self.backlogCount -= len(docList)
+
+        for i, (dbName, collectionName, docList) in enumerate(batchList):
+            if not self.insertBatch(dbName, collectionName, docList):
+                self.addBacklog(batchList[i:])
+                return
+
+    #----------------------------------------------------------------------
+    def insertBatch(self, dbName, collectionName, docList):
+        """写入一批数据，数据库不可用时返回False"""
+        if not docList:
+            return True
+
+        result = self.mainEngine.dbInsertMany(dbName, collectionName,
+                                              [d for d, putTime in docList], ordered=False)
+        if result is False:
+            with self.metricsLock:
+                self.failedCount += 1
+            return False
+
+        # 数据本身有问题时（result为None）不再重试，按已处理统计
+        lag = time() - min(putTime for d, putTime in docList)
+        with self.metricsLock:
+            self.writtenCount += len(docList)
+            self.lastLag = lag
+            self.maxLag = max(self.maxLag, lag)
+        return True
+
+    #----------------------------------------------------------------------
+    def addBacklog(self, batchList):
+        """保留写入失败的数据，超出maxBacklog的最早数据写入文件"""
+        for batch in batchList:
+            self.backlog.append(batch)
+            self.backlogCount += len(batch[2])
+
+        spillList = []
+        while self.backlogCount > self.maxBacklog and len(self.backlog) > 1:
+            batch = self.backlog.popleft()
+            self.backlogCount -= len(batch[2])
+            spillList.append(batch)
+
+        if spillList:
+            self.spill(spillList)
+
+    #----------------------------------------------------------------------
+    def getSpillPath(self):
+        """文件目录"""
+        path = self.spillPath or getTempPath('drSpill')
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        return path
+
+    #----------------------------------------------------------------------
+    def spill(self, batchList):
+        """把数据写入文件"""
+        count = sum(len(docList) for dbName, collectionName, docList in batchList)
+        fileName = '{0}{1}_{2}{3}'.format(SPILL_FILE_PREFIX, datetime.now().strftime('%Y%m%d_%H%M%S_%f'),
+                                          count, SPILL_FILE_SUFFIX)
+        filePath = os.path.join(self.getSpillPath(), fileName)
+        tmpPath = filePath + '.tmp'
+
+        with open(tmpPath, 'wb') as f:
+            pickle.dump(batchList, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpPath, filePath)
+
+        with self.metricsLock:
+            self.spilledCount += count
+
+    #----------------------------------------------------------------------
+    def listSpillFiles(self):
+        """按时间顺序列出文件，返回[(文件名, 数据条数)]"""
+        path = self.spillPath or getTempPath('drSpill')
+        if not os.path.isdir(path):
+            return []
+
+        fileList = []
+        for fileName in sorted(os.listdir(path)):
+            if fileName.startswith(SPILL_FILE_PREFIX) and fileName.endswith(SPILL_FILE_SUFFIX):
+                count = int(fileName[:-len(SPILL_FILE_SUFFIX)].rsplit('_', 1)[1])
+                fileList.append((fileName, count))
+        return fileList
+
+    #----------------------------------------------------------------------
+    def loadSpillFiles(self):
+        """按顺序写入文件中的数据，全部写入成功返回True"""
+        path = self.getSpillPath()
+        for fileName, count in self.listSpillFiles():
+            filePath = os.path.join(path, fileName)
+            with open(filePath, 'rb') as f:
+                batchList = pickle.load(f)
+
+            for i, (dbName, collectionName, docList) in enumerate(batchList):
+                if not self.insertBatch(dbName, collectionName, docList):
+                    # 剩余部分写回文件，文件名的时间部分不变，保持顺序
+                    if i > 0:
+                        remainList = batchList[i:]
+                        remainCount = sum(len(batch[2]) for batch in remainList)
+                        newPath = os.path.join(path, '{0}_{1}{2}'.format(fileName.rsplit('_', 1)[0],
+                                                                         remainCount, SPILL_FILE_SUFFIX))
+                        with open(newPath + '.tmp', 'wb') as f:
+                            pickle.dump(remainList, f, protocol=pickle.HIGHEST_PROTOCOL)
+                        os.replace(newPath + '.tmp', newPath)
+                        if newPath != filePath:
+                            os.remove(filePath)
+                        with self.metricsLock:
+                            self.spilledCount -= count - remainCount
+                    return False
+
+            os.remove(filePath)
+            with self.metricsLock:
+                self.spilledCount -= count
+
+        return True
+
+    #----------------------------------------------------------------------
+    def getMetrics(self):
+        """
+        写入统计
+        queued：队列和缓存中等待写入的条数
+        backlog：写入失败、保留在内存中的条数
+        spilled：写入失败、保存在文件中的条数
+        lag：最近一次写入的延迟秒数（放入队列到写入完成），maxLag：最长延迟秒数
+        """
+        with self.metricsLock:
+            return {'queued': self.queue.qsize() + self.bufferCount,
+                    'backlog': self.backlogCount,
+                    'spilled': self.spilledCount,
+                    'written': self.writtenCount,
+                    'failed': self.failedCount,
+                    'lag': self.lastLag,
+                    'maxLag': self.maxLag}
+
+
+########################################################################
+class DrFileWriter(object):
+    """
+    文件写入器，接口与DrBulkWriter相同
+    每个(数据库, 集合, 自然日)缓存的数据每flushInterval秒追加写入一次
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, columnStorePath, tickDbName, barDbName, flushInterval=1.0):
+        """
+        columnStorePath: 列式存储的根目录
+        tickDbName/barDbName: tick和分钟线的数据库名，用于确定分区的kind，其他数据库（其他周期的K线）均视为K线
+        """
+        self.columnStore = CtaColumnStore(columnStorePath)
+        self.kindDict = {tickDbName: u'{}_{}'.format(COLUMN_KIND_TICK, tickDbName),
+                         barDbName: u'{}_{}'.format(COLUMN_KIND_BAR, barDbName)}
+        self.flushInterval = flushInterval
+
+        self.queue = Queue()            # (数据库, 集合, 数据字典, 放入时间)
+        self.bufferDict = OrderedDict() # (kind, 集合, 自然日): [(数据字典, 放入时间)]
+
+        # 本次运行中各合约第一个和最近一个有数据的自然日，用于登记完整记录的区间
+        self.firstDayDict = {}          # (kind, 集合): 自然日
+        self.lastDayDict = {}           # (kind, 集合): 自然日
+
+        # 统计
+        self.metricsLock = Lock()
+        self.writtenCount = 0
+        self.failedCount = 0
+        self.lastLag = 0.0
+        self.maxLag = 0.0
+
+        self.active = False
+        self.thread = Thread(target=self.run)
+
+    #----------------------------------------------------------------------
+    def put(self, dbName, collectionName, d):
+        """放入一条待写入的数据"""
+        self.queue.put((dbName, collectionName, d, time()))
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动"""
+        self.active = True
+        self.thread.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止，写入剩余的数据"""
+        if self.active:
+            self.active = False
+            self.thread.join()
+
+        self.drainQueue()
+        self.flush()
+
+    #----------------------------------------------------------------------
+    def run(self):
+        """写入线程运行函数"""
+        lastFlushTime = time()
+        while self.active:
+            try:
+                dbName, collectionName, d, putTime = self.queue.get(block=True, timeout=self.flushInterval)
+                self.addBuffer(dbName, collectionName, d, putTime)
+            except Empty:
+                pass
+
+            if time() - lastFlushTime >= self.flushInterval:
+                lastFlushTime = time()
+                self.drainQueue()
+                self.flush()
+
+    #----------------------------------------------------------------------
+    def drainQueue(self):
+        """把队列中已有的数据全部取出，放入待写入缓存"""
+        while True:
+            try:
+                dbName, collectionName, d, putTime = self.queue.get_nowait()
+            except Empty:
+                return
+            self.addBuffer(dbName, collectionName, d, putTime)
+
+    #----------------------------------------------------------------------
+    def addBuffer(self, dbName, collectionName, d, putTime):
+        """按自然日放入待写入缓存，没有datetime的数据无法分区，忽略"""
+        dt = d.get('datetime')
+        if not isinstance(dt, datetime):
+            return
+
+        kind = self.kindDict.get(dbName) or u'{}_{}'.format(COLUMN_KIND_BAR, dbName)
+        key = (kind, collectionName, dt.strftime('%Y%m%d'))
+        if key not in self.bufferDict:
+            self.bufferDict[key] = []
+        self.bufferDict[key].append((d, putTime))
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """追加写入缓存中的数据"""
+        bufferDict = self.bufferDict
+        self.bufferDict = OrderedDict()
+
+        symbolSet = set()
+        for (kind, collectionName, day), docList in bufferDict.items():
+            try:
+                self.columnStore.appendRecords(kind, collectionName, day,
+                                               [d for d, putTime in docList], updateIndex=False)
+            except Exception:
+                traceback.print_exc()
+                with self.metricsLock:
+                    self.failedCount += 1
+                continue
+
+            symbolSet.add((kind, collectionName))
+            self.updateDay(kind, collectionName, day)
+
+            lag = time() - min(putTime for d, putTime in docList)
+            with self.metricsLock:
+                self.writtenCount += len(docList)
+                self.lastLag = lag
+                self.maxLag = max(self.maxLag, lag)
+
+        for kind, collectionName in symbolSet:
+            self.columnStore.saveIndex(kind, collectionName)
+
+    #----------------------------------------------------------------------
+    def updateDay(self, kind, collectionName, day):
+        """
+        出现新的自然日时，把之前已结束的自然日登记为完整区间（回测时按区间判断能否直接使用）
+        本次运行的第一个自然日可能是中途开始记录的，不登记
+        """
+        key = (kind, collectionName)
+        if key not in self.firstDayDict:
+            self.firstDayDict[key] = day
+            self.lastDayDict[key] = day
+            return
+
+        lastDay = self.lastDayDict[key]
+        if day <= lastDay:
+            return
+        self.lastDayDict[key] = day
+
+        startDay = lastDay if lastDay != self.firstDayDict[key] else nextDay(lastDay)
+        endDay = (datetime.strptime(day, '%Y%m%d') - timedelta(days=1)).strftime('%Y%m%d')
+        if startDay <= endDay:
+            self.columnStore.addRange(kind, collectionName, startDay, endDay)
+
+    #----------------------------------------------------------------------
+    def getMetrics(self):
+        """写入统计，字段与DrBulkWriter相同"""
+        with self.metricsLock:
+            return {'queued': self.queue.qsize() + sum([len(l) for l in list(self.bufferDict.values())]),
+                    'backlog': 0,
+                    'spilled': 0,
+                    'written': self.writtenCount,
+                    'failed': self.failedCount,
+                    'lag': self.lastLag,
+                    'maxLag': self.maxLag}
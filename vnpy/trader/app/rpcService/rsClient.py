@@ -3,6 +3,9 @@
 import copy
 
 from vnpy.rpc import RpcClient
+from vnpy.trader.vtEvent import EVENT_TICK
+from vnpy.trader.vtPublisher import subscribeEvents
+from vnpy.trader.vtTickBus import TickBusReader
 
 
 ########################################################################
@@ -51,21 +54,47 @@ class RsClient(RpcClient):
         super(RsClient, self).__init__(reqAddress, subAddress)
         
         self.eventEngine = None
+        self.tickBus = None             # 本机tick总线读取方，使用时行情不再从zmq推送接收
         
     #----------------------------------------------------------------------
     def callback(self, topic, data):
         """事件推送回调函数"""
+        if self.tickBus and data.type_.startswith(EVENT_TICK):
+            return                      # 行情由tick总线推送
         self.eventEngine.put(data)      # 直接放入事件引擎中
     
     #----------------------------------------------------------------------
-    def init(self, eventEngine):
-        """初始化"""
+    def init(self, eventEngine, eventTypeList=None, vtSymbolList=None, tickBusName=''):
+        """
+        初始化
+        eventTypeList: 需要的事件类型，为空时订阅全部推送；
+                       不为空时在服务端登记，服务端只推送这些事件（vtSymbolList为需要的合约）
+        tickBusName: 与服务端（RS_setting.json的tickBusName）在同一台机器时，从该名称的tick总线接收行情
+        """
         self.eventEngine = eventEngine  # 绑定事件引擎对象
         
         self.usePickle()                # 使用cPickle序列化
-        self.subscribeTopic('')         # 订阅全部主题推送
+        if not eventTypeList:
+            self.subscribeTopic('')     # 订阅全部主题推送
         self.start()                    # 启动
 
+        if tickBusName:
+            self.tickBus = TickBusReader(eventEngine, tickBusName, vtSymbolList)
+            self.tickBus.start()
+            if eventTypeList:
+                eventTypeList = [eventType for eventType in eventTypeList if not eventType.startswith(EVENT_TICK)]
+
+        if eventTypeList:
+            subscribeEvents(self, eventTypeList, vtSymbolList)
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止"""
+        super(RsClient, self).stop()
+        if self.tickBus:
+            self.tickBus.stop()
+            self.tickBus = None
+
 
 ########################################################################
 class MainEngineProxy(object):
@@ -80,10 +109,10 @@ class MainEngineProxy(object):
         self.client = None
         
     #----------------------------------------------------------------------
-    def init(self, reqAddress, subAddress):
+    def init(self, reqAddress, subAddress, eventTypeList=None, vtSymbolList=None, tickBusName=''):
         """初始化"""
         self.client = RsClient(reqAddress, subAddress)
-        self.client.init(self.eventEngine)
+        self.client.init(self.eventEngine, eventTypeList, vtSymbolList, tickBusName)
 
     #----------------------------------------------------------------------
     def __getattr__(self, name):
@@ -5,9 +5,15 @@ import json
 from vnpy.trader.vtConstant import EMPTY_STRING
 
 from vnpy.rpc import RpcServer
+from vnpy.trader.vtPublisher import EventPublisher
+from vnpy.trader.vtTickBus import TickBusWriter
 from vnpy.trader.vtFunction import getJsonPath
 
 
+# 配置文件中可选的推送设置，对应RpcServer的同名参数
+PUB_SETTING_KEYS = ['pubQueueSize', 'pubDropPolicy', 'pubHwm', 'pubFlushInterval', 'pubBatchSize']
+
+
 ########################################################################
 class RsEngine(object):
     """RPC服务引擎"""
@@ -24,6 +30,8 @@ class RsEngine(object):
         self.eventEngine = eventEngine
         
         self.server = None                  # RPC服务对象
+        self.publisher = None               # 事件推送对象
+        self.tickBus = None                 # 本机tick总线写入方（tickBusName不为空时创建）
         self.repAddress = EMPTY_STRING      # REP地址
         self.pubAddress = EMPTY_STRING      # PUB地址
         
@@ -41,10 +49,20 @@ class RsEngine(object):
             self.repAddress = d['repAddress']
             self.pubAddress = d['pubAddress']
             
-            self.server = RpcServer(self.repAddress, self.pubAddress)
+            pubSetting = {key: d[key] for key in PUB_SETTING_KEYS if key in d}
+            
+            self.server = RpcServer(self.repAddress, self.pubAddress, **pubSetting)
             self.server.usePickle()
             self.server.register(self.call)
+            # 客户端全部声明订阅（RsClient.init指定eventTypeList）时，设置legacy为false关闭原来的推送
+            self.publisher = EventPublisher(self.server, legacy=d.get('legacy', True))
             self.server.start()
+
+            # 同机的客户端可以通过共享内存的tick总线接收行情，不经过zmq推送
+            tickBusName = d.get('tickBusName', '')
+            if tickBusName:
+                self.tickBus = TickBusWriter(tickBusName)
+                self.tickBus.registerEvent(self.eventEngine)
             
     #----------------------------------------------------------------------
     def registerEvent(self):
@@ -83,11 +101,14 @@ class RsEngine(object):
     #----------------------------------------------------------------------
     def processEvent(self, event):
         """处理事件推送"""
-        self.server.publish('', event)
+        self.publisher.publishEvent(event, '')
     
     #----------------------------------------------------------------------
     def stop(self):
         """停止"""
         self.server.stop()
+        if self.tickBus:
+            self.tickBus.close()
+            self.tickBus = None
         
     
\ No newline at end of file
@@ -20,6 +20,7 @@ from vnpy.api.binance import BinanceSpotApi,BinanceAPIException,BinanceRequestEx
 from vnpy.trader.vtGateway import *
 from vnpy.trader.vtFunction import getJsonPath
 from vnpy.trader.vtFunction import systemSymbolToVnSymbol , VnSymbolToSystemSymbol
+from vnpy.trader.vtOrderBook import OrderBook, DIFF_BUFFERED, DIFF_STALE, DIFF_GAP
 from vnpy.trader.vtConstant import PRICETYPE_LIMITPRICE, DIRECTION_LONG, DIRECTION_NET,DIRECTION_SHORT, PRODUCT_SPOT, EXCHANGE_BINANCE, OFFSET_OPEN, OFFSET_CLOSE
 from vnpy.trader.vtConstant import STATUS_UNKNOWN, STATUS_REJECTED, STATUS_ALLTRADED, STATUS_CANCELLED, STATUS_PARTTRADED, STATUS_NOTTRADED
 '''
@@ -72,6 +73,8 @@ class BinanceGateway(VtGateway):
             self.interval = float(setting['interval'])
             self.log_message = setting['log_message'] if 'log_message' in setting else False
             self.api_spot.setAccount(self.accountID)
+            # 行情合并模式（latest/merge），缺省不合并
+            self.setTickConflation(setting.get('tick_conflation', None))
             # 若希望连接后自动订阅
             if 'auto_subscribe' in setting.keys():
                 self.auto_subscribe_symbol_pairs = set(setting['auto_subscribe'])
@@ -131,6 +134,11 @@ class BinanceGateway(VtGateway):
         """查询持仓"""
         pass
     
+    #----------------------------------------------------------------------
+    def getReqMetrics(self):
+        """REST请求调度统计（队列长度、各端点耗时）"""
+        return self.api_spot.getReqMetrics()
+
     #----------------------------------------------------------------------
     def close(self):
         """关闭"""
@@ -217,8 +225,7 @@ class BinanceApi(BinanceSpotApi):
 
         self.registerSymbolSets = set([])
 
-        self.tick_depth_array_dict = {}         # 用于计算 ticker 的 depth 的数据 
-        self.symbol_real_depth_dict = {}        # 用于保存所有的深度数据的 dict 
+        self.orderBookDict = {}                 # key:symbol_pair, value:OrderBook，本地订单簿
 
     #----------------------------------------------------------------------
     def list_orders(self):
@@ -552,64 +559,23 @@ print ex.status_code, ex.message , ex.code , ex.request , ex.uri , ex.kwargs
         if upper_symbol is None:
             return
         symbol_pair = systemSymbolToVnSymbol(upper_symbol)
-        first_update_id = msg["U"]
-        final_update_id = msg["u"]
-        bids = msg["b"]
-        asks = msg["a"]
         uu_time_stamp = msg["E"]
 
-        all_keys = self.symbol_real_depth_dict.keys()
-
-        # print "onDepth"
-        # 判断是否已经 读取过历史数据
-        if symbol_pair in all_keys:
-            # print "if symbol_pair in all_keys:"
-            info = self.symbol_real_depth_dict[symbol_pair]
-            depth_dict_bids = info["depth_dict_bids"]
-            depth_dict_asks = info["depth_dict_asks"]
-            last_event_id = info["last_event_id"]
-            if int(last_event_id) + 1 >= int(first_update_id) and int(last_event_id) < int(final_update_id):
-                for b_arr in bids:
-                    price , volume , tmp_arr = b_arr
-                    price = float(price)
-                    volume = float(volume)
-                    if volume > 0:
-                        depth_dict_bids[price] = volume
-                    else:
-                        if price in depth_dict_bids.keys():
-                            del depth_dict_bids[price]
-                for a_arr in asks:
-                    price , volume , tmp_arr = a_arr
-                    price = float(price)
-                    volume = float(volume)
-                    if volume > 0:
-                        depth_dict_asks[price] = volume
-                    else:
-                        if price in depth_dict_asks.keys():
-                            del depth_dict_asks[price]
-
-                self.symbol_real_depth_dict[symbol_pair]["last_event_id"] = str(final_update_id)
-            else:
-                if int(last_event_id) + 1 < int(first_update_id):
-                    # 说明信息已经不及时了
-                    del self.symbol_real_depth_dict[symbol_pair]
-                    self.tick_depth_array_dict[symbol_pair] = [msg]
-                    self.gateway.writeLog( "del update info %s's depth" % symbol_pair)
+        book = self.orderBookDict.get(symbol_pair)
+        if book is None:
+            book = OrderBook(symbol_pair)
+            self.orderBookDict[symbol_pair] = book
 
-                    self.dealMsgArrayInfo(symbol_pair)
-        else:
-            # print "else symbol_pair in all_keys:"
-            if symbol_pair not in self.tick_depth_array_dict:
-                self.tick_depth_array_dict[symbol_pair] = [msg]
-            else:
-                self.tick_depth_array_dict[symbol_pair].append( msg)
+        # 应用增量，尚无快照或漏收数据时，重新读取快照
+        result = book.applyDiff(msg["b"], msg["a"], int(msg["U"]), int(msg["u"]))
+        if result == DIFF_GAP:
+            self.gateway.writeLog("del update info %s's depth" % symbol_pair)
+        if result in (DIFF_BUFFERED, DIFF_GAP):
             self.dealMsgArrayInfo(symbol_pair)
-
-        # print "self.symbol_real_depth_dict"
-        # print self.symbol_real_depth_dict
-
-        depth_dict_bids = self.symbol_real_depth_dict[symbol_pair]["depth_dict_bids"]
-        depth_dict_asks = self.symbol_real_depth_dict[symbol_pair]["depth_dict_asks"]
+            if not book.ready:
+                return
+        elif result == DIFF_STALE:
+            return
 
         symbol = symbol_pair + "." + EXCHANGE_BINANCE
         if symbol not in self.tickDict:
@@ -623,27 +589,7 @@ print ex.status_code, ex.message , ex.code , ex.request , ex.uri , ex.kwargs
             tick = self.tickDict[symbol]
 
         try:
-            arr = sorted(depth_dict_bids.items(),  key=lambda x: x[0])
-            # print "tick1" , arr
-            arr_len = len(arr)
-            (tick.bidPrice1, tick.bidVolume1)  = arr[-1] if arr_len >=1 else (0,0)
-            (tick.bidPrice2, tick.bidVolume2)  = arr[-2] if arr_len >=2 else (0,0)
-            (tick.bidPrice3, tick.bidVolume3)  = arr[-3] if arr_len >=3 else (0,0)
-            (tick.bidPrice4, tick.bidVolume4)  = arr[-4] if arr_len >=4 else (0,0)
-            (tick.bidPrice5, tick.bidVolume5)  = arr[-5] if arr_len >=5 else (0,0)
-        except Exception as ex:
-            self.gateway.writeError(u'OnDepth Exception:{}'.format(str(ex)))
-            self.gateway.writeLog(u'OnDepth {}'.format(traceback.format_exc()))
-
-        try:
-            arr = sorted(depth_dict_asks.items(), key=lambda x: x[0])
-            # print "tick2", arr
-            arr_len = len(arr)
-            (tick.askPrice1, tick.askVolume1)  = arr[0] if arr_len >=1 else (0,0)
-            (tick.askPrice2, tick.askVolume2)  = arr[1] if arr_len >=2 else (0,0)
-            (tick.askPrice3, tick.askVolume3)  = arr[2] if arr_len >=3 else (0,0)
-            (tick.askPrice4, tick.askVolume4)  = arr[3] if arr_len >=4 else (0,0)
-            (tick.askPrice5, tick.askVolume5)  = arr[4] if arr_len >=5 else (0,0)
+            book.updateTick(tick)
         except Exception as ex:
             self.gateway.writeError(u'OnDepth Exception:{}'.format(str(ex)))
             self.gateway.writeLog(u'OnDepth {}'.format(traceback.format_exc()))
@@ -655,50 +601,21 @@ print ex.status_code, ex.message , ex.code , ex.request , ex.uri , ex.kwargs
         self.gateway.onTick(tick)
         #self.gateway.onTick(copy(tick))
 
-    # 处理msg数据
+    # 读取深度快照，重建本地订单簿
     def dealMsgArrayInfo(self, symbol_pair):
-        # print "in dealMsgArrayInfo"
-        data = self.getDepthSymbol(symbol_pair )
-        depth_dict_bids = {}
-        depth_dict_asks = {}
-        lastUpdateId = data["lastUpdateId"]
-        bids = data["bids"]
-        asks = data["asks"]
-        for b_arr in bids:
-            price , volume , tmp_arr = b_arr
-            price = float(price)
-            volume = float(volume)
-            depth_dict_bids[price] = volume
-        for a_arr in asks:
-            price , volume , tmp_arr = a_arr
-            price = float(price)
-            volume = float(volume)
-            depth_dict_asks[price] = volume
-
-        arr = self.tick_depth_array_dict.get(symbol_pair , [])
-        for msg in arr:
-            first_update_id = msg["U"]
-            final_update_id = msg["u"]
-            if int(final_update_id) > int(lastUpdateId) :
-                bids = msg["b"]
-                asks = msg["a"]
-                for b_arr in bids:
-                    price , volume , tmp_arr = b_arr
-                    price = float(price)
-                    volume = float(volume)
-                    if volume > 0:
-                        depth_dict_bids[price] = volume
-                for a_arr in asks:
-                    price , volume , tmp_arr = a_arr
-                    price = float(price)
-                    volume = float(volume)
-                    if volume > 0:
-                        depth_dict_asks[price] = volume
-
-                lastUpdateId = final_update_id
-        self.tick_depth_array_dict[symbol_pair] = []
-
-        self.symbol_real_depth_dict[symbol_pair] = {"last_event_id":str(lastUpdateId) ,  "depth_dict_bids":depth_dict_bids , "depth_dict_asks":depth_dict_asks}
+        book = self.orderBookDict[symbol_pair]
+        try:
+            data = self.getDepthSymbol(symbol_pair)
+        except Exception as ex:
+            self.gateway.writeError(u'读取{}深度快照异常:{}'.format(symbol_pair, str(ex)))
+            return
+
+        if not data or "lastUpdateId" not in data:
+            self.gateway.writeError(u'读取{}深度快照失败:{}'.format(symbol_pair, data))
+            return
+
+        if book.applySnapshot(data["bids"], data["asks"], int(data["lastUpdateId"])) == DIFF_GAP:
+            self.gateway.writeLog(u'{}深度快照早于缓存的增量，等待下一次快照'.format(symbol_pair))
 
 
     #----------------------------------------------------------------------
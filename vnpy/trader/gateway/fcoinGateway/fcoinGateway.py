@@ -132,6 +132,11 @@ class FcoinGateway(VtGateway):
         """查询持仓"""
         pass
     
+    # ----------------------------------------------------------------------
+    def getReqMetrics(self):
+        """REST请求调度统计（队列长度、各端点耗时）"""
+        return self.tradeApi.getReqMetrics()
+
     # ----------------------------------------------------------------------
     def close(self):
         """关闭"""
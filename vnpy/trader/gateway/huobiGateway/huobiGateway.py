@@ -140,6 +140,11 @@ class HuobiGateway(VtGateway):
         """查询持仓"""
         pass
 
+    #----------------------------------------------------------------------
+    def getReqMetrics(self):
+        """交易接口的请求统计（队列中的请求数、等待重试的请求数、重试次数、放弃重试的请求数）"""
+        return self.tradeApi.getReqMetrics()
+
     #----------------------------------------------------------------------
     def close(self):
         """关闭"""
@@ -516,6 +521,18 @@ class HuobiTradeApi(TradeApi):
         err.errorMsg = msg
         self.gateway.onError(err)
 
+    #----------------------------------------------------------------------
+    def onDeadLetter(self, req, msg):
+        """放弃重试的请求回调"""
+        path, params, func, callback, reqid, idempotent, attempt = req
+
+        if reqid in self.reqLocalDict:
+            # 委托请求失败，交易所可能已经收到，查询委托确认状态
+            self.gateway.writeError(u'委托请求失败，状态未知，查询委托确认：{0} {1}'.format(self.reqLocalDict[reqid], msg))
+            self.qryOrder()
+        else:
+            self.gateway.writeError(u'请求{0}次后放弃：{1} {2}'.format(attempt, path, msg))
+
     #----------------------------------------------------------------------
     def onGetSymbols(self, data, reqid):
         """查询代码回调"""
@@ -17,6 +17,7 @@ from threading import Thread
 from time import sleep
 import traceback
 import zlib         # 新增解压功能
+from concurrent.futures import ThreadPoolExecutor
 
 from vnpy.api.okex import WsSpotApi, WsFuturesApi, SPOT_SYMBOL_PAIRS, CONTRACT_SYMBOL, CONTRACT_TYPE, SPOT_CURRENCY
 from vnpy.api.okex.okexData import SPOT_TRADE_SIZE_DICT, SPOT_REST_ERROR_DICT, SPORT_WS_ERROR_DICT, FUTURES_ERROR_DICT
@@ -80,8 +81,6 @@ class OkexGateway(VtGateway):
 
         self.qryCount = 0                           # 查询触发倒计时
         self.qryTrigger = 2                         # 查询触发点
-        self.hbCount = 0                            # 心跳触发倒计时
-        self.hbTrigger = 30                         # 心跳触发点
 
         # gateway 配置文件
         self.fileName = self.gatewayName + '_connect.json'
@@ -112,6 +111,8 @@ class OkexGateway(VtGateway):
             spot_connect = setting['spot_connect']
             futures_connect = setting['futures_connect']
             self.log_message = setting.get('log_message', False)
+            # 行情合并模式（latest/merge），缺省不合并
+            self.setTickConflation(setting.get('tick_conflation', None))
 
             # 若限定使用的合约对
             if "symbol_pairs" in setting.keys():
@@ -327,30 +328,10 @@ class OkexGateway(VtGateway):
             if self.qryNextFunction == len(self.qryFunctionList):
                 self.qryNextFunction = 0
 
-    def heartbeat(self,event):
-        """
-        心跳
-        :return:
-        """
-        self.hbCount += 1
-
-        if self.hbCount < self.hbTrigger:
-            return
-
-        # 清空倒计时
-        self.hbCount = 0
-        # 发送心跳请求
-        if self.api_spot.active and self.spot_connected:
-            self.api_spot.sendHeartBeat()
-
-        if self.api_futures.active and self.futures_connected:
-            self.api_futures.sendHeartBeat()
-
     # ----------------------------------------------------------------------
     def startQuery(self):
         """启动连续查询"""
         self.eventEngine.register(EVENT_TIMER, self.query)
-        self.eventEngine.register(EVENT_TIMER, self.heartbeat)
 
     # ----------------------------------------------------------------------
     def setQryEnabled(self, qryEnabled):
@@ -539,19 +520,7 @@ class OkexSpotApi(WsSpotApi):
             return
 
         self.gateway.spot_connected = False
-        self.gateway.writeLog(u'Spot服务器连接断开')
-
-        # 重新连接
-        if self.active:
-            def reconnect():
-                while not self.gateway.spot_connected:
-                    self.gateway.writeLog(u'等待10秒后重新连接')
-                    sleep(10)
-                    if not self.gateway.spot_connected:
-                        self.reconnect()
-
-            t = Thread(target=reconnect)
-            t.start()
+        self.gateway.writeLog(u'Spot服务器连接断开，等待wsTransport重新连接')
 
     # ----------------------------------------------------------------------
     def subscribe(self, subscribeReq):
@@ -1555,6 +1524,11 @@ class OkexFuturesApi(WsFuturesApi):
         self.queryed_pos_symbols = set([])
         self._use_leverage = "10"           # 缺省使用的杠杆比率
 
+        # 持仓查询使用阻塞的REST请求，不能在websocket回调（共享的wsTransport事件循环）中执行，
+        # 交给单独的线程按顺序执行；同一合约的查询尚未执行时不重复提交
+        self.posQueryExecutor = None
+        self.pendingPosQuerys = set()
+
         self.bids_depth_dict = {}
         self.asks_depth_dict = {}
 
@@ -1676,20 +1650,6 @@ class OkexFuturesApi(WsFuturesApi):
             error.errorMsg = u'FutureApi Error:{}'.format(FUTURES_ERROR_DICT.get(error_code))
             self.gateway.onError(error)
 
-    # ----------------------------------------------------------------------
-    def reconnect(self):
-        """
-        重连
-        :return:
-        """
-        while not self.gateway.futures_connected:
-            self.writeLog(u'okex Api_contract 等待10秒后重新连接')
-            self.connect(self.apiKey, self.secretKey, self.trace)
-
-            sleep(10)
-            if not self.gateway.futures_connected:
-                self.reconnect()
-
     # ----------------------------------------------------------------------
     def onClose(self, ws):
         """接口断开"""
@@ -1698,13 +1658,7 @@ class OkexFuturesApi(WsFuturesApi):
             return
 
         self.gateway.futures_connected = False
-        self.writeLog(u'期货服务器连接断开')
-
-        # 重新连接
-        if self.active:
-            self.writeLog(u'重新连接期货服务器')
-            t = Thread(target=self.reconnect)
-            t.start()
+        self.writeLog(u'期货服务器连接断开，等待wsTransport重新连接')
 
     # ----------------------------------------------------------------------
     def dealSymbolFunc(self, symbol):
@@ -2508,7 +2462,8 @@ h_this_week_usd'}
                 # 如果该合约账号的净值大于0,则通过rest接口，逐一合约类型获取持仓
                 if account.balance > 0:
                     for contractType in CONTRACT_TYPE:
-                        self.query_future_position(symbol=symbol,contractType=contractType,leverage=self._use_leverage)
+                        self.submitPosQuery(self.query_future_position, symbol=symbol, contractType=contractType,
+                                            leverage=self._use_leverage)
             else:
                 # 说明是逐仓返回
                 t_contracts = s_inf.get('contracts',[])
@@ -2543,10 +2498,40 @@ h_this_week_usd'}
 
                     if account.balance > 0 or account.available > 0:
                         for contractType in CONTRACT_TYPE:
-                            self.query_future_position_4fix(symbol=symbol, contractType=contractType)
+                            self.submitPosQuery(self.query_future_position_4fix, symbol=symbol,
+                                                contractType=contractType)
 
                     self.gateway.onAccount(account)
 
+    def submitPosQuery(self, func, symbol, contractType, **kwargs):
+        """在持仓查询线程中执行func(symbol, contractType, ...)，同一查询尚未执行时忽略"""
+        key = (func.__name__, symbol, contractType)
+        if key in self.pendingPosQuerys:
+            return
+        self.pendingPosQuerys.add(key)
+
+        if self.posQueryExecutor is None:
+            self.posQueryExecutor = ThreadPoolExecutor(max_workers=1)
+
+        def run():
+            self.pendingPosQuerys.discard(key)
+            try:
+                func(symbol=symbol, contractType=contractType, **kwargs)
+            except Exception as ex:
+                self.writeLog(u'{}异常:{},{}'.format(func.__name__, str(ex), traceback.format_exc()))
+
+        self.posQueryExecutor.submit(run)
+
+    # ----------------------------------------------------------------------
+    def close(self):
+        """关闭接口，停止持仓查询线程"""
+        super(OkexFuturesApi, self).close()
+        if self.posQueryExecutor is not None:
+            self.posQueryExecutor.shutdown(wait=False)
+            self.posQueryExecutor = None
+        self.pendingPosQuerys.clear()
+
+    # ----------------------------------------------------------------------
     def query_future_position(self, symbol, contractType, leverage):
         """全仓模式下，查询持仓信息"""
         qry_symbol = '{}_usd'.format(symbol) + ':' + contractType
@@ -6,6 +6,7 @@ import requests
 import execjs
 from datetime import datetime, timedelta
 from vnpy.trader.app.ctaStrategy.ctaBase import CtaBarData, CtaTickData
+from vnpy.trader.vtHistoryCache import historyCache
 
 class UtilSinaClient(object):
     """
@@ -25,6 +26,13 @@ class UtilSinaClient(object):
         self.session = requests.session()
         self.session.keep_alive = False
 
+    def getContent(self, url, key=None):
+        """
+        下载url的内容，多个策略同时下载同一数据时只下载一次（见vtHistoryCache）
+        :param key: 缓存的键值，url中含有时间戳等变化部分时需指定，缺省为url
+        """
+        return historyCache.get(('sina', key or url), lambda: self.session.get(url).content)
+
     def getTicks(self, symbol, callback,start_dt=None):
         """
         从sina加载最新的分时数据（Min1)数据
@@ -37,7 +45,7 @@ class UtilSinaClient(object):
             url = u'http://stock2.finance.sina.com.cn/futures/api/json.php/InnerFuturesService.getInnerFutures5MLine?symbol={0}'.format(
                 symbol)
             self.strategy.writeCtaLog(u'从sina下载{0}Tick数据 {1}'.format(symbol, url))
-            responses = execjs.eval(self.session.get(url).content.decode('gbk').split('\n')[-1])
+            responses = execjs.eval(self.getContent(url).decode('gbk').split('\n')[-1])
 
             datevalue = datetime.now().strftime('%Y-%m-%d')
 
@@ -103,7 +111,7 @@ class UtilSinaClient(object):
             url = u'http://stock2.finance.sina.com.cn/futures/api/jsonp.php/var%20t1nf_{0}=/InnerFuturesNewService.getMinLine?symbol={0}'.format(symbol)
             self.strategy.writeCtaLog(u'从sina下载{0}Tick数据 {1}'.format(symbol, url))
 
-            response_data= self.session.get(url).content
+            response_data= self.getContent(url)
             response_data = response_data.decode('gbk').split('=')[-1]
             response_data = response_data.replace('(', '')
             response_data = response_data.replace(');', '')
@@ -176,7 +184,7 @@ class UtilSinaClient(object):
         try:
             url = u'http://stock2.finance.sina.com.cn/futures/api/json.php/InnerFuturesService.getInnerFutures{0}MinKLine?symbol={1}'.format(minute,symbol)
             self.strategy.writeCtaLog(u'从sina下载{0}的{1}分钟数据 {2}'.format(symbol,minute, url))
-            responses = execjs.eval(self.session.get(url).content.decode('gbk').split('\n')[-1])
+            responses = execjs.eval(self.getContent(url).decode('gbk').split('\n')[-1])
             dayVolume = 0
 
             for item in responses:
@@ -273,7 +281,7 @@ class UtilSinaClient(object):
             url=u'http://stock2.finance.sina.com.cn/futures/api/jsonp.php/var%20_{1}_{0}_{2}=/InnerFuturesNewService.getFewMinLine?symbol={1}&type={0}'.format(minute,symbol,timestamp)
             #url = u'http://stock2.finance.sina.com.cn/futures/api/json.php/InnerFuturesService.getInnerFutures{0}MinKLine?symbol={1}'.format(minute,symbol)
             self.strategy.writeCtaLog(u'从sina下载{0}的{1}分钟数据 {2}'.format(symbol,minute, url))
-            response_data = self.session.get(url).content
+            response_data = self.getContent(url, key=('getFewMinLine', symbol, minute))
             response_data = response_data.decode('gbk').split('=')[-1]
             response_data = response_data.replace('(', '')
             response_data = response_data.replace(');', '')
@@ -368,7 +376,7 @@ class UtilSinaClient(object):
         try:
             url = u'http://stock.finance.sina.com.cn/futures/api/json.php/InnerFuturesService.getInnerFuturesDailyKLine?symbol={0}'.format(symbol)
             self.strategy.writeCtaLog(u'从sina下载{0}的日K数据 {1}'.format(symbol, url))
-            responses = execjs.eval(self.session.get(url).content.decode('gbk'))
+            responses = execjs.eval(self.getContent(url).decode('gbk'))
             dayVolume = 0
 
             for item in responses:
@@ -6,6 +6,9 @@ import platform
 import sys
 
 from vnpy.rpc import RpcClient
+from vnpy.trader.vtEvent import EVENT_TICK
+from vnpy.trader.vtGlobal import globalSetting
+from vnpy.trader.vtTickBus import TickBusReader
 from vnpy.trader.app.ctaStrategy.ctaEngine import CtaEngine
 from vnpy.trader.app.dataRecorder.drEngine import DrEngine
 from vnpy.trader.app.riskManager.rmEngine import RmEngine
@@ -21,17 +24,38 @@ class VtClient(RpcClient):
     """vn.trader客户端"""
 
     #----------------------------------------------------------------------
-    def __init__(self, reqAddress, subAddress, eventEngine):
-        """Constructor"""
+    def __init__(self, reqAddress, subAddress, eventEngine, tickBusName=''):
+        """
+        Constructor
+        tickBusName: 与VtServer在同一台机器时，从该名称的tick总线（共享内存）接收行情，zmq推送的行情忽略
+        """
         super(VtClient, self).__init__(reqAddress, subAddress)
         
         self.eventEngine = eventEngine
         
         #self.usePickle()
+
+        self.tickBus = TickBusReader(eventEngine, tickBusName) if tickBusName else None
         
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动客户端"""
+        super(VtClient, self).start()
+        if self.tickBus:
+            self.tickBus.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止客户端"""
+        super(VtClient, self).stop()
+        if self.tickBus:
+            self.tickBus.stop()
+
     #----------------------------------------------------------------------
     def callback(self, topic, data):
         """subscribe 回调函数"""
+        if self.tickBus and data.type_.startswith(EVENT_TICK):
+            return      # 行情由tick总线推送
 
         self.eventEngine.put(data)
 
@@ -195,7 +219,7 @@ def main():
     # 创建客户端
     reqAddress = 'tcp://localhost:2114'
     subAddress = 'tcp://localhost:2116'
-    client = VtClient(reqAddress, subAddress, eventEngine)
+    client = VtClient(reqAddress, subAddress, eventEngine, globalSetting.get('tickBusName', ''))
 
     # 这里是订阅所有的publish event，也可以指定。
     client.subscribeTopic('')
@@ -208,8 +232,6 @@ def main():
     
     # 设置Qt的皮肤
     try:
-        from vnpy.trader.vtGlobal import globalSetting
-
         if globalSetting['darkStyle']:
             import qdarkstyle
             app.setStyleSheet(qdarkstyle.load_stylesheet(pyside=False))
@@ -0,0 +1,320 @@
+# encoding: UTF-8
+
+'''
+MainEngine的异步数据库服务
+
+写入（插入、更新、删除）放入队列后立即返回，由写入线程按顺序取出，
+连续的同一(数据库, 集合)的操作合并为一次bulk_write，数量达到batchSize或距上次写入超过flushInterval秒时写入。
+数据库不可用时，未写入的操作保留在内存中（最多maxBacklog条，超出时丢弃最早的操作），恢复后按顺序重试。
+服务未启动（未连接过数据库）或已停止时，写入操作直接丢弃并计入丢弃数量，不在内存中积压。
+写入的数据字典在放入队列时复制，调用方之后修改原对象不影响写入的内容。
+
+读取可以：
+    queryAsync：在线程池中执行查询，完成后调用回调函数，返回Future
+    queryChunks：生成器，按chunkSize条一批返回查询结果，不一次性读入全部数据
+两者均支持projection，只返回需要的字段。
+'''
+
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
+from threading import Thread, Lock
+from time import time, sleep
+
+from pymongo import ASCENDING, InsertOne, ReplaceOne, DeleteMany
+from pymongo.errors import ConnectionFailure, AutoReconnect, BulkWriteError
+
+# 写入操作类型
+DB_OP_INSERT = 'insert'
+DB_OP_UPDATE = 'update'
+DB_OP_DELETE = 'delete'
+
+
+########################################################################
+class DbService(object):
+    """异步数据库服务，使用MainEngine的dbClient"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, mainEngine, batchSize=500, flushInterval=0.2, maxBacklog=100000,
+                 queryWorkers=2, chunkSize=1000):
+        """
+        batchSize: 一次bulk_write最多包含的操作数
+        flushInterval: 距上次写入超过该秒数时写入
+        maxBacklog: 数据库不可用时内存中最多保留的操作数
+        queryWorkers: 异步查询的线程数
+        chunkSize: queryChunks每批返回的缺省条数
+        """
+        self.mainEngine = mainEngine
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.maxBacklog = maxBacklog
+        self.queryWorkers = queryWorkers
+        self.chunkSize = chunkSize
+
+        self.queue = Queue()            # (操作类型, 数据库, 集合, 数据字典, 过滤条件, upsert)
+        self.pending = deque()          # 已从队列取出、等待写入（或写入失败等待重试）的操作
+
+        self.executor = None            # 异步查询线程池，第一次查询时创建
+
+        # 统计
+        self.metricsLock = Lock()
+        self.writtenCount = 0           # 已写入的操作数
+        self.failedCount = 0            # 数据库不可用导致写入失败的次数
+        self.errorCount = 0             # 数据本身有问题、放弃写入的操作数
+        self.droppedCount = 0           # 超出maxBacklog或服务未运行被丢弃的操作数
+        self.dropWarned = False         # 服务未运行时是否已提示丢弃
+
+        self.active = False
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动写入线程"""
+        if not self.active:
+            self.active = True
+            self.dropWarned = False
+            self.thread.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止，写入剩余的操作"""
+        if self.active:
+            self.active = False
+            self.thread.join()
+
+        self.drainQueue()
+        while self.pending:
+            if not self.flush():
+                self.mainEngine.writeError(u'数据库不可用，{0}条写入操作未完成'.format(len(self.pending)))
+                break
+
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    #----------------------------------------------------------------------
+    def insert(self, dbName, collectionName, d):
+        """异步插入数据"""
+        self.put((DB_OP_INSERT, dbName, collectionName, dict(d), None, False))
+
+    #----------------------------------------------------------------------
+    def update(self, dbName, collectionName, d, flt, upsert=False):
+        """异步更新数据（替换匹配flt的第一条数据）"""
+        self.put((DB_OP_UPDATE, dbName, collectionName, dict(d), flt, upsert))
+
+    #----------------------------------------------------------------------
+    def delete(self, dbName, collectionName, flt):
+        """异步删除匹配flt的数据"""
+        self.put((DB_OP_DELETE, dbName, collectionName, None, flt, False))
+
+    #----------------------------------------------------------------------
+    def put(self, item):
+        """操作放入队列，服务未运行时丢弃"""
+        if self.active:
+            self.queue.put(item)
+            return
+
+        with self.metricsLock:
+            self.droppedCount += 1
+            warned = self.dropWarned
+            self.dropWarned = True
+        if not warned:
+            self.mainEngine.writeError(u'数据库服务未运行（未连接数据库），丢弃写入操作:{0}.{1}'.format(item[1], item[2]))
+
+    #----------------------------------------------------------------------
+    def run(self):
+        """写入线程运行函数"""
+        lastFlushTime = time()
+        while self.active:
+            timeout = max(lastFlushTime + self.flushInterval - time(), 0.01)
+            try:
+                self.pending.append(self.queue.get(block=True, timeout=timeout))
+                self.drainQueue()
+            except Empty:
+                pass
+
+            if not self.pending:
+                lastFlushTime = time()
+                continue
+
+            if len(self.pending) >= self.batchSize or time() - lastFlushTime >= self.flushInterval:
+                if not self.flush():
+                    # 数据库不可用，稍后重试
+                    sleep(1)
+                lastFlushTime = time()
+
+    #----------------------------------------------------------------------
+    def drainQueue(self):
+        """把队列中已有的操作全部取出，放入待写入列表"""
+        while True:
+            try:
+                self.pending.append(self.queue.get_nowait())
+            except Empty:
+                break
+
+        # 超出上限时丢弃最早的操作
+        dropped = 0
+        while len(self.pending) > self.maxBacklog:
+            self.pending.popleft()
+            dropped += 1
+        if dropped:
+            with self.metricsLock:
+                self.droppedCount += dropped
+            self.mainEngine.writeError(u'数据库写入积压超过{0}条，丢弃{1}条最早的操作'.format(self.maxBacklog, dropped))
+
+    #----------------------------------------------------------------------
+    def flush(self):
+        """按顺序写入待写入的操作，数据库不可用时返回False（剩余操作保留）"""
+        while self.pending:
+            # 取出连续的同一集合的操作，合并为一次bulk_write
+            op, dbName, collectionName = self.pending[0][:3]
+            requestList = []
+            for item in self.pending:
+                if item[1] != dbName or item[2] != collectionName or len(requestList) >= self.batchSize:
+                    break
+                requestList.append(self.toRequest(item))
+
+            if not self.bulkWrite(dbName, collectionName, requestList):
+                return False
+
+            for i in range(len(requestList)):
+                self.pending.popleft()
+
+        return True
+
+    #----------------------------------------------------------------------
+    def toRequest(self, item):
+        """写入操作转换为pymongo的请求"""
+        op, dbName, collectionName, d, flt, upsert = item
+        if op == DB_OP_INSERT:
+            return InsertOne(d)
+        elif op == DB_OP_UPDATE:
+            return ReplaceOne(flt, d, upsert=upsert)
+        return DeleteMany(flt)
+
+    #----------------------------------------------------------------------
+    def bulkWrite(self, dbName, collectionName, requestList):
+        """执行一次bulk_write，数据库不可用时返回False"""
+        dbClient = self.mainEngine.dbClient
+        if not dbClient:
+            with self.metricsLock:
+                self.failedCount += 1
+            if self.mainEngine.db_has_connected:
+                self.mainEngine.dbConnect()
+            return False
+
+        try:
+            dbClient[dbName][collectionName].bulk_write(requestList, ordered=True)
+            with self.metricsLock:
+                self.writtenCount += len(requestList)
+            return True
+
+        except BulkWriteError as ex:
+            # 数据本身有问题（如重复的_id），跳过出错的操作，写入其后的操作
+            index = ex.details['writeErrors'][0]['index']
+            self.mainEngine.writeError(u'数据库写入出错:{0}.{1} {2}'.format(dbName, collectionName,
+                                                                           ex.details['writeErrors'][0].get('errmsg')))
+            with self.metricsLock:
+                self.writtenCount += index
+                self.errorCount += 1
+            if index + 1 < len(requestList):
+                return self.bulkWrite(dbName, collectionName, requestList[index + 1:])
+            return True
+
+        except (ConnectionFailure, AutoReconnect) as ex:
+            self.mainEngine.writeError(u'数据库连接断开，稍后重试写入:{0}'.format(str(ex)))
+            with self.metricsLock:
+                self.failedCount += 1
+            return False
+
+        except Exception as ex:
+            self.mainEngine.writeError(u'数据库写入异常:{0}'.format(str(ex)))
+            self.mainEngine.writeError(traceback.format_exc())
+            with self.metricsLock:
+                self.errorCount += len(requestList)
+            return True
+
+    #----------------------------------------------------------------------
+    def getCursor(self, dbName, collectionName, flt, sortKey='', sortDirection=ASCENDING,
+                  projection=None, batchSize=0):
+        """查询游标，数据库不可用时返回None"""
+        dbClient = self.mainEngine.dbClient
+        if not dbClient:
+            if self.mainEngine.db_has_connected:
+                self.mainEngine.dbConnect()
+                dbClient = self.mainEngine.dbClient
+            if not dbClient:
+                return None
+
+        cursor = dbClient[dbName][collectionName].find(flt, projection)
+        if sortKey:
+            cursor = cursor.sort(sortKey, sortDirection)
+        if batchSize:
+            cursor = cursor.batch_size(batchSize)
+        return cursor
+
+    #----------------------------------------------------------------------
+    def query(self, dbName, collectionName, flt, sortKey='', sortDirection=ASCENDING, projection=None):
+        """同步查询，返回数据列表"""
+        cursor = self.getCursor(dbName, collectionName, flt, sortKey, sortDirection, projection)
+        if cursor is None:
+            return []
+        return list(cursor)
+
+    #----------------------------------------------------------------------
+    def queryAsync(self, dbName, collectionName, flt, callback=None, sortKey='', sortDirection=ASCENDING,
+                   projection=None):
+        """
+        在线程池中查询，返回Future，结果为数据列表
+        callback: 查询完成后调用callback(数据列表)（在查询线程中）
+        """
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.queryWorkers)
+
+        future = self.executor.submit(self.query, dbName, collectionName, flt, sortKey, sortDirection, projection)
+        if callback:
+            def onDone(f):
+                if f.exception() is not None:
+                    self.mainEngine.writeError(u'数据库异步查询异常:{0}'.format(str(f.exception())))
+                    return
+                callback(f.result())
+            future.add_done_callback(onDone)
+        return future
+
+    #----------------------------------------------------------------------
+    def queryChunks(self, dbName, collectionName, flt, sortKey='', sortDirection=ASCENDING, projection=None,
+                    chunkSize=0):
+        """生成器，按chunkSize条一批返回查询结果（数据列表）"""
+        chunkSize = chunkSize or self.chunkSize
+        cursor = self.getCursor(dbName, collectionName, flt, sortKey, sortDirection, projection, chunkSize)
+        if cursor is None:
+            return
+
+        try:
+            chunk = []
+            for d in cursor:
+                chunk.append(d)
+                if len(chunk) >= chunkSize:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        finally:
+            cursor.close()
+
+    #----------------------------------------------------------------------
+    def getMetrics(self):
+        """
+        写入统计
+        queued：等待写入的操作数（含写入失败等待重试的操作）
+        written：已写入的操作数，failed：数据库不可用导致写入失败的次数
+        error：数据有问题放弃写入的操作数，dropped：积压过多被丢弃的操作数
+        """
+        with self.metricsLock:
+            return {'queued': self.queue.qsize() + len(self.pending),
+                    'written': self.writtenCount,
+                    'failed': self.failedCount,
+                    'error': self.errorCount,
+                    'dropped': self.droppedCount}
@@ -17,6 +17,7 @@ from vnpy.trader.language import text
 #from vnpy.trader.app.dataRecorder.drEngine import DrEngine
 #from vnpy.trader.app.riskManager.rmEngine import RmEngine
 from vnpy.trader.vtFunction import loadMongoSetting, getTempPath
+from vnpy.trader.vtDbService import DbService
 from vnpy.trader.vtGateway import *
 from vnpy.trader.app import (ctaStrategy,cmaStrategy, riskManager)
 from vnpy.trader.setup_logger import setup_logger
@@ -54,6 +55,7 @@ class MainEngine(object):
         # MongoDB数据库相关
         self.dbClient = None    # MongoDB客户端对象
         self.db_has_connected = False
+        self.dbService = DbService(self)    # 异步写入、分批读取（dbInsertAsync/dbQueryAsync/dbQueryChunks等）
 
         # 接口实例
         self.gatewayDict = OrderedDict()
@@ -302,6 +304,9 @@ class MainEngine(object):
         if self.drEngine:
             self.drEngine.stop()
 
+        # 写入尚未完成的异步数据库操作
+        self.dbService.stop()
+
         # 保存数据引擎里的合约数据到硬盘
         self.dataEngine.saveContracts()
 
@@ -500,6 +505,7 @@ class MainEngine(object):
 
                 self.writeLog(text.DATABASE_CONNECTING_COMPLETED)
                 self.db_has_connected = True
+                self.dbService.start()
 
                 # 如果启动日志记录，则注册日志事件监听函数
                 #if logging:
@@ -544,7 +550,7 @@ class MainEngine(object):
         :param collectionName:
         :param data_list:
         :param ordered: 是否忽略insert error
-        :return:
+        :return: 写入成功返回True，数据库不可用返回False（可稍后重试），其他错误返回None
         """
         if not isinstance(data_list,list):
             self.writeLog(text.DATA_INSERT_FAILED)
@@ -554,36 +560,40 @@ class MainEngine(object):
                 db = self.dbClient[dbName]
                 collection = db[collectionName]
                 collection.insert_many(data_list, ordered = ordered)
+                return True
             else:
                 self.writeLog(text.DATA_INSERT_FAILED)
                 if self.db_has_connected:
                     self.writeLog(u'重新尝试连接数据库')
                     self.dbConnect()
+                return False
 
         except AutoReconnect as ex:
             self.writeError(u'数据库连接断开重连:{}'.format(str(ex)))
             time.sleep(1)
+            return False
         except ConnectionFailure:
             self.dbClient = None
             self.writeError(u'数据库连接断开')
             if self.db_has_connected:
                 self.writeLog(u'重新尝试连接数据库')
                 self.dbConnect()
+            return False
         except Exception as ex:
             self.writeError(u'dbInsertMany exception:{}'.format(str(ex)))
 
     # ----------------------------------------------------------------------
-    def dbQuery(self, dbName, collectionName, d, sortKey='', sortDirection=ASCENDING):
-        """从MongoDB中读取数据，d是查询要求，返回的是数据库查询的指针"""
+    def dbQuery(self, dbName, collectionName, d, sortKey='', sortDirection=ASCENDING, projection=None):
+        """从MongoDB中读取数据，d是查询要求，projection是需要返回的字段，返回的是数据列表"""
         try:
             if self.dbClient:
                 db = self.dbClient[dbName]
                 collection = db[collectionName]
 
                 if sortKey:
-                    cursor = collection.find(d).sort(sortKey, sortDirection)  # 对查询出来的数据进行排序
+                    cursor = collection.find(d, projection).sort(sortKey, sortDirection)  # 对查询出来的数据进行排序
                 else:
-                    cursor = collection.find(d)
+                    cursor = collection.find(d, projection)
 
                 if cursor:
                     return list(cursor)
@@ -609,17 +619,17 @@ class MainEngine(object):
 
         return []
 
-    def dbQueryBySort(self, dbName, collectionName, d, sortName, sortType, limitNum=0):
+    def dbQueryBySort(self, dbName, collectionName, d, sortName, sortType, limitNum=0, projection=None):
         """从MongoDB中读取数据，d是查询要求，sortName是排序的字段,sortType是排序类型
-          返回的是数据库查询的指针"""
+          projection是需要返回的字段，返回的是数据列表"""
         try:
             if self.dbClient:
                 db = self.dbClient[dbName]
                 collection = db[collectionName]
                 if limitNum > 0:
-                    cursor = collection.find(d).sort(sortName, sortType).limit(limitNum)
+                    cursor = collection.find(d, projection).sort(sortName, sortType).limit(limitNum)
                 else:
-                    cursor = collection.find(d).sort(sortName, sortType)
+                    cursor = collection.find(d, projection).sort(sortName, sortType)
                 if cursor:
                     return list(cursor)
                 else:
@@ -699,6 +709,42 @@ class MainEngine(object):
         except Exception as ex:
             self.writeError(u'dbDelete exception:{}'.format(str(ex)))
 
+    # ----------------------------------------------------------------------
+    def dbInsertAsync(self, dbName, collectionName, d):
+        """异步插入数据，立即返回，由DbService的写入线程批量写入"""
+        self.dbService.insert(dbName, collectionName, d)
+
+    def dbUpdateAsync(self, dbName, collectionName, d, flt, upsert=False):
+        """异步更新数据，参数同dbUpdate"""
+        self.dbService.update(dbName, collectionName, d, flt, upsert)
+
+    def dbDeleteAsync(self, dbName, collectionName, flt):
+        """异步删除数据，参数同dbDelete"""
+        self.dbService.delete(dbName, collectionName, flt)
+
+    def dbQueryAsync(self, dbName, collectionName, d, callback=None, sortKey='', sortDirection=ASCENDING,
+                     projection=None):
+        """
+        在DbService的线程池中查询，返回Future（结果为数据列表），不阻塞调用线程
+        callback: 查询完成后在查询线程中调用callback(数据列表)
+        """
+        return self.dbService.queryAsync(dbName, collectionName, d, callback, sortKey, sortDirection, projection)
+
+    def dbQueryChunks(self, dbName, collectionName, d, sortKey='', sortDirection=ASCENDING, projection=None,
+                      chunkSize=0):
+        """生成器，按chunkSize条一批返回查询结果，不一次性读入全部数据"""
+        try:
+            for chunk in self.dbService.queryChunks(dbName, collectionName, d, sortKey, sortDirection,
+                                                    projection, chunkSize):
+                yield chunk
+        except AutoReconnect as ex:
+            self.writeError(u'数据库连接断开重连:{}'.format(str(ex)))
+        except ConnectionFailure:
+            self.dbClient = None
+            self.writeError(u'数据库连接断开')
+        except Exception as ex:
+            self.writeError(u'dbQueryChunks exception:{}'.format(str(ex)))
+
     #----------------------------------------------------------------------
     def dbLogging(self, event):
         """向MongoDB中插入日志"""
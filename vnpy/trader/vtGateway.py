@@ -2,6 +2,8 @@
 
 import time,os,sys
 from datetime import datetime
+from copy import copy
+from threading import Lock
 
 from vnpy.trader.vtEvent import *
 from vnpy.trader.vtConstant import *
@@ -21,11 +23,34 @@ class VtGateway(object):
         self.gatewayName = gatewayName
         self.logger = None
         self.accountID = 'AccountID'
+        self.tickConflater = None   # 行情合并器，为None时不合并
         self.createLogger()
 
+    # ----------------------------------------------------------------------
+    def setTickConflation(self, mode):
+        """
+        设置行情合并模式
+        mode: None/'' 不合并；CONFLATION_LATEST 只保留最新tick；CONFLATION_MERGE 保留最新tick并累加被跳过tick的lastVolume
+        """
+        if self.tickConflater:
+            self.tickConflater.close()
+            self.tickConflater = None
+
+        if mode:
+            self.tickConflater = TickConflater(self.eventEngine, self.putTickEvent, mode)
+            self.writeLog(u'{}启用行情合并模式:{}'.format(self.gatewayName, mode))
+
     # ----------------------------------------------------------------------
     def onTick(self, tick):
         """市场行情推送"""
+        if self.tickConflater:
+            self.tickConflater.onTick(tick)
+        else:
+            self.putTickEvent(tick)
+
+    # ----------------------------------------------------------------------
+    def putTickEvent(self, tick):
+        """推送行情事件"""
         # 通用事件
         event1 = Event(type_=EVENT_TICK)
         event1.dict_['data'] = tick
@@ -180,6 +205,11 @@ class VtGateway(object):
         """查询状态"""
         return True
 
+    # ----------------------------------------------------------------------
+    def getReqMetrics(self):
+        """请求统计（队列中的请求数、重试次数等），不支持的接口返回空字典"""
+        return {}
+
     # ----------------------------------------------------------------------
     def close(self):
         """关闭"""
@@ -212,3 +242,93 @@ class VtGateway(object):
         if self.logger:
             self.logger.error(content)
 
+
+
+CONFLATION_LATEST = 'latest'    # 只保留最新的未处理tick
+CONFLATION_MERGE = 'merge'      # 保留最新的未处理tick，并累加被跳过tick的成交量
+
+
+########################################################################
+class TickConflater(object):
+    """
+    行情合并器
+    每个vtSymbol在事件队列中最多只有一个未处理的tick，
+    在其被事件引擎处理前到达的新tick会替换掉等待中的tick，并计入跳过数量。
+    事件引擎处理完该tick的EVENT_TICK事件后，才推送等待中的最新tick。
+    """
+
+    # ----------------------------------------------------------------------
+    def __init__(self, eventEngine, putFunc, mode=CONFLATION_LATEST):
+        """Constructor"""
+        if mode not in (CONFLATION_LATEST, CONFLATION_MERGE):
+            raise ValueError(u'不支持的行情合并模式:{}'.format(mode))
+
+        self.eventEngine = eventEngine
+        self.putFunc = putFunc          # 实际推送行情事件的函数
+        self.mode = mode
+
+        self.lock = Lock()
+        self.inflightDict = {}          # vtSymbol: 已推送、尚未被处理的tick
+        self.pendingDict = {}           # vtSymbol: 等待推送的最新tick
+        self.droppedDict = {}           # vtSymbol: 被跳过的tick数量
+
+        self.eventEngine.register(EVENT_TICK, self.processTickEvent)
+
+    # ----------------------------------------------------------------------
+    def onTick(self, tick):
+        """接收网关行情"""
+        # 部分网关会复用同一个tick对象，这里保存快照
+        tick = copy(tick)
+        vtSymbol = tick.vtSymbol
+
+        with self.lock:
+            if vtSymbol not in self.inflightDict:
+                self.inflightDict[vtSymbol] = tick
+                self.putFunc(tick)
+                return
+
+            pending = self.pendingDict.get(vtSymbol)
+            if pending is not None:
+                self.droppedDict[vtSymbol] = self.droppedDict.get(vtSymbol, 0) + 1
+                if self.mode == CONFLATION_MERGE:
+                    tick.lastVolume += pending.lastVolume
+            self.pendingDict[vtSymbol] = tick
+
+    # ----------------------------------------------------------------------
+    def processTickEvent(self, event):
+        """事件引擎处理完一个tick事件后，推送等待中的最新tick"""
+        tick = event.dict_['data']
+        vtSymbol = tick.vtSymbol
+
+        with self.lock:
+            # 只处理本合并器推送的tick
+            if self.inflightDict.get(vtSymbol) is not tick:
+                return
+
+            pending = self.pendingDict.pop(vtSymbol, None)
+            if pending is None:
+                del self.inflightDict[vtSymbol]
+                return
+
+            self.inflightDict[vtSymbol] = pending
+            self.putFunc(pending)
+
+    # ----------------------------------------------------------------------
+    def getDroppedCount(self, vtSymbol=None):
+        """获取被跳过的tick数量，不指定vtSymbol时返回全部合约的字典"""
+        if vtSymbol:
+            return self.droppedDict.get(vtSymbol, 0)
+        return dict(self.droppedDict)
+
+    # ----------------------------------------------------------------------
+    def close(self):
+        """停止合并，推送所有等待中的tick"""
+        self.eventEngine.unregister(EVENT_TICK, self.processTickEvent)
+
+        with self.lock:
+            pendingList = list(self.pendingDict.values())
+            self.pendingDict.clear()
+            self.inflightDict.clear()
+
+        for tick in pendingList:
+            self.putFunc(tick)
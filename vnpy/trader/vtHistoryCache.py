@@ -0,0 +1,85 @@
+# encoding: UTF-8
+
+"""
+历史数据下载的共享缓存
+
+多个策略初始化时（尤其是并行初始化时）经常下载同一合约、同一周期的历史数据，
+各数据客户端（BinanceData、OkexData、UtilSinaClient）通过historyCache.get下载：
+相同键值的请求只下载一次，其余请求等待并共享同一结果，结果在ttl秒内有效。
+返回的数据被多个调用者共享，调用者不能修改。
+"""
+
+from concurrent.futures import Future
+from threading import Lock
+from time import time
+
+
+########################################################################
+class HistoryCache(object):
+    """按键值去重的下载缓存"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, ttl=60):
+        """ttl: 下载结果的有效秒数"""
+        self.ttl = ttl
+
+        self.lock = Lock()
+        self.cacheDict = {}         # 键值: (Future, 下载完成时间)
+
+        self.loadCount = 0          # 实际下载次数
+        self.hitCount = 0           # 共享已有结果（或等待中的下载）的次数
+
+    #----------------------------------------------------------------------
+    def get(self, key, loadFunc, ttl=None):
+        """
+        返回键值对应的数据，没有有效的缓存时调用loadFunc()下载
+        同一键值正在下载时，等待下载完成；下载异常时不缓存，异常抛给本次的全部调用者
+        """
+        if ttl is None:
+            ttl = self.ttl
+
+        with self.lock:
+            item = self.cacheDict.get(key)
+            if item and (not item[0].done() or time() - item[1] < ttl):
+                future = item[0]
+                isLoader = False
+                self.hitCount += 1
+            else:
+                future = Future()
+                self.cacheDict[key] = (future, time())
+                isLoader = True
+                self.loadCount += 1
+
+        if isLoader:
+            try:
+                result = loadFunc()
+            except Exception as ex:
+                with self.lock:
+                    if self.cacheDict.get(key, (None,))[0] is future:
+                        del self.cacheDict[key]
+                future.set_exception(ex)
+                raise
+
+            with self.lock:
+                self.cacheDict[key] = (future, time())
+            future.set_result(result)
+
+        return future.result()
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空缓存"""
+        with self.lock:
+            self.cacheDict.clear()
+
+    #----------------------------------------------------------------------
+    def getMetrics(self):
+        """缓存统计"""
+        with self.lock:
+            return {'size': len(self.cacheDict),
+                    'loadCount': self.loadCount,
+                    'hitCount': self.hitCount}
+
+
+# 全局共享的缓存
+historyCache = HistoryCache()
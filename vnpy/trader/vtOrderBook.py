@@ -0,0 +1,134 @@
+# encoding: UTF-8
+
+"""
+本地订单簿
+
+保存一个合约的全部买卖档位（SortedDict，按价格排序），供各websocket接口共享：
+    applySnapshot：用全量深度（REST快照或全量推送）重建订单簿
+    applyDiff：应用增量推送，插入/删除一档为O(log n)，并按更新编号检查是否漏收数据
+    getBids/getAsks/updateTick：读取前N档为O(N)，无需对整个订单簿排序
+
+增量编号规则（与币安相同）：每个增量带有起始编号firstId和结束编号finalId，
+finalId不大于当前编号的增量已过期，丢弃；firstId大于当前编号+1说明中间有漏收，需要重新获取快照。
+收到快照之前的增量先缓存，快照到达后按编号补上。
+"""
+
+from itertools import islice
+from operator import neg
+
+from sortedcontainers import SortedDict
+
+# applyDiff的返回值
+DIFF_APPLIED = 'applied'        # 已应用
+DIFF_STALE = 'stale'            # 已过期，丢弃
+DIFF_BUFFERED = 'buffered'      # 尚无快照，已缓存
+DIFF_GAP = 'gap'                # 漏收数据，订单簿已清空，需重新获取快照
+
+# tick中各档位的字段名
+BID_FIELDS = [('bidPrice%d' % i, 'bidVolume%d' % i) for i in range(1, 6)]
+ASK_FIELDS = [('askPrice%d' % i, 'askVolume%d' % i) for i in range(1, 6)]
+
+
+########################################################################
+class OrderBook(object):
+    """单个合约的本地订单簿"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, symbol='', maxBuffer=1000):
+        """
+        symbol: 合约代码（仅用于显示）
+        maxBuffer: 快照到达前最多缓存的增量数
+        """
+        self.symbol = symbol
+        self.maxBuffer = maxBuffer
+
+        self.bids = SortedDict(neg)     # 价格: 数量，价格从高到低
+        self.asks = SortedDict()        # 价格: 数量，价格从低到高
+
+        self.lastUpdateId = None        # 当前的更新编号，None为尚无快照
+        self.bufferList = []            # 快照到达前收到的增量 [(bids, asks, firstId, finalId)]
+
+    #----------------------------------------------------------------------
+    @property
+    def ready(self):
+        """是否已有快照"""
+        return self.lastUpdateId is not None
+
+    #----------------------------------------------------------------------
+    def reset(self):
+        """清空订单簿，等待新的快照"""
+        self.bids.clear()
+        self.asks.clear()
+        self.lastUpdateId = None
+
+    #----------------------------------------------------------------------
+    def applySnapshot(self, bids, asks, lastUpdateId=0):
+        """
+        用全量深度重建订单簿，并补上缓存中编号在快照之后的增量
+        bids/asks: [[价格, 数量, ...], ...]，价格、数量可以是字符串
+        返回补上增量后的状态，DIFF_GAP说明快照早于缓存的增量，需要重新获取快照
+        """
+        self.reset()
+        self.updateLevels(self.bids, bids)
+        self.updateLevels(self.asks, asks)
+        self.lastUpdateId = lastUpdateId
+
+        bufferList = self.bufferList
+        self.bufferList = []
+        for diff in bufferList:
+            if self.applyDiff(*diff) == DIFF_GAP:
+                return DIFF_GAP
+        return DIFF_APPLIED
+
+    #----------------------------------------------------------------------
+    def applyDiff(self, bids, asks, firstId, finalId):
+        """应用一个增量，返回DIFF_APPLIED/DIFF_STALE/DIFF_BUFFERED/DIFF_GAP"""
+        if self.lastUpdateId is None:
+            self.bufferList.append((bids, asks, firstId, finalId))
+            if len(self.bufferList) > self.maxBuffer:
+                del self.bufferList[0]
+            return DIFF_BUFFERED
+
+        if finalId <= self.lastUpdateId:
+            return DIFF_STALE
+
+        if firstId > self.lastUpdateId + 1:
+            # 漏收数据，当前增量留待新的快照后补上
+            self.reset()
+            self.bufferList = [(bids, asks, firstId, finalId)]
+            return DIFF_GAP
+
+        self.updateLevels(self.bids, bids)
+        self.updateLevels(self.asks, asks)
+        self.lastUpdateId = finalId
+        return DIFF_APPLIED
+
+    #----------------------------------------------------------------------
+    def updateLevels(self, book, levels):
+        """更新档位，数量为0的档位删除"""
+        for level in levels:
+            price = float(level[0])
+            volume = float(level[1])
+            if volume > 0:
+                book[price] = volume
+            else:
+                book.pop(price, None)
+
+    #----------------------------------------------------------------------
+    def getBids(self, n=5):
+        """前n档买盘 [(价格, 数量)]，价格从高到低"""
+        return list(islice(self.bids.items(), n))
+
+    #----------------------------------------------------------------------
+    def getAsks(self, n=5):
+        """前n档卖盘 [(价格, 数量)]，价格从低到高"""
+        return list(islice(self.asks.items(), n))
+
+    #----------------------------------------------------------------------
+    def updateTick(self, tick):
+        """把前5档买卖盘写入tick，不足5档的部分为0"""
+        d = tick.__dict__
+        for fields, book in ((BID_FIELDS, self.bids), (ASK_FIELDS, self.asks)):
+            levels = islice(book.items(), len(fields))
+            for priceField, volumeField in fields:
+                d[priceField], d[volumeField] = next(levels, (0, 0))
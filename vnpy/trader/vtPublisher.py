@@ -0,0 +1,266 @@
+# encoding: UTF-8
+
+"""
+RPC服务端的事件推送
+
+两种推送同时存在：
+    原来的推送：全部事件按原来的主题和序列化方式推送，未声明订阅的客户端（包括旧版本客户端）不受影响
+    声明的推送：客户端通过远程调用subscribeEvents声明需要的事件类型和合约，服务端另外推送这些事件
+
+声明的推送的主题为 STREAM_PREFIX + 事件类型 + vtSymbol（数据没有vtSymbol时没有vtSymbol），
+客户端可以在zmq层按主题过滤，例如订阅'@eTick.'接收全部行情，订阅'@eTick.rb1901'只接收rb1901的行情。
+全部使用publishRaw推送：行情、委托、成交事件使用msgpack打包为固定字段顺序的列表（紧凑格式），
+其他事件为RpcServer序列化的Event（格式名称KIND_EVENT）。没有设置decodeFunc的客户端忽略publishRaw的推送，
+因此订阅全部主题（''）的原客户端不会重复收到事件。
+
+原来的推送对每个事件都要序列化一次，声明的事件还要再序列化、推送一次。
+全部客户端都声明订阅时，应关闭原来的推送（EventPublisher的legacy参数，
+RsEngine为RS_setting.json的legacy，VtServer为VT_setting.json的publishLegacy），只序列化客户端需要的事件。
+
+客户端的声明有有效期（expireSeconds），需定期重新声明（subscribeEvents函数自动进行），
+断开时未调用unsubscribeEvents的客户端过期后不再为其推送。
+"""
+
+import os
+import socket
+from concurrent.futures import TimeoutError as FutureTimeout
+from copy import copy
+from datetime import datetime
+from threading import Lock, Thread
+from time import time, sleep
+
+from msgpack import packb, unpackb
+
+from vnpy.event import Event
+from vnpy.trader.vtEvent import EVENT_TICK, EVENT_ORDER, EVENT_TRADE
+from vnpy.trader.vtObject import VtTickData, VtOrderData, VtTradeData
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+STREAM_PREFIX = '@'         # 声明的推送的主题前缀，与原来的推送主题区分
+KIND_EVENT = b'event'       # 声明的推送中，RpcServer序列化的Event的格式名称
+
+
+########################################################################
+class CompactSchema(object):
+    """紧凑格式：按数据类的缺省字段顺序，把数据对象打包为值列表，最后一项为datetime字符串"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, kind, eventType, dataClass):
+        """Constructor"""
+        self.kind = kind                # 格式名称，随消息发送
+        self.eventType = eventType      # 解包后生成的事件类型
+        self.dataClass = dataClass
+
+        self.defaultDict = dataClass().__dict__
+        self.defaultDict.pop('rawData', None)
+        self.fieldList = list(self.defaultDict.keys())
+
+    #----------------------------------------------------------------------
+    def pack(self, data):
+        """打包数据对象"""
+        d = data.__dict__
+        values = [d.get(name) for name in self.fieldList]
+
+        dt = d.get('datetime')
+        values.append(dt.strftime(DATETIME_FORMAT) if isinstance(dt, datetime) else None)
+        return packb(values, use_bin_type=True)
+
+    #----------------------------------------------------------------------
+    def unpack(self, datab):
+        """解包为数据对象"""
+        values = unpackb(datab, raw=False)
+
+        data = self.dataClass.__new__(self.dataClass)
+        d = copy(self.defaultDict)
+        d.update(zip(self.fieldList, values))
+        d['rawData'] = None
+        if values[-1]:
+            d['datetime'] = datetime.strptime(values[-1], DATETIME_FORMAT)
+        data.__dict__ = d
+        return data
+
+
+COMPACT_SCHEMA_LIST = [CompactSchema(b'tick', EVENT_TICK, VtTickData),
+                       CompactSchema(b'order', EVENT_ORDER, VtOrderData),
+                       CompactSchema(b'trade', EVENT_TRADE, VtTradeData)]
+COMPACT_EVENT_DICT = {schema.eventType: schema for schema in COMPACT_SCHEMA_LIST}     # 事件类型: 紧凑格式
+COMPACT_KIND_DICT = {schema.kind: schema for schema in COMPACT_SCHEMA_LIST}          # 格式名称: 紧凑格式
+
+
+########################################################################
+class EventPublisher(object):
+    """按客户端声明的订阅筛选并推送事件"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, server, compact=True, legacy=True, expireSeconds=120):
+        """
+        server: RpcServer对象，会在其上注册subscribeEvents和unsubscribeEvents两个远程函数
+        compact: 行情、委托、成交是否使用紧凑格式推送
+        legacy: 是否保留原来的推送，全部客户端都声明订阅时应关闭，避免序列化全部事件
+        expireSeconds: 客户端声明的有效秒数，超过该时间没有重新声明的客户端被移除
+        """
+        self.server = server
+        self.compact = compact
+        self.legacy = legacy
+        self.expireSeconds = expireSeconds
+
+        self.lock = Lock()
+        self.clientDict = {}        # 客户端名称: (事件类型列表, 合约列表或None, 声明时间)
+        self.typeDict = {}          # 事件类型: 合约集合（None为全部合约），由各客户端的订阅合并而成
+        self.nextExpireTime = 0     # 下次检查过期声明的时间
+
+        self.server.register(self.subscribeEvents)
+        self.server.register(self.unsubscribeEvents)
+
+    #----------------------------------------------------------------------
+    def subscribeEvents(self, clientName, eventTypeList, vtSymbolList=None):
+        """
+        客户端声明需要的事件（远程调用），会替换该客户端之前的声明，同时延长有效期
+        vtSymbolList只对带有vtSymbol的数据生效，为空时接收全部合约
+        """
+        with self.lock:
+            self.clientDict[clientName] = (list(eventTypeList), list(vtSymbolList) if vtSymbolList else None,
+                                           time())
+            self.updateTypeDict()
+        return True
+
+    #----------------------------------------------------------------------
+    def unsubscribeEvents(self, clientName):
+        """客户端取消声明（远程调用）"""
+        with self.lock:
+            self.clientDict.pop(clientName, None)
+            self.updateTypeDict()
+        return True
+
+    #----------------------------------------------------------------------
+    def expireClients(self, now):
+        """移除过期的客户端声明"""
+        self.nextExpireTime = now + 1
+        expireTime = now - self.expireSeconds
+        with self.lock:
+            expiredList = [name for name, (eventTypeList, vtSymbolList, lastTime) in self.clientDict.items()
+                           if lastTime < expireTime]
+            for name in expiredList:
+                del self.clientDict[name]
+            if expiredList:
+                self.updateTypeDict()
+
+    #----------------------------------------------------------------------
+    def updateTypeDict(self):
+        """合并各客户端的订阅"""
+        typeDict = {}
+        for eventTypeList, vtSymbolList, lastTime in self.clientDict.values():
+            for eventType in eventTypeList:
+                if vtSymbolList is None:
+                    typeDict[eventType] = None
+                elif eventType not in typeDict:
+                    typeDict[eventType] = set(vtSymbolList)
+                elif typeDict[eventType] is not None:
+                    typeDict[eventType].update(vtSymbolList)
+
+        # 整体替换，推送线程读取时无需加锁
+        self.typeDict = typeDict
+
+    #----------------------------------------------------------------------
+    def publishEvent(self, event, topic=None):
+        """
+        推送事件
+        topic: 原来的推送使用的主题，None时为事件类型
+        """
+        if self.legacy:
+            self.server.publish(event.type_ if topic is None else topic, event)
+
+        if not self.clientDict:
+            return
+
+        now = time()
+        if now >= self.nextExpireTime:
+            self.expireClients(now)
+
+        typeDict = self.typeDict
+        if event.type_ not in typeDict:
+            return
+
+        data = event.dict_.get('data')
+        vtSymbol = getattr(data, 'vtSymbol', None)
+
+        vtSymbolSet = typeDict[event.type_]
+        if vtSymbol and vtSymbolSet is not None and vtSymbol not in vtSymbolSet:
+            return
+
+        topic = STREAM_PREFIX + (event.type_ + vtSymbol if vtSymbol else event.type_)
+
+        schema = COMPACT_EVENT_DICT.get(event.type_) if self.compact else None
+        if schema is not None and isinstance(data, schema.dataClass):
+            try:
+                datab = schema.pack(data)
+            except TypeError:
+                # 含有msgpack无法打包的字段，使用原来的序列化方式
+                datab = None
+
+            if datab is not None:
+                self.server.publishRaw(topic, schema.kind, datab)
+                return
+
+        self.server.publishRaw(topic, KIND_EVENT, self.server.pack(event))
+
+
+#----------------------------------------------------------------------
+def unpackCompactEvent(kind, datab):
+    """解包紧凑格式的推送，返回Event对象，不支持的格式返回None"""
+    schema = COMPACT_KIND_DICT.get(kind)
+    if schema is None:
+        return None
+
+    event = Event(type_=schema.eventType)
+    event.dict_['data'] = schema.unpack(datab)
+    return event
+
+
+#----------------------------------------------------------------------
+def subscribeEvents(client, eventTypeList, vtSymbolList=None, clientName='', renewInterval=30):
+    """
+    客户端声明需要的事件：在服务端登记，并在zmq层订阅对应主题
+    client: RpcClient对象，其服务端需使用EventPublisher推送事件
+    vtSymbolList只对带有vtSymbol的数据生效，不带vtSymbol的事件类型请单独声明（不指定合约）
+    renewInterval: 重新声明的间隔秒数，应小于服务端的expireSeconds；服务端重启后也会恢复声明
+    """
+    if not clientName:
+        clientName = u'{0}_{1}_{2}'.format(socket.gethostname(), os.getpid(), id(client))
+
+    def decodeFunc(kind, datab):
+        if kind == KIND_EVENT:
+            return client.unpack(datab)
+        return unpackCompactEvent(kind, datab)
+
+    client.decodeFunc = decodeFunc
+    client.subscribeEvents(clientName, eventTypeList, vtSymbolList)
+
+    for eventType in eventTypeList:
+        if vtSymbolList:
+            for vtSymbol in vtSymbolList:
+                client.subscribeTopic(STREAM_PREFIX + eventType + vtSymbol)
+        else:
+            client.subscribeTopic(STREAM_PREFIX + eventType)
+
+    thread = Thread(target=renewEvents, args=(client, clientName, eventTypeList, vtSymbolList, renewInterval))
+    thread.daemon = True
+    thread.start()
+
+    return clientName
+
+
+#----------------------------------------------------------------------
+def renewEvents(client, clientName, eventTypeList, vtSymbolList, renewInterval):
+    """定期重新声明，客户端停止后退出"""
+    while True:
+        sleep(renewInterval)
+        future = client.callAsync('subscribeEvents', (clientName, eventTypeList, vtSymbolList),
+                                  timeout=renewInterval)
+        try:
+            # 客户端运行时，调用在超时前一定完成（成功或RpcTimeout，服务端不可用时下次再声明）
+            future.exception(timeout=renewInterval * 2)
+        except FutureTimeout:
+            # 客户端已停止，请求线程不再处理调用
+            return
@@ -19,6 +19,9 @@ from threading import Thread
 import vtEvent
 from vnpy.rpc import RpcServer
 from vnpy.trader.vtEngine import MainEngine
+from vnpy.trader.vtGlobal import globalSetting
+from vnpy.trader.vtPublisher import EventPublisher
+from vnpy.trader.vtTickBus import TickBusWriter
 
 from vnpy.trader.gateway import ctpGateway
 init_gateway_names = {'CTP': ['CTP', 'CTP_Prod', 'CTP_Post', 'CTP_EBF', 'CTP_JR', 'CTP_JR2']}
@@ -28,8 +31,12 @@ class VtServer(RpcServer):
     """vn.trader服务器"""
 
     #----------------------------------------------------------------------
-    def __init__(self, repAddress, pubAddress):
-        """Constructor"""
+    def __init__(self, repAddress, pubAddress, legacy=True, tickBusName=''):
+        """
+        Constructor
+        legacy: 是否保留原来的推送（全部事件），客户端都声明订阅时应关闭
+        tickBusName: 不为空时，同时把行情写入该名称的本机tick总线，同机的VtClient可以从共享内存读取
+        """
         super(VtServer, self).__init__(repAddress, pubAddress)
         self.usePickle()
         
@@ -63,13 +70,22 @@ class VtServer(RpcServer):
         self.register(self.engine.getAllGatewayNames)
         self.register(self.engine.saveData)
         
+        # 按客户端声明的订阅推送事件（同时注册subscribeEvents/unsubscribeEvents远程函数）
+        self.publisher = EventPublisher(self, legacy=legacy)
+
         # 注册事件引擎发送的事件处理监听
         self.engine.eventEngine.registerGeneralHandler(self.eventHandler)
+
+        # 本机tick总线
+        self.tickBus = None
+        if tickBusName:
+            self.tickBus = TickBusWriter(tickBusName)
+            self.tickBus.registerEvent(self.engine.eventEngine)
         
     #----------------------------------------------------------------------
     def eventHandler(self, event):
         """事件处理"""
-        self.publish(event.type_, event)
+        self.publisher.publishEvent(event, event.type_)
         
     #----------------------------------------------------------------------
     def stopServer(self):
@@ -80,6 +96,10 @@ class VtServer(RpcServer):
         # 停止服务器线程
         self.stop()
 
+        if self.tickBus:
+            self.tickBus.close()
+            self.tickBus = None
+
 
 #----------------------------------------------------------------------
 def printLog(content):
@@ -94,7 +114,8 @@ def runServer():
     pubAddress = 'tcp://*:2016'
     
     # 创建并启动服务器
-    server = VtServer(repAddress, pubAddress)
+    server = VtServer(repAddress, pubAddress, globalSetting.get('publishLegacy', True),
+                      globalSetting.get('tickBusName', ''))
     server.start()
     
     printLog('-'*50)
@@ -0,0 +1,475 @@
+# encoding: UTF-8
+
+"""
+本机多进程共享行情的tick总线
+
+拥有行情接口的进程使用TickBusWriter把tick写入共享内存（multiprocessing.shared_memory），
+每个合约一段共享内存，内部为定长记录的环形缓冲区；同机的其他进程使用TickBusReader轮询读取，
+生成VtTickData推入本进程的事件引擎，无需序列化和网络传输，用于替代同机进程间的zmq PUB推送。
+
+共享内存名称：
+    总线目录：busName
+    合约缓冲区：busName_vtSymbol（vtSymbol中的特殊字符替换为_）
+
+合约缓冲区结构：
+    头部：已写入的记录总数（int64）、容量（int64）、合约信息（json，定长）
+    记录：TICK_DTYPE定长记录 × 容量，第n条记录写在 n % 容量 处
+
+写入方先写记录，再更新记录总数；记录总数为n时，写入方可能正在写第n条记录（覆盖第n-容量条），
+读取方只读取第n-容量+1条之后的记录，复制后再次检查记录总数，
+已被覆盖的记录（读取过慢）丢弃并计入丢失数量。
+
+用法：
+    写入进程：writer = TickBusWriter('vnpyTick'); writer.registerEvent(eventEngine)
+    读取进程：reader = TickBusReader(eventEngine, 'vnpyTick', ['rb1901.SHFE']); reader.start()
+"""
+
+import json
+import re
+import struct
+import threading
+from operator import attrgetter
+from datetime import datetime, timedelta
+from time import sleep
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from vnpy.event import Event
+from vnpy.trader.vtEvent import EVENT_TICK
+from vnpy.trader.vtObject import VtTickData
+
+# 浮点字段，按VtTickData的字段顺序
+# 成交量保存为浮点数（数字货币的成交量为小数），读取时整数值转换回int
+TICK_FLOAT_FIELDS = ['lastPrice', 'lastVolume', 'volume',
+                     'openPrice', 'highPrice', 'lowPrice', 'preClosePrice',
+                     'upperLimit', 'lowerLimit',
+                     'bidPrice1', 'bidPrice2', 'bidPrice3', 'bidPrice4', 'bidPrice5',
+                     'askPrice1', 'askPrice2', 'askPrice3', 'askPrice4', 'askPrice5',
+                     'bidVolume1', 'bidVolume2', 'bidVolume3', 'bidVolume4', 'bidVolume5',
+                     'askVolume1', 'askVolume2', 'askVolume3', 'askVolume4', 'askVolume5']
+# 整数字段
+TICK_INT_FIELDS = ['preOpenInterest', 'openInterest']
+# 成交量字段
+TICK_VOLUME_FIELDS = [name for name in TICK_FLOAT_FIELDS if 'Volume' in name or name == 'volume']
+# 字符串字段（定长），日期兼容'%Y%m%d'和'%Y-%m-%d'两种格式（币安、OKEX等）
+TICK_STR_FIELDS = [('time', 16), ('date', 10), ('tradingDay', 10)]
+# 每个合约缓冲区内取值不变的字段，保存在头部
+TICK_CONST_FIELDS = ['symbol', 'exchange', 'vtSymbol', 'gatewayName']
+
+TICK_DTYPE = np.dtype([('datetime', np.int64)] +
+                      [(name, np.float64) for name in TICK_FLOAT_FIELDS] +
+                      [(name, np.int64) for name in TICK_INT_FIELDS] +
+                      [(name, 'S%d' % size) for name, size in TICK_STR_FIELDS])
+
+HEADER_SIZE = 512               # 合约缓冲区头部字节数
+HEADER_INFO_OFFSET = 16         # 头部中合约信息的起始位置
+SYMBOL_NAME_SIZE = 64           # 总线目录中每个合约名称的字节数
+
+# 写入时使用struct直接打包到共享内存，与TICK_DTYPE的内存布局一致
+TICK_STRUCT = struct.Struct('<q%dd%dq%s' % (len(TICK_FLOAT_FIELDS), len(TICK_INT_FIELDS),
+                                           ''.join(['%ds' % size for name, size in TICK_STR_FIELDS])))
+COUNTER_STRUCT = struct.Struct('<q')
+
+getFloatValues = attrgetter(*TICK_FLOAT_FIELDS)
+getIntValues = attrgetter(*TICK_INT_FIELDS)
+getStrValues = attrgetter(*[name for name, size in TICK_STR_FIELDS])
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+NO_DATETIME = np.iinfo(np.int64).min     # 没有datetime时的取值
+
+
+#----------------------------------------------------------------------
+def getSegmentName(busName, vtSymbol):
+    """合约缓冲区的共享内存名称"""
+    return '{0}_{1}'.format(busName, re.sub(r'[^0-9A-Za-z_.-]', '_', vtSymbol))
+
+
+#----------------------------------------------------------------------
+def attachSharedMemory(name):
+    """
+    连接已存在的共享内存，不存在时返回None
+    读取方不拥有共享内存，不能由本进程的resource_tracker在退出时删除
+    """
+    try:
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # python3.13之前没有track参数
+            shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return None
+
+    # multiprocessing创建的子进程与父进程共用resource_tracker，登记是幂等的，不能取消登记
+    if multiprocessing.parent_process() is None:
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+    return shm
+
+
+########################################################################
+class TickBuffer(object):
+    """单个合约的tick环形缓冲区"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, shm):
+        """Constructor"""
+        self.shm = shm
+
+        header = np.ndarray((2,), dtype=np.int64, buffer=shm.buf)
+        self.counter = header[0:1]              # 已写入的记录总数
+        self.capacity = int(header[1])
+        self.writeCount = int(header[0])        # 写入方使用的记录总数
+
+        self.records = np.ndarray((self.capacity,), dtype=TICK_DTYPE,
+                                  buffer=shm.buf, offset=HEADER_SIZE)
+
+    #----------------------------------------------------------------------
+    @classmethod
+    def create(cls, name, capacity, info):
+        """创建缓冲区，info为合约信息字典"""
+        infob = json.dumps(info).encode('utf-8')
+        if len(infob) > HEADER_SIZE - HEADER_INFO_OFFSET:
+            raise ValueError(u'合约信息过长：{0}'.format(info))
+
+        size = HEADER_SIZE + TICK_DTYPE.itemsize * capacity
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # 上次运行未正常删除的共享内存，重新创建
+            old = shared_memory.SharedMemory(name=name)
+            old.close()
+            old.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray((2,), dtype=np.int64, buffer=shm.buf)
+        header[0] = 0
+        header[1] = capacity
+        shm.buf[HEADER_INFO_OFFSET:HEADER_INFO_OFFSET+len(infob)] = infob
+        shm.buf[HEADER_INFO_OFFSET+len(infob)] = 0
+        return cls(shm)
+
+    #----------------------------------------------------------------------
+    def getInfo(self):
+        """读取合约信息"""
+        infob = bytes(self.shm.buf[HEADER_INFO_OFFSET:HEADER_SIZE]).split(b'\x00', 1)[0]
+        return json.loads(infob.decode('utf-8'))
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """断开共享内存"""
+        # numpy数组引用着共享内存，需先释放
+        self.counter = None
+        self.records = None
+        self.shm.close()
+
+
+########################################################################
+class TickBusWriter(object):
+    """
+    tick总线写入方，运行在拥有行情接口的进程中
+    可以直接调用writeTick，或者通过registerEvent从事件引擎接收全部tick
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, busName, capacity=4096, maxSymbols=1024):
+        """
+        busName: 总线名称，读取方使用相同的名称
+        capacity: 每个合约缓冲区保存的tick数量，读取方落后超过该数量时会丢失tick
+        maxSymbols: 最多支持的合约数量
+        """
+        self.busName = busName
+        self.capacity = capacity
+        self.maxSymbols = maxSymbols
+
+        self.bufferDict = {}            # vtSymbol: TickBuffer
+        self.lock = threading.Lock()
+
+        # 总线目录：合约数量（int64）+ 合约名称列表
+        size = 8 + SYMBOL_NAME_SIZE * maxSymbols
+        try:
+            self.directory = shared_memory.SharedMemory(name=busName, create=True, size=size)
+        except FileExistsError:
+            old = shared_memory.SharedMemory(name=busName)
+            old.close()
+            old.unlink()
+            self.directory = shared_memory.SharedMemory(name=busName, create=True, size=size)
+        self.symbolCount = np.ndarray((1,), dtype=np.int64, buffer=self.directory.buf)
+        self.symbolCount[0] = 0
+        self.symbolNames = np.ndarray((maxSymbols,), dtype='S%d' % SYMBOL_NAME_SIZE,
+                                      buffer=self.directory.buf, offset=8)
+
+    #----------------------------------------------------------------------
+    def registerEvent(self, eventEngine):
+        """从事件引擎接收全部tick写入总线"""
+        eventEngine.register(EVENT_TICK, self.processTickEvent)
+
+    #----------------------------------------------------------------------
+    def processTickEvent(self, event):
+        """处理行情事件"""
+        self.writeTick(event.dict_['data'])
+
+    #----------------------------------------------------------------------
+    def getBuffer(self, tick):
+        """获取合约的缓冲区，不存在时创建并登记到目录"""
+        vtSymbol = tick.vtSymbol
+        with self.lock:
+            buf = self.bufferDict.get(vtSymbol)
+            if buf is not None:
+                return buf
+
+            count = int(self.symbolCount[0])
+            if count >= self.maxSymbols:
+                raise ValueError(u'tick总线{0}的合约数量超过上限{1}'.format(self.busName, self.maxSymbols))
+
+            nameb = vtSymbol.encode('utf-8')
+            if len(nameb) > SYMBOL_NAME_SIZE:
+                raise ValueError(u'合约代码过长：{0}'.format(vtSymbol))
+
+            info = {name: getattr(tick, name, '') for name in TICK_CONST_FIELDS}
+            buf = TickBuffer.create(getSegmentName(self.busName, vtSymbol), self.capacity, info)
+            self.bufferDict[vtSymbol] = buf
+
+            # 先写名称，再增加数量
+            self.symbolNames[count] = nameb
+            self.symbolCount[0] = count + 1
+            return buf
+
+    #----------------------------------------------------------------------
+    def writeTick(self, tick):
+        """写入一个tick"""
+        buf = self.bufferDict.get(tick.vtSymbol)
+        if buf is None:
+            buf = self.getBuffer(tick)
+
+        dt = getattr(tick, 'datetime', None)
+        if isinstance(dt, datetime):
+            dtValue = (dt - EPOCH) // ONE_MICROSECOND
+        else:
+            dtValue = NO_DATETIME
+
+        try:
+            values = ((dtValue,) + getFloatValues(tick) + getIntValues(tick) +
+                      tuple([value.encode('utf-8') for value in getStrValues(tick)]))
+        except (AttributeError, TypeError):
+            # 存在为None或类型不符的字段
+            values = [dtValue]
+            values.extend([float(getattr(tick, name, 0) or 0) for name in TICK_FLOAT_FIELDS])
+            values.extend([int(getattr(tick, name, 0) or 0) for name in TICK_INT_FIELDS])
+            values.extend([(getattr(tick, name, '') or '').encode('utf-8') for name, size in TICK_STR_FIELDS])
+
+        # 先写记录，再更新记录总数
+        n = buf.writeCount
+        shm = buf.shm.buf
+        try:
+            TICK_STRUCT.pack_into(shm, HEADER_SIZE + (n % buf.capacity) * TICK_STRUCT.size, *values)
+        except struct.error:
+            values = list(values)
+            values[-len(TICK_INT_FIELDS)-len(TICK_STR_FIELDS):-len(TICK_STR_FIELDS)] = \
+                [int(v) for v in values[-len(TICK_INT_FIELDS)-len(TICK_STR_FIELDS):-len(TICK_STR_FIELDS)]]
+            TICK_STRUCT.pack_into(shm, HEADER_SIZE + (n % buf.capacity) * TICK_STRUCT.size, *values)
+        buf.writeCount = n + 1
+        COUNTER_STRUCT.pack_into(shm, 0, n + 1)
+
+    #----------------------------------------------------------------------
+    def close(self, unlink=True):
+        """关闭总线，unlink为True时删除共享内存（读取方之后无法再连接）"""
+        with self.lock:
+            for buf in self.bufferDict.values():
+                shm = buf.shm
+                buf.close()
+                if unlink:
+                    shm.unlink()
+            self.bufferDict.clear()
+
+            self.symbolCount = None
+            self.symbolNames = None
+            self.directory.close()
+            if unlink:
+                self.directory.unlink()
+
+
+########################################################################
+class TickBusReader(object):
+    """
+    tick总线读取方，在后台线程中轮询共享内存，把新的tick推入事件引擎
+    推送的事件与接口的onTick相同：EVENT_TICK和EVENT_TICK+vtSymbol
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, eventEngine, busName, vtSymbolList=None, pollInterval=0.0001):
+        """
+        vtSymbolList: 需要接收的合约，为空时接收总线上的全部合约
+        pollInterval: 没有新数据时的等待秒数，0为持续轮询（延迟最低，占用一个CPU核）
+        """
+        self.eventEngine = eventEngine
+        self.busName = busName
+        self.vtSymbolSet = set(vtSymbolList) if vtSymbolList else None
+        self.pollInterval = pollInterval
+
+        self.directory = None
+        self.symbolCount = None
+        self.symbolNames = None
+        self.knownCount = 0             # 已处理的目录合约数量
+
+        self.readerList = []            # [vtSymbol, TickBuffer, 已读取的记录总数, tick模板字典]
+        self.lostDict = {}              # vtSymbol: 因读取过慢丢失的tick数量
+
+        self.active = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动"""
+        self.active = True
+        if not self.thread.is_alive():
+            self.thread.start()
+
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止"""
+        self.active = False
+        if self.thread.is_alive():
+            self.thread.join()
+
+        for reader in self.readerList:
+            reader[1].close()
+        self.readerList = []
+
+        if self.directory is not None:
+            self.symbolCount = None
+            self.symbolNames = None
+            self.directory.close()
+            self.directory = None
+        self.knownCount = 0
+
+    #----------------------------------------------------------------------
+    def run(self):
+        """轮询线程运行函数"""
+        idleCount = 0
+        while self.active:
+            # 新增合约较少，空闲时才检查目录
+            if idleCount % 100 == 0:
+                self.checkDirectory()
+
+            if self.poll():
+                idleCount = 0
+            else:
+                idleCount += 1
+                if self.pollInterval:
+                    sleep(self.pollInterval)
+
+    #----------------------------------------------------------------------
+    def checkDirectory(self):
+        """检查总线目录，连接新出现的合约缓冲区"""
+        if self.directory is None:
+            self.directory = attachSharedMemory(self.busName)
+            if self.directory is None:
+                return
+            self.symbolCount = np.ndarray((1,), dtype=np.int64, buffer=self.directory.buf)
+            self.symbolNames = np.ndarray(((self.directory.size - 8) // SYMBOL_NAME_SIZE,),
+                                          dtype='S%d' % SYMBOL_NAME_SIZE,
+                                          buffer=self.directory.buf, offset=8)
+
+        count = int(self.symbolCount[0])
+        while self.knownCount < count:
+            vtSymbol = self.symbolNames[self.knownCount].decode('utf-8')
+            if self.vtSymbolSet is None or vtSymbol in self.vtSymbolSet:
+                shm = attachSharedMemory(getSegmentName(self.busName, vtSymbol))
+                if shm is None:
+                    # 写入方刚登记，稍后再连接
+                    return
+                buf = TickBuffer(shm)
+
+                template = VtTickData().__dict__
+                template.update(buf.getInfo())
+
+                # 只接收连接之后写入的tick
+                self.readerList.append([vtSymbol, buf, int(buf.counter[0]), template])
+            self.knownCount += 1
+
+    #----------------------------------------------------------------------
+    def poll(self):
+        """读取各合约的新tick，返回读取的数量"""
+        total = 0
+        for reader in self.readerList:
+            vtSymbol, buf, readCount, template = reader
+            n = int(buf.counter[0])
+            if n == readCount:
+                continue
+
+            # 写入方可能正在写第n条记录，第n-capacity条及之前的记录不再可靠
+            capacity = buf.capacity
+            lowest = n - capacity + 1
+            if readCount < lowest:
+                self.addLost(vtSymbol, lowest - readCount)
+                readCount = lowest
+
+            # 复制记录（可能跨越环形缓冲区的末尾）
+            start = readCount % capacity
+            end = start + (n - readCount)
+            if end <= capacity:
+                records = buf.records[start:end].copy()
+            else:
+                records = np.concatenate((buf.records[start:], buf.records[:end-capacity]))
+
+            # 复制期间被覆盖的记录丢弃
+            overwritten = int(buf.counter[0]) - capacity + 1 - readCount
+            if overwritten > 0:
+                self.addLost(vtSymbol, overwritten)
+                records = records[overwritten:]
+
+            reader[2] = n
+            for tick in self.createTicks(records, template):
+                self.putTickEvent(tick)
+            total += len(records)
+
+        return total
+
+    #----------------------------------------------------------------------
+    def createTicks(self, records, template):
+        """记录数组转换为VtTickData列表"""
+        names = records.dtype.names
+        tickList = []
+        for row in records.tolist():
+            d = template.copy()
+            d.update(zip(names, row))
+
+            dtValue = d['datetime']
+            d['datetime'] = EPOCH + timedelta(microseconds=dtValue) if dtValue != NO_DATETIME else None
+            # 超长被截断的字符串可能不是完整的utf-8字符
+            for name, size in TICK_STR_FIELDS:
+                d[name] = d[name].decode('utf-8', 'ignore')
+            for name in TICK_VOLUME_FIELDS:
+                value = d[name]
+                if value.is_integer():
+                    d[name] = int(value)
+
+            tick = VtTickData.__new__(VtTickData)
+            tick.__dict__ = d
+            tickList.append(tick)
+        return tickList
+
+    #----------------------------------------------------------------------
+    def addLost(self, vtSymbol, count):
+        """记录丢失的tick数量"""
+        self.lostDict[vtSymbol] = self.lostDict.get(vtSymbol, 0) + count
+
+    #----------------------------------------------------------------------
+    def putTickEvent(self, tick):
+        """推送行情事件"""
+        # 通用事件
+        event1 = Event(type_=EVENT_TICK)
+        event1.dict_['data'] = tick
+        self.eventEngine.put(event1)
+
+        # 特定合约代码的事件
+        event2 = Event(type_=EVENT_TICK+tick.vtSymbol)
+        event2.dict_['data'] = tick
+        self.eventEngine.put(event2)